@@ -8,6 +8,10 @@ lightweight.
 """
 from typing import Any, Dict, Optional, List
 import logging
+import time
+
+from .metrics import agent_run_seconds
+from .tracing import span
 
 
 # Internal registry mapping task_name -> agent (or agent wrapper)
@@ -98,6 +102,15 @@ def run_agent(name: str, payload: Dict[str, Any]) -> Optional[Any]:
     errors fall back to a stub-style result so callers never fail due to
     agent runtime errors.
     """
+    start = time.perf_counter()
+    with span("run_agent", task=name):
+        result = _run_agent(name, payload)
+    outcome = "error" if result is None and name in _agents else ("missing" if result is None else "ok")
+    agent_run_seconds.observe(time.perf_counter() - start, name, outcome)
+    return result
+
+
+def _run_agent(name: str, payload: Dict[str, Any]) -> Optional[Any]:
     if not _agents:
         initialize_agents()
 
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
@@ -7,8 +8,12 @@ import json
 from datetime import datetime
 import threading
 import os
+import anyio
 
-DATA_DIR = Path(__file__).parent / ".." / "data"
+from .metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware
+from .tracing import TracingMiddleware, tracer
+
+DATA_DIR = Path(os.getenv("MCP_DATA_DIR", str(Path(__file__).parent / ".." / "data")))
 DATA_DIR = DATA_DIR.resolve()
 DEVICES_FILE = DATA_DIR / "devices.json"
 ACCESS_FILE = DATA_DIR / "access.json"
@@ -24,6 +29,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Sampled / ?trace=1 span tracing (see servers/tracing.py)
+app.add_middleware(TracingMiddleware)
+# Request count/latency by router and action (see servers/metrics.py); outermost
+app.add_middleware(MetricsMiddleware)
+
+def _threadpool_workers():
+    # Sync endpoints run on AnyIO's default thread limiter; only readable from the event loop
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return [(("busy",), limiter.borrowed_tokens), (("limit",), limiter.total_tokens)]
+
+def _threadpool_queue():
+    return [((), anyio.to_thread.current_default_thread_limiter().statistics().tasks_waiting)]
+
+REGISTRY.gauge_callback("mcp_threadpool_workers", "Worker threads for sync endpoints", ("state",), _threadpool_workers)
+REGISTRY.gauge_callback("mcp_threadpool_queue_depth", "Sync endpoint calls waiting for a worker thread", (), _threadpool_queue)
+
 @app.on_event("startup")
 def _initialize_agents_on_startup():
 	# Initialize CrewAI agents (stubs if crewai isn't installed)
@@ -35,6 +56,37 @@ def _initialize_agents_on_startup():
 		print(f"⚠️  Failed to initialize agents: {e}")
 		print("📦 Continuing with stub agents")
 
+@app.on_event("startup")
+async def _start_report_ingestion():
+    # UDP listener for mote reports (see servers/ingest.py); off unless enabled
+    from .ingest import ingest_enabled
+    from .utils import report_ingestor
+    if not ingest_enabled():
+        return
+    try:
+        await report_ingestor.start(
+            host=os.getenv("WISE_INGEST_HOST", "0.0.0.0"),
+            port=int(os.getenv("WISE_INGEST_PORT", "5678"))
+        )
+    except OSError as e:
+        print(f"⚠️  Report listener not started: {e}")
+
+@app.on_event("startup")
+async def _start_ota_queue():
+    # Delivers queued OTA updates when offline devices come back (see servers/ota_queue.py)
+    from .utils import ota_queue
+    ota_queue.start()
+
+@app.on_event("shutdown")
+async def _stop_report_ingestion():
+    from .utils import report_ingestor, telemetry_store, delta_builder, ota_queue, protocol_dispatcher
+    await report_ingestor.stop()
+    telemetry_store.close()
+    tracer.exporter.close()
+    delta_builder.shutdown()
+    ota_queue.stop()
+    protocol_dispatcher.close()
+
 # Root endpoint for health
 @app.get("/")
 def root():
@@ -45,10 +97,16 @@ def root():
         "endpoints": {
             "health": "/health",
             "docs": "/docs",
+            "metrics": "/metrics",
             "tasks": "/tasks/*"
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    # async so the thread-pool gauges are read on the event loop
+    return PlainTextResponse(REGISTRY.expose(), media_type=CONTENT_TYPE)
+
 @app.get("/health")
 def health_check():
     return {
@@ -66,6 +124,12 @@ from .tasks.plan_validation import validation_router
 from .tasks.plan_execution import execution_router
 from .tasks.access_control import access_router
 from .tasks.algorithm_execution import algorithm_router
+from .tasks.flow_orchestration import flow_router
+from .tasks.flow_execution import flow_execution_router
+from .tasks.flow_validation import flow_validation_router
+from .tasks.topology_monitoring import topology_router
+from .tasks.diagnostics import diagnostics_router
+from .tasks.firmware_distribution import firmware_router
 
 app.include_router(device_router, prefix="/tasks")
 app.include_router(deployment_router, prefix="/tasks")
@@ -74,5 +138,11 @@ app.include_router(validation_router, prefix="/tasks")
 app.include_router(execution_router, prefix="/tasks")
 app.include_router(access_router, prefix="/tasks")
 app.include_router(algorithm_router, prefix="/tasks")
+app.include_router(flow_router, prefix="/tasks")
+app.include_router(flow_execution_router, prefix="/tasks")
+app.include_router(flow_validation_router, prefix="/tasks")
+app.include_router(topology_router, prefix="/tasks")
+app.include_router(diagnostics_router, prefix="/tasks")
+app.include_router(firmware_router, prefix="/tasks")
 
 from .utils import read_json, write_json
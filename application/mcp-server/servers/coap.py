@@ -0,0 +1,821 @@
+"""Native CoAP client (RFC 7252) with Observe (RFC 7641) and block-wise
+transfer (RFC 7959), so plan steps can target the WSN motes directly.
+
+The Contiki-NG motes link the CoAP engine (os/net/app-layer/coap in the
+contiki-workspace Makefile) and serve on UDP 5683. Their buffers are small:
+REST_MAX_CHUNK_SIZE defaults to 64 bytes, so larger bodies travel block-wise
+(Block1 up, Block2 down), and by default only one exchange per mote is
+outstanding at a time (NSTART = 1).
+
+CoapClient shares one UDP socket per address family between all motes.
+Responses are matched by token and ACK/RST by message id. Confirmable
+messages are retransmitted with exponential backoff (ACK_TIMEOUT 2 s,
+ACK_RANDOM_FACTOR 1.5, MAX_RETRANSMIT 4). Responses may be piggybacked on
+the ACK or sent separately. Observations deliver notifications through an
+async iterator, dropping the oldest when the consumer falls behind and
+reordered ones by their Observe sequence number.
+
+LoopbackCoapServer is an in-process stand-in for a mote: resources are
+JSON values keyed by (Uri-Host, path), responses go out in 64-byte blocks,
+and observers are notified whenever a resource changes.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+COAP_PORT = 5683
+
+# Message types
+CON, NON, ACK, RST = 0, 1, 2, 3
+
+# Method codes
+EMPTY = 0
+GET, POST, PUT, DELETE = 1, 2, 3, 4
+METHODS = {"GET": GET, "POST": POST, "PUT": PUT, "DELETE": DELETE}
+
+
+def response_code(code_class: int, detail: int) -> int:
+    return code_class << 5 | detail
+
+
+CREATED = response_code(2, 1)
+DELETED = response_code(2, 2)
+CHANGED = response_code(2, 4)
+CONTENT = response_code(2, 5)
+CONTINUE = response_code(2, 31)
+BAD_REQUEST = response_code(4, 0)
+NOT_FOUND = response_code(4, 4)
+METHOD_NOT_ALLOWED = response_code(4, 5)
+REQUEST_ENTITY_INCOMPLETE = response_code(4, 8)
+
+# Option numbers
+OPT_URI_HOST = 3
+OPT_ETAG = 4
+OPT_OBSERVE = 6
+OPT_URI_PORT = 7
+OPT_URI_PATH = 11
+OPT_CONTENT_FORMAT = 12
+OPT_URI_QUERY = 15
+OPT_ACCEPT = 17
+OPT_BLOCK2 = 23
+OPT_BLOCK1 = 27
+
+FORMAT_TEXT = 0
+FORMAT_JSON = 50
+
+# Transmission parameters (RFC 7252 section 4.8)
+ACK_TIMEOUT = 2.0
+ACK_RANDOM_FACTOR = 1.5
+MAX_RETRANSMIT = 4
+
+# Contiki-NG REST_MAX_CHUNK_SIZE
+DEFAULT_BLOCK_SIZE = 64
+
+OBSERVE_REGISTER = 0
+OBSERVE_DEREGISTER = 1
+
+
+class CoapError(Exception):
+    """An exchange failed: reset by the peer or not acknowledged."""
+
+
+def code_string(code: int) -> str:
+    return f"{code >> 5}.{code & 31:02d}"
+
+
+def encode_uint(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
+def decode_uint(data: bytes) -> int:
+    return int.from_bytes(data, "big")
+
+
+def encode_block(num: int, more: bool, size: int) -> bytes:
+    """Block1/Block2 option value; size is a power of two from 16 to 1024."""
+    szx = size.bit_length() - 5
+    if size & (size - 1) or not 0 <= szx <= 6:
+        raise ValueError(f"Invalid CoAP block size: {size}")
+    return encode_uint(num << 4 | int(more) << 3 | szx)
+
+
+def decode_block(data: bytes) -> Tuple[int, bool, int]:
+    value = decode_uint(data)
+    return value >> 4, bool(value & 0x8), 16 << min(value & 0x7, 6)
+
+
+def _nibble(value: int) -> Tuple[int, bytes]:
+    if value < 13:
+        return value, b""
+    if value < 269:
+        return 13, bytes([value - 13])
+    return 14, struct.pack("!H", value - 269)
+
+
+def _read_extended(nibble: int, data: bytes, pos: int) -> Tuple[int, int]:
+    if nibble < 13:
+        return nibble, pos
+    if nibble == 13:
+        if pos >= len(data):
+            raise ValueError("Truncated CoAP option")
+        return data[pos] + 13, pos + 1
+    if nibble == 14:
+        if pos + 2 > len(data):
+            raise ValueError("Truncated CoAP option")
+        return struct.unpack_from("!H", data, pos)[0] + 269, pos + 2
+    raise ValueError("Reserved CoAP option nibble")
+
+
+class CoapMessage:
+    __slots__ = ("mtype", "code", "message_id", "token", "options", "payload")
+
+    def __init__(
+        self,
+        mtype: int,
+        code: int,
+        message_id: int = 0,
+        token: bytes = b"",
+        options: Optional[List[Tuple[int, bytes]]] = None,
+        payload: bytes = b""
+    ):
+        self.mtype = mtype
+        self.code = code
+        self.message_id = message_id
+        self.token = token
+        self.options = list(options or [])
+        self.payload = payload
+
+    def opt(self, number: int) -> Optional[bytes]:
+        for option, value in self.options:
+            if option == number:
+                return value
+        return None
+
+    def opts(self, number: int) -> List[bytes]:
+        return [value for option, value in self.options if option == number]
+
+    def without(self, *numbers: int) -> List[Tuple[int, bytes]]:
+        return [(option, value) for option, value in self.options if option not in numbers]
+
+    @property
+    def content_format(self) -> Optional[int]:
+        value = self.opt(OPT_CONTENT_FORMAT)
+        return None if value is None else decode_uint(value)
+
+    @property
+    def success(self) -> bool:
+        return self.code >> 5 == 2
+
+    def encode(self) -> bytes:
+        if len(self.token) > 8:
+            raise ValueError("CoAP token longer than 8 bytes")
+        out = bytearray(struct.pack("!BBH", 0x40 | self.mtype << 4 | len(self.token), self.code, self.message_id))
+        out += self.token
+        last = 0
+        # sorted() is stable, so repeated options (Uri-Path segments) keep their order
+        for number, value in sorted(self.options, key=lambda option: option[0]):
+            delta, delta_ext = _nibble(number - last)
+            length, length_ext = _nibble(len(value))
+            out.append(delta << 4 | length)
+            out += delta_ext + length_ext + value
+            last = number
+        if self.payload:
+            out.append(0xFF)
+            out += self.payload
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "CoapMessage":
+        if len(data) < 4:
+            raise ValueError("CoAP message shorter than its header")
+        first, code, message_id = struct.unpack_from("!BBH", data)
+        if first >> 6 != 1:
+            raise ValueError("Unsupported CoAP version")
+        token_length = first & 0x0F
+        if token_length > 8 or len(data) < 4 + token_length:
+            raise ValueError("Invalid CoAP token")
+        pos = 4 + token_length
+        token = bytes(data[4:pos])
+        options = []
+        number = 0
+        payload = b""
+        while pos < len(data):
+            byte = data[pos]
+            pos += 1
+            if byte == 0xFF:
+                payload = bytes(data[pos:])
+                if not payload:
+                    raise ValueError("CoAP payload marker without payload")
+                break
+            delta, pos = _read_extended(byte >> 4, data, pos)
+            length, pos = _read_extended(byte & 0x0F, data, pos)
+            number += delta
+            if pos + length > len(data):
+                raise ValueError("Truncated CoAP option")
+            options.append((number, bytes(data[pos:pos + length])))
+            pos += length
+        return cls((first >> 4) & 0x3, code, message_id, token, options, payload)
+
+
+def request_options(
+    host: Optional[str] = None,
+    path: str = "",
+    query: Optional[Dict[str, Any]] = None,
+    content_format: Optional[int] = None,
+    accept: Optional[int] = None
+) -> List[Tuple[int, bytes]]:
+    options = []
+    if host:
+        options.append((OPT_URI_HOST, host.encode()))
+    options.extend((OPT_URI_PATH, segment.encode()) for segment in path.strip("/").split("/") if segment)
+    if content_format is not None:
+        options.append((OPT_CONTENT_FORMAT, encode_uint(content_format)))
+    for key, value in (query or {}).items():
+        options.append((OPT_URI_QUERY, f"{key}={value}".encode()))
+    if accept is not None:
+        options.append((OPT_ACCEPT, encode_uint(accept)))
+    return options
+
+
+def _addr_key(addr: Tuple) -> Tuple[str, int]:
+    # IPv6 socket addresses carry flowinfo/scope id as well
+    return addr[0], addr[1]
+
+
+class _Endpoint(asyncio.DatagramProtocol):
+    def __init__(self, client: "CoapClient"):
+        self.client = client
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.client._received(self, data, addr)
+
+    def error_received(self, exc):
+        logger.debug(f"CoAP socket error: {exc}")
+
+
+_END = object()
+
+
+class CoapObservation:
+    """
+    Notifications of one observed resource, first response included. Iterate
+    with `async for`; the iteration ends when the server stops the
+    observation (a response without Observe) or after cancel().
+    """
+
+    def __init__(self, client: "CoapClient", endpoint: _Endpoint, addr: Tuple, options: List[Tuple[int, bytes]],
+                 token: bytes, maxsize: int = 64):
+        self.client = client
+        self.endpoint = endpoint
+        self.addr = addr
+        self.options = options
+        self.token = token
+        self.notifications = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._last: Optional[Tuple[int, float]] = None
+        self._closed = False
+
+    def _fresh(self, sequence: int) -> bool:
+        # RFC 7641 section 3.4: newer within half the 24-bit space, or after 128 s
+        now = time.monotonic()
+        if self._last is not None:
+            last, received_at = self._last
+            if not ((last < sequence and sequence - last < 1 << 23) or
+                    (last > sequence and last - sequence > 1 << 23) or
+                    now > received_at + 128):
+                return False
+        self._last = (sequence, now)
+        return True
+
+    def _put(self, item: Any):
+        if self._queue.full():
+            # Keep the freshest state; a slow consumer loses the oldest notification
+            self._queue.get_nowait()
+        self._queue.put_nowait(item)
+
+    def _deliver(self, message: CoapMessage):
+        if self._closed:
+            return
+        observe = message.opt(OPT_OBSERVE)
+        if observe is None or not message.success:
+            # Plain response: the server does not (or no longer) keep the observation
+            self._put(message)
+            self._end()
+            return
+        if self._fresh(decode_uint(observe)):
+            self.notifications += 1
+            self.client.counters["notifications"] += 1
+            self._put(message)
+
+    def _end(self):
+        self._closed = True
+        self.client._observations.pop(self.token, None)
+        self._put(_END)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> CoapMessage:
+        item = await self._queue.get()
+        if item is _END:
+            self._put(_END)
+            raise StopAsyncIteration
+        # A notification too large for one datagram carries its first block only
+        return await self.client._complete_block2(self.endpoint, self.addr, GET, self.options, item)
+
+    async def cancel(self):
+        """Deregister (GET with Observe = 1) and end the iteration."""
+        if self._closed:
+            return
+        self._end()
+        options = [(number, value) for number, value in self.options if number != OPT_OBSERVE]
+        options.append((OPT_OBSERVE, encode_uint(OBSERVE_DEREGISTER)))
+        try:
+            await asyncio.wait_for(self.client._exchange(self.endpoint, self.addr, GET, options, b"", True, self.token), 5)
+        except (CoapError, asyncio.TimeoutError) as e:
+            # The server drops the observer on its next notification anyway (we answer with RST)
+            logger.debug(f"CoAP observe deregistration failed: {e}")
+
+
+class CoapClient:
+    """
+    CoAP client over shared UDP sockets, one per address family. At most
+    `nstart` exchanges are outstanding per endpoint (RFC 7252 section 4.7);
+    exchanges with different motes run concurrently. Bodies larger than
+    `block_size` are sent block-wise and block-wise responses are reassembled.
+    """
+
+    def __init__(
+        self,
+        nstart: int = 1,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        ack_timeout: float = ACK_TIMEOUT,
+        max_retransmit: int = MAX_RETRANSMIT
+    ):
+        encode_block(0, False, block_size)
+        self.nstart = nstart
+        self.block_size = block_size
+        self.ack_timeout = ack_timeout
+        self.max_retransmit = max_retransmit
+        self._endpoints: Dict[int, _Endpoint] = {}
+        self._message_id = random.randrange(0x10000)
+        self._acks: Dict[Tuple[Any, int], asyncio.Future] = {}
+        self._responses: Dict[bytes, asyncio.Future] = {}
+        self._observations: Dict[bytes, CoapObservation] = {}
+        self._limits: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+        # Recently received confirmable messages, to re-ACK duplicates without redelivering
+        self._seen: "OrderedDict[Tuple[Any, int], int]" = OrderedDict()
+        self.counters = {
+            "requests": 0,
+            "retransmissions": 0,
+            "timeouts": 0,
+            "resets": 0,
+            "blocks": 0,
+            "notifications": 0
+        }
+
+    # -- public API ---------------------------------------------------------
+
+    async def request(
+        self,
+        host: str,
+        method: str = "GET",
+        path: str = "",
+        payload: bytes = b"",
+        port: int = COAP_PORT,
+        query: Optional[Dict[str, Any]] = None,
+        content_format: Optional[int] = None,
+        accept: Optional[int] = None,
+        confirmable: bool = True,
+        uri_host: Optional[str] = None
+    ) -> CoapMessage:
+        """One request; the returned response carries the whole (reassembled) body."""
+        code = METHODS.get(method.upper())
+        if code is None:
+            raise ValueError(f"Unsupported CoAP method: {method}")
+        endpoint, addr = await self._endpoint_for(host, port)
+        options = request_options(uri_host, path, query, content_format, accept)
+        self.counters["requests"] += 1
+        async with self._limit(addr):
+            if len(payload) > self.block_size:
+                response = await self._send_block1(endpoint, addr, code, options, payload, confirmable)
+            else:
+                response = await self._exchange(endpoint, addr, code, options, payload, confirmable)
+            return await self._complete_block2(endpoint, addr, code, options, response, confirmable)
+
+    async def observe(
+        self,
+        host: str,
+        path: str,
+        port: int = COAP_PORT,
+        query: Optional[Dict[str, Any]] = None,
+        accept: Optional[int] = None,
+        uri_host: Optional[str] = None,
+        maxsize: int = 64
+    ) -> CoapObservation:
+        """Register as an observer; the first item of the observation is the current state."""
+        endpoint, addr = await self._endpoint_for(host, port)
+        options = request_options(uri_host, path, query, None, accept)
+        token = self._new_token()
+        observation = CoapObservation(self, endpoint, addr, options, token, maxsize)
+        # Registered before sending, so the response and notifications are routed to it
+        self._observations[token] = observation
+        register = options + [(OPT_OBSERVE, encode_uint(OBSERVE_REGISTER))]
+        self.counters["requests"] += 1
+        try:
+            async with self._limit(addr):
+                ack = await self._send_confirmable(
+                    endpoint, addr, CoapMessage(CON, GET, self._next_message_id(), token, register)
+                )
+        except BaseException:
+            self._observations.pop(token, None)
+            raise
+        if ack.code != EMPTY:
+            observation._deliver(ack)
+        return observation
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "sockets": len(self._endpoints),
+            "in_flight": len(self._responses),
+            "observations": len(self._observations)
+        }
+
+    def close(self):
+        for observation in list(self._observations.values()):
+            observation._end()
+        for future in list(self._acks.values()) + list(self._responses.values()):
+            if not future.done():
+                future.set_exception(CoapError("CoAP client closed"))
+        for endpoint in self._endpoints.values():
+            if endpoint.transport is not None:
+                endpoint.transport.close()
+        self._endpoints.clear()
+
+    # -- exchanges ------------------------------------------------------------
+
+    def _limit(self, addr: Tuple) -> asyncio.Semaphore:
+        key = _addr_key(addr)
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.nstart)
+        return limit
+
+    def _next_message_id(self) -> int:
+        self._message_id = (self._message_id + 1) & 0xFFFF
+        return self._message_id
+
+    def _new_token(self) -> bytes:
+        while True:
+            token = os.urandom(4)
+            if token not in self._responses and token not in self._observations:
+                return token
+
+    async def _endpoint_for(self, host: str, port: int) -> Tuple[_Endpoint, Tuple]:
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+        if not infos:
+            raise CoapError(f"Cannot resolve {host}")
+        family, _, _, _, addr = infos[0]
+        endpoint = self._endpoints.get(family)
+        if endpoint is None:
+            bind = ("::", 0) if family == socket.AF_INET6 else ("0.0.0.0", 0)
+            _, created = await loop.create_datagram_endpoint(lambda: _Endpoint(self), local_addr=bind, family=family)
+            endpoint = self._endpoints.setdefault(family, created)
+            if endpoint is not created:
+                created.transport.close()
+        return endpoint, addr
+
+    async def _exchange(
+        self,
+        endpoint: _Endpoint,
+        addr: Tuple,
+        code: int,
+        options: List[Tuple[int, bytes]],
+        payload: bytes,
+        confirmable: bool = True,
+        token: Optional[bytes] = None
+    ) -> CoapMessage:
+        token = token or self._new_token()
+        message = CoapMessage(CON if confirmable else NON, code, self._next_message_id(), token, options, payload)
+        response = asyncio.get_running_loop().create_future()
+        self._responses[token] = response
+        try:
+            if confirmable:
+                ack = await self._send_confirmable(endpoint, addr, message)
+                if ack.code != EMPTY:
+                    return ack
+            else:
+                endpoint.transport.sendto(message.encode(), addr)
+            # Separate response (or NON): bounded by the caller's deadline
+            return await response
+        finally:
+            self._responses.pop(token, None)
+
+    async def _send_confirmable(self, endpoint: _Endpoint, addr: Tuple, message: CoapMessage) -> CoapMessage:
+        """Send a CON until it is acknowledged; returns the ACK (possibly with a piggybacked response)."""
+        key = (_addr_key(addr), message.message_id)
+        ack = asyncio.get_running_loop().create_future()
+        self._acks[key] = ack
+        data = message.encode()
+        timeout = self.ack_timeout * random.uniform(1, ACK_RANDOM_FACTOR)
+        try:
+            for attempt in range(self.max_retransmit + 1):
+                if attempt:
+                    self.counters["retransmissions"] += 1
+                endpoint.transport.sendto(data, addr)
+                try:
+                    reply = await asyncio.wait_for(asyncio.shield(ack), timeout)
+                except asyncio.TimeoutError:
+                    timeout *= 2
+                    continue
+                if reply.mtype == RST:
+                    self.counters["resets"] += 1
+                    raise CoapError(f"CoAP request reset by {addr[0]}")
+                return reply
+            self.counters["timeouts"] += 1
+            raise CoapError(f"No CoAP ACK from {addr[0]} after {self.max_retransmit} retransmissions")
+        finally:
+            self._acks.pop(key, None)
+
+    async def _send_block1(
+        self,
+        endpoint: _Endpoint,
+        addr: Tuple,
+        code: int,
+        options: List[Tuple[int, bytes]],
+        payload: bytes,
+        confirmable: bool
+    ) -> CoapMessage:
+        size = self.block_size
+        num = 0
+        while True:
+            chunk = payload[num * size:(num + 1) * size]
+            more = (num + 1) * size < len(payload)
+            self.counters["blocks"] += 1
+            response = await self._exchange(
+                endpoint, addr, code, options + [(OPT_BLOCK1, encode_block(num, more, size))], chunk, confirmable
+            )
+            if not more or response.code != CONTINUE:
+                return response
+            block1 = response.opt(OPT_BLOCK1)
+            if block1 is not None:
+                # The server may ask for smaller blocks (RFC 7959 section 2.3)
+                _, _, server_size = decode_block(block1)
+                if server_size < size:
+                    num = (num + 1) * size // server_size
+                    size = server_size
+                    continue
+            num += 1
+
+    async def _complete_block2(
+        self,
+        endpoint: _Endpoint,
+        addr: Tuple,
+        code: int,
+        options: List[Tuple[int, bytes]],
+        response: CoapMessage,
+        confirmable: bool = True
+    ) -> CoapMessage:
+        block2 = response.opt(OPT_BLOCK2)
+        if block2 is None or not response.success:
+            return response
+        num, more, size = decode_block(block2)
+        body = bytearray(response.payload)
+        etag = response.opt(OPT_ETAG)
+        # Later blocks are fetched with GET on the same resource, also after a POST/PUT
+        skip = (OPT_OBSERVE, OPT_BLOCK1, OPT_BLOCK2, OPT_CONTENT_FORMAT)
+        base = [(number, value) for number, value in options if number not in skip]
+        while more:
+            self.counters["blocks"] += 1
+            block = await self._exchange(
+                endpoint, addr, GET, base + [(OPT_BLOCK2, encode_block(num + 1, False, size))], b"", confirmable
+            )
+            if not block.success:
+                return block
+            if etag is not None and block.opt(OPT_ETAG) not in (None, etag):
+                raise CoapError("Representation changed during block-wise transfer")
+            num, more, size = decode_block(block.opt(OPT_BLOCK2) or encode_block(num + 1, False, size))
+            body += block.payload
+        return CoapMessage(response.mtype, response.code, response.message_id, response.token,
+                           response.without(OPT_BLOCK2), bytes(body))
+
+    # -- datagrams ------------------------------------------------------------
+
+    def _received(self, endpoint: _Endpoint, data: bytes, addr: Tuple):
+        try:
+            message = CoapMessage.decode(data)
+        except ValueError as e:
+            logger.debug(f"Dropping malformed CoAP datagram from {addr[0]}: {e}")
+            return
+        key = _addr_key(addr)
+
+        if message.mtype in (ACK, RST):
+            ack = self._acks.get((key, message.message_id))
+            if ack is not None and not ack.done():
+                ack.set_result(message)
+            return
+
+        target = self._observations.get(message.token) or self._responses.get(message.token)
+        if message.code >> 5 == 0 or target is None:
+            # Ping, a request (this side serves nothing) or an unknown token
+            # (e.g. an observation we dropped): reset it
+            endpoint.transport.sendto(CoapMessage(RST, EMPTY, message.message_id).encode(), addr)
+            return
+
+        if message.mtype == CON:
+            endpoint.transport.sendto(CoapMessage(ACK, EMPTY, message.message_id).encode(), addr)
+            seen = (key, message.message_id)
+            if seen in self._seen:
+                return
+            self._seen[seen] = 1
+            if len(self._seen) > 256:
+                self._seen.popitem(last=False)
+
+        if isinstance(target, CoapObservation):
+            target._deliver(message)
+        elif not target.done():
+            target.set_result(message)
+
+
+class LoopbackCoapServer(asyncio.DatagramProtocol):
+    """
+    In-process stand-in for a mote's CoAP engine. Resources are JSON values
+    keyed by (Uri-Host, path): GET returns one, PUT/POST store the payload,
+    DELETE removes it. Responses larger than `block_size` go out block-wise,
+    Block1 uploads are reassembled, and observers are notified (NON) whenever
+    a resource changes.
+    """
+
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        self.resources: Dict[Tuple[str, str], Any] = {}
+        self.requests = 0
+        self.local_addr: Optional[Tuple[str, int]] = None
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._observers: Dict[Tuple[str, str], Dict[Tuple[Tuple[str, int], bytes], Tuple]] = {}
+        self._uploads: Dict[Tuple, bytearray] = {}
+        self._sequence = 0
+        self._message_id = random.randrange(0x10000)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> Tuple[str, int]:
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        return self.local_addr
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self.local_addr = transport.get_extra_info("sockname")[:2]
+
+    def set_resource(self, host: str, path: str, value: Any):
+        key = (host, path.strip("/"))
+        self.resources[key] = value
+        self._notify(key)
+
+    def observers(self, host: str, path: str) -> int:
+        return len(self._observers.get((host, path.strip("/")), {}))
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            message = CoapMessage.decode(data)
+        except ValueError:
+            return
+        if message.mtype == RST:
+            # Reset of a notification: that observer is gone
+            for observers in self._observers.values():
+                for observer, (_, _, message_id) in list(observers.items()):
+                    if observer[0] == _addr_key(addr) and message_id == message.message_id:
+                        del observers[observer]
+            return
+        if message.mtype == ACK:
+            return
+        if message.code == EMPTY:
+            if message.mtype == CON:
+                self._transport.sendto(CoapMessage(RST, EMPTY, message.message_id).encode(), addr)
+            return
+        if message.code >> 5:
+            return
+
+        self.requests += 1
+        code, options, payload = self._handle(message, addr)
+        if message.mtype == CON:
+            reply = CoapMessage(ACK, code, message.message_id, message.token, options, payload)
+        else:
+            reply = CoapMessage(NON, code, self._next_message_id(), message.token, options, payload)
+        self._transport.sendto(reply.encode(), addr)
+
+    def _next_message_id(self) -> int:
+        self._message_id = (self._message_id + 1) & 0xFFFF
+        return self._message_id
+
+    def _representation(self, key: Tuple[str, str]) -> bytes:
+        host, path = key
+        return json.dumps({"host": host, "resource": path, "value": self.resources.get(key)}).encode()
+
+    def _block(self, body: bytes, num: int, size: int) -> Tuple[List[Tuple[int, bytes]], bytes]:
+        size = min(size, self.block_size)
+        if len(body) <= size and num == 0:
+            return [], body
+        more = (num + 1) * size < len(body)
+        return [(OPT_BLOCK2, encode_block(num, more, size))], body[num * size:(num + 1) * size]
+
+    def _handle(self, message: CoapMessage, addr) -> Tuple[int, List[Tuple[int, bytes]], bytes]:
+        host = (message.opt(OPT_URI_HOST) or b"").decode()
+        path = "/".join(segment.decode() for segment in message.opts(OPT_URI_PATH))
+        key = (host, path)
+        payload = message.payload
+        options = [(OPT_CONTENT_FORMAT, encode_uint(FORMAT_JSON))]
+
+        block1 = message.opt(OPT_BLOCK1)
+        if block1 is not None:
+            num, more, size = decode_block(block1)
+            upload_key = (_addr_key(addr), key)
+            if num == 0:
+                self._uploads[upload_key] = bytearray()
+            upload = self._uploads.get(upload_key)
+            if upload is None or len(upload) != num * size:
+                self._uploads.pop(upload_key, None)
+                return REQUEST_ENTITY_INCOMPLETE, [], b""
+            upload += payload
+            if more:
+                return CONTINUE, [(OPT_BLOCK1, encode_block(num, True, size))], b""
+            payload = bytes(self._uploads.pop(upload_key))
+            options.append((OPT_BLOCK1, encode_block(num, False, size)))
+
+        if message.code == GET:
+            observe = message.opt(OPT_OBSERVE)
+            if observe is not None:
+                observers = self._observers.setdefault(key, {})
+                observer = (_addr_key(addr), message.token)
+                if decode_uint(observe) == OBSERVE_REGISTER:
+                    observers[observer] = (addr, message.token, None)
+                    options.append((OPT_OBSERVE, encode_uint(self._sequence)))
+                else:
+                    observers.pop(observer, None)
+            num, _, size = decode_block(message.opt(OPT_BLOCK2)) if message.opt(OPT_BLOCK2) else (0, False, self.block_size)
+            block_options, body = self._block(self._representation(key), num, size)
+            return CONTENT, options + block_options, body
+
+        if message.code in (POST, PUT):
+            try:
+                value = json.loads(payload) if payload else None
+            except ValueError:
+                value = payload.decode(errors="replace")
+            self.resources[key] = value
+            self._notify(key)
+            block_options, body = self._block(self._representation(key), 0, self.block_size)
+            return CHANGED, options + block_options, body
+
+        if message.code == DELETE:
+            self.resources.pop(key, None)
+            self._notify(key)
+            return DELETED, [], b""
+
+        return METHOD_NOT_ALLOWED, [], b""
+
+    def _notify(self, key: Tuple[str, str]):
+        observers = self._observers.get(key)
+        if not observers or self._transport is None:
+            return
+        self._sequence = (self._sequence + 1) & 0xFFFFFF
+        block_options, body = self._block(self._representation(key), 0, self.block_size)
+        for observer, (addr, token, _) in list(observers.items()):
+            message_id = self._next_message_id()
+            observers[observer] = (addr, token, message_id)
+            options = [(OPT_OBSERVE, encode_uint(self._sequence)), (OPT_CONTENT_FORMAT, encode_uint(FORMAT_JSON))]
+            self._transport.sendto(CoapMessage(NON, CONTENT, message_id, token, options + block_options, body).encode(), addr)
+
+
+def decode_payload(message: CoapMessage) -> Any:
+    """Response body as JSON, text or hex, following its Content-Format."""
+    if not message.payload:
+        return None
+    if message.content_format in (FORMAT_JSON, None):
+        try:
+            return json.loads(message.payload)
+        except ValueError:
+            if message.content_format == FORMAT_JSON:
+                return message.payload.decode(errors="replace")
+    try:
+        return message.payload.decode()
+    except UnicodeDecodeError:
+        return message.payload.hex()
@@ -0,0 +1,312 @@
+"""Flow-table compaction for SDN-WISE motes.
+
+A mote's flow table holds MAX_FLOW_RULES (10) entries (sdn-wise-agent.c); any
+packet without a matching rule is punted to the controller. Per-hop plans from
+the route compiler give every relay one rule per (src, dst) route through it,
+so relays near a sink overflow quickly.
+
+The compactor rebuilds a plan route by route:
+- rules on a node that share (dst, action, nextHop) collapse into one rule with
+  a wildcard source (ADDR_ANY); motes try exact (src, dst) rules first, so
+  routes that disagree with the wildcard keep an exact rule
+- routes are placed in descending traffic volume, so when a table is full it is
+  the low-volume routes that get displaced
+- a displaced route is spilled onto an alternative path that only uses hops
+  whose tables still have room (or can absorb it into an existing aggregate)
+- routes that cannot be placed at all are reported as unplaced
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import heapq
+import logging
+
+from .routing import ACTION_FORWARD, RouteCompiler
+
+logger = logging.getLogger(__name__)
+
+MAX_FLOW_RULES = 10
+ADDR_ANY = 0xFFFF
+
+Route = Tuple[int, int]
+
+
+class FlowTable:
+    """Planned flow table of one node: {(dst, action): {nextHop: {src: volume}}}."""
+
+    def __init__(self, node_id: int, capacity: int):
+        self.node_id = node_id
+        self.capacity = capacity
+        self.groups: Dict[Tuple[int, int], Dict[int, Dict[int, float]]] = {}
+        self.pinned: List[Dict[str, Any]] = []
+        self._grouped = 0
+
+    @staticmethod
+    def _entries(by_hop: Dict[int, Dict[int, float]]) -> int:
+        # The biggest nextHop group becomes one wildcard rule, the others stay exact
+        if not by_hop:
+            return 0
+        sizes = sorted((len(srcs) for srcs in by_hop.values()), reverse=True)
+        return 1 + sum(sizes[1:])
+
+    def size(self) -> int:
+        return len(self.pinned) + self._grouped
+
+    def cost_of_adding(self, src: int, dst: int, action: int, next_hop: int) -> int:
+        by_hop = self.groups.get((dst, action))
+        if not by_hop:
+            return 1
+        if len(by_hop) == 1 and next_hop in by_hop:
+            # Joins the only group: absorbed by its (wildcard) rule
+            return 0
+        before = self._entries(by_hop)
+        trial = {hop: len(srcs) for hop, srcs in by_hop.items()}
+        trial[next_hop] = trial.get(next_hop, 0) + (0 if src in by_hop.get(next_hop, {}) else 1)
+        sizes = sorted(trial.values(), reverse=True)
+        return 1 + sum(sizes[1:]) - before
+
+    def fits(self, src: int, dst: int, action: int, next_hop: int) -> bool:
+        by_hop = self.groups.get((dst, action))
+        if by_hop is not None and len(by_hop) == 1 and next_hop in by_hop:
+            return True
+        return self.size() + self.cost_of_adding(src, dst, action, next_hop) <= self.capacity
+
+    def add(self, src: int, dst: int, action: int, next_hop: int, volume: float):
+        by_hop = self.groups.setdefault((dst, action), {})
+        if len(by_hop) == 1 and next_hop in by_hop:
+            by_hop[next_hop][src] = volume
+            return
+        before = self._entries(by_hop) if len(by_hop) > 1 or next_hop not in by_hop else 1
+        by_hop.setdefault(next_hop, {})[src] = volume
+        after = self._entries(by_hop) if len(by_hop) > 1 else 1
+        self._grouped += after - before
+
+    def rules(self) -> List[Dict[str, Any]]:
+        rules = list(self.pinned)
+        for (dst, action), by_hop in self.groups.items():
+            # Wildcard goes to the group carrying the most traffic
+            ranked = sorted(by_hop.items(), key=lambda item: (len(item[1]), sum(item[1].values())), reverse=True)
+            for i, (hop, srcs) in enumerate(ranked):
+                if i == 0 and len(srcs) > 1:
+                    rules.append({
+                        "nodeId": self.node_id,
+                        "srcAddr": ADDR_ANY,
+                        "dstAddr": dst,
+                        "action": action,
+                        "nextHop": hop,
+                        "aggregates": sorted(srcs),
+                        "description": f"Aggregate of {len(srcs)} routes to {dst} via {hop}"
+                    })
+                    continue
+                for src in sorted(srcs):
+                    rules.append({
+                        "nodeId": self.node_id,
+                        "srcAddr": src,
+                        "dstAddr": dst,
+                        "action": action,
+                        "nextHop": hop
+                    })
+        return rules
+
+
+class FlowCompactor:
+    """
+    Fits a flow plan into per-node flow-table capacity.
+
+    traffic maps a source node (or "src->dst") to its expected packet rate;
+    routes without an entry count as volume 1. Spilling needs the topology (or
+    an already built RouteCompiler) to find alternative paths; without it
+    overflowing routes are only reported.
+    """
+
+    def __init__(
+        self,
+        capacity: int = MAX_FLOW_RULES,
+        topology: Optional[Dict[str, Any]] = None,
+        metric: str = "hops",
+        traffic: Optional[Dict[Any, float]] = None,
+        router: Optional[RouteCompiler] = None
+    ):
+        if capacity < 1:
+            raise ValueError(f"Flow table capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.traffic = {str(k): float(v) for k, v in (traffic or {}).items()}
+        if router is None and topology and topology.get("links"):
+            router = RouteCompiler(topology, metric=metric)
+        self.router = router
+
+    def volume(self, src: int, dst: int) -> float:
+        return self.traffic.get(f"{src}->{dst}", self.traffic.get(str(src), 1.0))
+
+    @staticmethod
+    def routes_from_flows(flows: Iterable[Dict[str, Any]]) -> Tuple[Dict[Route, List[int]], List[Dict[str, Any]]]:
+        """Rebuild (src, dst) -> path from per-hop forward rules; other rules are returned as pinned."""
+        hops: Dict[Tuple[int, int, int], int] = {}
+        pinned = []
+        for flow in flows:
+            if int(flow.get("action", ACTION_FORWARD)) != ACTION_FORWARD or int(flow["srcAddr"]) == ADDR_ANY:
+                pinned.append(flow)
+                continue
+            hops[(int(flow["nodeId"]), int(flow["srcAddr"]), int(flow["dstAddr"]))] = int(flow["nextHop"])
+
+        by_route: Dict[Route, Dict[int, int]] = {}
+        for (node, src, dst), hop in hops.items():
+            by_route.setdefault((src, dst), {})[node] = hop
+
+        routes: Dict[Route, List[int]] = {}
+        for (src, dst), next_of in by_route.items():
+            # Start at the source, or (for plans that only program relays) at a
+            # hop no other rule of the route forwards to
+            if src in next_of:
+                start = src
+            else:
+                heads = set(next_of) - set(next_of.values())
+                start = min(heads) if heads else min(next_of)
+            path = [start]
+            seen = {start}
+            current = start
+            while current != dst and current in next_of:
+                current = next_of[current]
+                if current in seen:
+                    break
+                path.append(current)
+                seen.add(current)
+            routes[(src, dst)] = path
+
+        # Any hop not covered by a reconstructed route (e.g. a loop) is kept verbatim
+        covered = set()
+        for (src, dst), path in routes.items():
+            covered.update((node, src, dst) for node in path[:-1])
+        for key, hop in hops.items():
+            if key not in covered:
+                node, src, dst = key
+                pinned.append({"nodeId": node, "srcAddr": src, "dstAddr": dst, "action": ACTION_FORWARD, "nextHop": hop})
+        return routes, pinned
+
+    def _spill_path(self, tables: Dict[int, FlowTable], src: int, dst: int) -> Optional[List[int]]:
+        """Cheapest path src -> dst using only hops whose table can take the route."""
+        if self.router is None or dst not in self.router.reverse_adj:
+            return None
+        dist = {dst: 0.0}
+        next_hop: Dict[int, int] = {}
+        heap = [(0.0, dst)]
+        while heap:
+            d, v = heapq.heappop(heap)
+            if v == src:
+                break
+            if d > dist[v]:
+                continue
+            for u, cost in self.router.reverse_adj[v]:
+                table = tables.get(u)
+                if table is not None and not table.fits(src, dst, ACTION_FORWARD, v):
+                    continue
+                nd = d + cost
+                if nd < dist.get(u, float("inf")):
+                    dist[u] = nd
+                    next_hop[u] = v
+                    heapq.heappush(heap, (nd, u))
+        return RouteCompiler.path_from_tree(src, dst, next_hop)
+
+    def compact(
+        self,
+        flows: List[Dict[str, Any]],
+        routes: Optional[Dict[Route, List[int]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Return the compacted plan: flows, per-node utilization and spill/unplaced routes.
+
+        routes ({(src, dst): path}) can be passed when the caller already has
+        them (RouteCompiler.compile_flows), which skips rebuilding them from flows.
+        """
+        if routes is None:
+            routes, pinned = self.routes_from_flows(flows)
+        else:
+            pinned = []
+
+        tables: Dict[int, FlowTable] = {}
+        capacity = self.capacity
+
+        def table(node: int) -> FlowTable:
+            found = tables.get(node)
+            if found is None:
+                found = tables[node] = FlowTable(node, capacity)
+            return found
+
+        for flow in pinned:
+            table(int(flow["nodeId"])).pinned.append(flow)
+
+        # Routes that do not reach their destination cannot be compacted safely
+        partial = {key: path for key, path in routes.items() if path[-1] != key[1]}
+        for (src, dst), path in partial.items():
+            for node, hop in zip(path, path[1:]):
+                table(node).pinned.append({"nodeId": node, "srcAddr": src, "dstAddr": dst, "action": ACTION_FORWARD, "nextHop": hop})
+
+        volumes = {key: self.volume(*key) for key in routes if key not in partial}
+        ordered = sorted(volumes, key=lambda key: (-volumes[key], len(routes[key]), key))
+
+        spilled: Dict[str, Dict[str, Any]] = {}
+        unplaced: List[Dict[str, Any]] = []
+        for src, dst in ordered:
+            path = routes[(src, dst)]
+            volume = volumes[(src, dst)]
+            group = (dst, ACTION_FORWARD)
+            hops = list(zip(path, path[1:]))
+            # Most hops join the single existing group of their node (a tree
+            # converging on the sink); only other hops need the full check
+            fits = True
+            for node, hop in hops:
+                current = tables.get(node)
+                if current is None:
+                    continue
+                by_hop = current.groups.get(group)
+                if by_hop is not None and len(by_hop) == 1 and hop in by_hop:
+                    continue
+                if not current.fits(src, dst, ACTION_FORWARD, hop):
+                    fits = False
+                    break
+            if not fits:
+                alternative = self._spill_path(tables, src, dst)
+                if alternative is None:
+                    unplaced.append({"srcAddr": src, "dstAddr": dst, "volume": volume, "path": path})
+                    continue
+                spilled[f"{src}->{dst}"] = {"original": path, "path": alternative}
+                hops = list(zip(alternative, alternative[1:]))
+            for node, hop in hops:
+                current = tables.get(node)
+                by_hop = current.groups.get(group) if current is not None else None
+                if by_hop is not None and len(by_hop) == 1 and hop in by_hop:
+                    by_hop[hop][src] = volume
+                else:
+                    table(node).add(src, dst, ACTION_FORWARD, hop, volume)
+
+        if unplaced:
+            logger.warning(f"{len(unplaced)} route(s) do not fit in flow tables of capacity {self.capacity}")
+
+        compacted: List[Dict[str, Any]] = []
+        utilization: Dict[str, Dict[str, Any]] = {}
+        for node in sorted(tables):
+            rules = tables[node].rules()
+            compacted.extend(rules)
+            utilization[str(node)] = {
+                "rules": len(rules),
+                "capacity": self.capacity,
+                "utilization": round(len(rules) / self.capacity, 3),
+                "aggregated_rules": sum(1 for r in rules if r["srcAddr"] == ADDR_ANY),
+                "over_capacity": len(rules) > self.capacity
+            }
+
+        peak = max((u["utilization"] for u in utilization.values()), default=0.0)
+        return {
+            "flows": compacted,
+            "utilization": utilization,
+            "spilled": spilled,
+            "unplaced": unplaced,
+            "summary": {
+                "input_rules": len(flows),
+                "output_rules": len(compacted),
+                "aggregated_rules": sum(u["aggregated_rules"] for u in utilization.values()),
+                "routes": len(routes),
+                "spilled_routes": len(spilled),
+                "unplaced_routes": len(unplaced),
+                "nodes_over_capacity": sum(1 for u in utilization.values() if u["over_capacity"]),
+                "peak_utilization": peak
+            }
+        }
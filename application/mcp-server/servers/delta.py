@@ -0,0 +1,398 @@
+"""Binary deltas between firmware images.
+
+A delta rebuilds a target image from a base image the device already runs:
+
+    header:  MAGIC | base sha256 (32 bytes) | target sha256 (32) | target size (u64)
+    body:    zlib stream of ops
+             0x01 COPY   base offset (u64), length (u32)
+             0x02 INSERT length (u32), bytes
+             0x00 END
+
+Matching is rsync-style: the base is indexed by a polynomial hash of every
+aligned BLOCK_SIZE block, the hash of every window of the target is computed
+with numpy from prefix sums, and candidate hits are verified and extended
+byte-wise. Both images are memory-mapped and the target is hashed one
+SEGMENT at a time, so working memory stays bounded by the segment size plus
+a small per-block index rather than by the image size. Every delta is
+applied and checked against the target SHA-256 before it is kept.
+
+Deltas are built in a process pool (spawn context; the server has threads)
+so hashing never competes with request handling for the GIL, and are stored
+in the firmware store as ordinary content-addressed artifacts, which makes
+them downloadable with Range like full images. numpy is optional: without
+it no deltas are built and devices get full images.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from .firmware import CHUNK_SIZE, FirmwareStore, hash_file
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+
+    _numpy_available = True
+except Exception:
+    np = None
+    _numpy_available = False
+
+MAGIC = b"MCPDLT01"
+DELTA_FORMAT = "mcp-delta-v1"
+BLOCK_SIZE = 512
+SEGMENT = 1 << 20
+# A delta this close to the full image size is not worth a second download path
+MAX_USEFUL_RATIO = 0.8
+
+_HASH_BASE = 0x100000001B3           # odd, so it is invertible mod 2**64
+_HASH_INV = pow(_HASH_BASE, -1, 1 << 64)
+_HEADER = struct.Struct(">8s32s32sQ")
+_COPY = struct.Struct(">BQI")
+_INSERT = struct.Struct(">BI")
+OP_END, OP_COPY, OP_INSERT = 0, 1, 2
+
+
+def delta_available() -> bool:
+    return _numpy_available
+
+
+def _powers(base: int, count: int):
+    powers = np.empty(count, dtype=np.uint64)
+    powers[0] = 1
+    if count > 1:
+        powers[1:] = base
+        np.cumprod(powers, out=powers)
+    return powers
+
+
+class _WindowHasher:
+    """Hash of every `width`-byte window of a buffer, computed segment by segment."""
+
+    def __init__(self, width: int, segment: int = SEGMENT):
+        self.width = width
+        self.segment = segment
+        self._pow = _powers(_HASH_BASE, segment + width)
+        self._inv = _powers(_HASH_INV, segment)
+
+    def hashes(self, data, start: int, stop: int):
+        """Hashes of windows starting at start..stop-1 (stop - start <= segment)."""
+        count = stop - start
+        x = np.frombuffer(data, dtype=np.uint8, count=count + self.width - 1, offset=start).astype(np.uint64)
+        prefix = np.zeros(len(x) + 1, dtype=np.uint64)
+        np.cumsum(x * self._pow[:len(x)], out=prefix[1:])
+        return (prefix[self.width:self.width + count] - prefix[:count]) * self._inv[:count]
+
+
+def _match_length(target, t: int, base, b: int, limit: int) -> int:
+    """Length of the common run of target[t:] and base[b:], up to limit."""
+    length = 0
+    while length < limit:
+        step = min(CHUNK_SIZE, limit - length)
+        left = target[t + length:t + length + step]
+        right = base[b + length:b + length + step]
+        if left == right:
+            length += step
+            continue
+        diff = np.frombuffer(left, dtype=np.uint8) != np.frombuffer(right, dtype=np.uint8)
+        return length + int(np.argmax(diff))
+    return length
+
+
+class _DeltaWriter:
+    def __init__(self, out, base_sha: str, target_sha: str, target_size: int):
+        self.out = out
+        self.out.write(_HEADER.pack(MAGIC, bytes.fromhex(base_sha), bytes.fromhex(target_sha), target_size))
+        self._zlib = zlib.compressobj(6)
+        self.copied = 0
+        self.inserted = 0
+        self.ops = 0
+
+    def _emit(self, data: bytes):
+        self.out.write(self._zlib.compress(data))
+
+    def copy(self, offset: int, length: int):
+        while length > 0:
+            step = min(length, 0xFFFFFFFF)
+            self._emit(_COPY.pack(OP_COPY, offset, step))
+            offset += step
+            length -= step
+            self.copied += step
+            self.ops += 1
+
+    def insert(self, data):
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = bytes(data[start:start + CHUNK_SIZE])
+            self._emit(_INSERT.pack(OP_INSERT, len(chunk)))
+            self._emit(chunk)
+            self.inserted += len(chunk)
+            self.ops += 1
+
+    def close(self):
+        self._emit(bytes([OP_END]))
+        self.out.write(self._zlib.flush())
+
+
+def generate_delta(base_path: str, target_path: str, out_path: str, block_size: int = BLOCK_SIZE) -> Dict[str, Any]:
+    """Write a delta from base to target at out_path, then verify it by applying it."""
+    if not _numpy_available:
+        raise RuntimeError("numpy is required to build firmware deltas")
+    started = time.time()
+    base_sha, base_size = hash_file(Path(base_path))
+    target_sha, target_size = hash_file(Path(target_path))
+
+    with open(base_path, "rb") as bf, open(target_path, "rb") as tf, open(out_path, "wb") as out:
+        base = mmap.mmap(bf.fileno(), 0, access=mmap.ACCESS_READ)
+        target = mmap.mmap(tf.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            writer = _DeltaWriter(out, base_sha, target_sha, target_size)
+            hasher = _WindowHasher(block_size)
+
+            # Aligned base blocks: hash -> first offset
+            block_hashes, block_offsets = [], []
+            for start in range(0, base_size - block_size + 1, hasher.segment):
+                stop = min(start + hasher.segment, base_size - block_size + 1)
+                aligned = np.arange(start + (-start % block_size), stop, block_size)
+                block_hashes.append(hasher.hashes(base, start, stop)[aligned - start])
+                block_offsets.append(aligned)
+            if block_hashes:
+                hashes = np.concatenate(block_hashes)
+                offsets = np.concatenate(block_offsets)
+                hashes, first = np.unique(hashes, return_index=True)
+                offsets = offsets[first]
+            else:
+                hashes = offsets = np.empty(0, dtype=np.uint64)
+
+            pos = 0                 # first target byte not yet encoded
+            last_window = target_size - block_size + 1
+            start = 0
+            while start < last_window and len(hashes):
+                stop = min(start + hasher.segment, last_window)
+                window = hasher.hashes(target, start, stop)
+                found = np.isin(window, hashes)
+                candidates = np.nonzero(found)[0] + start
+                slots = np.searchsorted(hashes, window[candidates - start])
+                k = int(np.searchsorted(candidates, pos))
+                while k < len(candidates):
+                    t = int(candidates[k])
+                    b = int(offsets[slots[k]])
+                    if target[t:t + block_size] != base[b:b + block_size]:
+                        k += 1
+                        continue
+                    length = block_size + _match_length(target, t + block_size, base, b + block_size,
+                                                        min(target_size - t, base_size - b) - block_size)
+                    # Grow backwards into bytes that would otherwise be inserted
+                    while t > pos and b > 0 and target[t - 1] == base[b - 1]:
+                        t -= 1
+                        b -= 1
+                        length += 1
+                    if t > pos:
+                        writer.insert(target[pos:t])
+                    writer.copy(b, length)
+                    pos = t + length
+                    k = int(np.searchsorted(candidates, pos))
+                start = max(stop, pos)
+            if pos < target_size:
+                writer.insert(target[pos:target_size])
+            writer.close()
+        finally:
+            base.close()
+            target.close()
+
+    stats = {
+        "format": DELTA_FORMAT,
+        "block_size": block_size,
+        "base_sha256": base_sha,
+        "target_sha256": target_sha,
+        "target_size_bytes": target_size,
+        "delta_size_bytes": os.path.getsize(out_path),
+        "copied_bytes": writer.copied,
+        "inserted_bytes": writer.inserted,
+        "ops": writer.ops,
+    }
+    stats["ratio"] = round(stats["delta_size_bytes"] / target_size, 4) if target_size else 1.0
+
+    # Never hand out a delta that does not reproduce the target
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(out_path), suffix=".check", delete=True) as check:
+        apply_delta(base_path, out_path, check.name)
+    stats["build_seconds"] = round(time.time() - started, 3)
+    return stats
+
+
+class _Inflater:
+    """Bounded reads from a zlib stream."""
+
+    def __init__(self, source):
+        self.source = source
+        self._zlib = zlib.decompressobj()
+        self._buffer = b""
+
+    def read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            if self._zlib.unconsumed_tail:
+                data = self._zlib.unconsumed_tail
+            else:
+                data = self.source.read(CHUNK_SIZE)
+                if not data:
+                    break
+            self._buffer += self._zlib.decompress(data, max(CHUNK_SIZE, size - len(self._buffer)))
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        if len(chunk) < size:
+            raise ValueError("Truncated firmware delta")
+        return chunk
+
+
+def apply_delta(base_path: str, delta_path: str, out_path: str) -> Dict[str, Any]:
+    """Rebuild the target image; reference for the device-side patcher."""
+    with open(delta_path, "rb") as delta, open(base_path, "rb") as base, open(out_path, "wb") as out:
+        magic, base_sha, target_sha, target_size = _HEADER.unpack(delta.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("Not a firmware delta")
+        if hash_file(Path(base_path))[0] != base_sha.hex():
+            raise ValueError("Delta does not apply to this base image")
+        ops = _Inflater(delta)
+        digest = hashlib.sha256()
+        written = 0
+        while True:
+            op = ops.read(1)[0]
+            if op == OP_END:
+                break
+            if op == OP_COPY:
+                _, offset, length = _COPY.unpack(bytes([op]) + ops.read(_COPY.size - 1))
+                base.seek(offset)
+                while length > 0:
+                    chunk = base.read(min(CHUNK_SIZE, length))
+                    if not chunk:
+                        raise ValueError("Delta copies past the end of the base image")
+                    out.write(chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+                    length -= len(chunk)
+            elif op == OP_INSERT:
+                _, length = _INSERT.unpack(bytes([op]) + ops.read(_INSERT.size - 1))
+                chunk = ops.read(length)
+                out.write(chunk)
+                digest.update(chunk)
+                written += length
+            else:
+                raise ValueError(f"Unknown delta op {op}")
+    if written != target_size or digest.hexdigest() != target_sha.hex():
+        raise ValueError("Delta output does not match the target image")
+    return {"target_sha256": target_sha.hex(), "target_size_bytes": written}
+
+
+class DeltaBuilder:
+    """
+    Builds and caches deltas between stored images in a process pool.
+    request() never blocks: it returns the cached delta, or schedules a
+    build and reports it as building.
+    """
+
+    def __init__(self, store: FirmwareStore, max_workers: int = 1, max_image_bytes: int = 64 << 20,
+                 block_size: int = BLOCK_SIZE):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_image_bytes = max_image_bytes
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def request(self, base_ref: str, target_ref: str) -> Dict[str, Any]:
+        base = self.store.get(base_ref)
+        target = self.store.get(target_ref)
+        key = (base["sha256"], target["sha256"])
+        if key[0] == key[1]:
+            return {"status": "unavailable", "reason": "Base and target are the same image"}
+
+        cached = self.store.get_delta(*key)
+        if cached is not None:
+            return cached
+        # Checked on disk: a build would fail the same way on every pull, and failures aren't cached
+        for sha in key:
+            try:
+                size = self.store.object_path(sha).stat().st_size
+            except FileNotFoundError:
+                return {"status": "unavailable", "reason": f"Image {sha[:12]} missing from the store"}
+            if size == 0:
+                # mmap can't map an empty file
+                return {"status": "unavailable", "reason": "Empty image"}
+        if not _numpy_available:
+            return {"status": "unavailable", "reason": "numpy not installed"}
+        if max(base["size_bytes"], target["size_bytes"]) > self.max_image_bytes:
+            return {"status": "unavailable", "reason": f"Image larger than {self.max_image_bytes} bytes"}
+
+        with self._lock:
+            if key not in self._inflight:
+                tmp_dir = self.store.root / "tmp"
+                tmp_dir.mkdir(parents=True, exist_ok=True)
+                out_path = tmp_dir / f"{key[0][:16]}-{key[1][:16]}.delta"
+                future = self._executor().submit(
+                    generate_delta, str(self.store.object_path(key[0])), str(self.store.object_path(key[1])),
+                    str(out_path), self.block_size
+                )
+                self._inflight[key] = future
+                future.add_done_callback(lambda f, key=key, out_path=out_path: self._finished(key, out_path, f))
+                logger.info(f"Building firmware delta {key[0][:12]} -> {key[1][:12]}")
+        return {"status": "building", "base_sha256": key[0], "target_sha256": key[1]}
+
+    def wait(self, base_ref: str, target_ref: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Request a delta and block until it is built (operator warm-up, not the request path)."""
+        status = self.request(base_ref, target_ref)
+        if status["status"] != "building":
+            return status
+        with self._lock:
+            future = self._inflight.get((status["base_sha256"], status["target_sha256"]))
+        if future is not None:
+            future.result(timeout)
+            # The done callback registers the result; it may still be running
+            for _ in range(100):
+                with self._lock:
+                    if (status["base_sha256"], status["target_sha256"]) not in self._inflight:
+                        break
+                time.sleep(0.01)
+        return self.request(base_ref, target_ref)
+
+    def _finished(self, key: Tuple[str, str], out_path: Path, future: Future):
+        try:
+            stats = future.result()
+            if stats["ratio"] > MAX_USEFUL_RATIO:
+                self.store.register_delta(*key, {"status": "unavailable", "reason": "Delta not smaller than image",
+                                                 **stats})
+            else:
+                artifact = self.store.put_file(out_path, metadata={
+                    "kind": "delta", "base_sha256": key[0], "target_sha256": key[1], "format": DELTA_FORMAT
+                })
+                self.store.register_delta(*key, {"status": "ready", "sha256": artifact["sha256"],
+                                                 "size_bytes": artifact["size_bytes"], **stats})
+            logger.info(f"Firmware delta {key[0][:12]} -> {key[1][:12]}: ratio {stats['ratio']}, "
+                        f"{stats['build_seconds']}s")
+        except Exception as e:
+            # Not cached: the next request retries
+            logger.error(f"Firmware delta {key[0][:12]} -> {key[1][:12]} failed: {e}")
+        finally:
+            out_path.unlink(missing_ok=True)
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,348 @@
+"""Content-addressed firmware artifact store.
+
+Images are stored once under their SHA-256:
+
+    <root>/objects/ab/ab12...ef     image bytes
+    <root>/index.json               {"artifacts": {sha256: meta}, "versions": {version: sha256},
+                                     "deltas": {"base:target": delta info}}
+
+Uploads are streamed chunk by chunk into a temp file while being hashed,
+then renamed into place, so a multi-MB image is never held in memory and
+re-uploading the same bytes is a no-op. Downloads are served in chunks from
+byte ranges (see servers/tasks/firmware_distribution.py for HTTP Range).
+
+Signatures are RSA-2048 PKCS#1 v1.5 over the image SHA-256, base64 encoded,
+checked against the PEM public key at FIRMWARE_PUBLIC_KEY_PATH. The digest is
+re-streamed from disk (so a corrupted object fails too) and verified as a
+prehashed value; each (artifact, signature) result is cached, so an image is
+verified once no matter how many devices it is pushed to. Verification needs
+the optional `cryptography` package and fails closed without it.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+
+    _crypto_available = True
+except Exception:
+    _crypto_available = False
+
+CHUNK_SIZE = 1 << 20
+MIN_RSA_BITS = 2048
+SIGNATURE_ALGORITHM = "RSA-PKCS1v15-SHA256"
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+def hash_file(path: Path, chunk_size: int = CHUNK_SIZE) -> Tuple[str, int]:
+    """(sha256 hex, size) of a file, read chunk by chunk."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class ArtifactWriter:
+    """Streams one upload into the store; commit() moves it to its content address."""
+
+    def __init__(self, store: "FirmwareStore"):
+        self.store = store
+        tmp_dir = store.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._path = Path(name)
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self._digest.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        self._path.unlink(missing_ok=True)
+
+    def commit(self, version: Optional[str] = None, signature: Optional[str] = None,
+               expected_sha256: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        sha256 = self._digest.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            self.abort()
+            raise ValueError(f"SHA-256 mismatch: expected {expected_sha256}, got {sha256}")
+        if self.size == 0:
+            self.abort()
+            raise ValueError("Empty firmware image")
+
+        dest = self.store.object_path(sha256)
+        if dest.exists():
+            # Same bytes already stored
+            self._path.unlink(missing_ok=True)
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._path, dest)
+        return self.store._register(sha256, self.size, version, signature, metadata)
+
+
+class FirmwareStore:
+    def __init__(self, root: Path, public_key_path: Optional[str] = None):
+        self.root = Path(root)
+        self.public_key_path = public_key_path
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, Any]] = None
+        self._public_key = None
+        # (sha256, signature) -> verification result
+        self._verified: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._verify_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / "index.json"
+
+    def object_path(self, sha256: str) -> Path:
+        return self.root / "objects" / sha256[:2] / sha256
+
+    def _load(self) -> Dict[str, Any]:
+        if self._index is None:
+            if self.index_path.exists():
+                self._index = json.loads(self.index_path.read_text())
+            else:
+                self._index = {"artifacts": {}, "versions": {}}
+        return self._index
+
+    def _save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._index, indent=2))
+        os.replace(tmp, self.index_path)
+
+    def _register(self, sha256: str, size: int, version: Optional[str], signature: Optional[str],
+                  metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            index = self._load()
+            artifact = index["artifacts"].setdefault(sha256, {
+                "sha256": sha256,
+                "size_bytes": size,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "versions": [],
+            })
+            if version:
+                previous = index["versions"].get(version)
+                if previous and previous != sha256:
+                    index["artifacts"][previous]["versions"].remove(version)
+                    logger.warning(f"Firmware version {version} moved from {previous[:12]} to {sha256[:12]}")
+                index["versions"][version] = sha256
+                if version not in artifact["versions"]:
+                    artifact["versions"].append(version)
+            if signature:
+                artifact["signature"] = signature
+            if metadata:
+                artifact.setdefault("metadata", {}).update(metadata)
+            self._save()
+            logger.info(f"Stored firmware {sha256[:12]} ({size} bytes) as {version or 'unversioned'}")
+            return dict(artifact)
+
+    def attach(self, sha256: str, version: Optional[str] = None, signature: Optional[str] = None) -> Dict[str, Any]:
+        """Point `version` at a stored image and/or record its signature."""
+        artifact = self.get(sha256)
+        return self._register(sha256, artifact["size_bytes"], version, signature, None)
+
+    def writer(self) -> ArtifactWriter:
+        return ArtifactWriter(self)
+
+    def put(self, chunks: Iterable[bytes], **kwargs) -> Dict[str, Any]:
+        """Store an image from an iterable of byte chunks (see ArtifactWriter.commit for kwargs)."""
+        writer = self.writer()
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit(**kwargs)
+
+    def put_file(self, path: Path, **kwargs) -> Dict[str, Any]:
+        def _chunks() -> Iterator[bytes]:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+        return self.put(_chunks(), **kwargs)
+
+    def resolve(self, ref: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Find an artifact by sha256 (optionally "sha256:" prefixed), version,
+        or a URL/path whose last segment is one of those, e.g.
+        http://ota-server.local/firmware/v1.2.3.bin or /tasks/firmware/<sha256>.
+        """
+        if not ref:
+            return None
+        candidates = [ref]
+        tail = ref.rstrip("/").rsplit("/", 1)[-1]
+        if tail != ref:
+            candidates.append(tail)
+        if tail.endswith(".bin"):
+            tail = tail[:-4]
+            candidates.append(tail)
+        if tail[:1] in ("v", "V") and tail[1:2].isdigit():
+            candidates.append(tail[1:])
+        with self._lock:
+            index = self._load()
+            for candidate in candidates:
+                key = candidate[7:] if candidate.startswith("sha256:") else candidate
+                sha256 = key.lower() if _SHA256.match(key.lower()) else index["versions"].get(key)
+                if sha256 and sha256 in index["artifacts"]:
+                    return dict(index["artifacts"][sha256])
+        return None
+
+    def get(self, ref: str) -> Dict[str, Any]:
+        artifact = self.resolve(ref)
+        if artifact is None:
+            raise ValueError(f"Firmware {ref} not found in store")
+        return artifact
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            index = self._load()
+            return sorted((dict(a) for a in index["artifacts"].values()), key=lambda a: a["created_at"])
+
+    def get_delta(self, base_sha256: str, target_sha256: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            delta = self._load().get("deltas", {}).get(f"{base_sha256}:{target_sha256}")
+            if delta and delta.get("status") == "ready" and delta["sha256"] not in self._index["artifacts"]:
+                return None
+            return dict(delta) if delta else None
+
+    def register_delta(self, base_sha256: str, target_sha256: str, info: Dict[str, Any]):
+        with self._lock:
+            self._load().setdefault("deltas", {})[f"{base_sha256}:{target_sha256}"] = {
+                **info, "base_sha256": base_sha256, "target_sha256": target_sha256,
+                "created_at": datetime.utcnow().isoformat() + "Z"
+            }
+            self._save()
+
+    def read_range(self, sha256: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield bytes [start, end] (inclusive) of an image in chunks."""
+        path = self.object_path(sha256)
+        end = path.stat().st_size - 1 if end is None else end
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def _load_public_key(self):
+        if self._public_key is None:
+            if not self.public_key_path:
+                raise RuntimeError("No firmware public key configured (FIRMWARE_PUBLIC_KEY_PATH)")
+            key = serialization.load_pem_public_key(Path(self.public_key_path).read_bytes())
+            if not isinstance(key, rsa.RSAPublicKey):
+                raise RuntimeError("Firmware public key is not an RSA key")
+            if key.key_size < MIN_RSA_BITS:
+                raise RuntimeError(f"Firmware public key is {key.key_size} bits, need at least {MIN_RSA_BITS}")
+            self._public_key = key
+        return self._public_key
+
+    def verify(self, ref: str, signature: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Verify an artifact's signature (the one given, else the one stored
+        with it). Results are cached per (artifact, signature).
+        """
+        artifact = self.get(ref)
+        sha256 = artifact["sha256"]
+        signature = signature or artifact.get("signature")
+        if not signature:
+            return {"sha256": sha256, "valid": False, "reason": "No signature", "cached": False}
+
+        key = (sha256, signature)
+        with self._lock:
+            lock = self._verify_locks.setdefault(key, threading.Lock())
+        with lock:
+            cached = self._verified.get(key)
+            if cached is not None:
+                self._hits += 1
+                return {**cached, "cached": True}
+            self._misses += 1
+            result = self._verify_uncached(sha256, signature)
+            # Missing key/library is a setup problem, not a verdict on the image: don't pin it
+            if result.get("valid") or result.get("reason") == "Invalid signature":
+                self._verified[key] = result
+        return {**result, "cached": False}
+
+    def _verify_uncached(self, sha256: str, signature: str) -> Dict[str, Any]:
+        result = {
+            "sha256": sha256,
+            "valid": False,
+            "algorithm": SIGNATURE_ALGORITHM,
+            "verified_at": datetime.utcnow().isoformat() + "Z",
+            "reason": None,
+        }
+        if not _crypto_available:
+            result["reason"] = "cryptography package not installed"
+            return result
+        try:
+            public_key = self._load_public_key()
+        except (OSError, ValueError, RuntimeError) as e:
+            result["reason"] = f"Public key unavailable: {e}"
+            return result
+        try:
+            raw_signature = base64.b64decode(signature, validate=True)
+        except (binascii.Error, ValueError):
+            result["reason"] = "Signature is not valid base64"
+            return result
+
+        digest, _ = hash_file(self.object_path(sha256))
+        if digest != sha256:
+            result["reason"] = "Stored image is corrupted (SHA-256 mismatch)"
+            return result
+        try:
+            public_key.verify(raw_signature, bytes.fromhex(digest), padding.PKCS1v15(), Prehashed(hashes.SHA256()))
+        except InvalidSignature:
+            result["reason"] = "Invalid signature"
+            logger.warning(f"Firmware {sha256[:12]} failed signature verification")
+            return result
+        result["valid"] = True
+        return result
+
+    def cache_stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "entries": len(self._verified),
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,302 @@
+"""Battery depletion forecasting from telemetry history.
+
+Every node's battery history (the "battery" metric of the telemetry store) is
+fitted with two exponentially weighted least-squares models at once:
+- linear:       battery(t) = a + b*t
+- exponential:  ln battery(t) = a + b*t
+and the one with the better weighted R^2 is used to predict when the node
+reaches the depletion threshold, with and without an extra plan load.
+
+The fits are kept as per-node sufficient statistics (weighted sums) in numpy
+arrays. A refresh only folds in samples that arrived since the previous one
+(older samples are decayed by exp(-dt/tau) instead of being re-read), and all
+nodes are updated and solved in bulk.
+
+numpy is optional: without it the forecaster reports itself unavailable and
+energy validation falls back to the fixed battery thresholds.
+"""
+from typing import Any, Dict, List, Optional
+import logging
+import math
+import threading
+import time
+
+try:
+    import numpy as np
+
+    _numpy_available = True
+except ImportError:
+    np = None
+    _numpy_available = False
+
+logger = logging.getLogger(__name__)
+
+# Typical mote/ESP32 pack when a device does not declare battery_capacity_mwh
+DEFAULT_BATTERY_CAPACITY_MWH = 7400.0
+# Baseline drain assumed for devices without any battery history (idle ESP32)
+DEFAULT_IDLE_MW = 20.0
+
+# Gap between corridor activations, as in AlgorithmExecutionAgent.build_plan
+SEQUENTIAL_GAP_MS = 2000
+
+# Row order of the sufficient statistics: sum w, w*t, w*y, w*t^2, w*t*y, w*y^2
+_W, _T, _Y, _TT, _TY, _YY = range(6)
+
+
+def forecaster_available() -> bool:
+    return _numpy_available
+
+
+def plan_duty_cycles(plan: Dict[str, Any]) -> Dict[str, float]:
+    """Fraction of the plan timeline each scheduled device is active (continuous entries count as 1)."""
+    schedule = plan.get("algorithm", {}).get("schedule") or {}
+    total = schedule.get("timeline_total_ms")
+    duty: Dict[str, float] = {}
+    for entry in schedule.get("entries", []):
+        device_id = str(entry.get("device_id"))
+        duration = entry.get("duration_ms")
+        share = 1.0 if duration is None or not total else min(1.0, duration / total)
+        duty[device_id] = min(1.0, duty.get(device_id, 0.0) + share)
+    return duty
+
+
+def timeline_duty_cycles(device_ids: List[str], t_active_seconds: float = 20) -> Dict[str, Dict[str, float]]:
+    """
+    Duty cycles of the same devices under both corridor timelines: all devices
+    continuously on (naive_baseline) or one at a time, repeating
+    (sequential_corridor).
+    """
+    active_ms = t_active_seconds * 1000
+    cycle_ms = len(device_ids) * (active_ms + SEQUENTIAL_GAP_MS)
+    sequential = active_ms / cycle_ms if cycle_ms else 0.0
+    return {
+        "naive_baseline": {d: 1.0 for d in device_ids},
+        "sequential_corridor": {d: sequential for d in device_ids}
+    }
+
+
+class BatteryForecaster:
+    """
+    Cached, incrementally refreshed time-to-depletion forecasts.
+
+    tau_hours sets how fast old samples lose weight; refresh_seconds bounds how
+    often the telemetry store is re-read (forecasts in between are served from
+    the cached fit).
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        metric: str = "battery",
+        tau_hours: float = 6.0,
+        min_samples: int = 3,
+        threshold_percent: float = 5.0,
+        refresh_seconds: float = 30.0
+    ):
+        self.store = store
+        self.metric = metric
+        self.tau_hours = tau_hours
+        self.min_samples = min_samples
+        self.threshold_percent = threshold_percent
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._last_ts: Dict[str, int] = {}
+        self._refreshed_at = 0.0
+        self.refreshes = 0
+        self.samples_folded = 0
+        if _numpy_available:
+            self._ref = np.zeros(0)                # per-node reference time (hours), newest sample
+            self._count = np.zeros(0)              # unweighted samples seen
+            self._stats = np.zeros((2, 6, 0))      # [model][statistic][node]
+            self._fit = None
+
+    # -- incremental refresh ------------------------------------------------
+
+    def _grow(self, size: int):
+        extra = size - self._ref.shape[0]
+        if extra <= 0:
+            return
+        self._ref = np.concatenate([self._ref, np.zeros(extra)])
+        self._count = np.concatenate([self._count, np.zeros(extra)])
+        self._stats = np.concatenate([self._stats, np.zeros((2, 6, extra))], axis=2)
+
+    def refresh(self, force: bool = False) -> int:
+        """Fold samples newer than the last refresh into the fits; returns samples added."""
+        if not _numpy_available:
+            return 0
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds and self._fit is not None:
+                return 0
+            fresh = self.store.samples_since(self.metric, self._last_ts)
+            self._refreshed_at = time.monotonic()
+            if not fresh and self._fit is not None:
+                return 0
+
+            for node in fresh:
+                if node not in self._index:
+                    self._index[node] = len(self._index)
+            self._grow(len(self._index))
+
+            idx_parts, t_parts, y_parts = [], [], []
+            for node, (timestamps, values) in fresh.items():
+                idx_parts.append(np.full(len(timestamps), self._index[node], dtype=np.int64))
+                t_parts.append(np.asarray(timestamps, dtype=np.float64))
+                y_parts.append(np.asarray(values, dtype=np.float64))
+                self._last_ts[node] = timestamps[-1]
+            added = 0
+            if idx_parts:
+                idx = np.concatenate(idx_parts)
+                t = np.concatenate(t_parts) / 3600.0
+                y = np.concatenate(y_parts)
+                added = self._fold(idx, t, y)
+            self._fit = self._solve()
+            self.refreshes += 1
+            self.samples_folded += added
+            return added
+
+    def _fold(self, idx, t, y) -> int:
+        n = self._ref.shape[0]
+        touched = np.zeros(n, dtype=bool)
+        touched[idx] = True
+        old_ref = self._ref.copy()
+        new_ref = old_ref.copy()
+        # Nodes seen for the first time take their newest sample as reference
+        first = touched & (self._count == 0)
+        new_ref[first] = -np.inf
+        np.maximum.at(new_ref, idx, t)
+        d = np.where(touched & ~first, new_ref - old_ref, 0.0)
+
+        # Re-centre existing sums on the new reference time, then decay them
+        decay = np.exp(-d / self.tau_hours)
+        for m in range(2):
+            s = self._stats[m]
+            sw, st, sy, stt, sty, syy = s
+            s[_TT] = stt - 2 * d * st + d * d * sw
+            s[_TY] = sty - d * sy
+            s[_T] = st - d * sw
+            s *= decay
+
+        tc = t - new_ref[idx]
+        w = np.exp(tc / self.tau_hours)
+        ys = (y, np.log(np.clip(y, 0.1, None)))
+        for m in range(2):
+            ym = ys[m]
+            columns = (w, w * tc, w * ym, w * tc * tc, w * tc * ym, w * ym * ym)
+            for row, values in enumerate(columns):
+                self._stats[m, row] += np.bincount(idx, weights=values, minlength=n)
+        self._count += np.bincount(idx, minlength=n)
+        self._ref = new_ref
+        return int(idx.shape[0])
+
+    def _solve(self) -> Dict[str, Any]:
+        """Weighted least squares for every node and both models at once."""
+        s = self._stats
+        sw, st, sy, stt, sty, syy = s[:, _W], s[:, _T], s[:, _Y], s[:, _TT], s[:, _TY], s[:, _YY]
+        det = sw * stt - st * st
+        ok = (det > 1e-12) & (self._count >= self.min_samples)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            b = np.where(ok, (sw * sty - st * sy) / det, 0.0)
+            a = np.where(sw > 0, (sy - b * st) / sw, 0.0)
+            sse = syy - a * sy - b * sty
+            sst = syy - sy * sy / sw
+            r2 = np.where(ok & (sst > 1e-12), 1 - sse / sst, 0.0)
+        # Model choice per node: exponential only when it leaves at most half
+        # the unexplained variance of the linear fit
+        use_exp = ok[1] & ((1 - r2[1]) < 0.5 * (1 - r2[0]))
+        return {"a": a, "b": b, "r2": r2, "ok": ok, "use_exp": use_exp}
+
+    # -- forecasts --------------------------------------------------------------
+
+    def forecast(self, devices: List[Dict[str, Any]], horizon_hours: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Forecast depletion for devices: [{"id", "battery" (fallback),
+        "load_mw" (plan load), "duty" (0..1), "capacity_mwh", "idle_mw"}].
+        Hours are counted from now.
+        """
+        if not _numpy_available or not devices:
+            return {}
+        self.refresh()
+        with self._lock:
+            fit = self._fit
+            count = len(devices)
+            ids = [str(d["id"]) for d in devices]
+            rows = np.array([self._index.get(i, -1) for i in ids])
+            known = (rows >= 0) & fit["ok"][0][np.maximum(rows, 0)] if fit is not None and self._ref.shape[0] else np.zeros(count, dtype=bool)
+            safe = np.maximum(rows, 0)
+            now_h = time.time() / 3600.0
+            thr = self.threshold_percent
+
+            capacity = np.array([float(d.get("capacity_mwh") or DEFAULT_BATTERY_CAPACITY_MWH) for d in devices])
+            extra = np.array([float(d.get("load_mw") or 0.0) * float(d.get("duty", 1.0)) for d in devices]) / capacity * 100.0
+            fallback = np.array([float(d["battery"]) if d.get("battery") is not None else 100.0 for d in devices])
+            idle = np.array([float(d.get("idle_mw") or DEFAULT_IDLE_MW) for d in devices]) / capacity * 100.0
+
+            if known.any():
+                dt = now_h - self._ref[safe]
+                use_exp = fit["use_exp"][safe] & known
+                a_lin, b_lin = fit["a"][0][safe], fit["b"][0][safe]
+                a_exp, b_exp = fit["a"][1][safe], fit["b"][1][safe]
+                level_lin = a_lin + b_lin * dt
+                level_exp = np.exp(a_exp + b_exp * dt)
+                level = np.where(use_exp, level_exp, level_lin)
+                slope = np.where(use_exp, b_exp * level_exp, b_lin)
+                r2 = np.where(use_exp, fit["r2"][1][safe], fit["r2"][0][safe])
+            else:
+                use_exp = np.zeros(count, dtype=bool)
+                level = slope = r2 = np.zeros(count)
+                b_exp = np.zeros(count)
+
+            level = np.clip(np.where(known, level, fallback), 0.0, 100.0)
+            slope = np.where(known, slope, -idle)
+            margin = level - thr
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Linear (and no-history) nodes: closed form
+                base = np.where(slope < 0, margin / -slope, np.inf)
+                loaded_rate = slope - extra
+                with_plan = np.where(loaded_rate < 0, margin / -loaded_rate, np.inf)
+                # Exponential nodes: level*e^(b t) - extra*t = thr, solved by bisection
+                if use_exp.any():
+                    be = b_exp
+                    exp_base = np.where(be < 0, np.log(thr / np.maximum(level, 1e-9)) / be, np.inf)
+                    base = np.where(use_exp, exp_base, base)
+                    hi = np.where(np.isfinite(exp_base), exp_base, np.where(extra > 0, margin / np.maximum(extra, 1e-12), 0.0))
+                    lo = np.zeros(count)
+                    for _ in range(48):
+                        mid = (lo + hi) / 2
+                        alive = level * np.exp(be * mid) - extra * mid > thr
+                        lo = np.where(alive, mid, lo)
+                        hi = np.where(alive, hi, mid)
+                    exp_plan = np.where(np.isfinite(exp_base) | (extra > 0), hi, np.inf)
+                    with_plan = np.where(use_exp, exp_plan, with_plan)
+            base = np.where(margin <= 0, 0.0, base)
+            with_plan = np.where(margin <= 0, 0.0, with_plan)
+
+            result = {}
+            for i, device_id in enumerate(ids):
+                hours = float(base[i])
+                hours_plan = float(with_plan[i])
+                entry = {
+                    "battery_now": round(float(level[i]), 2),
+                    "model": ("exponential" if use_exp[i] else "linear") if known[i] else "baseline",
+                    "drain_percent_per_hour": round(float(-slope[i]), 4),
+                    "fit_r2": round(float(r2[i]), 3) if known[i] else None,
+                    "hours_to_depletion": round(hours, 2) if math.isfinite(hours) else None,
+                    "hours_to_depletion_with_plan": round(hours_plan, 2) if math.isfinite(hours_plan) else None
+                }
+                if horizon_hours is not None:
+                    entry["survives_plan"] = not (hours_plan < horizon_hours)
+                result[device_id] = entry
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": _numpy_available,
+            "nodes": len(self._index),
+            "refreshes": self.refreshes,
+            "samples_folded": self.samples_folded,
+            "tau_hours": self.tau_hours,
+            "refresh_seconds": self.refresh_seconds
+        }
@@ -0,0 +1,312 @@
+"""SDN-WISE report ingestion over UDP.
+
+Motes push reports to the controller port (UDP_SERVER_PORT 5678 in
+sdn-wise-agent.c). This listener decodes them directly in the MCP server so
+battery, neighbour and liveness data do not have to wait for the next ONOS
+REST poll.
+
+Packets use the header from WisePacket.java (big-endian):
+    netId(1) len(1) dst(2) src(2) typ(1) ttl(1) nxh(2) payload...
+The fields take 10 bytes, but WisePacket counts 11 bytes of overhead
+(len = 11 + payload, parse() rejects anything shorter than 11), so the same
+accounting is used here: payload starts at byte 10 and is len - 11 bytes long.
+Payloads handled:
+    TYPE_TOPOLOGY (3): count(1) then count x neighbour id(2)
+    TYPE_STATS    (4): battery(1) packets_sent(2) packets_received(1)
+
+The Contiki agent (send_report_to_controller in sdn-wise-agent.c) does not
+use that framing. It sends 20-byte reports laid out as
+    len(1)=20 type(1)=WISE_TYPE_REPORT (0x03) src(2) unset(3) packets_sent(4) unset...
+and its type numbering differs from WisePacket (3 is REPORT there, TOPOLOGY
+here). Its byte 1 is the type, which read as a WisePacket length (3) is
+below the 11-byte minimum, so the two framings cannot be confused: a
+datagram whose byte 1 is 0x03 and byte 0 a plausible length is decoded as
+a mote report.
+
+The hot path only unpacks the header from a memoryview and coalesces the
+result per source node; registry and liveness index are updated in batches by
+a periodic flush, so bursts cost one dict write per packet.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import logging
+import os
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">BBHHBBH")
+PAYLOAD_OFFSET = HEADER.size  # 10
+HEADER_LEN = 11  # overhead counted in len, as in WisePacket.parse()/serialize()
+STATS = struct.Struct(">BHB")
+# sdn-wise-agent.c report: len, type, src, 3 bytes the mote leaves unset, packets_sent
+MOTE_REPORT = struct.Struct(">BBH3xI")
+MOTE_TYPE_REPORT = 0x03
+
+TYPE_DATA = 0
+TYPE_CONFIG = 1
+TYPE_FLOW_RULE = 2
+TYPE_TOPOLOGY = 3
+TYPE_STATS = 4
+
+WISE_INGEST_PORT = 5678
+
+
+class NodeState:
+    """Latest reported state of one mote."""
+
+    __slots__ = ("node_id", "battery", "packets_sent", "packets_received", "neighbors", "last_seen", "reports")
+
+    def __init__(self, node_id: int):
+        self.node_id = node_id
+        self.battery: Optional[int] = None
+        self.packets_sent: Optional[int] = None
+        self.packets_received: Optional[int] = None
+        self.neighbors: Tuple[int, ...] = ()
+        self.last_seen = 0.0
+        self.reports = 0
+
+    def to_dict(self, now: float, timeout: float) -> Dict[str, Any]:
+        return {
+            "nodeId": self.node_id,
+            "battery": self.battery,
+            "packetsSent": self.packets_sent,
+            "packetsReceived": self.packets_received,
+            "neighbors": list(self.neighbors),
+            "lastSeen": self.last_seen,
+            "active": now - self.last_seen < timeout,
+            "reports": self.reports
+        }
+
+
+class ReportIngestor(asyncio.DatagramProtocol):
+    """
+    Datagram protocol + in-memory device registry fed by mote reports.
+
+    Counters: received/parsed packets and bytes, mote-format reports, drops by reason
+    (short, bad_length, unknown_type, backlog), flush batches and a
+    packets-per-second rate over the last flush window.
+
+    When a telemetry store is given, every flushed stats report is also
+    recorded as battery / packets_sent / packets_received samples.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 0.25,
+        max_pending: int = 65536,
+        node_timeout: float = 30.0,
+        telemetry: Optional[Any] = None
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Same staleness rule as TopologyManager.NODE_TIMEOUT_MS
+        self.node_timeout = node_timeout
+        self.telemetry = telemetry
+
+        self.registry: Dict[int, NodeState] = {}
+        # Liveness index: node ids ordered by last report, oldest first
+        self.liveness: "OrderedDict[int, float]" = OrderedDict()
+        # src -> [seen_at, reports, battery, sent, received, neighbours]
+        self._pending: Dict[int, List[Any]] = {}
+
+        self.counters = {
+            "packets_received": 0,
+            "packets_parsed": 0,
+            "bytes_received": 0,
+            "mote_reports": 0,
+            "dropped_short": 0,
+            "dropped_bad_length": 0,
+            "dropped_unknown_type": 0,
+            "dropped_backlog": 0,
+            "flushes": 0
+        }
+        self._rate = 0.0
+        self._window_start = time.monotonic()
+        self._window_packets = 0
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.local_addr: Optional[Tuple[str, int]] = None
+
+    # -- asyncio.DatagramProtocol -----------------------------------------
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self.local_addr = transport.get_extra_info("sockname")
+
+    def datagram_received(self, data: bytes, addr):
+        self.ingest(data)
+
+    def error_received(self, exc):
+        logger.warning(f"Report listener socket error: {exc}")
+
+    # -- parsing ------------------------------------------------------------
+
+    def ingest(self, data: bytes, now: Optional[float] = None) -> bool:
+        """Decode one datagram into the pending batch; False if it was dropped."""
+        counters = self.counters
+        counters["packets_received"] += 1
+        size = len(data)
+        counters["bytes_received"] += size
+        if size < HEADER_LEN:
+            counters["dropped_short"] += 1
+            return False
+
+        view = memoryview(data)
+        if view[1] == MOTE_TYPE_REPORT and MOTE_REPORT.size <= view[0] <= size:
+            _length, _typ, src, sent = MOTE_REPORT.unpack_from(view, 0)
+            entry = self._pending_entry(src, now)
+            if entry is None:
+                return False
+            entry[3] = sent
+            counters["mote_reports"] += 1
+            counters["packets_parsed"] += 1
+            self._window_packets += 1
+            return True
+
+        _net_id, length, _dst, src, typ, _ttl, _nxh = HEADER.unpack_from(view, 0)
+        if length < HEADER_LEN or length > size:
+            counters["dropped_bad_length"] += 1
+            return False
+        if typ != TYPE_STATS and typ != TYPE_TOPOLOGY and typ != TYPE_DATA:
+            counters["dropped_unknown_type"] += 1
+            return False
+
+        entry = self._pending_entry(src, now)
+        if entry is None:
+            return False
+
+        if typ == TYPE_STATS and length >= HEADER_LEN + STATS.size:
+            entry[2], entry[3], entry[4] = STATS.unpack_from(view, PAYLOAD_OFFSET)
+        elif typ == TYPE_TOPOLOGY and length > HEADER_LEN:
+            count = min(view[PAYLOAD_OFFSET], (length - HEADER_LEN - 1) // 2)
+            entry[5] = struct.unpack_from(f">{count}H", view, PAYLOAD_OFFSET + 1)
+
+        counters["packets_parsed"] += 1
+        self._window_packets += 1
+        return True
+
+    def _pending_entry(self, src: int, now: Optional[float]) -> Optional[List[Any]]:
+        entry = self._pending.get(src)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                self.counters["dropped_backlog"] += 1
+                return None
+            entry = self._pending[src] = [0.0, 0, None, None, None, None]
+        entry[0] = now if now is not None else time.time()
+        entry[1] += 1
+        return entry
+
+    # -- batching -------------------------------------------------------------
+
+    def flush(self) -> int:
+        """Apply the pending batch to the registry and liveness index; returns nodes updated."""
+        pending, self._pending = self._pending, {}
+        registry = self.registry
+        liveness = self.liveness
+        samples = []
+        for src, (seen, reports, battery, sent, received, neighbors) in pending.items():
+            state = registry.get(src)
+            if state is None:
+                state = registry[src] = NodeState(src)
+            state.last_seen = seen
+            state.reports += reports
+            # Mote reports carry packets_sent only; stats reports carry all three
+            if battery is not None:
+                state.battery = battery
+                samples.append((src, "battery", battery, seen))
+            if sent is not None:
+                state.packets_sent = sent
+                samples.append((src, "packets_sent", sent, seen))
+            if received is not None:
+                state.packets_received = received
+                samples.append((src, "packets_received", received, seen))
+            if neighbors is not None:
+                state.neighbors = neighbors
+            liveness[src] = seen
+            liveness.move_to_end(src)
+
+        if samples and self.telemetry is not None:
+            self.telemetry.record_many(samples)
+            self.telemetry.flush()
+
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed > 0:
+            self._rate = self._window_packets / elapsed
+        self._window_start = now
+        self._window_packets = 0
+        self.counters["flushes"] += 1
+        return len(pending)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Report flush failed: {e}")
+
+    # -- queries ----------------------------------------------------------------
+
+    def stale_nodes(self, now: Optional[float] = None) -> List[int]:
+        """Nodes silent for longer than node_timeout (walks only the stale prefix)."""
+        cutoff = (now if now is not None else time.time()) - self.node_timeout
+        stale = []
+        for node_id, seen in self.liveness.items():
+            if seen >= cutoff:
+                break
+            stale.append(node_id)
+        return stale
+
+    def nodes(self, active_only: bool = False) -> List[Dict[str, Any]]:
+        now = time.time()
+        result = [state.to_dict(now, self.node_timeout) for state in self.registry.values()]
+        if active_only:
+            result = [n for n in result if n["active"]]
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        counters = dict(self.counters)
+        dropped = sum(v for k, v in counters.items() if k.startswith("dropped_"))
+        return {
+            "listening": self._transport is not None,
+            "address": f"{self.local_addr[0]}:{self.local_addr[1]}" if self.local_addr else None,
+            **counters,
+            "dropped_total": dropped,
+            "packets_per_second": round(self._rate, 1),
+            "pending": len(self._pending),
+            "nodes_known": len(self.registry),
+            "nodes_stale": len(self.stale_nodes())
+        }
+
+    # -- lifecycle ----------------------------------------------------------------
+
+    async def start(self, host: str = "0.0.0.0", port: int = WISE_INGEST_PORT, receive_buffer: int = 4 * 1024 * 1024):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        # A larger kernel buffer absorbs report bursts between event-loop turns
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+            except OSError as e:
+                logger.warning(f"Could not set report socket buffer: {e}")
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"SDN-WISE report listener on udp://{host}:{port}")
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self.flush()
+
+
+def ingest_enabled() -> bool:
+    return os.getenv("WISE_INGEST_ENABLED", "false").lower() in ("1", "true", "yes")
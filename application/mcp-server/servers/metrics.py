@@ -0,0 +1,400 @@
+"""Prometheus-style metrics for the MCP server.
+
+Counters and histograms are sharded per thread: each thread only ever touches
+its own shard, so recording a sample takes no lock and request threads never
+contend on the instrumentation. A scrape sums the shards; shards of threads
+that have exited are folded into a retired total so short-lived threads (ONOS
+cache refreshes, executor workers) do not accumulate.
+
+Values computed at scrape time (cache hit counters, thread-pool queue depth)
+are registered as callbacks instead of being pushed on every change.
+
+The text exposition follows the Prometheus 0.0.4 format served at /metrics.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import itertools
+import json
+import re
+import threading
+import time
+import weakref
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans sub-millisecond file reads up to multi-second plan executions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _ThreadToken:
+    """Lives in a thread's local storage; its finalizer retires the thread's shard."""
+
+
+class _ShardedRows:
+    """Per-thread dicts of label values -> list of numbers, summed on read."""
+
+    def __init__(self, width: int):
+        self._width = width
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._live: Dict[int, Dict[LabelValues, List[float]]] = {}
+        self._retired: Dict[LabelValues, List[float]] = {}
+
+    def row(self, labels: LabelValues) -> List[float]:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = [0.0] * self._width
+        return row
+
+    def _new_shard(self) -> Dict[LabelValues, List[float]]:
+        shard: Dict[LabelValues, List[float]] = {}
+        token = _ThreadToken()
+        with self._lock:
+            shard_id = next(self._ids)
+            self._live[shard_id] = shard
+        self._local.shard = shard
+        self._local.token = token
+        weakref.finalize(token, self._retire, shard_id)
+        return shard
+
+    def _retire(self, shard_id: int):
+        with self._lock:
+            shard = self._live.pop(shard_id, None)
+            if shard:
+                self._fold(self._retired, shard)
+
+    def _fold(self, into: Dict[LabelValues, List[float]], shard: Dict[LabelValues, List[float]]):
+        # list(...) snapshots in one step under the GIL; owners may keep writing
+        for labels, row in list(shard.items()):
+            total = into.get(labels)
+            if total is None:
+                into[labels] = list(row)
+            else:
+                for i, value in enumerate(list(row)):
+                    total[i] += value
+
+    def snapshot(self) -> Dict[LabelValues, List[float]]:
+        with self._lock:
+            shards = list(self._live.values())
+            merged = {labels: list(row) for labels, row in self._retired.items()}
+        for shard in shards:
+            self._fold(merged, shard)
+        return merged
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._rows = _ShardedRows(1)
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._rows.row(labels)[0] += amount
+
+    def value(self, *labels: str) -> float:
+        row = self._rows.snapshot().get(labels)
+        return row[0] if row else 0.0
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, row in sorted(self._rows.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(row[0])}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Row layout: one count per bucket, +Inf overflow, sum, count
+        self._rows = _ShardedRows(len(self.buckets) + 3)
+
+    def observe(self, value: float, *labels: str):
+        row = self._rows.row(labels)
+        row[bisect_left(self.buckets, value)] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self, *labels: str) -> Dict[str, Any]:
+        """Count, sum and per-bucket (non-cumulative) counts for one label set."""
+        row = self._rows.snapshot().get(labels) or [0.0] * (len(self.buckets) + 3)
+        return {"count": row[-1], "sum": row[-2], "buckets": dict(zip(self.buckets + (float("inf"),), row[:-2]))}
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bounds = self.buckets + (float("inf"),)
+        for labels, row in sorted(self._rows.snapshot().items()):
+            cumulative = 0.0
+            for bound, count in zip(bounds, row[:-2]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(row[-1])}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose samples are produced at scrape time."""
+
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: Tuple[str, ...],
+                 collect: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.collect():
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                       collect: Callable[[], Iterable[Tuple[LabelValues, float]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, "gauge", labelnames, collect))
+
+    def counter_callback(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                         collect: Callable[[], Iterable[Tuple[LabelValues, float]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, "counter", labelnames, collect))
+
+    def expose(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                # A broken callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+http_requests = REGISTRY.counter(
+    "mcp_http_requests_total", "HTTP requests by router, action and status code",
+    ("router", "action", "status"))
+http_request_seconds = REGISTRY.histogram(
+    "mcp_http_request_duration_seconds", "HTTP request latency by router and action",
+    ("router", "action"))
+datastore_seconds = REGISTRY.histogram(
+    "mcp_datastore_duration_seconds", "JSON data file read/write time",
+    ("op", "file"))
+datastore_lock_wait_seconds = REGISTRY.histogram(
+    "mcp_datastore_lock_wait_seconds", "Time spent waiting for the shared data write lock")
+agent_run_seconds = REGISTRY.histogram(
+    "mcp_agent_run_duration_seconds", "run_agent duration by task and outcome",
+    ("task", "outcome"))
+plan_step_seconds = REGISTRY.histogram(
+    "mcp_plan_step_dispatch_seconds", "Plan step dispatch latency by device protocol and status",
+    ("protocol", "status"))
+plan_step_retries = REGISTRY.counter(
+    "mcp_plan_step_retries_total", "Plan step attempts retried, by transport and status of the failed attempt",
+    ("transport", "status"))
+onos_request_seconds = REGISTRY.histogram(
+    "mcp_onos_request_duration_seconds", "ONOS REST call latency by method, resource and status",
+    ("method", "resource", "status"))
+
+_inflight = {"requests": 0}
+REGISTRY.gauge_callback(
+    "mcp_http_requests_in_flight", "HTTP requests currently being handled", (),
+    lambda: [((), _inflight["requests"])])
+
+
+MAX_ACTIONS_PER_ROUTER = 64
+_LABEL_RE = re.compile(r"^[A-Za-z0-9_:.\-]{1,64}$")
+_ACTION_RE = re.compile(rb'"(?:action|op)"\s*:\s*"([^"]{1,64})"')
+_PARSE_LIMIT_BYTES = 256 * 1024
+_known_actions: Dict[str, set] = {}
+
+
+def _route_labels(path: str) -> str:
+    if path.startswith("/tasks/"):
+        router = path[len("/tasks/"):].strip("/").split("/", 1)[0]
+        return router if _LABEL_RE.match(router) else "other"
+    if path in ("/", "/health", "/metrics"):
+        return path
+    return "other"
+
+
+def _router_label(scope) -> str:
+    """
+    Router label once routing has run. Requests that matched no route (404s,
+    made-up /tasks/<name> paths) are all "other", so the label set is fixed by
+    the mounted routers rather than by what clients send.
+    """
+    if scope.get("route") is None:
+        return "other"
+    return _route_labels(scope.get("path", ""))
+
+
+def _parse_action(body: bytes) -> str:
+    """action (or op for access-control) from a task payload: the name, "none" or "other"."""
+    action = None
+    if len(body) <= _PARSE_LIMIT_BYTES:
+        try:
+            payload = json.loads(body) if body else None
+            if isinstance(payload, dict):
+                action = payload.get("action") or payload.get("op")
+        except ValueError:
+            pass
+    else:
+        match = _ACTION_RE.search(body[:4096])
+        action = match.group(1).decode("utf-8", "replace") if match else None
+    if not isinstance(action, str) or not _LABEL_RE.match(action):
+        return "none" if action is None else "other"
+    return action
+
+
+def _action_label(router: str, action: str) -> str:
+    """The parsed action as a label, with bounded cardinality per mounted router."""
+    if action in ("none", "other"):
+        return action
+    if router == "other":
+        return "other"
+    known = _known_actions.setdefault(router, set())
+    if action not in known:
+        if len(known) >= MAX_ACTIONS_PER_ROUTER:
+            return "other"
+        known.add(action)
+    return action
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count and latency by router and action.
+
+    Task payloads are buffered to read their action and then replayed to the
+    app unchanged; the endpoint would read the whole body anyway.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        action = "none"
+        if scope.get("method") == "POST" and scope.get("path", "").startswith("/tasks/"):
+            buffered = []
+            while True:
+                message = await receive()
+                buffered.append(message)
+                if message["type"] != "http.request" or not message.get("more_body", False):
+                    break
+            action = _parse_action(b"".join(m.get("body", b"") for m in buffered))
+            # Shared with the tracing middleware (request.state.action)
+            scope.setdefault("state", {})["action"] = action
+
+            async def replay():
+                if buffered:
+                    return buffered.pop(0)
+                return await receive()
+            app_receive = replay
+        else:
+            app_receive = receive
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        _inflight["requests"] += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, app_receive, send_wrapper)
+        finally:
+            _inflight["requests"] -= 1
+            router = _router_label(scope)
+            action = _action_label(router, action)
+            http_request_seconds.observe(time.perf_counter() - start, router, action)
+            http_requests.inc(router, action, str(status["code"]))
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, Any]]):
+    """Expose a cache's hits/stale_hits/misses counters and hit ratio."""
+    def _lookups():
+        s = stats()
+        return [((name, "hit"), s.get("hits", 0)), ((name, "stale_hit"), s.get("stale_hits", 0)),
+                ((name, "miss"), s.get("misses", 0))]
+
+    def _ratio():
+        return [((name,), stats().get("hit_ratio"))]
+
+    _cache_lookups.append(_lookups)
+    _cache_ratios.append(_ratio)
+
+
+_cache_lookups: List[Callable[[], List[Tuple[LabelValues, float]]]] = []
+_cache_ratios: List[Callable[[], List[Tuple[LabelValues, Optional[float]]]]] = []
+REGISTRY.counter_callback(
+    "mcp_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"),
+    lambda: [sample for collect in _cache_lookups for sample in collect()])
+REGISTRY.gauge_callback(
+    "mcp_cache_hit_ratio", "Fraction of cache lookups served from cache (fresh or stale)", ("cache",),
+    lambda: [sample for collect in _cache_ratios for sample in collect()])
@@ -0,0 +1,430 @@
+"""ONOS client for the SDN-WISE application.
+
+Wraps the REST API exposed by the wisesdn ONOS app (WiseWebResource,
+`/onos/wisesdn/api/*`). Topology and device reads go through a small TTL
+cache so dashboard polling does not turn into one ONOS round-trip per request.
+
+Environment:
+- ONOS_URL / ONOS_USER / ONOS_PASSWORD: controller location and credentials
+- ONOS_CACHE_TTL_SECONDS: how long a read is served without revalidation
+- ONOS_CACHE_STALE_SECONDS: extra window where a stale value is served while
+  a background refresh runs (stale-while-revalidate)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from .metrics import onos_request_seconds
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class TopologyCache:
+    """
+    Keyed TTL cache with stale-while-revalidate and single-flight refresh.
+
+    - fresh (age < ttl): served from cache
+    - stale (ttl <= age < ttl + stale): served from cache, one background
+      refresh is started for the key
+    - expired/missing: the first caller loads, concurrent callers for the same
+      key wait for that load instead of issuing their own request
+
+    `invalidate()` bumps a generation counter so loads that started before the
+    invalidation never write their (possibly outdated) result back.
+    """
+
+    def __init__(self, ttl_seconds: float = 5.0, stale_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Any] = {}     # key -> (value, fetched_at)
+        self._inflight: Dict[str, threading.Event] = {}
+        self._errors: Dict[str, BaseException] = {}
+        self._generation = 0
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, loading it with loader if needed."""
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    value, fetched_at = entry
+                    age = now - fetched_at
+                    if age < self.ttl_seconds:
+                        self._stats["hits"] += 1
+                        return value
+                    if age < self.ttl_seconds + self.stale_seconds:
+                        self._stats["stale_hits"] += 1
+                        if key not in self._inflight:
+                            self._start_refresh(key, loader)
+                        return value
+
+                event = self._inflight.get(key)
+                if event is None:
+                    # This caller owns the load
+                    self._stats["misses"] += 1
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    generation = self._generation
+                    owner = True
+                else:
+                    owner = False
+
+            if owner:
+                return self._load(key, loader, event, generation)
+
+            # Single-flight: wait for the owner, then re-check the cache
+            event.wait()
+            with self._lock:
+                error = self._errors.get(key)
+                entry = self._entries.get(key)
+            if entry is not None:
+                with self._lock:
+                    self._stats["hits"] += 1
+                return entry[0]
+            if error is not None:
+                raise error
+            # Invalidated while waiting; loop and load again
+
+    def _load(self, key: str, loader: Callable[[], Any], event: threading.Event, generation: int) -> Any:
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._errors[key] = e
+                self._inflight.pop(key, None)
+            event.set()
+            raise
+
+        with self._lock:
+            self._errors.pop(key, None)
+            if generation == self._generation:
+                self._entries[key] = (value, time.monotonic())
+            self._inflight.pop(key, None)
+        event.set()
+        return value
+
+    def _start_refresh(self, key: str, loader: Callable[[], Any]) -> None:
+        """Start a background refresh for key. Caller must hold the lock."""
+        event = threading.Event()
+        self._inflight[key] = event
+        self._stats["refreshes"] += 1
+        generation = self._generation
+
+        def _refresh():
+            try:
+                self._load(key, loader, event, generation)
+            except Exception as e:
+                with self._lock:
+                    self._stats["refresh_errors"] += 1
+                    # Keep serving the stale value; it is still inside its window
+                    self._errors.pop(key, None)
+                logger.warning(f"Background refresh of {key} failed: {e}")
+
+        threading.Thread(target=_refresh, name=f"onos-cache-{key}", daemon=True).start()
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one key (or everything) and discard loads already in flight."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._generation += 1
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current TTL settings."""
+        with self._lock:
+            stats = dict(self._stats)
+            cached_keys = sorted(self._entries.keys())
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else None
+        stats["ttl_seconds"] = self.ttl_seconds
+        stats["stale_seconds"] = self.stale_seconds
+        stats["cached_keys"] = cached_keys
+        return stats
+
+
+FlowKey = Tuple[int, int, int, int, int]
+
+
+def flow_payload(flow: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a flow dict to the fields the controller stores."""
+    return {
+        "nodeId": int(flow["nodeId"]),
+        "srcAddr": int(flow["srcAddr"]),
+        "dstAddr": int(flow["dstAddr"]),
+        "action": int(flow.get("action", 1)),
+        "nextHop": int(flow["nextHop"])
+    }
+
+
+def flow_key(flow: Dict[str, Any]) -> FlowKey:
+    p = flow_payload(flow)
+    return (p["nodeId"], p["srcAddr"], p["dstAddr"], p["action"], p["nextHop"])
+
+
+def flow_id(flow: Dict[str, Any]) -> str:
+    """Flow id as generated by FlowTableManager.generateFlowId."""
+    p = flow_payload(flow)
+    return "flow-%04X-%04X-%04X-%d" % (p["nodeId"], p["srcAddr"], p["dstAddr"], p["action"])
+
+
+def diff_flows(desired: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Split desired/current flows into add, keep and remove lists (duplicates collapsed)."""
+    current_by_key = {flow_key(f): f for f in current}
+    desired_by_key: Dict[FlowKey, Dict[str, Any]] = {}
+    for f in desired:
+        desired_by_key.setdefault(flow_key(f), f)
+    return {
+        "add": [f for k, f in desired_by_key.items() if k not in current_by_key],
+        "keep": [f for k, f in desired_by_key.items() if k in current_by_key],
+        "remove": [f for k, f in current_by_key.items() if k not in desired_by_key]
+    }
+
+
+def _flow_result(flow: Dict[str, Any], status: str, change: str, message: str) -> Dict[str, Any]:
+    return {
+        "node_id": flow.get("nodeId"),
+        "srcAddr": flow.get("srcAddr"),
+        "dstAddr": flow.get("dstAddr"),
+        "nextHop": flow.get("nextHop"),
+        "status": status,
+        "change": change,
+        "message": message
+    }
+
+
+def _result_from_response(response: requests.Response) -> Dict[str, Any]:
+    try:
+        result = response.json()
+    except ValueError:
+        result = {"status": "error", "message": response.text}
+    if not isinstance(result, dict):
+        result = {"status": "error", "message": str(result)}
+    if response.status_code != 200 and result.get("status") != "error":
+        result = {"status": "error", "message": f"HTTP {response.status_code}: {response.text}"}
+    return result
+
+
+class OnosClient:
+    """REST client for the wisesdn ONOS application."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        timeout_seconds: float = 5.0,
+        cache: Optional[TopologyCache] = None
+    ):
+        self.base_url = (base_url or os.getenv("ONOS_URL", "http://172.25.0.2:8181")).rstrip("/")
+        self.api_url = f"{self.base_url}/onos/wisesdn/api"
+        self.auth = (user or os.getenv("ONOS_USER", "onos"), password or os.getenv("ONOS_PASSWORD", "rocks"))
+        self.timeout_seconds = timeout_seconds
+        self.cache = cache or TopologyCache(
+            ttl_seconds=float(os.getenv("ONOS_CACHE_TTL_SECONDS", "5")),
+            stale_seconds=float(os.getenv("ONOS_CACHE_STALE_SECONDS", "30"))
+        )
+        self._session = requests.Session()
+        self._session.auth = self.auth
+        self._batch_supported = True
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send one API call, recording its latency by resource (path without node ids)."""
+        resource = "/".join(part for part in path.split("/")[:2] if not part.isdigit())
+        start = time.perf_counter()
+        status = "error"
+        with span("onos.request", method=method, resource=resource) as s:
+            try:
+                response = self._session.request(method, f"{self.api_url}/{path}", timeout=self.timeout_seconds, **kwargs)
+                status = str(response.status_code)
+                return response
+            finally:
+                s.set_attribute("http.status_code", status)
+                onos_request_seconds.observe(time.perf_counter() - start, method, resource, status)
+
+    def _get(self, path: str) -> Any:
+        response = self._request("GET", path)
+        response.raise_for_status()
+        return response.json()
+
+    def _fetch_topology(self) -> Dict[str, Any]:
+        return self._get("topology")
+
+    def _fetch_devices(self) -> List[Dict[str, Any]]:
+        return self._get("devices")
+
+    def get_topology(self) -> Dict[str, Any]:
+        """Get WSN topology ({"nodes": [...], "links": [...]})."""
+        return self.cache.get("topology", self._fetch_topology)
+
+    def get_wsn_devices(self) -> List[Dict[str, Any]]:
+        """Get all WSN devices known to the controller."""
+        return self.cache.get("devices", self._fetch_devices)
+
+    def get_flows(self, node_id: int) -> List[Dict[str, Any]]:
+        """Get the flow table installed on a node (not cached)."""
+        data = self._get(f"flows/{node_id}")
+        return data.get("flows", []) if isinstance(data, dict) else data
+
+    def get_stats(self, node_id: int) -> Dict[str, Any]:
+        """Get per-node statistics (battery, packet counters)."""
+        return self._get(f"stats/{node_id}")
+
+    def install_flow(self, flow: Dict[str, Any]) -> Dict[str, Any]:
+        """Install a single flow rule and invalidate cached topology/device reads."""
+        try:
+            return self._post_flow(flow_payload(flow))
+        finally:
+            # Device flowCount (and possibly links) changed on the controller side
+            self.cache.invalidate()
+
+    def _post_flow(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        response = self._request("POST", "flows", json=payload)
+        return _result_from_response(response)
+
+    def _post_flow_batch(self, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """POST a batch of flows; falls back to one request per flow on older controllers."""
+        if self._batch_supported:
+            response = self._request("POST", "flows/batch", json=payloads)
+            if response.status_code in (404, 405):
+                logger.info("ONOS has no flows/batch endpoint; installing flows one by one")
+                self._batch_supported = False
+            else:
+                result = _result_from_response(response)
+                results = result.get("results")
+                if isinstance(results, list) and len(results) == len(payloads):
+                    return results
+                return [result] * len(payloads)
+        return [self._post_flow(payload) for payload in payloads]
+
+    def _delete_flow(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        response = self._request("DELETE", f"flows/{payload['nodeId']}/{flow_id(payload)}")
+        return _result_from_response(response)
+
+    def install_flows(
+        self,
+        flows: List[Dict[str, Any]],
+        prune: bool = False,
+        batch_size: int = 32,
+        max_workers: int = 8
+    ) -> Dict[str, Any]:
+        """
+        Bulk-install flows, sending only what differs from the installed tables.
+
+        Flows are grouped per node; each node's current table is fetched
+        (`api/flows/{nodeId}`) and diffed against the desired flows:
+        - add: desired but not installed -> POSTed in batches of batch_size
+        - keep: already installed -> nothing is sent
+        - remove: installed but not desired -> deleted only when prune=True,
+          except rules replaced by a desired flow with the same flow id
+          (e.g. a new nextHop), which are always deleted: the controller
+          appends rather than replaces, and the old rule would keep matching
+        Nodes are processed concurrently. Returns one result per desired flow
+        (plus one per removed flow) and a summary of the diff.
+        """
+        by_node: Dict[int, List[Dict[str, Any]]] = {}
+        for flow in flows:
+            by_node.setdefault(int(flow["nodeId"]), []).append(flow)
+
+        def _apply_node(node_id: int) -> List[Dict[str, Any]]:
+            desired = by_node[node_id]
+            try:
+                current = self.get_flows(node_id)
+            except Exception as e:
+                return [_flow_result(f, "error", "failed", f"Could not read flow table: {e}") for f in desired]
+
+            diff = diff_flows(desired, current)
+            to_add = diff["add"]
+            keep = diff["keep"]
+            add_ids = {flow_id(f) for f in to_add}
+            if prune:
+                to_remove, stale = diff["remove"], []
+            else:
+                to_remove = [f for f in diff["remove"] if flow_id(f) in add_ids]
+                stale = [f for f in diff["remove"] if flow_id(f) not in add_ids]
+            if to_remove:
+                # Controller flow ids ignore nextHop, so a delete also drops any
+                # kept rule sharing the id; those get re-installed below
+                removed_ids = {flow_id(f) for f in to_remove}
+                to_add = to_add + [f for f in keep if flow_id(f) in removed_ids]
+                keep = [f for f in keep if flow_id(f) not in removed_ids]
+            results = [_flow_result(f, "success", "unchanged", "Flow already installed") for f in keep]
+
+            # Removals go first so they cannot delete freshly added rules
+            undeleted_ids = set()
+            for f in to_remove:
+                try:
+                    response = self._delete_flow(flow_payload(f))
+                except Exception as e:
+                    response = {"status": "error", "message": str(e)}
+                ok = response.get("status") == "success"
+                if not ok:
+                    undeleted_ids.add(flow_id(f))
+                message = "Flow removed" if flow_id(f) not in add_ids else "Flow replaced by a new rule with the same id"
+                results.append(_flow_result(
+                    f, "success" if ok else "error", "removed" if ok else "failed",
+                    response.get("message", message)
+                ))
+            results.extend(_flow_result(f, "success", "stale", "Installed but not in plan (prune disabled)") for f in stale)
+            if undeleted_ids:
+                # Adding next to a rule that could not be deleted would leave the old one matching first
+                results.extend(
+                    _flow_result(f, "error", "failed", "Installed rule with the same flow id could not be removed")
+                    for f in to_add if flow_id(f) in undeleted_ids
+                )
+                to_add = [f for f in to_add if flow_id(f) not in undeleted_ids]
+
+            for start in range(0, len(to_add), batch_size):
+                chunk = to_add[start:start + batch_size]
+                try:
+                    responses = self._post_flow_batch([flow_payload(f) for f in chunk])
+                except Exception as e:
+                    responses = [{"status": "error", "message": str(e)}] * len(chunk)
+                for f, response in zip(chunk, responses):
+                    ok = response.get("status") == "success"
+                    results.append(_flow_result(
+                        f, "success" if ok else "error", "added" if ok else "failed",
+                        response.get("message", "Flow installed")
+                    ))
+            return results
+
+        results: List[Dict[str, Any]] = []
+        if by_node:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(by_node)))) as pool:
+                for node_results in pool.map(_apply_node, sorted(by_node)):
+                    results.extend(node_results)
+
+        summary = {change: 0 for change in ("added", "unchanged", "removed", "stale", "failed")}
+        for r in results:
+            summary[r["change"]] += 1
+        summary["nodes"] = len(by_node)
+
+        if summary["added"] or summary["removed"]:
+            self.cache.invalidate()
+
+        return {
+            "status": "success" if not summary["failed"] else ("partial_failure" if summary["added"] + summary["unchanged"] else "error"),
+            "summary": summary,
+            "results": results
+        }
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
@@ -0,0 +1,375 @@
+"""Durable delivery queue for OTA updates to offline devices.
+
+A push that finds its device offline parks the update here instead of only
+reporting it as pending. The queue keeps at most one update per device (a
+newer enqueue supersedes the older one) and survives restarts through an
+append-only JSON-lines journal:
+
+    {"op": "enqueue", "entry": {...}}
+    {"op": "attempt", "id": ..., "attempts": n, "next_attempt_at": t, "error": ...}
+    {"op": "done", "id": ..., "status": "delivered" | "failed" | "cancelled" | "superseded" | "expired"}
+
+The journal is replayed on load and rewritten with only the live entries once
+it grows well past them. An update that was being dispatched during a crash
+is simply pending again on restart (devices check the version they run).
+
+A watcher thread decides when to deliver. Liveness comes from heartbeat()
+calls (device heartbeats, pull-mode check-ins) and from the online() callback
+the OTA agent registers (deployment status, SDN-WISE reports). Deliveries go
+through a token bucket and a bounded worker pool, so a gateway reboot that
+brings hundreds of devices back at once is drained at a steady rate instead
+of all at once. Failed deliveries back off exponentially per the entry's
+retry policy.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DispatchFn = Callable[[str, Dict[str, Any]], Dict[str, Any]]
+OnlineFn = Callable[[List[str]], Set[str]]
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + "Z" if ts else None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Seconds until a token is available; takes it when that is 0."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class OtaDeliveryQueue:
+    def __init__(
+        self,
+        path: Path,
+        rate_per_second: float = 5.0,
+        burst: float = 10.0,
+        max_concurrency: int = 5,
+        poll_seconds: float = 5.0,
+        heartbeat_timeout: float = 60.0
+    ):
+        self.path = Path(path)
+        self.max_concurrency = max_concurrency
+        self.poll_seconds = poll_seconds
+        self.heartbeat_timeout = heartbeat_timeout
+        self._bucket = TokenBucket(rate_per_second, burst)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.Semaphore(max_concurrency)
+        self._dispatch: Optional[DispatchFn] = None
+        self._online: Optional[OnlineFn] = None
+
+        self._entries: Dict[str, Dict[str, Any]] = {}      # device_id -> entry
+        self._in_flight: Set[str] = set()
+        self._heartbeats: Dict[str, float] = {}
+        self._journal_lines = 0
+        self._loaded = False
+        self.counters = {"enqueued": 0, "delivered": 0, "failed": 0, "retried": 0,
+                         "superseded": 0, "cancelled": 0, "expired": 0}
+
+    # -- journal ---------------------------------------------------------------
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                self._journal_lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append
+                    continue
+                op = record.get("op")
+                if op == "enqueue":
+                    entry = record["entry"]
+                    self._entries[entry["device_id"]] = entry
+                elif op in ("attempt", "done"):
+                    entry = self._entries.get(record.get("device_id"))
+                    if entry is None or entry["id"] != record.get("id"):
+                        continue
+                    if op == "attempt":
+                        entry.update(attempts=record["attempts"], next_attempt_at=record["next_attempt_at"],
+                                     last_error=record.get("error"))
+                    else:
+                        del self._entries[entry["device_id"]]
+        logger.info(f"OTA queue loaded {len(self._entries)} pending updates from {self.path.name}")
+
+    def _append(self, records: Iterable[Dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                self._journal_lines += 1
+            f.flush()
+            os.fsync(f.fileno())
+        if self._journal_lines > max(1000, 4 * len(self._entries)):
+            self._compact()
+
+    def _compact(self):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps({"op": "enqueue", "entry": entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._journal_lines = len(self._entries)
+
+    # -- API -------------------------------------------------------------------
+
+    def configure(self, dispatch: DispatchFn, online: Optional[OnlineFn] = None):
+        """Register how updates are delivered and how online devices are found."""
+        self._dispatch = dispatch
+        self._online = online
+
+    def enqueue(self, device_id: str, firmware: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        return self.enqueue_many([device_id], firmware, **kwargs)[0]
+
+    def enqueue_many(self, device_ids: Iterable[str], firmware: Dict[str, Any], source: Optional[str] = None,
+                     max_retries: int = 3, retry_delay_seconds: float = 60.0, exponential_backoff: bool = True,
+                     ttl_seconds: float = DEFAULT_TTL_SECONDS) -> List[Dict[str, Any]]:
+        """Queue one image for several devices with a single journal write."""
+        now = time.time()
+        image = {k: firmware.get(k) for k in ("version", "binary_url", "signature", "sha256") if firmware.get(k)}
+        entries = [
+            {
+                "id": uuid.uuid4().hex[:12],
+                "device_id": device_id,
+                "firmware": image,
+                "source": source,
+                "queued_at": now,
+                "expires_at": now + ttl_seconds,
+                "attempts": 0,
+                "max_retries": max_retries,
+                "retry_delay_seconds": retry_delay_seconds,
+                "exponential_backoff": exponential_backoff,
+                "next_attempt_at": now,
+                "last_error": None,
+            }
+            for device_id in dict.fromkeys(device_ids)
+        ]
+        with self._lock:
+            self._load()
+            records = []
+            for entry in entries:
+                previous = self._entries.get(entry["device_id"])
+                if previous is not None:
+                    records.append({"op": "done", "id": previous["id"], "device_id": entry["device_id"],
+                                    "status": "superseded"})
+                    self.counters["superseded"] += 1
+                self._entries[entry["device_id"]] = entry
+                records.append({"op": "enqueue", "entry": entry})
+            if records:
+                self._append(records)
+            self.counters["enqueued"] += len(entries)
+            public = [self._public(entry) for entry in entries]
+        self._wake.set()
+        return public
+
+    def cancel(self, device_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            entry = self._entries.get(device_id)
+            if entry is None:
+                raise ValueError(f"No queued OTA update for {device_id}")
+            if device_id in self._in_flight:
+                raise ValueError(f"OTA update for {device_id} is being delivered")
+            self._finish(entry, "cancelled")
+        return self._public(entry, status="cancelled")
+
+    def heartbeat(self, device_ids: Iterable[str]) -> int:
+        """Mark devices as just seen; returns how many have a queued update."""
+        now = time.time()
+        with self._lock:
+            self._load()
+            waiting = 0
+            for device_id in device_ids:
+                self._heartbeats[device_id] = now
+                waiting += device_id in self._entries
+            # Keep the heartbeat map bounded to recently seen devices
+            if len(self._heartbeats) > 4 * max(len(self._entries), 1024):
+                cutoff = now - self.heartbeat_timeout
+                self._heartbeats = {d: t for d, t in self._heartbeats.items() if t >= cutoff}
+        if waiting:
+            self._wake.set()
+        return waiting
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._load()
+            entry = self._entries.get(device_id)
+            return self._public(entry) if entry else None
+
+    def list(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._load()
+            entries = sorted(self._entries.values(), key=lambda e: e["queued_at"])[:limit]
+            return [self._public(e) for e in entries]
+
+    def depth(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            return {
+                "pending": len(self._entries),
+                "in_flight": len(self._in_flight),
+                "running": self._thread is not None,
+                "rate_per_second": self._bucket.rate,
+                "max_concurrency": self.max_concurrency,
+                **self.counters,
+            }
+
+    def _public(self, entry: Dict[str, Any], status: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            **{k: v for k, v in entry.items() if k not in ("queued_at", "expires_at", "next_attempt_at")},
+            "status": status or ("delivering" if entry["device_id"] in self._in_flight else "pending"),
+            "queued_at": _iso(entry["queued_at"]),
+            "expires_at": _iso(entry["expires_at"]),
+            "next_attempt_at": _iso(entry["next_attempt_at"]),
+        }
+
+    def _finish(self, entry: Dict[str, Any], status: str):
+        """Drop a live entry and journal why (caller holds the lock)."""
+        if self._entries.get(entry["device_id"]) is entry:
+            del self._entries[entry["device_id"]]
+        self.counters[status] = self.counters.get(status, 0) + 1
+        self._append([{"op": "done", "id": entry["id"], "device_id": entry["device_id"], "status": status}])
+
+    # -- delivery ----------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ota-queue")
+        self._thread = threading.Thread(target=self._run, name="ota-queue-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout=5)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.dispatch_ready()
+            except Exception as e:
+                logger.exception(f"OTA queue dispatch failed: {e}")
+
+    def _ready(self) -> List[Dict[str, Any]]:
+        """Due entries whose device is online, oldest first."""
+        now = time.time()
+        with self._lock:
+            self._load()
+            for entry in [e for e in self._entries.values() if e["expires_at"] <= now
+                          and e["device_id"] not in self._in_flight]:
+                self._finish(entry, "expired")
+            due = [e for e in self._entries.values()
+                   if e["next_attempt_at"] <= now and e["device_id"] not in self._in_flight]
+            fresh = {d for d, seen in self._heartbeats.items() if now - seen < self.heartbeat_timeout}
+        if not due:
+            return []
+        online = {e["device_id"] for e in due if e["device_id"] in fresh}
+        if self._online is not None:
+            online |= self._online([e["device_id"] for e in due if e["device_id"] not in online])
+        return sorted((e for e in due if e["device_id"] in online), key=lambda e: e["queued_at"])
+
+    def dispatch_ready(self) -> int:
+        """Deliver every due update whose device is online, rate limited; returns how many were started."""
+        if self._dispatch is None or self._pool is None:
+            return 0
+        started = 0
+        for entry in self._ready():
+            delay = self._bucket.delay()
+            while delay > 0:
+                if self._stop.wait(delay):
+                    return started
+                delay = self._bucket.delay()
+            # Blocks while max_concurrency deliveries are running
+            while not self._slots.acquire(timeout=0.5):
+                if self._stop.is_set():
+                    return started
+            with self._lock:
+                if self._entries.get(entry["device_id"]) is not entry:
+                    # Cancelled or superseded while waiting for a token
+                    self._slots.release()
+                    continue
+                self._in_flight.add(entry["device_id"])
+            self._pool.submit(self._deliver, entry)
+            started += 1
+        return started
+
+    def _deliver(self, entry: Dict[str, Any]):
+        device_id = entry["device_id"]
+        try:
+            try:
+                result = self._dispatch(device_id, entry["firmware"])
+                error = None if result.get("status") == "completed" else result.get("error", result.get("status"))
+            except Exception as e:
+                error = str(e)
+            with self._lock:
+                self._in_flight.discard(device_id)
+                if self._entries.get(device_id) is not entry:
+                    return
+                if error is None:
+                    self._finish(entry, "delivered")
+                    logger.info(f"Delivered queued OTA {entry['firmware'].get('version')} to {device_id}")
+                    return
+                entry["attempts"] += 1
+                entry["last_error"] = error
+                if entry["attempts"] > entry["max_retries"]:
+                    self._finish(entry, "failed")
+                    logger.warning(f"Queued OTA to {device_id} failed after {entry['attempts']} attempts: {error}")
+                    return
+                backoff = 2 ** (entry["attempts"] - 1) if entry.get("exponential_backoff", True) else 1
+                entry["next_attempt_at"] = time.time() + entry["retry_delay_seconds"] * backoff
+                self.counters["retried"] += 1
+                self._append([{"op": "attempt", "id": entry["id"], "device_id": device_id,
+                               "attempts": entry["attempts"], "next_attempt_at": entry["next_attempt_at"],
+                               "error": error}])
+        finally:
+            self._slots.release()
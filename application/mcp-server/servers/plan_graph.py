@@ -0,0 +1,139 @@
+"""Step dependency graphs for plans.
+
+A step may declare "depends_on": one step_id or a list of them (a step
+without a step_id is referred to as "step-<index>"). PlanGraph checks the
+references, orders the steps topologically and finds the critical path:
+the chain of dependent steps with the largest total duration, which is how
+long the plan takes when everything off that chain runs concurrently.
+
+Plans without any depends_on keep the meaning of their algorithm type:
+"sequential" chains every step to the previous one, "parallel" leaves them
+all independent.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import plan_step_seconds
+
+# Observed latencies are only trusted once a protocol has this many successful steps
+MIN_LATENCY_SAMPLES = 5
+
+
+def step_name(step: Dict[str, Any], index: int) -> str:
+    step_id = step.get("step_id")
+    return str(step_id) if step_id is not None else f"step-{index}"
+
+
+def has_dependencies(steps: List[Dict[str, Any]]) -> bool:
+    return any(step.get("depends_on") not in (None, [], "") for step in steps)
+
+
+def observed_latency_ms(protocol: Optional[str]) -> Optional[float]:
+    """Mean dispatch latency of successful steps over `protocol`, from the plan step metrics."""
+    if not protocol:
+        return None
+    snapshot = plan_step_seconds.snapshot(protocol.upper(), "success")
+    if snapshot["count"] < MIN_LATENCY_SAMPLES:
+        return None
+    return snapshot["sum"] / snapshot["count"] * 1000.0
+
+
+class PlanGraph:
+    """
+    Dependencies between the steps of a plan, by step index. Raises
+    ValueError for duplicate step_ids, unknown references and cycles.
+    """
+
+    def __init__(self, steps: List[Dict[str, Any]], chain: bool = False):
+        self.steps = steps
+        self.names = [step_name(step, index) for index, step in enumerate(steps)]
+        positions: Dict[str, int] = {}
+        for index, name in enumerate(self.names):
+            if name in positions:
+                raise ValueError(f"Duplicate step_id: {name}")
+            positions[name] = index
+
+        self.dependencies: List[List[int]] = []
+        for index, step in enumerate(steps):
+            refs = step.get("depends_on")
+            if refs in (None, [], ""):
+                refs = [self.names[index - 1]] if chain and index > 0 else []
+            elif not isinstance(refs, list):
+                refs = [refs]
+            dependencies = []
+            for ref in refs:
+                position = positions.get(str(ref))
+                if position is None:
+                    raise ValueError(f"Step {self.names[index]} depends on unknown step {ref}")
+                if position not in dependencies:
+                    dependencies.append(position)
+            self.dependencies.append(dependencies)
+
+        self.dependents: List[List[int]] = [[] for _ in steps]
+        for index, dependencies in enumerate(self.dependencies):
+            for dependency in dependencies:
+                self.dependents[dependency].append(index)
+        self.order = self._topological_order()
+
+    @classmethod
+    def for_plan(cls, steps: List[Dict[str, Any]], execution_type: str = "sequential") -> "PlanGraph":
+        """Graph of a plan: explicit depends_on if any step has one, otherwise implied by the algorithm type."""
+        chain = execution_type != "parallel" and not has_dependencies(steps)
+        return cls(steps, chain=chain)
+
+    def _topological_order(self) -> List[int]:
+        waiting = [len(dependencies) for dependencies in self.dependencies]
+        order = [index for index, count in enumerate(waiting) if count == 0]
+        for index in order:
+            for dependent in self.dependents[index]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    order.append(dependent)
+        if len(order) < len(self.steps):
+            cyclic = [self.names[index] for index, count in enumerate(waiting) if count > 0]
+            raise ValueError(f"Step dependencies form a cycle: {', '.join(cyclic)}")
+        return order
+
+    def roots(self) -> List[int]:
+        return [index for index in self.order if not self.dependencies[index]]
+
+    def critical_path(self, durations: List[float]) -> Tuple[float, List[int]]:
+        """Longest chain by total duration: (its duration, its step indices in order)."""
+        if not self.steps:
+            return 0.0, []
+        finish = [0.0] * len(self.steps)
+        previous: List[Optional[int]] = [None] * len(self.steps)
+        for index in self.order:
+            start, latest = 0.0, None
+            for dependency in self.dependencies[index]:
+                if latest is None or finish[dependency] > start:
+                    start, latest = finish[dependency], dependency
+            previous[index] = latest
+            finish[index] = start + durations[index]
+        # On ties, prefer the step furthest along the graph so the path is the longest chain
+        last = max(reversed(self.order), key=lambda index: finish[index])
+        path = [last]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        return finish[last], path[::-1]
+
+    def schedule(self, expected_ms: Callable[[Dict[str, Any]], float],
+                 timeout_ms: Callable[[Dict[str, Any]], float]) -> Dict[str, Any]:
+        """
+        Up-front estimate: the critical path by expected step durations, and
+        the worst case along timeouts (each step using its full timeout).
+        """
+        estimate, path = self.critical_path([expected_ms(step) for step in self.steps])
+        worst_case, _ = self.critical_path([timeout_ms(step) for step in self.steps])
+        return {
+            "estimated_ms": int(round(estimate)),
+            "worst_case_ms": int(round(worst_case)),
+            "critical_path": [self.names[index] for index in path],
+            "depth": self._depth()
+        }
+
+    def _depth(self) -> int:
+        """Number of dependency levels (1 for fully parallel plans)."""
+        level = [0] * len(self.steps)
+        for index in self.order:
+            level[index] = max((level[dependency] + 1 for dependency in self.dependencies[index]), default=1)
+        return max(level, default=0)
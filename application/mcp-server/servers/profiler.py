@@ -0,0 +1,285 @@
+"""On-demand CPU sampling and memory growth diagnostics for a live server.
+
+SamplingProfiler starts a thread that reads `sys._current_frames()` every
+interval for the requested duration and counts the stack of every other
+thread, including the event loop. Samples are wall-clock; stacks whose
+innermost frame is a known blocking wait (idle pool workers, the selector)
+are dropped unless include_idle is set. Nothing is installed while no
+profile is running, so the server pays nothing between runs.
+
+Profiles are rendered as collapsed stacks (flamegraph.pl / speedscope
+import) or as a speedscope JSON document, plus a top-functions summary.
+
+MemoryTracker wraps tracemalloc: start() records a baseline snapshot, diff()
+compares a fresh snapshot with it to show what grew, stop() turns tracing
+off again (tracemalloc slows allocations while it is on).
+"""
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+MIN_INTERVAL_MS = 1.0
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# (file basename, function) of innermost frames that mean "waiting, not working"
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+}
+
+Frame = Tuple[str, str, int]   # (qualified name, file, first line)
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_PACKAGE_ROOT):
+        return os.path.relpath(filename, _PACKAGE_ROOT)
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+class Profile:
+    def __init__(self, interval_s: float, include_idle: bool):
+        self.interval_s = interval_s
+        self.include_idle = include_idle
+        self.started = time.time()
+        self.duration_s = 0.0
+        self.samples = 0
+        self.idle_samples = 0
+        # (thread name, stack root-first) -> sample count
+        self.stacks: Counter = Counter()
+
+    def collapsed(self) -> str:
+        """One `thread;outer;...;inner count` line per distinct stack."""
+        lines = []
+        for (thread, stack), count in self.stacks.most_common():
+            frames = [f"{name} ({path}:{line})" for name, path, line in stack]
+            lines.append(";".join([thread] + frames) + f" {count}")
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def speedscope(self, name: str = "mcp-server") -> Dict[str, Any]:
+        """speedscope file-format document with one sampled profile per thread."""
+        frame_index: Dict[Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        per_thread: Dict[str, Dict[str, list]] = {}
+        for (thread, stack), count in self.stacks.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            profile = per_thread.setdefault(thread, {"samples": [], "weights": []})
+            profile["samples"].append(indices)
+            profile["weights"].append(round(count * self.interval_s, 6))
+        profiles = [
+            {
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(p["weights"]), 6),
+                "samples": p["samples"],
+                "weights": p["weights"],
+            }
+            for thread, p in sorted(per_thread.items())
+        ]
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "servers.profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def top(self, limit: int = 20) -> Dict[str, Any]:
+        """Functions by self samples (innermost frame) and total samples (anywhere on the stack)."""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for (_, stack), count in self.stacks.items():
+            if not stack:
+                continue
+            self_counts[stack[-1]] += count
+            for frame in set(stack):
+                total_counts[frame] += count
+        busy = sum(self.stacks.values()) or 1
+
+        def rows(counter: Counter) -> List[Dict[str, Any]]:
+            return [
+                {"function": f[0], "file": f"{f[1]}:{f[2]}", "samples": c, "percent": round(100.0 * c / busy, 2)}
+                for f, c in counter.most_common(limit)
+            ]
+        return {"self": rows(self_counts), "total": rows(total_counts)}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "duration_s": round(self.duration_s, 3),
+            "interval_ms": round(self.interval_s * 1000, 3),
+            "samples": self.samples,
+            "idle_samples_dropped": 0 if self.include_idle else self.idle_samples,
+            "distinct_stacks": len(self.stacks),
+            "threads": sorted({thread for thread, _ in self.stacks}),
+        }
+
+
+class SamplingProfiler:
+    """Runs at most one sampling session at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Optional[Profile] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return self._active is not None
+
+    def start(self, interval_ms: float = 10.0, include_idle: bool = False) -> Profile:
+        if interval_ms < MIN_INTERVAL_MS:
+            raise ValueError(f"interval_ms must be at least {MIN_INTERVAL_MS}")
+        with self._lock:
+            if self._active is not None:
+                raise RuntimeError("A profile is already running")
+            profile = Profile(interval_ms / 1000.0, include_idle)
+            self._active = profile
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(profile,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({interval_ms}ms interval)")
+        return profile
+
+    def stop(self) -> Profile:
+        with self._lock:
+            profile, thread = self._active, self._thread
+            if profile is None:
+                raise RuntimeError("No profile is running")
+            self._stop.set()
+        thread.join()
+        with self._lock:
+            self._active = None
+            self._thread = None
+        profile.duration_s = time.time() - profile.started
+        logger.info(f"Sampling profiler stopped: {profile.samples} samples over {profile.duration_s:.1f}s")
+        return profile
+
+    def _run(self, profile: Profile):
+        own = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(profile.interval_s):
+            frames = sys._current_frames()
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack: List[Frame] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((getattr(code, "co_qualname", code.co_name), _short_path(code.co_filename),
+                                  code.co_firstlineno))
+                    frame = frame.f_back
+                profile.samples += 1
+                if stack and not profile.include_idle:
+                    leaf = stack[0]
+                    if (os.path.basename(leaf[1]), leaf[0].rsplit(".", 1)[-1]) in IDLE_FRAMES:
+                        profile.idle_samples += 1
+                        continue
+                stack.reverse()
+                profile.stacks[(names.get(ident, f"thread-{ident}"), tuple(stack))] += 1
+
+
+class MemoryTracker:
+    """tracemalloc baseline/diff; tracing is only on between start() and stop()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_here = False
+        self.started_at: Optional[float] = None
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ])
+
+    def start(self, nframes: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, min(int(nframes), 64)))
+                self._started_here = True
+            self._baseline = self._snapshot()
+            self.started_at = time.time()
+        return self.status()
+
+    def diff(self, top: int = 20, group_by: str = "lineno", reset: bool = False) -> Dict[str, Any]:
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise ValueError("group_by must be lineno, filename or traceback")
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                raise RuntimeError("Memory tracking is not running (use memory_start first)")
+            snapshot = self._snapshot()
+            stats = snapshot.compare_to(self._baseline, group_by)
+            if reset:
+                self._baseline = snapshot
+        growth = [s for s in stats if s.size_diff > 0][:max(1, int(top))]
+        result = {
+            "group_by": group_by,
+            "total_size_diff_kb": round(sum(s.size_diff for s in stats) / 1024, 1),
+            "total_count_diff": sum(s.count_diff for s in stats),
+            "top_growth": [
+                {
+                    "location": str(s.traceback[0]) if s.traceback else "?",
+                    "size_kb": round(s.size / 1024, 1),
+                    "size_diff_kb": round(s.size_diff / 1024, 1),
+                    "count": s.count,
+                    "count_diff": s.count_diff,
+                    **({"traceback": [str(f) for f in s.traceback]} if group_by == "traceback" else {}),
+                }
+                for s in growth
+            ],
+            "baseline_reset": reset,
+        }
+        result.update(self.status())
+        return result
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            status = self.status()
+            self._baseline = None
+            self.started_at = None
+            if self._started_here and tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._started_here = False
+        status["tracing"] = False
+        return status
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "since": self.started_at,
+            "traced_current_kb": round(current / 1024, 1),
+            "traced_peak_kb": round(peak / 1024, 1),
+            "tracemalloc_overhead_kb": round(tracemalloc.get_tracemalloc_memory() / 1024, 1) if tracing else 0,
+        }
@@ -0,0 +1,764 @@
+"""Protocol dispatcher for plan steps.
+
+Each transport is a plugin registered under the protocol names it serves
+(the "protocol" of a device service: HTTP/REST, MQTT, CoAP, BLE, ...). A
+plugin owns its connection pool and batching policy and implements an async
+send(); the dispatcher runs every plugin on one background event loop, so
+the synchronous plan executor (request threadpool) can dispatch one step or
+a whole parallel group in a single call.
+
+    http         HTTP/REST, HTTPS   keep-alive connection pool (httpx)
+    mqtt         MQTT               one broker connection, pipelined QoS 1 publishes,
+                                    replies read from <device>/<service>/response
+    coap         COAP, THREAD       native CoAP client (servers/coap.py), NSTART per mote
+    ble_gateway  BLE                commands batched into one POST to the BLE gateway
+
+The dispatcher retries transient failures per the step's retry policy
+and keeps a circuit breaker per device (see servers/resilience.py), so
+steps to a device that keeps timing out fail fast instead of each waiting
+out its timeout_ms.
+
+Every plugin has a loopback stand-in, enabled with PROTOCOL_LOOPBACK=all or
+a comma-separated list of plugin names: requests are answered in-process
+(httpx MockTransport, an in-process broker, a LoopbackCoapServer, a
+simulated gateway) instead of going to the network, so plans can be
+executed end to end without devices.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+import uuid
+
+import httpx
+
+from .metrics import plan_step_retries
+from .resilience import CircuitBreakerRegistry, RetryPolicy
+from .coap import (
+    COAP_PORT, DEFAULT_BLOCK_SIZE, FORMAT_JSON, CoapClient, LoopbackCoapServer, code_string, decode_payload
+)
+
+try:
+    import paho.mqtt.client as mqtt
+
+    _paho_available = True
+except ImportError:
+    mqtt = None
+    _paho_available = False
+
+logger = logging.getLogger(__name__)
+
+
+def instruction_call(instruction: Optional[str], parameters: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Method and body a plan instruction maps to (HTTP and CoAP)."""
+    if instruction == "activate_service":
+        return "POST", {"command": "activate", **parameters}
+    if instruction == "query_service":
+        return "GET", parameters
+    if instruction == "deactivate_service":
+        return "POST", {"command": "deactivate", **parameters}
+    return "POST", parameters
+
+
+def step_result(request: Dict[str, Any], status: str, **fields) -> Dict[str, Any]:
+    return {
+        "step_id": request.get("step_id"),
+        "instruction": request.get("instruction"),
+        "device_id": request.get("device_id"),
+        "service": request.get("service"),
+        "status": status,
+        **fields
+    }
+
+
+class BatchPolicy:
+    """
+    How a plugin groups sends: up to `max_batch` requests per batch, waiting
+    at most `linger_ms` for a batch to fill, with `concurrency` sends in
+    flight per plugin.
+    """
+
+    def __init__(self, max_batch: int = 1, linger_ms: float = 0.0, concurrency: int = 16):
+        self.max_batch = max(1, max_batch)
+        self.linger_ms = linger_ms
+        self.concurrency = max(1, concurrency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"max_batch": self.max_batch, "linger_ms": self.linger_ms, "concurrency": self.concurrency}
+
+
+class TransportPlugin:
+    """
+    Base class for transports. Subclasses set `name` and `protocols` and
+    implement send(); start()/close() open and release their pool on the
+    dispatcher loop. submit() adds the concurrency limit, the step deadline
+    (timeout_ms) and counters.
+
+    A request is a dict with step_id, instruction, device_id, service,
+    address (IP), mac, parameters, timeout_ms and the original plan step
+    (protocol-specific options such as port, path or observe).
+    """
+
+    name = "transport"
+    protocols: Tuple[str, ...] = ()
+
+    def __init__(self, batch: Optional[BatchPolicy] = None):
+        self.batch = batch or BatchPolicy()
+        self.loopback = False
+        self.started = False
+        self._start_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(self.batch.concurrency)
+        self.counters = {"sent": 0, "succeeded": 0, "failed": 0, "timeouts": 0, "batches": 0}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.started:
+            async with self._start_lock:
+                if not self.started:
+                    await self.start()
+                    self.started = True
+        timeout_ms = request.get("timeout_ms", 5000)
+        async with self._slots:
+            self.counters["sent"] += 1
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(self.send(request), timeout_ms / 1000.0)
+            except asyncio.TimeoutError:
+                result = step_result(request, "timeout", protocol=self.name, error=f"Request timeout after {timeout_ms}ms")
+            except Exception as e:
+                result = step_result(request, "failed", protocol=self.name, error=str(e), retryable=True)
+            result["duration_ms"] = int((time.perf_counter() - started) * 1000)
+        status = result.get("status")
+        if status == "success":
+            self.counters["succeeded"] += 1
+        elif status == "timeout":
+            self.counters["timeouts"] += 1
+        else:
+            self.counters["failed"] += 1
+        return result
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "protocols": list(self.protocols),
+            "loopback": self.loopback,
+            "started": self.started,
+            "batch": self.batch.to_dict(),
+            **self.counters,
+            "pool": self.pool_stats()
+        }
+
+
+class HttpTransport(TransportPlugin):
+    """HTTP/REST services: http(s)://<ip>:<port>/<service> over a keep-alive pool."""
+
+    name = "http"
+    protocols = ("HTTP", "HTTP/REST", "HTTPS", "REST")
+
+    def __init__(self, pool_size: int = 20):
+        super().__init__(BatchPolicy(concurrency=pool_size))
+        self.pool_size = pool_size
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(self._loopback) if self.loopback else None,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        step = request.get("step", {})
+        url = f"{step.get('protocol', 'http')}://{request.get('address')}:{step.get('port', 80)}/{request.get('service')}"
+        method, payload = instruction_call(request.get("instruction"), request.get("parameters", {}))
+        timeout = request.get("timeout_ms", 5000) / 1000.0
+        logger.info(f"HTTP {method} to {url} with timeout {request.get('timeout_ms', 5000)}ms")
+        try:
+            if method == "GET":
+                response = await self._client.get(url, params=payload, timeout=timeout)
+            else:
+                response = await self._client.post(url, json=payload, timeout=timeout)
+        except httpx.TimeoutException:
+            return step_result(request, "timeout", error=f"Request timeout after {request.get('timeout_ms', 5000)}ms", url=url)
+        except httpx.HTTPError as e:
+            return step_result(request, "failed", error=str(e), url=url, retryable=True)
+
+        if response.status_code in (200, 201, 202):
+            try:
+                response_data = response.json()
+            except ValueError:
+                response_data = response.text
+            return step_result(request, "success", method=method, url=url,
+                               response_code=response.status_code, response=response_data)
+        return step_result(request, "failed", method=method, url=url, response_code=response.status_code,
+                           error=f"HTTP {response.status_code}: {response.text}")
+
+    @staticmethod
+    def _loopback(request: httpx.Request) -> httpx.Response:
+        received = json.loads(request.content) if request.content else dict(request.url.params)
+        return httpx.Response(200, json={
+            "device": request.url.host,
+            "service": request.url.path.strip("/"),
+            "method": request.method,
+            "received": received,
+            "status": "ok"
+        })
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {"max_connections": self.pool_size}
+
+
+class _LoopbackBroker:
+    """
+    In-process stand-in for the broker and the devices behind it: every
+    publish is acknowledged and every command is answered on the matching
+    response topic.
+    """
+
+    def __init__(self, plugin: "MqttTransport", loop: asyncio.AbstractEventLoop):
+        self.plugin = plugin
+        self.loop = loop
+        self.published = deque(maxlen=1000)
+        self._mid = 0
+
+    def publish(self, topic: str, payload: str, qos: int) -> int:
+        self._mid += 1
+        mid = self._mid
+        self.published.append((topic, payload))
+        self.loop.call_soon(self.plugin._published, mid)
+        if topic.endswith("/command"):
+            command = json.loads(payload)
+            reply = json.dumps({
+                "request_id": command.get("request_id"),
+                "status": "ok",
+                "instruction": command.get("instruction"),
+                "parameters": command.get("parameters")
+            })
+            self.loop.call_soon(self.plugin._reply, topic[:-len("command")] + "response", reply.encode())
+        return mid
+
+
+class MqttTransport(TransportPlugin):
+    """
+    MQTT services: commands are published (QoS 1) to
+    <device>/<service>/command. Publishes are pipelined up to `max_inflight`
+    unacknowledged messages on the one broker connection. Steps that expect
+    a reply (query_service, or expect_response in the step) wait for a
+    message with the same request_id on <device>/<service>/response.
+    """
+
+    name = "mqtt"
+    protocols = ("MQTT",)
+
+    def __init__(self, host: str = "localhost", port: int = 1883, max_inflight: int = 20, qos: int = 1):
+        super().__init__(BatchPolicy(concurrency=max_inflight))
+        self.host = host
+        self.port = port
+        self.max_inflight = max_inflight
+        self.qos = qos
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client = None
+        self._broker: Optional[_LoopbackBroker] = None
+        self._acks: Dict[int, asyncio.Future] = {}
+        self._replies: Dict[str, asyncio.Future] = {}
+        self._connected = False
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.loopback:
+            self._broker = _LoopbackBroker(self, self._loop)
+            self._connected = True
+            return
+        if not _paho_available:
+            return
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        else:
+            client = mqtt.Client()
+        client.max_inflight_messages_set(self.max_inflight)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_publish = lambda _client, _userdata, mid, *args: self._loop.call_soon_threadsafe(self._published, mid)
+        client.on_message = lambda _client, _userdata, message: self._loop.call_soon_threadsafe(
+            self._reply, message.topic, message.payload
+        )
+        client.connect_async(self.host, self.port, keepalive=60)
+        client.loop_start()
+        self._client = client
+
+    async def close(self):
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        self._connected = True
+        client.subscribe("+/+/response", qos=self.qos)
+        logger.info(f"MQTT connected to {self.host}:{self.port}")
+
+    def _on_disconnect(self, client, userdata, *args):
+        self._connected = False
+
+    def _published(self, mid: int):
+        ack = self._acks.pop(mid, None)
+        if ack is not None and not ack.done():
+            ack.set_result(True)
+
+    def _reply(self, topic: str, payload: bytes):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        reply = self._replies.pop(message.get("request_id"), None) if isinstance(message, dict) else None
+        if reply is not None and not reply.done():
+            reply.set_result(message)
+
+    async def send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if self._broker is None and self._client is None:
+            return step_result(request, "failed", protocol="MQTT",
+                               error="paho-mqtt is not installed (or set PROTOCOL_LOOPBACK=mqtt)")
+        step = request.get("step", {})
+        instruction = request.get("instruction")
+        topic = f"{request.get('device_id')}/{request.get('service')}/command"
+        payload = {
+            "request_id": uuid.uuid4().hex,
+            "instruction": instruction,
+            "parameters": request.get("parameters", {}),
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        expect_reply = step.get("expect_response", instruction == "query_service")
+        reply = None
+        if expect_reply:
+            reply = self._replies[payload["request_id"]] = self._loop.create_future()
+        logger.info(f"MQTT publish to {topic} with timeout {request.get('timeout_ms', 5000)}ms")
+        mid, ack = None, None
+        try:
+            if self._broker is not None:
+                mid = self._broker.publish(topic, json.dumps(payload), self.qos)
+            else:
+                info = self._client.publish(topic, json.dumps(payload), qos=self.qos)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS and info.rc != mqtt.MQTT_ERR_NO_CONN:
+                    return step_result(request, "failed", protocol="MQTT", topic=topic, retryable=True,
+                                       error=f"MQTT publish failed: {mqtt.error_string(info.rc)}")
+                mid = info.mid
+            ack = self._acks[mid] = self._loop.create_future()
+            # QoS 1: wait for the PUBACK; paho queues the message while reconnecting
+            await ack
+            response: Any = f"MQTT published to {topic}"
+            if reply is not None:
+                response = await reply
+        finally:
+            self._replies.pop(payload["request_id"], None)
+            # Timed out or cancelled before the PUBACK; paho reuses mids, so only drop our own future
+            if ack is not None and self._acks.get(mid) is ack:
+                del self._acks[mid]
+        return step_result(request, "success", protocol="MQTT", topic=topic, payload=payload, response=response)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            "broker": "loopback" if self.loopback else f"{self.host}:{self.port}",
+            "connected": self._connected,
+            "max_inflight": self.max_inflight,
+            "awaiting_ack": len(self._acks),
+            "awaiting_reply": len(self._replies)
+        }
+
+
+class CoapTransport(TransportPlugin):
+    """
+    CoAP services on the motes: coap://<ip>:<port>/<path or service>. GET
+    parameters go in Uri-Query, other bodies as JSON (Content-Format 50).
+    A step with "observe": {"notifications": n, "duration_ms": t} collects
+    up to n notifications (or as many as arrive within t) and deregisters.
+    """
+
+    name = "coap"
+    protocols = ("COAP", "THREAD")
+
+    def __init__(self, nstart: int = 1, block_size: int = DEFAULT_BLOCK_SIZE, concurrency: int = 64):
+        super().__init__(BatchPolicy(concurrency=concurrency))
+        self.nstart = nstart
+        self.block_size = block_size
+        self._client: Optional[CoapClient] = None
+        self.server: Optional[LoopbackCoapServer] = None
+
+    async def start(self):
+        self._client = CoapClient(nstart=self.nstart, block_size=self.block_size)
+        if self.loopback:
+            self.server = LoopbackCoapServer(self.block_size)
+            await self.server.start()
+
+    async def close(self):
+        if self._client is not None:
+            self._client.close()
+        if self.server is not None:
+            self.server.close()
+
+    async def send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        step = request.get("step", {})
+        address = request.get("address")
+        port = step.get("port", COAP_PORT)
+        path = (step.get("path") or request.get("service") or "").strip("/")
+        uri = f"coap://{f'[{address}]' if address and ':' in address else address}:{port}/{path}"
+        host, uri_host = address, None
+        if self.server is not None:
+            # One in-process server stands in for every mote, told apart by Uri-Host
+            uri_host = address or request.get("device_id")
+            host, port = self.server.local_addr
+        if not host:
+            return step_result(request, "failed", protocol="CoAP", error="Device has no IP address")
+
+        observe = step.get("observe")
+        if observe:
+            notifications = await self._observe(host, port, path, uri_host, observe, request.get("timeout_ms", 5000))
+            return step_result(request, "success", protocol="CoAP", method="GET", uri=uri,
+                               observe=True, response=notifications)
+
+        method, payload = instruction_call(request.get("instruction"), request.get("parameters", {}))
+        if method == "GET":
+            response = await self._client.request(host, "GET", path, port=port, query=payload, uri_host=uri_host)
+        else:
+            response = await self._client.request(host, method, path, json.dumps(payload).encode(), port=port,
+                                                  content_format=FORMAT_JSON, uri_host=uri_host)
+        if response.success:
+            return step_result(request, "success", protocol="CoAP", method=method, uri=uri,
+                               response_code=code_string(response.code), response=decode_payload(response))
+        return step_result(request, "failed", protocol="CoAP", method=method, uri=uri,
+                           response_code=code_string(response.code),
+                           error=f"CoAP {code_string(response.code)}: {decode_payload(response)}")
+
+    async def _observe(self, host: str, port: int, path: str, uri_host: Optional[str],
+                       observe: Dict[str, Any], timeout_ms: int) -> List[Any]:
+        if not isinstance(observe, dict):
+            observe = {}
+        wanted = int(observe.get("notifications", 1))
+        # Leave room for deregistration inside the step deadline
+        duration = min(float(observe.get("duration_ms", timeout_ms)), timeout_ms * 0.8) / 1000.0
+        observation = await self._client.observe(host, path, port=port, uri_host=uri_host)
+        notifications: List[Any] = []
+
+        async def collect():
+            async for message in observation:
+                notifications.append(decode_payload(message))
+                if len(notifications) >= wanted:
+                    return
+
+        try:
+            await asyncio.wait_for(collect(), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await observation.cancel()
+        return notifications
+
+    def pool_stats(self) -> Dict[str, Any]:
+        stats = {"nstart": self.nstart, "block_size": self.block_size}
+        if self._client is not None:
+            stats.update(self._client.stats())
+        return stats
+
+
+class BleGatewayTransport(TransportPlugin):
+    """
+    BLE devices have no IP address; commands go through the BLE gateway's
+    HTTP API in batches:
+
+        POST <gateway>/commands {"commands": [{"id", "device", "address", "service", "instruction", "parameters"}]}
+        -> {"results": [{"id", "status": "ok" | "error", "response" | "error"}]}
+
+    Concurrent sends are queued and flushed as one request once `max_batch`
+    are waiting or `linger_ms` after the first, so a parallel group of BLE
+    steps costs one gateway round trip.
+    """
+
+    name = "ble_gateway"
+    protocols = ("BLE",)
+
+    def __init__(self, gateway_url: str = "", max_batch: int = 32, linger_ms: float = 10.0, pool_size: int = 4):
+        super().__init__(BatchPolicy(max_batch=max_batch, linger_ms=linger_ms, concurrency=max_batch * pool_size))
+        self.gateway_url = gateway_url.rstrip("/")
+        self.pool_size = pool_size
+        self._client: Optional[httpx.AsyncClient] = None
+        self._queue: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.gateway_requests = 0
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.gateway_url or "http://ble-gateway.loopback",
+            transport=httpx.MockTransport(self._loopback) if self.loopback else None,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.gateway_url and not self.loopback:
+            return step_result(request, "failed", protocol="BLE", error="BLE_GATEWAY_URL is not configured")
+        command = {
+            "id": uuid.uuid4().hex,
+            "device": request.get("device_id"),
+            "address": request.get("mac") or request.get("address"),
+            "service": request.get("service"),
+            "instruction": request.get("instruction"),
+            "parameters": request.get("parameters", {}),
+            "timeout_ms": request.get("timeout_ms", 5000)
+        }
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((command, future))
+        if len(self._queue) >= self.batch.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch.linger_ms / 1000.0, self._flush)
+        result = await future
+        if result.get("status") == "ok":
+            return step_result(request, "success", protocol="BLE", gateway=self.gateway_url or "loopback",
+                               response=result.get("response"))
+        return step_result(request, "failed", protocol="BLE", gateway=self.gateway_url or "loopback",
+                           error=result.get("error", "BLE gateway error"), retryable=bool(result.get("retryable")))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._queue:
+            batch, self._queue = self._queue[:self.batch.max_batch], self._queue[self.batch.max_batch:]
+            asyncio.get_running_loop().create_task(self._post(batch))
+
+    async def _post(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        self.gateway_requests += 1
+        timeout = max(command["timeout_ms"] for command, _ in batch) / 1000.0
+        try:
+            response = await self._client.post("/commands", json={"commands": [command for command, _ in batch]},
+                                               timeout=timeout)
+            response.raise_for_status()
+            results = {result.get("id"): result for result in response.json().get("results", [])}
+            for command, future in batch:
+                if not future.done():
+                    future.set_result(results.get(command["id"], {"status": "error", "error": "No result from BLE gateway"}))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    @staticmethod
+    def _loopback(request: httpx.Request) -> httpx.Response:
+        commands = json.loads(request.content).get("commands", [])
+        return httpx.Response(200, json={"results": [
+            {
+                "id": command["id"],
+                "status": "ok",
+                "response": {"device": command["device"], "service": command["service"],
+                             "instruction": command["instruction"], "received": command["parameters"]}
+            }
+            for command in commands
+        ]})
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            "gateway": self.gateway_url or ("loopback" if self.loopback else None),
+            "gateway_requests": self.gateway_requests,
+            "queued": len(self._queue)
+        }
+
+
+class ProtocolDispatcher:
+    """
+    Registry of transport plugins by protocol name, and the background event
+    loop they run on. dispatch()/dispatch_many() are called from worker
+    threads and block until the plugins have answered, retries included.
+    A request's "retry" object overrides fields of the default policy.
+    """
+
+    def __init__(self, loopback: str = "", retry_policy: Optional[RetryPolicy] = None,
+                 breakers: Optional[CircuitBreakerRegistry] = None):
+        self.loopback = {name.strip().lower() for name in loopback.split(",") if name.strip()}
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers = breakers or CircuitBreakerRegistry()
+        self._plugins: Dict[str, TransportPlugin] = {}
+        self._by_protocol: Dict[str, TransportPlugin] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(self, plugin: TransportPlugin) -> TransportPlugin:
+        """Add a plugin; one registered under the same name is replaced."""
+        plugin.loopback = plugin.loopback or "all" in self.loopback or plugin.name in self.loopback
+        with self._lock:
+            previous = self._plugins.get(plugin.name)
+            if previous is not None:
+                for protocol in previous.protocols:
+                    self._by_protocol.pop(protocol.upper(), None)
+                if previous.started and self._loop is not None:
+                    asyncio.run_coroutine_threadsafe(previous.close(), self._loop)
+            self._plugins[plugin.name] = plugin
+            for protocol in plugin.protocols:
+                self._by_protocol[protocol.upper()] = plugin
+        return plugin
+
+    def plugin_for(self, protocol: Optional[str]) -> Optional[TransportPlugin]:
+        return self._by_protocol.get((protocol or "").upper())
+
+    def protocols(self) -> List[str]:
+        return sorted(self._by_protocol)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="protocol-dispatcher", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def dispatch(self, protocol: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        return self.dispatch_many([(protocol, request)])[0]
+
+    def submit(self, protocol: str, request: Dict[str, Any]) -> concurrent.futures.Future:
+        """Non-blocking dispatch(): the future resolves to the step result."""
+        plugin = self.plugin_for(protocol)
+        if plugin is None:
+            raise ValueError(f"Unsupported protocol: {protocol}")
+        plugin.counters["batches"] += 1
+        return asyncio.run_coroutine_threadsafe(self._deliver(plugin, request), self._ensure_loop())
+
+    def dispatch_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Send (protocol, request) pairs concurrently; results come back in
+        order. Requests for one plugin are in flight together, so the plugin
+        can pool and batch them.
+        """
+        if not items:
+            return []
+        plugins = []
+        for protocol, _ in items:
+            plugin = self.plugin_for(protocol)
+            if plugin is None:
+                raise ValueError(f"Unsupported protocol: {protocol}")
+            plugins.append(plugin)
+        for plugin in {plugin.name: plugin for plugin in plugins}.values():
+            plugin.counters["batches"] += 1
+
+        async def run() -> List[Dict[str, Any]]:
+            return list(await asyncio.gather(*(
+                self._deliver(plugin, request) for plugin, (_, request) in zip(plugins, items)
+            )))
+
+        # Attempts are bounded by their timeout_ms inside the plugin; this is a backstop
+        deadline = max(self.worst_case_seconds(request) for _, request in items) + 5
+        future = asyncio.run_coroutine_threadsafe(run(), self._ensure_loop())
+        try:
+            return future.result(deadline)
+        except concurrent.futures.TimeoutError:
+            # Stop the attempts so they release what they hold (half-open probe slots)
+            future.cancel()
+            raise
+
+    def worst_case_seconds(self, request: Dict[str, Any]) -> float:
+        """Upper bound for a request: every attempt times out after the longest backoff."""
+        try:
+            policy = self.retry_policy.with_overrides(request.get("retry"))
+        except (TypeError, ValueError):
+            policy = self.retry_policy
+        return policy.worst_case_seconds(request.get("timeout_ms", 5000))
+
+    async def _deliver(self, plugin: TransportPlugin, request: Dict[str, Any]) -> Dict[str, Any]:
+        """One step: attempts with backoff while failures are transient and the device's circuit allows."""
+        device_id = request.get("device_id")
+        try:
+            policy = self.retry_policy.with_overrides(request.get("retry"))
+        except (TypeError, ValueError) as e:
+            return step_result(request, "failed", protocol=plugin.name, error=f"Invalid retry policy: {e}",
+                               attempts=0, duration_ms=0)
+
+        started = time.perf_counter()
+        result: Optional[Dict[str, Any]] = None
+        failed_attempts: List[Dict[str, Any]] = []
+        attempts = 0
+        while attempts < policy.max_attempts:
+            if not self.breakers.allow(device_id):
+                if result is None:
+                    result = step_result(request, "failed", protocol=plugin.name,
+                                         error=f"Circuit open for device {device_id} after repeated failures")
+                break
+            attempts += 1
+            recorded = False
+            try:
+                result = await plugin.submit(request)
+                transient = policy.is_transient(result)
+                self.breakers.record(device_id, transient, result.get("error"))
+                recorded = True
+            finally:
+                if not recorded:
+                    # Cancelled before an outcome: hand back a half-open probe slot taken by allow()
+                    self.breakers.release(device_id)
+            if not transient or attempts == policy.max_attempts:
+                break
+            plan_step_retries.inc(plugin.name, result["status"])
+            failed_attempts.append({
+                "status": result["status"], "error": result.get("error"), "duration_ms": result.get("duration_ms")
+            })
+            await asyncio.sleep(policy.delay(attempts))
+
+        result.pop("retryable", None)
+        result["attempts"] = attempts
+        circuit = self.breakers.state(device_id) if device_id else "closed"
+        if circuit != "closed":
+            result["circuit"] = circuit
+        if failed_attempts:
+            result["retried"] = failed_attempts
+        result["duration_ms"] = int((time.perf_counter() - started) * 1000)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loop_running": self._loop is not None,
+            "loopback": sorted(self.loopback),
+            "retry_policy": self.retry_policy.to_dict(),
+            "circuit_breaker": self.breakers.settings(),
+            "protocols": {protocol: plugin.name for protocol, plugin in sorted(self._by_protocol.items())},
+            "plugins": [plugin.stats() for plugin in self._plugins.values()]
+        }
+
+    def close(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        started = [plugin for plugin in self._plugins.values() if plugin.started]
+
+        async def close_all():
+            await asyncio.gather(*(plugin.close() for plugin in started), return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_all(), loop).result(5)
+        except Exception as e:
+            logger.warning(f"Protocol plugins did not close cleanly: {e}")
+        for plugin in started:
+            plugin.started = False
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
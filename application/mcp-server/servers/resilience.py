@@ -0,0 +1,233 @@
+"""Retry policies and per-device circuit breakers for plan steps.
+
+A step is retried when an attempt fails transiently: a timeout, a
+transport error (connection refused, unreachable) or a retryable status
+code (HTTP 408/429/5xx, CoAP 5.00/5.03/5.04). Backoff is exponential with
+full jitter, so retries against a struggling device don't line up.
+
+Every attempt is also recorded in the device's circuit breaker. After
+`failure_threshold` consecutive transient failures the circuit opens, and
+steps to that device fail immediately instead of waiting out their
+timeout_ms. After `reset_seconds` the circuit is half-open: a limited
+number of probe requests go through, and the first one decides whether it
+closes again or stays open for another period. Answers such as HTTP 404
+count as successes here because the device did respond.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import random
+import threading
+import time
+
+DEFAULT_RETRYABLE_CODES = ("408", "429", "500", "502", "503", "504", "5.00", "5.03", "5.04")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    """Attempts per step and the backoff between them."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_ms: float = 100.0,
+        max_backoff_ms: float = 2000.0,
+        multiplier: float = 2.0,
+        retryable_status_codes: Iterable[Any] = DEFAULT_RETRYABLE_CODES
+    ):
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_ms = float(backoff_ms)
+        self.max_backoff_ms = float(max_backoff_ms)
+        self.multiplier = float(multiplier)
+        self.retryable_status_codes = {str(code) for code in retryable_status_codes}
+
+    def with_overrides(self, overrides: Optional[Dict[str, Any]]) -> "RetryPolicy":
+        """
+        Policy for one step: `overrides` is the plan's and the step's "retry"
+        object, e.g. {"max_attempts": 5, "backoff_ms": 200,
+        "max_backoff_ms": 5000, "retryable_status_codes": [503]}.
+        """
+        if not overrides:
+            return self
+        if not isinstance(overrides, dict):
+            raise ValueError("retry must be an object")
+        return RetryPolicy(
+            max_attempts=overrides.get("max_attempts", self.max_attempts),
+            backoff_ms=overrides.get("backoff_ms", self.backoff_ms),
+            max_backoff_ms=overrides.get("max_backoff_ms", self.max_backoff_ms),
+            multiplier=overrides.get("multiplier", self.multiplier),
+            retryable_status_codes=overrides.get("retryable_status_codes", self.retryable_status_codes)
+        )
+
+    def is_transient(self, result: Dict[str, Any]) -> bool:
+        """Whether a step result is a failure worth retrying (and held against the device)."""
+        status = result.get("status")
+        if status == "success":
+            return False
+        if status == "timeout":
+            return True
+        if "response_code" in result:
+            return str(result["response_code"]) in self.retryable_status_codes
+        return bool(result.get("retryable"))
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number `attempt` (1-based); full jitter."""
+        ceiling = min(self.max_backoff_ms, self.backoff_ms * self.multiplier ** (attempt - 1))
+        return random.uniform(0, ceiling) / 1000.0
+
+    def worst_case_seconds(self, timeout_ms: float) -> float:
+        return self.max_attempts * (timeout_ms + self.max_backoff_ms) / 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "backoff_ms": self.backoff_ms,
+            "max_backoff_ms": self.max_backoff_ms,
+            "multiplier": self.multiplier,
+            "retryable_status_codes": sorted(self.retryable_status_codes)
+        }
+
+
+class CircuitBreaker:
+    """Breaker state for one device; guarded by the registry's lock."""
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probes_in_flight = 0
+        self.failures = 0
+        self.successes = 0
+        self.rejected = 0
+        self.last_failure: Optional[str] = None
+        self.last_change = time.time()
+
+    def to_dict(self, reset_seconds: float) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == OPEN and self.opened_at is not None:
+            retry_in = round(max(0.0, self.opened_at + reset_seconds - time.monotonic()), 3)
+        return {
+            "device_id": self.device_id,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "successes": self.successes,
+            "rejected": self.rejected,
+            "last_failure": self.last_failure,
+            "probe_in_seconds": retry_in,
+            "since": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.last_change))
+        }
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers by device id."""
+
+    def __init__(self, failure_threshold: int = 3, reset_seconds: float = 30.0, half_open_probes: int = 1):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, device_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(device_id)
+        if breaker is None:
+            breaker = self._breakers[device_id] = CircuitBreaker(device_id)
+        return breaker
+
+    def _set_state(self, breaker: CircuitBreaker, state: str):
+        if breaker.state != state:
+            breaker.state = state
+            breaker.last_change = time.time()
+
+    def allow(self, device_id: Optional[str]) -> bool:
+        """
+        Whether a request to the device may go out now. In half-open state this
+        hands out a probe slot; the caller must report the outcome with
+        record(), or give the slot back with release() if there is none.
+        """
+        if not device_id:
+            return True
+        with self._lock:
+            breaker = self._get(device_id)
+            if breaker.state == OPEN:
+                if time.monotonic() - breaker.opened_at < self.reset_seconds:
+                    breaker.rejected += 1
+                    return False
+                self._set_state(breaker, HALF_OPEN)
+                breaker.probes_in_flight = 0
+            if breaker.state == HALF_OPEN:
+                if breaker.probes_in_flight >= self.half_open_probes:
+                    breaker.rejected += 1
+                    return False
+                breaker.probes_in_flight += 1
+            return True
+
+    def record(self, device_id: Optional[str], failed: bool, error: Optional[str] = None):
+        if not device_id:
+            return
+        with self._lock:
+            breaker = self._get(device_id)
+            if breaker.state == HALF_OPEN:
+                breaker.probes_in_flight = max(0, breaker.probes_in_flight - 1)
+            if failed:
+                breaker.failures += 1
+                breaker.consecutive_failures += 1
+                breaker.last_failure = error
+                if breaker.state == HALF_OPEN or breaker.consecutive_failures >= self.failure_threshold:
+                    self._set_state(breaker, OPEN)
+                    breaker.opened_at = time.monotonic()
+            else:
+                breaker.successes += 1
+                breaker.consecutive_failures = 0
+                self._set_state(breaker, CLOSED)
+
+    def release(self, device_id: Optional[str]):
+        """Give back a probe slot from allow() whose request never finished (cancelled); records no outcome."""
+        if not device_id:
+            return
+        with self._lock:
+            breaker = self._breakers.get(device_id)
+            if breaker is not None and breaker.state == HALF_OPEN:
+                breaker.probes_in_flight = max(0, breaker.probes_in_flight - 1)
+
+    def state(self, device_id: str) -> str:
+        with self._lock:
+            breaker = self._breakers.get(device_id)
+            if breaker is None:
+                return CLOSED
+            if breaker.state == OPEN and time.monotonic() - breaker.opened_at >= self.reset_seconds:
+                return HALF_OPEN
+            return breaker.state
+
+    def reset(self, device_id: Optional[str] = None) -> int:
+        """Forget breaker state for one device (or all); returns how many were cleared."""
+        with self._lock:
+            if device_id is None:
+                count = len(self._breakers)
+                self._breakers.clear()
+                return count
+            return 1 if self._breakers.pop(device_id, None) is not None else 0
+
+    def open_count(self) -> int:
+        with self._lock:
+            return sum(1 for breaker in self._breakers.values() if breaker.state != CLOSED)
+
+    def snapshot(self, device_id: Optional[str] = None, include_closed: bool = False) -> List[Dict[str, Any]]:
+        with self._lock:
+            breakers = [self._breakers[device_id]] if device_id in self._breakers else (
+                [] if device_id else list(self._breakers.values())
+            )
+            return [
+                breaker.to_dict(self.reset_seconds) for breaker in breakers
+                if include_closed or device_id or breaker.state != CLOSED
+            ]
+
+    def settings(self) -> Dict[str, Any]:
+        return {
+            "failure_threshold": self.failure_threshold,
+            "reset_seconds": self.reset_seconds,
+            "half_open_probes": self.half_open_probes
+        }
@@ -0,0 +1,394 @@
+"""Wave-based OTA rollout jobs.
+
+A rollout pushes one verified firmware image to a fleet in waves: a small
+canary first, then cumulative percentage batches (e.g. 10% -> 50% -> 100%).
+Each wave is pushed with bounded concurrency; when its failure rate crosses
+the threshold the job either pauses for an operator (resume / cancel /
+rollback) or rolls the already-updated devices back to the previous image on
+its own.
+
+Jobs run on a background thread per rollout, so the HTTP request that starts
+one returns a job id immediately and progress is polled through the job API
+(see NetworkAutoConfigurationAgent and the network-configuration endpoint).
+Targets that are unknown or offline are split off when the job is created
+and never count towards a wave's failure rate.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import itertools
+import logging
+import math
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CANARY = 1
+DEFAULT_BATCH_PERCENTAGES = [10, 50, 100]
+DEFAULT_FAILURE_THRESHOLD = 0.2
+ONLINE_STATUSES = ("active", "idle")
+
+# Terminal job states; anything else is still owned by the job thread
+FINISHED = ("completed", "failed", "rolled_back", "cancelled")
+
+PushFn = Callable[[str, Dict[str, Any]], Dict[str, Any]]
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def plan_waves(device_ids: List[str], canary: int = DEFAULT_CANARY,
+               batch_percentages: Optional[List[float]] = None) -> List[List[str]]:
+    """Split device_ids into a canary wave and cumulative percentage batches."""
+    percentages = sorted(float(p) for p in (batch_percentages or DEFAULT_BATCH_PERCENTAGES))
+    if any(p <= 0 or p > 100 for p in percentages):
+        raise ValueError("batch_percentages must be in (0, 100]")
+    if canary < 0:
+        raise ValueError("canary must be >= 0")
+    total = len(device_ids)
+    waves = []
+    done = min(int(canary), total)
+    if done:
+        waves.append(device_ids[:done])
+    for percent in percentages + [100.0]:
+        target = min(total, max(done, math.ceil(total * percent / 100.0)))
+        if target > done:
+            waves.append(device_ids[done:target])
+            done = target
+    return waves
+
+
+class RolloutJob:
+    def __init__(self, job_id: str, waves: List[List[str]], firmware: Dict[str, Any],
+                 rollback_firmware: Optional[Dict[str, Any]], config: Dict[str, Any]):
+        self.job_id = job_id
+        self.firmware = firmware
+        self.rollback_firmware = rollback_firmware
+        self.config = config
+        self.status = "queued"
+        self.reason: Optional[str] = None
+        self.created_at = _now()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.waves = [
+            {
+                "index": i,
+                "name": "canary" if i == 0 and config.get("canary") else f"wave-{i + 1}",
+                "devices": ids,
+                "size": len(ids),
+                "status": "waiting",
+                "completed": 0,
+                "failed": 0,
+                "failure_rate": None,
+                "started_at": None,
+                "finished_at": None,
+                "duration_s": None,
+            }
+            for i, ids in enumerate(waves)
+        ]
+        self.next_wave = 0
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.skipped: List[Dict[str, Any]] = []
+        self.rolled_back: List[Dict[str, Any]] = []
+        self.events: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._pause_requested = False
+        self._command: Optional[str] = None
+
+    def log(self, message: str):
+        self.events.append({"timestamp": _now(), "message": message})
+        logger.info(f"Rollout {self.job_id}: {message}")
+
+    def snapshot(self, include_devices: bool = False) -> Dict[str, Any]:
+        with self._cond:
+            counts = {"completed": 0, "failed": 0}
+            for result in self.results.values():
+                if result.get("status") in counts:
+                    counts[result["status"]] += 1
+            total = sum(w["size"] for w in self.waves)
+            counts["remaining"] = total - counts["completed"] - counts["failed"]
+            counts["skipped"] = len(self.skipped)
+            counts["rolled_back"] = len([r for r in self.rolled_back if r.get("status") == "completed"])
+            snapshot = {
+                "job_id": self.job_id,
+                "status": self.status,
+                "reason": self.reason,
+                "firmware_version": self.firmware.get("version"),
+                "rollback_version": (self.rollback_firmware or {}).get("version"),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "config": self.config,
+                "total_devices": total,
+                "progress_percent": round(100.0 * (counts["completed"] + counts["failed"]) / total, 1) if total else 100.0,
+                "counts": counts,
+                "current_wave": self.next_wave if self.status not in FINISHED else None,
+                "waves": [{k: v for k, v in w.items() if k != "devices"} for w in self.waves],
+                "skipped": self.skipped,
+                "events": list(self.events[-50:]),
+            }
+            if include_devices:
+                snapshot["devices"] = list(self.results.values())
+                snapshot["rollback_results"] = list(self.rolled_back)
+            return snapshot
+
+
+class RolloutManager:
+    """Creates rollout jobs and runs each on its own thread."""
+
+    def __init__(self, max_finished_jobs: int = 100):
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: Dict[str, RolloutJob] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def start(
+        self,
+        targets: List[str],
+        device_index: Dict[str, Dict[str, Any]],
+        push: PushFn,
+        firmware: Dict[str, Any],
+        rollback_firmware: Optional[Dict[str, Any]] = None,
+        canary: int = DEFAULT_CANARY,
+        batch_percentages: Optional[List[float]] = None,
+        max_concurrency: int = 5,
+        failure_threshold: float = DEFAULT_FAILURE_THRESHOLD,
+        on_failure: str = "pause",
+        wave_interval_seconds: float = 0.0,
+        job_id: Optional[str] = None
+    ) -> RolloutJob:
+        if on_failure not in ("pause", "rollback"):
+            raise ValueError("on_failure must be pause or rollback")
+        if on_failure == "rollback" and not rollback_firmware:
+            raise ValueError("on_failure=rollback needs a rollback firmware version")
+        if not 0 <= failure_threshold <= 1:
+            raise ValueError("failure_threshold must be between 0 and 1")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1")
+
+        eligible, skipped, seen = [], [], set()
+        for device_id in targets:
+            if device_id in seen:
+                continue
+            seen.add(device_id)
+            device = device_index.get(device_id)
+            if device is None:
+                skipped.append({"deviceId": device_id, "status": "failed", "error": "Device not found"})
+            elif device.get("status") not in ONLINE_STATUSES:
+                skipped.append({
+                    "deviceId": device_id,
+                    "status": "pending",
+                    "error": f"Device status is {device.get('status')}, pending until device comes online"
+                })
+            else:
+                eligible.append(device_id)
+
+        config = {
+            "canary": min(int(canary), len(eligible)),
+            "batch_percentages": sorted(batch_percentages or DEFAULT_BATCH_PERCENTAGES),
+            "max_concurrency": int(max_concurrency),
+            "failure_threshold": failure_threshold,
+            "on_failure": on_failure,
+            "wave_interval_seconds": wave_interval_seconds,
+        }
+        job = RolloutJob(
+            job_id or f"rollout-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{next(self._ids)}-{uuid.uuid4().hex[:6]}",
+            plan_waves(eligible, config["canary"], config["batch_percentages"]),
+            firmware, rollback_firmware, config
+        )
+        job.skipped = skipped
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+
+        job.log(f"Created: {len(eligible)} devices in {len(job.waves)} waves, {len(skipped)} skipped")
+        threading.Thread(target=self._run, args=(job, push), name=f"ota-{job.job_id}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> RolloutJob:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Rollout {job_id} not found")
+        return job
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [
+            {k: s[k] for k in ("job_id", "status", "firmware_version", "created_at", "progress_percent", "counts")}
+            for s in (job.snapshot() for job in jobs)
+        ]
+
+    def pause(self, job_id: str) -> Dict[str, Any]:
+        """Pause after the wave in flight finishes."""
+        job = self.get(job_id)
+        with job._cond:
+            if job.status in FINISHED:
+                raise ValueError(f"Rollout {job_id} is already {job.status}")
+            job._pause_requested = True
+            job.log("Pause requested")
+            job._cond.notify_all()
+        return job.snapshot()
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        return self._command(job_id, "resume")
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        return self._command(job_id, "cancel")
+
+    def rollback(self, job_id: str) -> Dict[str, Any]:
+        job = self.get(job_id)
+        if not job.rollback_firmware:
+            raise ValueError(f"Rollout {job_id} has no rollback firmware")
+        return self._command(job_id, "rollback")
+
+    def _command(self, job_id: str, command: str) -> Dict[str, Any]:
+        job = self.get(job_id)
+        with job._cond:
+            if job.status in FINISHED:
+                raise ValueError(f"Rollout {job_id} is already {job.status}")
+            if command == "resume" and job.status != "paused" and not job._pause_requested:
+                raise ValueError(f"Rollout {job_id} is not paused")
+            job._command = command
+            job._pause_requested = False
+            job.log(f"{command.capitalize()} requested")
+            job._cond.notify_all()
+        return job.snapshot()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in FINISHED]
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job.job_id]
+
+    def _finish(self, job: RolloutJob, status: str, reason: Optional[str] = None):
+        with job._cond:
+            job.status = status
+            job.reason = reason or job.reason
+            job.finished_at = _now()
+        job.log(f"Finished: {status}" + (f" ({reason})" if reason else ""))
+
+    def _wait_for_command(self, job: RolloutJob, reason: str) -> str:
+        """
+        Park the job as paused until resume, cancel or rollback arrives. A
+        cancel or rollback sent while the last wave was running is acted on
+        right away; a pending resume belongs to an earlier pause and is dropped.
+        """
+        with job._cond:
+            if job._command == "resume":
+                job._command = None
+            if job._command is None:
+                job.status = "paused"
+                job.reason = reason
+                job.log(f"Paused: {reason}")
+                job._cond.wait_for(lambda: job._command is not None)
+            command, job._command = job._command, None
+            if command == "resume":
+                job.status = "running"
+                job.reason = None
+            return command
+
+    def _push_wave(self, job: RolloutJob, pool: ThreadPoolExecutor, push: PushFn,
+                   device_ids: List[str], firmware: Dict[str, Any]) -> List[Dict[str, Any]]:
+        def _one(device_id: str) -> Dict[str, Any]:
+            try:
+                result = push(device_id, firmware)
+            except Exception as e:
+                result = {"deviceId": device_id, "status": "failed", "error": str(e)}
+            if result.get("status") not in ("completed", "failed"):
+                result = {**result, "status": "failed", "error": result.get("error", f"Unexpected status {result.get('status')}")}
+            return result
+
+        futures = [pool.submit(_one, device_id) for device_id in device_ids]
+        return [f.result() for f in as_completed(futures)]
+
+    def _rollback(self, job: RolloutJob, pool: ThreadPoolExecutor, push: PushFn):
+        updated = [d for d, r in job.results.items() if r.get("status") == "completed"]
+        job.log(f"Rolling back {len(updated)} devices to {job.rollback_firmware.get('version')}")
+        with job._cond:
+            job.status = "rolling_back"
+        for result in self._push_wave(job, pool, push, updated, job.rollback_firmware):
+            with job._cond:
+                job.rolled_back.append(result)
+
+    def _run(self, job: RolloutJob, push: PushFn):
+        with job._cond:
+            job.status = "running"
+            job.started_at = _now()
+        config = job.config
+        pool = ThreadPoolExecutor(max_workers=config["max_concurrency"], thread_name_prefix=f"ota-{job.job_id}")
+        try:
+            while job.next_wave < len(job.waves):
+                wave = job.waves[job.next_wave]
+
+                command = None
+                with job._cond:
+                    if job._command == "cancel":
+                        command = "cancel"
+                    elif job._command == "rollback":
+                        command = "rollback"
+                    elif job._command == "resume":
+                        # Resumed before the pause took effect: nothing left to do
+                        job._command = None
+                    pause = job._pause_requested
+                    job._pause_requested = False
+                if pause and command is None:
+                    command = self._wait_for_command(job, "paused by operator")
+                if command == "cancel":
+                    self._finish(job, "cancelled", f"cancelled before {wave['name']}")
+                    return
+                if command == "rollback":
+                    self._rollback(job, pool, push)
+                    self._finish(job, "rolled_back", "rolled back by operator")
+                    return
+
+                with job._cond:
+                    wave["status"] = "running"
+                    wave["started_at"] = _now()
+                started = time.monotonic()
+                for result in self._push_wave(job, pool, push, wave["devices"], job.firmware):
+                    with job._cond:
+                        job.results[result.get("deviceId")] = result
+                        wave[result["status"]] += 1
+
+                attempted = wave["completed"] + wave["failed"]
+                failure_rate = wave["failed"] / attempted if attempted else 0.0
+                with job._cond:
+                    wave["failure_rate"] = round(failure_rate, 4)
+                    wave["finished_at"] = _now()
+                    wave["duration_s"] = round(time.monotonic() - started, 3)
+                    wave["status"] = "failed" if failure_rate > config["failure_threshold"] else "completed"
+                    job.next_wave += 1
+                job.log(f"{wave['name']}: {wave['completed']}/{wave['size']} updated, failure rate {failure_rate:.0%}")
+
+                if failure_rate > config["failure_threshold"]:
+                    reason = (f"{wave['name']} failure rate {failure_rate:.0%} exceeds "
+                              f"{config['failure_threshold']:.0%}")
+                    if config["on_failure"] == "rollback":
+                        self._rollback(job, pool, push)
+                        self._finish(job, "rolled_back", reason)
+                        return
+                    command = self._wait_for_command(job, reason)
+                    if command == "cancel":
+                        self._finish(job, "failed", reason)
+                        return
+                    if command == "rollback":
+                        self._rollback(job, pool, push)
+                        self._finish(job, "rolled_back", reason)
+                        return
+
+                if job.next_wave < len(job.waves) and config["wave_interval_seconds"] > 0:
+                    # Soak time between waves; pause/cancel/rollback cut it short
+                    with job._cond:
+                        job._cond.wait_for(lambda: job._command is not None or job._pause_requested,
+                                           timeout=config["wave_interval_seconds"])
+
+            self._finish(job, "completed")
+        except Exception as e:
+            logger.exception(f"Rollout {job.job_id} crashed")
+            self._finish(job, "failed", f"internal error: {e}")
+        finally:
+            pool.shutdown(wait=False)
@@ -0,0 +1,504 @@
+"""Topology-aware route compiler for SDN-WISE flow plans.
+
+Builds an adjacency graph from the controller topology (`/api/topology`:
+{"nodes": [{"id", "type", "active", "battery"}], "links": [{"source", "target"}]}),
+computes one shortest-path tree per sink and turns it into per-hop flow rules:
+every node on a route gets a (src, dst) -> nextHop rule, which is what the
+motes' flow_table_lookup() matches on.
+
+Metrics:
+- hops: every link costs 1
+- energy: relaying through a node costs more the emptier its battery is, so
+  routes avoid draining low-battery motes (the sink is mains-powered)
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACTION_FORWARD = 1
+
+METRICS = ("hops", "energy")
+
+
+def _node_id(node: Dict[str, Any]) -> Optional[int]:
+    value = node.get("id", node.get("nodeId"))
+    return int(value) if value is not None else None
+
+
+class RouteCompiler:
+    """
+    Compiles multi-hop routes for a WSN topology.
+
+    One Dijkstra run from the sink over reversed links yields the next hop of
+    every source at once (a shortest-path tree), so compiling routes for all
+    sensors costs O(E log V) regardless of how many sources are requested.
+    """
+
+    def __init__(
+        self,
+        topology: Dict[str, Any],
+        metric: str = "hops",
+        energy_weight: float = 4.0,
+        symmetric: bool = True,
+        include_inactive: bool = False
+    ):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown routing metric: {metric} (expected one of {', '.join(METRICS)})")
+        self.metric = metric
+        self.energy_weight = energy_weight
+        self.symmetric = symmetric
+
+        self.nodes: Dict[int, Dict[str, Any]] = {}
+        for node in topology.get("nodes", []):
+            node_id = _node_id(node)
+            if node_id is None:
+                continue
+            if not include_inactive and node.get("active") is False:
+                continue
+            self.nodes[node_id] = node
+
+        # reverse_adj[v] = [(u, cost)] for every link u -> v, i.e. the nodes that
+        # can hand a packet to v. Dijkstra from the sink walks these edges.
+        self.reverse_adj: Dict[int, List[Tuple[int, float]]] = {n: [] for n in self.nodes}
+        self.link_count = 0
+        seen = set()
+        for link in topology.get("links", []):
+            u, v = int(link["source"]), int(link["target"])
+            if u == v or u not in self.nodes or v not in self.nodes:
+                continue
+            pairs = ((u, v), (v, u)) if symmetric else ((u, v),)
+            for a, b in pairs:
+                if (a, b) in seen:
+                    continue
+                seen.add((a, b))
+                self.reverse_adj[b].append((a, self.link_cost(a, b)))
+                self.link_count += 1
+
+    def link_cost(self, u: int, v: int) -> float:
+        """Cost of u handing a packet to v."""
+        if self.metric == "hops":
+            return 1.0
+        node = self.nodes[v]
+        if node.get("type") == "border-router":
+            return 1.0
+        battery = max(0.0, min(100.0, float(node.get("battery", 100))))
+        drain = (100.0 - battery) / 100.0
+        return 1.0 + self.energy_weight * drain * drain
+
+    def shortest_path_tree(self, sink: int) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """Return (distance to sink, next hop towards sink) for every reachable node."""
+        if sink not in self.nodes:
+            raise ValueError(f"Sink {sink} is not an active node in the topology")
+
+        dist: Dict[int, float] = {sink: 0.0}
+        next_hop: Dict[int, int] = {}
+        heap = [(0.0, sink)]
+        reverse_adj = self.reverse_adj
+        while heap:
+            d, v = heapq.heappop(heap)
+            if d > dist[v]:
+                continue
+            for u, cost in reverse_adj[v]:
+                nd = d + cost
+                if nd < dist.get(u, float("inf")):
+                    dist[u] = nd
+                    next_hop[u] = v
+                    heapq.heappush(heap, (nd, u))
+        return dist, next_hop
+
+    @staticmethod
+    def path_from_tree(source: int, sink: int, next_hop: Dict[int, int]) -> Optional[List[int]]:
+        """Walk the tree from source to sink; None if source is unreachable."""
+        if source == sink:
+            return [sink]
+        if source not in next_hop:
+            return None
+        path = [source]
+        node = source
+        while node != sink:
+            node = next_hop[node]
+            path.append(node)
+        return path
+
+    def compile_flows(
+        self,
+        sources: Iterable[int],
+        sink: int,
+        tree: Optional[Tuple[Dict[int, float], Dict[int, int]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Compute routes from every source to sink and emit per-hop flow rules.
+
+        Returns {"flows": [...], "paths": {src: [src, ..., sink]}, "unreachable": [...],
+        "cost": {src: total_cost}}. A tree from shortest_path_tree() can be
+        passed to skip recomputing it.
+        """
+        dist, next_hop = tree if tree is not None else self.shortest_path_tree(sink)
+
+        flows: List[Dict[str, Any]] = []
+        emit = flows.append
+        paths: Dict[int, List[int]] = {}
+        unreachable: List[int] = []
+        for src in sources:
+            src = int(src)
+            if src == sink:
+                continue
+            if src not in next_hop:
+                unreachable.append(src)
+                continue
+            # Walk the tree inline: this loop runs once per emitted rule, so it
+            # avoids building intermediate path copies
+            path = [src]
+            node = src
+            while node != sink:
+                hop = next_hop[node]
+                emit({
+                    "nodeId": node,
+                    "srcAddr": src,
+                    "dstAddr": sink,
+                    "action": ACTION_FORWARD,
+                    "nextHop": hop
+                })
+                path.append(hop)
+                node = hop
+            paths[src] = path
+            flows[len(flows) - len(path) + 1]["description"] = f"Route from sensor {src} to sink {sink} ({len(path) - 1} hops)"
+
+        if unreachable:
+            logger.warning(f"{len(unreachable)} source(s) cannot reach sink {sink}: {unreachable[:10]}")
+
+        return {
+            "sink": sink,
+            "metric": self.metric,
+            "flows": flows,
+            "paths": paths,
+            "cost": {src: round(dist[src], 4) for src in paths},
+            "unreachable": unreachable
+        }
+
+
+class SinkTree:
+    """Shortest-path tree towards one sink, with child sets for subtree walks."""
+
+    def __init__(self, sink: int, dist: Dict[int, float], next_hop: Dict[int, int], sources: Iterable[int]):
+        self.sink = sink
+        self.dist = dist
+        self.next_hop = next_hop
+        self.sources = set(int(s) for s in sources) - {sink}
+        self.children: Dict[int, set] = {}
+        for node, hop in next_hop.items():
+            self.children.setdefault(hop, set()).add(node)
+
+    def subtree(self, roots: Iterable[int]) -> set:
+        """All nodes whose route to the sink passes through one of roots (roots included)."""
+        seen = set()
+        stack = [r for r in roots if r in self.dist]
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.extend(self.children.get(node, ()))
+        return seen
+
+    def set_parent(self, node: int, hop: Optional[int]):
+        old = self.next_hop.get(node)
+        if old is not None:
+            self.children.get(old, set()).discard(node)
+        if hop is None:
+            self.next_hop.pop(node, None)
+        else:
+            self.next_hop[node] = hop
+            self.children.setdefault(hop, set()).add(node)
+
+
+class DynamicRouter(RouteCompiler):
+    """
+    RouteCompiler that keeps one shortest-path tree per sink and repairs it in
+    place on topology events instead of recomputing every route.
+
+    - link added / cost decreased: Dijkstra restarted only from the improved
+      node, relaxing just the nodes whose distance actually drops
+    - link/node removed / cost increased: only the subtree hanging below the
+      broken edge is invalidated and re-attached from its intact neighbours
+
+    Every event returns the per-hop flow rules that were removed and added, for
+    the routes whose path changed - rules of untouched routes are never emitted.
+    """
+
+    def __init__(self, topology: Dict[str, Any], **kwargs):
+        super().__init__(topology, **kwargs)
+        # Forward adjacency, needed to find a surviving parent during repairs
+        self.adj: Dict[int, List[Tuple[int, float]]] = {n: [] for n in self.nodes}
+        for v, edges in self.reverse_adj.items():
+            for u, cost in edges:
+                self.adj[u].append((v, cost))
+        self.trees: Dict[int, SinkTree] = {}
+
+    def track(self, sink: int, sources: Iterable[int]) -> Dict[str, Any]:
+        """Start maintaining routes from sources to sink; returns the full compiled plan."""
+        sink = int(sink)
+        sources = [int(s) for s in sources]
+        dist, next_hop = self.shortest_path_tree(sink)
+        routes = self.compile_flows(sources, sink, tree=(dist, next_hop))
+        self.trees[sink] = SinkTree(sink, dist, next_hop, sources)
+        return routes
+
+    # -- topology events ---------------------------------------------------
+
+    def add_link(self, u: int, v: int) -> Dict[str, Any]:
+        u, v = int(u), int(v)
+        if u == v or u not in self.nodes or v not in self.nodes:
+            return self._no_change()
+        pairs = ((u, v), (v, u)) if self.symmetric else ((u, v),)
+        seeds = []
+        for a, b in pairs:
+            if any(hop == b for hop, _ in self.adj[a]):
+                continue
+            cost = self.link_cost(a, b)
+            self.adj[a].append((b, cost))
+            self.reverse_adj[b].append((a, cost))
+            self.link_count += 1
+            seeds.append((a, b, cost))
+        return self._apply(decreases=seeds)
+
+    def remove_link(self, u: int, v: int) -> Dict[str, Any]:
+        u, v = int(u), int(v)
+        pairs = ((u, v), (v, u)) if self.symmetric else ((u, v),)
+        broken = []
+        for a, b in pairs:
+            if a not in self.adj or not any(hop == b for hop, _ in self.adj[a]):
+                continue
+            self.adj[a] = [(hop, c) for hop, c in self.adj[a] if hop != b]
+            self.reverse_adj[b] = [(src, c) for src, c in self.reverse_adj[b] if src != a]
+            self.link_count -= 1
+            broken.append((a, b))
+        return self._apply(broken_edges=broken)
+
+    def add_node(self, node: Dict[str, Any], links: Iterable[int] = ()) -> Dict[str, Any]:
+        node_id = _node_id(node)
+        if node_id is None:
+            return self._no_change()
+        self.nodes[node_id] = node
+        self.adj.setdefault(node_id, [])
+        self.reverse_adj.setdefault(node_id, [])
+        delta = self._no_change()
+        for neighbour in links:
+            self._merge(delta, self.add_link(node_id, neighbour))
+        return delta
+
+    def remove_node(self, node_id: int) -> Dict[str, Any]:
+        node_id = int(node_id)
+        if node_id not in self.nodes:
+            return self._no_change()
+        broken = [(u, node_id) for u, _ in self.reverse_adj.get(node_id, [])]
+        for v, _ in self.adj.get(node_id, []):
+            self.reverse_adj[v] = [(u, c) for u, c in self.reverse_adj[v] if u != node_id]
+        for u, _ in self.reverse_adj.get(node_id, []):
+            self.adj[u] = [(v, c) for v, c in self.adj[u] if v != node_id]
+        self.link_count -= len(self.adj.pop(node_id, [])) + len(self.reverse_adj.pop(node_id, []))
+        del self.nodes[node_id]
+        # A removed sink takes its whole tree with it
+        tree = self.trees.pop(node_id, None)
+        delta = self._apply(broken_edges=broken, removed_node=node_id)
+        if tree is not None:
+            removed = []
+            for src in tree.sources:
+                path = self.path_from_tree(src, node_id, tree.next_hop)
+                if path:
+                    removed.extend(self._rules(src, node_id, path))
+            delta["removed"].extend(removed)
+        return delta
+
+    def update_node(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        """Refresh a node's attributes (battery); re-costs the links into it for the energy metric."""
+        node_id = _node_id(node)
+        if node_id is None or node_id not in self.nodes:
+            return self._no_change()
+        self.nodes[node_id] = node
+        if self.metric == "hops":
+            return self._no_change()
+        increased, decreased = [], []
+        for i, (u, old) in enumerate(self.reverse_adj[node_id]):
+            cost = self.link_cost(u, node_id)
+            if cost == old:
+                continue
+            self.reverse_adj[node_id][i] = (u, cost)
+            self.adj[u] = [(v, cost if v == node_id else c) for v, c in self.adj[u]]
+            if cost > old:
+                increased.append((u, node_id))
+            else:
+                decreased.append((u, node_id, cost))
+        return self._apply(broken_edges=increased, decreases=decreased)
+
+    def sync(self, topology: Dict[str, Any], include_inactive: bool = False) -> Dict[str, Any]:
+        """
+        Diff a fresh controller topology against the current graph and apply
+        the difference as events (nodes gone stale, links added/removed,
+        battery changes). Returns the merged rule delta plus the event counts.
+        """
+        nodes: Dict[int, Dict[str, Any]] = {}
+        for node in topology.get("nodes", []):
+            node_id = _node_id(node)
+            if node_id is None or (not include_inactive and node.get("active") is False):
+                continue
+            nodes[node_id] = node
+        links = set()
+        for link in topology.get("links", []):
+            u, v = int(link["source"]), int(link["target"])
+            if u != v and u in nodes and v in nodes:
+                links.add((u, v))
+                if self.symmetric:
+                    links.add((v, u))
+        current = {(u, v) for u, edges in self.adj.items() for v, _ in edges}
+
+        delta = self._no_change()
+        events = {"nodes_removed": 0, "nodes_added": 0, "links_removed": 0, "links_added": 0, "nodes_updated": 0}
+        for node_id in [n for n in self.nodes if n not in nodes]:
+            self._merge(delta, self.remove_node(node_id))
+            events["nodes_removed"] += 1
+        for u, v in sorted(current - links):
+            if u in self.nodes and v in self.nodes and any(hop == v for hop, _ in self.adj[u]):
+                self._merge(delta, self.remove_link(u, v))
+                events["links_removed"] += 1
+        for node_id, node in nodes.items():
+            if node_id not in self.nodes:
+                self._merge(delta, self.add_node(node))
+                events["nodes_added"] += 1
+        for u, v in sorted(links - current):
+            if not any(hop == v for hop, _ in self.adj[u]):
+                self._merge(delta, self.add_link(u, v))
+                events["links_added"] += 1
+        for node_id, node in nodes.items():
+            if node.get("battery") != self.nodes[node_id].get("battery"):
+                self._merge(delta, self.update_node(node))
+                events["nodes_updated"] += 1
+        delta["events"] = events
+        return delta
+
+    # -- repair ------------------------------------------------------------
+
+    def _apply(
+        self,
+        broken_edges: Iterable[Tuple[int, int]] = (),
+        decreases: Iterable[Tuple[int, int, float]] = (),
+        removed_node: Optional[int] = None
+    ) -> Dict[str, Any]:
+        broken_edges = list(broken_edges)
+        decreases = list(decreases)
+        delta = self._no_change()
+        for tree in self.trees.values():
+            old_hops: Dict[int, Optional[int]] = {}
+            roots = [a for a, b in broken_edges if tree.next_hop.get(a) == b]
+            if removed_node is not None and removed_node in tree.dist:
+                roots.append(removed_node)
+            if roots:
+                self._repair_increase(tree, roots, old_hops)
+            seeds = [(a, b, c) for a, b, c in decreases if b in tree.dist and tree.dist[b] + c < tree.dist.get(a, float("inf"))]
+            if seeds:
+                self._propagate_decrease(tree, seeds, old_hops)
+            if old_hops:
+                self._merge(delta, self._rule_changes(tree, old_hops))
+                delta["affected_nodes"] += len(old_hops)
+        return delta
+
+    def _repair_increase(self, tree: SinkTree, roots: List[int], old_hops: Dict[int, Optional[int]]):
+        affected = tree.subtree(roots)
+        for node in affected:
+            old_hops.setdefault(node, tree.next_hop.get(node))
+            tree.dist.pop(node, None)
+        for node in affected:
+            tree.set_parent(node, None)
+
+        # Re-attach each orphan through its best neighbour outside the broken subtree
+        dist = tree.dist
+        heap = []
+        for node in affected:
+            if node not in self.nodes:
+                continue
+            best, best_hop = float("inf"), None
+            for hop, cost in self.adj.get(node, []):
+                if hop in dist and dist[hop] + cost < best:
+                    best, best_hop = dist[hop] + cost, hop
+            if best_hop is not None:
+                heapq.heappush(heap, (best, node, best_hop))
+        while heap:
+            d, node, hop = heapq.heappop(heap)
+            if node in dist and dist[node] <= d:
+                continue
+            dist[node] = d
+            tree.set_parent(node, hop)
+            for u, cost in self.reverse_adj.get(node, []):
+                if u in affected and d + cost < dist.get(u, float("inf")):
+                    heapq.heappush(heap, (d + cost, u, node))
+
+    def _propagate_decrease(self, tree: SinkTree, seeds: List[Tuple[int, int, float]], old_hops: Dict[int, Optional[int]]):
+        dist = tree.dist
+        heap = [(dist[b] + cost, a, b) for a, b, cost in seeds]
+        heapq.heapify(heap)
+        while heap:
+            d, node, hop = heapq.heappop(heap)
+            if d >= dist.get(node, float("inf")):
+                continue
+            old_hops.setdefault(node, tree.next_hop.get(node))
+            dist[node] = d
+            tree.set_parent(node, hop)
+            for u, cost in self.reverse_adj.get(node, []):
+                if d + cost < dist.get(u, float("inf")):
+                    heapq.heappush(heap, (d + cost, u, node))
+
+    # -- rule deltas -------------------------------------------------------
+
+    def _rules(self, src: int, sink: int, path: List[int]) -> List[Dict[str, Any]]:
+        return [
+            {"nodeId": node, "srcAddr": src, "dstAddr": sink, "action": ACTION_FORWARD, "nextHop": hop}
+            for node, hop in zip(path, path[1:])
+        ]
+
+    def _rule_changes(self, tree: SinkTree, old_hops: Dict[int, Optional[int]]) -> Dict[str, Any]:
+        """Diff old and new per-hop rules of the routes that pass through a changed node."""
+        sink = tree.sink
+        # Every route whose old path crossed a changed node is a new descendant
+        # of one (or was itself invalidated), so this set covers all changes
+        candidates = (tree.subtree(old_hops) | set(old_hops)) & tree.sources
+
+        def old_path(src: int) -> Optional[List[int]]:
+            path, node, steps = [src], src, 0
+            while node != sink:
+                node = old_hops[node] if node in old_hops else tree.next_hop.get(node)
+                steps += 1
+                if node is None or steps > len(self.nodes) + 1:
+                    return None
+                path.append(node)
+            return path
+
+        added, removed, rerouted, unreachable = [], [], {}, []
+        for src in sorted(candidates):
+            before = old_path(src)
+            after = self.path_from_tree(src, sink, tree.next_hop) if src in self.nodes else None
+            if before == after:
+                continue
+            old_rules = {(r["nodeId"], r["nextHop"]): r for r in self._rules(src, sink, before)} if before else {}
+            new_rules = {(r["nodeId"], r["nextHop"]): r for r in self._rules(src, sink, after)} if after else {}
+            removed.extend(r for key, r in old_rules.items() if key not in new_rules)
+            added.extend(r for key, r in new_rules.items() if key not in old_rules)
+            if after:
+                rerouted[f"{src}->{sink}"] = after
+            else:
+                unreachable.append(src)
+        return {"added": added, "removed": removed, "rerouted": rerouted, "unreachable": unreachable, "affected_nodes": 0}
+
+    @staticmethod
+    def _no_change() -> Dict[str, Any]:
+        return {"added": [], "removed": [], "rerouted": {}, "unreachable": [], "affected_nodes": 0}
+
+    @staticmethod
+    def _merge(into: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+        into["added"].extend(delta["added"])
+        into["removed"].extend(delta["removed"])
+        into["rerouted"].update(delta["rerouted"])
+        into["unreachable"].extend(delta["unreachable"])
+        into["affected_nodes"] += delta["affected_nodes"]
+        return into
@@ -0,0 +1,413 @@
+"""Scenario inputs: Cooja simulation import and synthetic large topologies.
+
+Both sources produce the same motes list ({"id", "x", "y", "z", "interfaces"})
+which build_scenario() turns into the MCP server's own structures:
+- devices: entries in the format of data/devices.json
+- deployment: a document in the format of data/deployment_monitoring.json
+- topology: the ONOS wisesdn topology shape ({"nodes": [...], "links": [...]})
+  with links derived from the unit-disk radio model Cooja's UDGM uses
+  (two motes are linked when they are within transmitting_range)
+
+Link discovery bins motes into grid cells of one radio range and only
+compares neighbouring cells, so 100k-node topologies build in a few seconds.
+
+    python -m servers.scenarios generate grid 10000 /tmp/grid-10k
+    python -m servers.scenarios import ../../controller/onos-simulation/cooja-simulations/wsn-topology.csc /tmp/cooja
+"""
+from typing import Any, Dict, List, Optional, Union
+from datetime import datetime
+from pathlib import Path
+import argparse
+import logging
+import math
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from .utils import write_json
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("corridor", "grid", "random_geometric")
+MAX_NODES = 100_000
+
+# Cooja mote interfaces that map onto device services
+_INTERFACE_SERVICES = {
+    "ContikiPIR": "motion",
+    "Battery": "battery",
+    "ContikiButton": "button",
+    "ContikiLED": "led",
+    "ContikiBeeper": "beeper"
+}
+
+
+# -- Cooja import --------------------------------------------------------------
+
+def _float(element: Optional[ET.Element], default: Optional[float] = None) -> Optional[float]:
+    if element is None or element.text is None:
+        return default
+    return float(element.text.strip())
+
+
+def load_csc(source: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Parse a Cooja .csc file (path or XML text): simulation title, radio medium
+    with its ranges, mote types and motes with position and id.
+    """
+    text = str(source)
+    if text.lstrip().startswith("<"):
+        root = ET.fromstring(text)
+    else:
+        path = Path(source)
+        if path.suffix != ".csc":
+            raise ValueError(f"Not a Cooja simulation file: {path.name}")
+        if not path.exists():
+            raise ValueError(f"Cooja simulation not found: {path}")
+        root = ET.parse(path).getroot()
+
+    simulation = root.find("simulation")
+    if simulation is None:
+        raise ValueError("Cooja file has no <simulation> element")
+
+    medium = simulation.find("radiomedium")
+    radio = {
+        "type": (medium.text or "").strip().rsplit(".", 1)[-1] if medium is not None else "UDGM",
+        "transmitting_range": _float(medium.find("transmitting_range") if medium is not None else None, 50.0),
+        "interference_range": _float(medium.find("interference_range") if medium is not None else None, 100.0),
+        "success_ratio_tx": _float(medium.find("success_ratio_tx") if medium is not None else None, 1.0),
+        "success_ratio_rx": _float(medium.find("success_ratio_rx") if medium is not None else None, 1.0)
+    }
+
+    mote_types = {}
+    for motetype in simulation.findall("motetype"):
+        identifier = (motetype.findtext("identifier") or "").strip()
+        mote_types[identifier] = {
+            "class": (motetype.text or "").strip(),
+            "description": (motetype.findtext("description") or "").strip(),
+            "interfaces": [(i.text or "").strip().rsplit(".", 1)[-1] for i in motetype.findall("moteinterface")]
+        }
+
+    motes = []
+    for index, mote in enumerate(simulation.findall("mote")):
+        x = y = z = 0.0
+        mote_id = None
+        bitrate = None
+        for config in mote.findall("interface_config"):
+            kind = (config.text or "").strip().rsplit(".", 1)[-1]
+            if kind == "Position":
+                x, y, z = (_float(config.find(axis), 0.0) for axis in ("x", "y", "z"))
+            elif kind.endswith("MoteID") and config.find("id") is not None:
+                mote_id = int(config.findtext("id").strip())
+            elif config.find("bitrate") is not None:
+                bitrate = _float(config.find("bitrate"))
+        type_id = (mote.findtext("motetype_identifier") or "").strip()
+        motes.append({
+            "id": mote_id if mote_id is not None else index + 1,
+            "x": x,
+            "y": y,
+            "z": z,
+            "mote_type": type_id,
+            "bitrate_kbps": bitrate,
+            "interfaces": mote_types.get(type_id, {}).get("interfaces", [])
+        })
+
+    return {
+        "title": (simulation.findtext("title") or "").strip(),
+        "random_seed": int(simulation.findtext("randomseed") or 0) or None,
+        "radio_medium": radio,
+        "mote_types": mote_types,
+        "motes": motes
+    }
+
+
+# -- radio links -----------------------------------------------------------------
+
+def udgm_links(x: "np.ndarray", y: "np.ndarray", radio_range: float) -> "np.ndarray":
+    """Index pairs (i < j) of motes within radio_range of each other, as an (m, 2) array."""
+    n = x.shape[0]
+    if n < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    cx = np.floor((x - x.min()) / radio_range).astype(np.int64)
+    cy = np.floor((y - y.min()) / radio_range).astype(np.int64)
+    width = int(cy.max()) + 3
+    keys = (cx + 1) * width + (cy + 1)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    r2 = radio_range * radio_range
+
+    pairs = []
+    # Own cell plus half of the neighbouring cells, so every pair is visited once
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        target = keys + dx * width + dy
+        left = np.searchsorted(sorted_keys, target, side="left")
+        right = np.searchsorted(sorted_keys, target, side="right")
+        counts = right - left
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        i = np.repeat(np.arange(n), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(left, counts) + offsets]
+        keep = (x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 <= r2
+        if dx == 0 and dy == 0:
+            keep &= i < j
+        found = np.stack([i[keep], j[keep]], axis=1)
+        found.sort(axis=1)
+        pairs.append(found)
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.concatenate(pairs)
+
+
+def connected_components(n: int, links: "np.ndarray") -> int:
+    parent = list(range(n))
+
+    def find(a: int) -> int:
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    components = n
+    for a, b in links.tolist():
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+            components -= 1
+    return components
+
+
+# -- synthetic topologies --------------------------------------------------------
+
+def generate_motes(
+    kind: str,
+    nodes: int,
+    spacing: float = 10.0,
+    seed: int = 1,
+    jitter: float = 0.1
+) -> List[Dict[str, Any]]:
+    """
+    Mote positions for a synthetic topology:
+    - corridor: a line every spacing metres
+    - grid: a square grid with spacing metres between neighbours
+    - random_geometric: uniform in a square sized for the same density as the grid
+    Corridor and grid positions are jittered by jitter * spacing.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown topology kind: {kind} (expected one of {', '.join(KINDS)})")
+    if nodes < 1 or nodes > MAX_NODES:
+        raise ValueError(f"nodes must be between 1 and {MAX_NODES}, got {nodes}")
+    rng = np.random.default_rng(seed)
+
+    if kind == "corridor":
+        x = np.arange(nodes) * spacing
+        y = np.zeros(nodes)
+    elif kind == "grid":
+        side = math.ceil(math.sqrt(nodes))
+        index = np.arange(nodes)
+        x = (index % side) * spacing
+        y = (index // side) * spacing
+    else:
+        side = spacing * math.sqrt(nodes)
+        x = rng.uniform(0, side, nodes)
+        y = rng.uniform(0, side, nodes)
+        # The sink sits in the corner, as in the corridor and grid layouts
+        x[0] = y[0] = 0.0
+
+    if kind != "random_geometric" and jitter:
+        x = x + rng.uniform(-jitter, jitter, nodes) * spacing
+        y = y + rng.uniform(-jitter, jitter, nodes) * spacing
+        x[0] = y[0] = 0.0
+
+    interfaces = ["Position", "Battery", "ContikiPIR", "ContikiRadio"]
+    return [
+        {"id": i + 1, "x": round(float(x[i]), 2), "y": round(float(y[i]), 2), "z": 0.0, "interfaces": interfaces}
+        for i in range(nodes)
+    ]
+
+
+def default_radio_range(kind: str, spacing: float, avg_degree: float = 8.0) -> float:
+    """Range that keeps each layout connected with a modest node degree."""
+    if kind == "corridor":
+        return 2.5 * spacing
+    if kind == "grid":
+        return 1.5 * spacing
+    return spacing * math.sqrt(avg_degree / math.pi)
+
+
+# -- MCP server structures --------------------------------------------------------
+
+def build_scenario(
+    motes: List[Dict[str, Any]],
+    radio_range: float,
+    name: str = "synthetic",
+    location: str = "corridor",
+    services: Optional[List[str]] = None,
+    sink: Optional[int] = None,
+    seed: int = 1,
+    battery: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Devices, deployment document and topology for a list of motes. The sink
+    (default: the lowest mote id) becomes the border router. Batteries are
+    drawn between 40% and 100% unless battery is given.
+    """
+    if not motes:
+        raise ValueError("Scenario needs at least one mote")
+    if radio_range <= 0:
+        raise ValueError(f"radio_range must be positive, got {radio_range}")
+    rng = np.random.default_rng(seed)
+    ids = [int(m["id"]) for m in motes]
+    sink = sink if sink is not None else min(ids)
+    if sink not in ids:
+        raise ValueError(f"Sink {sink} is not one of the motes")
+
+    x = np.array([float(m["x"]) for m in motes])
+    y = np.array([float(m["y"]) for m in motes])
+    pairs = udgm_links(x, y, radio_range)
+    levels = (
+        np.full(len(motes), float(battery)) if battery is not None
+        else np.round(rng.uniform(40, 100, len(motes)))
+    )
+    now = datetime.utcnow().isoformat() + "Z"
+
+    devices, deployed, nodes = [], [], []
+    for i, mote in enumerate(motes):
+        node_id = ids[i]
+        is_sink = node_id == sink
+        device_id = f"mote-{node_id}"
+        device_type = "border-router" if is_sink else "sensor"
+        mote_services = services if services is not None else [
+            _INTERFACE_SERVICES[iface] for iface in mote.get("interfaces", []) if iface in _INTERFACE_SERVICES
+        ]
+        service_list = [{"name": s, "protocol": "SDN-WISE", "details": {}} for s in mote_services]
+        position = {"x": float(mote["x"]), "y": float(mote["y"]), "z": float(mote.get("z", 0.0))}
+        level = int(levels[i])
+        devices.append({
+            "device_id": device_id,
+            "deviceId": device_id,
+            "nodeId": node_id,
+            "name": f"{'Sink' if is_sink else 'Mote'} {node_id}",
+            "type": device_type,
+            "device_type": device_type,
+            "status": "active",
+            "battery": level,
+            "location": location,
+            "position": position,
+            "capabilities": mote_services,
+            "services": service_list
+        })
+        deployed.append({
+            "deviceId": device_id,
+            "nodeId": node_id,
+            "name": f"{'Sink' if is_sink else 'Mote'} {node_id}",
+            "type": device_type,
+            "status": "active",
+            "battery": level,
+            "location": position,
+            "services": service_list,
+            "last_seen": now
+        })
+        nodes.append({"id": node_id, "type": device_type, "active": True, "battery": level})
+
+    links = [{"source": ids[a], "target": ids[b]} for a, b in pairs.tolist()]
+    degrees = np.bincount(pairs.ravel(), minlength=len(motes)) if len(pairs) else np.zeros(len(motes))
+    summary = {
+        "name": name,
+        "nodes": len(motes),
+        "links": len(links),
+        "sink": sink,
+        "radio_range": radio_range,
+        "avg_degree": round(float(degrees.mean()), 2),
+        "max_degree": int(degrees.max()),
+        "isolated_nodes": int(np.count_nonzero(degrees == 0)),
+        "components": connected_components(len(motes), pairs)
+    }
+    return {
+        "summary": summary,
+        "devices": devices,
+        "deployment": {
+            "deployment": {
+                "name": name,
+                "environment": "simulation",
+                "timezone": "UTC",
+                "created_at": now,
+                "last_updated": now
+            },
+            "devices": deployed
+        },
+        "topology": {"nodes": nodes, "links": links}
+    }
+
+
+def scenario_from_csc(source: Union[str, Path], location: str = "corridor", **kwargs) -> Dict[str, Any]:
+    """Scenario from a Cooja simulation, using its UDGM transmitting range."""
+    csc = load_csc(source)
+    scenario = build_scenario(
+        csc["motes"],
+        csc["radio_medium"]["transmitting_range"],
+        name=csc["title"] or "cooja",
+        location=location,
+        battery=kwargs.pop("battery", 100),
+        **kwargs
+    )
+    scenario["summary"]["radio_medium"] = csc["radio_medium"]
+    return scenario
+
+
+def generate_scenario(
+    kind: str,
+    nodes: int,
+    spacing: float = 10.0,
+    radio_range: Optional[float] = None,
+    seed: int = 1,
+    **kwargs
+) -> Dict[str, Any]:
+    motes = generate_motes(kind, nodes, spacing, seed)
+    radio_range = radio_range or default_radio_range(kind, spacing)
+    kwargs.setdefault("name", f"{kind}-{nodes}")
+    if kind == "corridor":
+        kwargs.setdefault("services", ["motion", "camera"])
+    return build_scenario(motes, radio_range, seed=seed, **kwargs)
+
+
+def write_scenario(scenario: Dict[str, Any], directory: Union[str, Path]) -> Dict[str, str]:
+    """Write devices.json, deployment_monitoring.json and topology.json into directory."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files = {
+        "devices": directory / "devices.json",
+        "deployment": directory / "deployment_monitoring.json",
+        "topology": directory / "topology.json"
+    }
+    for key, path in files.items():
+        write_json(path, scenario[key])
+    logger.info(f"Scenario {scenario['summary']['name']} written to {directory}")
+    return {key: str(path) for key, path in files.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import Cooja simulations or generate synthetic WSN scenarios")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate")
+    gen.add_argument("kind", choices=KINDS)
+    gen.add_argument("nodes", type=int)
+    gen.add_argument("output")
+    gen.add_argument("--spacing", type=float, default=10.0)
+    gen.add_argument("--range", dest="radio_range", type=float)
+    gen.add_argument("--seed", type=int, default=1)
+    imp = sub.add_parser("import")
+    imp.add_argument("csc")
+    imp.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        scenario = generate_scenario(args.kind, args.nodes, args.spacing, args.radio_range, args.seed)
+    else:
+        scenario = scenario_from_csc(args.csc)
+    write_scenario(scenario, args.output)
+    print(scenario["summary"])
+
+
+if __name__ == "__main__":
+    main()
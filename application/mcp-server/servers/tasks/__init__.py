@@ -4,6 +4,12 @@ from .network_configuration import network_config_router
 from .plan_validation import validation_router
 from .plan_execution import execution_router
 from .algorithm_execution import algorithm_router
+from .flow_orchestration import flow_router
+from .flow_execution import flow_execution_router
+from .flow_validation import flow_validation_router
+from .topology_monitoring import topology_router
+from .diagnostics import diagnostics_router
+from .firmware_distribution import firmware_router
 __all__ = [
 	"device_router",
 	"deployment_router",
@@ -11,4 +17,10 @@ __all__ = [
 	"validation_router",
 	"execution_router",
 	"algorithm_router",
+	"flow_router",
+	"flow_execution_router",
+	"flow_validation_router",
+	"topology_router",
+	"diagnostics_router",
+	"firmware_router",
 ]
\ No newline at end of file
@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException, Response
 from typing import Dict, Any, List, Optional
-from ..utils import read_json, DATA_DIR
+from ..utils import read_json, DATA_DIR, cooja_path
+from ..tracing import traced
 from .plan_execution import PlanExecutionAgent
+from .plan_validation import PlanValidationAgent
+from ..simulation import compare_algorithms, measured_tradeoffs
+from ..scenarios import scenario_from_csc
 from datetime import datetime
 
 algorithm_router = APIRouter()
@@ -17,6 +21,7 @@ class AlgorithmExecutionAgent:
     def __init__(self, devices_path: str = DATA_DIR / "devices.json"):
         self.devices = read_json(devices_path)
 
+    @traced()
     def get_algorithm_options(self, user_intent: Optional[str] = None) -> Dict[str, Any]:
         return {
             "intent": user_intent or "",
@@ -56,10 +61,29 @@ class AlgorithmExecutionAgent:
             "timestamp": datetime.utcnow().isoformat() + "Z",
         }
 
+    @traced()
+    def simulate(
+        self,
+        algorithm_keys: Optional[List[str]] = None,
+        devices: Optional[List[Dict[str, Any]]] = None,
+        t_active_seconds: int = 20,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Run every algorithm's plan through the discrete-event simulator and compare them."""
+        keys = algorithm_keys or ["naive_baseline", "sequential_corridor"]
+        source = devices if devices is not None else self.devices
+        plans = {key: self.build_plan(key, source, t_active_seconds) for key in keys}
+        validator = PlanValidationAgent()
+        report = compare_algorithms(plans, source, validator._calculate_device_energy_consumption, params)
+        report["t_active_seconds"] = t_active_seconds
+        report["timestamp"] = datetime.utcnow().isoformat() + "Z"
+        return report
+
     def _corridor_devices(self, devices: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         source = devices if devices is not None else self.devices
         return [d for d in source if str(d.get("location", "")).lower() == "corridor"]
 
+    @traced()
     def build_plan(
         self,
         algorithm_key: str,
@@ -204,6 +228,7 @@ class AlgorithmExecutionAgent:
         else:
             raise ValueError(f"Unknown algorithm key: {algorithm_key}")
 
+    @traced()
     def execute_algorithm(
         self,
         algorithm_key: str,
@@ -232,7 +257,32 @@ def algorithm_execution(payload: Dict[str, Any], response: Response):
 
         if action == "options":
             intent = payload.get("intent")
-            return agent.get_algorithm_options(intent)
+            options = agent.get_algorithm_options(intent)
+            if payload.get("simulate"):
+                # Attach measured tradeoffs next to the descriptive ones
+                report = agent.simulate(params=payload.get("simulation"))
+                for option in options["options"]:
+                    result = report["algorithms"].get(option["key"])
+                    if result:
+                        option["simulated"] = measured_tradeoffs(result)
+                options["recommended"] = report["comparison"]["recommended"]
+            return options
+
+        elif action == "simulate":
+            keys = payload.get("algorithm_keys")
+            if payload.get("algorithm_key"):
+                keys = [payload["algorithm_key"]]
+            t_active = int(payload.get("t_active_seconds", 20))
+            devices = payload.get("devices")
+            if payload.get("csc"):
+                # Cooja simulation (XML text, or a path confined like import_csc) instead of devices.json
+                source = str(payload["csc"])
+                if not source.lstrip().startswith("<"):
+                    source = cooja_path(source)
+                devices = scenario_from_csc(source)["devices"]
+            report = agent.simulate(keys, devices, t_active, payload.get("params"))
+            report["action"] = "simulate"
+            return report
 
         elif action == "build_plan":
             key = payload.get("algorithm_key")
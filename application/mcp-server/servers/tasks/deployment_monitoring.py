@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Response
-from typing import Dict, Any, List, Optional
-from ..utils import read_json, DATA_DIR
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from ..utils import read_json, DATA_DIR, ndjson_response, wants_ndjson, telemetry_store, protocol_dispatcher
 from ..agents import run_agent
+from ..timeseries import FLOAT32_MAX, TS_LIMIT
 import logging
 from datetime import datetime, timedelta
 
@@ -24,6 +25,7 @@ class DeploymentMonitoringAgent:
     - Device: deviceId, IP, status, location (x,y,z), services
     - Services: name, protocol (HTTP/REST, MQTT, etc.), details
     - Connectivity: last_seen timestamp
+    - Circuit: plan step circuit breaker state (closed, open, half_open)
     """
 
     def __init__(self, deployment_path: str = DATA_DIR / "deployment_monitoring.json"):
@@ -230,23 +232,43 @@ class DeploymentMonitoringAgent:
             "last_seen": last_seen_str,
             "time_since_seen": str(time_since_seen) if time_since_seen else None,
             "is_online": is_online,
-            "location": device.get("location")
+            "location": device.get("location"),
+            "circuit": (protocol_dispatcher.breakers.snapshot(device_id) or [{"state": "closed"}])[0]
         }
 
     def get_deployment_status(self) -> Dict[str, Any]:
         """Get overall deployment status with statistics."""
-        total_devices = len(self.devices)
+        devices = []
+        for record in self.iter_deployment_status():
+            if record.pop("record") == "device":
+                devices.append(record)
+            else:
+                summary = record
         
-        # Count devices by status
+        return {
+            "total_devices": summary["total_devices"],
+            "status_breakdown": summary["status_breakdown"],
+            "recently_active": summary["recently_active"],
+            "circuits_open": summary["circuits_open"],
+            "devices": devices,
+            "network_config": summary["network_config"],
+            "timestamp": summary["timestamp"]
+        }
+
+    def iter_deployment_status(self) -> Iterator[Dict[str, Any]]:
+        """
+        Deployment status as records (?stream=ndjson): one "device" record per
+        device, then a "summary" record with the statistics gathered on the way.
+        """
+        # Count devices by status; devices last seen within 5 minutes are considered active
         status_counts = {}
+        active_count = 0
+        circuits_open = 0
+        now = datetime.utcnow()
+        breakers = protocol_dispatcher.breakers
         for device in self.devices:
             status = device.get("status", "unknown")
             status_counts[status] = status_counts.get(status, 0) + 1
-        
-        # Check connectivity - devices last seen within 5 minutes are considered active
-        now = datetime.utcnow()
-        active_count = 0
-        for device in self.devices:
             last_seen_str = device.get("last_seen", "")
             try:
                 last_seen = datetime.fromisoformat(last_seen_str.replace('Z', '+00:00'))
@@ -254,16 +276,47 @@ class DeploymentMonitoringAgent:
                     active_count += 1
             except:
                 pass
+            circuit = breakers.state(device.get("deviceId"))
+            if circuit != "closed":
+                circuits_open += 1
+            yield {"record": "device", **device, "circuit": circuit}
         
-        return {
-            "total_devices": total_devices,
+        yield {
+            "record": "summary",
+            "total_devices": len(self.devices),
             "status_breakdown": status_counts,
             "recently_active": active_count,
-            "devices": self.devices,
+            "circuits_open": circuits_open,
             "network_config": self.network_config,
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
 
+    def _telemetry_sample(self, index: int, sample: Any) -> Tuple[Any, str, Optional[float], Optional[float]]:
+        """(device_id, metric, value, timestamp) from one telemetry_record sample; ValueError if malformed."""
+        if not isinstance(sample, dict):
+            raise ValueError(f"samples[{index}] must be an object")
+        device_id, metric = sample.get("device_id"), sample.get("metric")
+        if device_id in (None, "") or not isinstance(device_id, (str, int)):
+            raise ValueError(f"samples[{index}]: device_id required")
+        if not metric or not isinstance(metric, str):
+            raise ValueError(f"samples[{index}]: metric required")
+        row = [device_id, metric]
+        for field in ("value", "timestamp"):
+            number = sample.get(field)
+            if number is not None:
+                try:
+                    number = float(number)
+                except (TypeError, ValueError):
+                    raise ValueError(f"samples[{index}]: {field} must be a number")
+                if number != number or number in (float("inf"), float("-inf")):
+                    raise ValueError(f"samples[{index}]: {field} must be finite")
+                if field == "value" and abs(number) > FLOAT32_MAX:
+                    raise ValueError(f"samples[{index}]: value out of range (|value| <= {FLOAT32_MAX:g})")
+                if field == "timestamp" and not 0 <= number < TS_LIMIT:
+                    raise ValueError(f"samples[{index}]: timestamp must be epoch seconds in [0, 2**32)")
+            row.append(number)
+        return tuple(row)
+
     def monitor(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Main monitoring method to handle various deployment queries."""
         action = payload.get("action", "status")
@@ -344,6 +397,67 @@ class DeploymentMonitoringAgent:
                 "count": len(devices)
             }
         
+        elif action == "telemetry_record":
+            samples = payload.get("samples")
+            if not samples:
+                raise ValueError("samples required for telemetry_record action")
+            if not isinstance(samples, list):
+                raise ValueError("samples must be a list")
+            # Shape checks run on the whole batch before anything is recorded
+            stored = telemetry_store.record_many([
+                self._telemetry_sample(index, sample) for index, sample in enumerate(samples)
+            ])
+            telemetry_store.flush()
+            return {
+                "received": len(samples),
+                "stored": stored
+            }
+        
+        elif action == "telemetry_range":
+            device_id = payload.get("device_id")
+            metric = payload.get("metric")
+            if not device_id or not metric:
+                raise ValueError("device_id and metric required for telemetry_range action")
+            return telemetry_store.query_range(
+                device_id,
+                metric,
+                start=payload.get("start"),
+                end=payload.get("end"),
+                tier=payload.get("tier"),
+                limit=int(payload.get("limit", 10000))
+            )
+        
+        elif action == "telemetry_aggregate":
+            metric = payload.get("metric")
+            if not metric:
+                raise ValueError("metric required for telemetry_aggregate action")
+            return telemetry_store.aggregate(
+                metric,
+                fn=payload.get("fn", "avg"),
+                node_ids=payload.get("device_ids"),
+                start=payload.get("start"),
+                end=payload.get("end"),
+                tier=payload.get("tier")
+            )
+        
+        elif action == "telemetry_stats":
+            return {"telemetry": telemetry_store.stats()}
+        
+        elif action == "circuit_breakers":
+            # Devices whose plan steps are failing fast or being probed
+            breakers = protocol_dispatcher.breakers
+            circuits = breakers.snapshot(payload.get("device_id"), include_closed=bool(payload.get("include_closed")))
+            return {
+                "circuits": circuits,
+                "count": len(circuits),
+                "settings": breakers.settings(),
+                "retry_policy": protocol_dispatcher.retry_policy.to_dict()
+            }
+        
+        elif action == "reset_circuit":
+            # Close a device's circuit after it has been repaired (all devices without device_id)
+            return {"reset": protocol_dispatcher.breakers.reset(payload.get("device_id"))}
+        
         elif action == "query":
             # Legacy query action for backward compatibility
             query = payload.get("query", "")
@@ -372,14 +486,15 @@ class DeploymentMonitoringAgent:
 
 
 @deployment_router.post("/deployment-monitoring")
-def deployment_monitoring(payload: Dict[str, Any], response: Response):
+def deployment_monitoring(payload: Dict[str, Any], response: Response, stream: Optional[str] = None):
     """
     Deployment Monitoring endpoint.
     
     Provides deployment status, device connectivity, and service availability.
     
     Supports actions:
-    - status: Get overall deployment status
+    - status: Get overall deployment status (?stream=ndjson streams one
+      record per device followed by a summary record)
     - device_info: Get info about a specific device
     - connectivity: Get connectivity info for a device
     - query_location: Get devices in a location
@@ -387,10 +502,21 @@ def deployment_monitoring(payload: Dict[str, Any], response: Response):
     - query_status: Get devices by status
     - query_capability: Get devices by location and capability
     - active_devices: Get recently active devices
+    - telemetry_record: Store telemetry samples (device_id, metric, value, timestamp)
+    - telemetry_range: Samples of one device/metric in a time range (raw, 1m or 1h tier)
+    - telemetry_aggregate: avg/min/max/sum/count/last of a metric per device
+    - telemetry_stats: Telemetry store size and counters
+    - circuit_breakers: Plan step circuit breakers that are open or half-open
+      (one device with device_id, closed ones too with include_closed)
+    - reset_circuit: Close the circuit of device_id (or of all devices)
     - query (legacy): Natural language query support
     """
     try:
         agent = DeploymentMonitoringAgent()
+        if wants_ndjson(stream):
+            if payload.get("action", "status") != "status":
+                raise ValueError("stream=ndjson is only supported for the status action")
+            return ndjson_response(agent.iter_deployment_status())
         result = agent.monitor(payload)
         
         # Add agent name to response
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, Response
-from typing import Dict, Any, List, Optional
-from ..utils import read_json, write_json, DATA_DIR
+from typing import Dict, Any, Iterator, List, Optional
+from ..utils import read_json, write_json, DATA_DIR, ndjson_response, wants_ndjson
 from ..agents import run_agent
+from ..tracing import traced, span
+from ..plan_graph import PlanGraph, observed_latency_ms
 import json
 import time
 import logging
@@ -44,6 +46,7 @@ class LLMOrchestrationAgent:
         self.devices = read_json(devices_path)
         self.execution_history = []
 
+    @traced()
     def generate_plan_from_intent(self, user_intent: str) -> Dict[str, Any]:
         """
         Generate an execution plan from user intent.
@@ -104,6 +107,7 @@ class LLMOrchestrationAgent:
             "devices": self.devices
         }
 
+    @traced()
     def analyze_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """
         Analyze a plan and extract key information:
@@ -114,6 +118,7 @@ class LLMOrchestrationAgent:
         devices_involved = plan.get("devices", [])
         algorithm = plan.get("algorithm", {})
         steps = algorithm.get("steps", [])
+        schedule = self._schedule(steps, algorithm.get("type", "sequential"), devices_involved)
         
         analysis = {
             "plan_id": plan.get("plan_id"),
@@ -122,7 +127,10 @@ class LLMOrchestrationAgent:
             "execution_mode": algorithm.get("type", "sequential"),
             "total_steps": len(steps),
             "services": self._extract_services(devices_involved),
-            "timeline_estimate_ms": self._estimate_execution_time(steps)
+            "timeline_estimate_ms": schedule["estimated_ms"],
+            "timeline_worst_case_ms": schedule["worst_case_ms"],
+            "critical_path": schedule["critical_path"],
+            "dependency_levels": schedule["depth"]
         }
         
         return analysis
@@ -135,15 +143,48 @@ class LLMOrchestrationAgent:
             services[device.get("deviceId")] = device_services
         return services
 
-    def _estimate_execution_time(self, steps: List[Dict]) -> int:
-        """Estimate total execution time based on steps."""
-        total_time = 0
-        for step in steps:
+    def _estimate_execution_time(self, steps: List[Dict], execution_mode: str = "sequential",
+                                 devices: Optional[List[Dict]] = None) -> int:
+        """
+        Estimate total execution time as the critical path of the step graph
+        (depends_on, or the chain/fan-out implied by the execution mode).
+        """
+        return self._schedule(steps, execution_mode, devices)["estimated_ms"]
+
+    def _schedule(self, steps: List[Dict], execution_mode: str, devices: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        graph = PlanGraph.for_plan(steps, execution_mode)
+        devices_by_id = {d.get("deviceId") or d.get("device_id"): d for d in (devices or self.devices)}
+        return graph.schedule(
+            lambda step: self._expected_step_ms(step, devices_by_id),
             # Assume 1000ms per step by default
-            timeout = step.get("timeout_ms", 1000)
-            total_time += timeout
-        return total_time
+            lambda step: step.get("timeout_ms", 1000)
+        )
+
+    def _expected_step_ms(self, step: Dict, devices_by_id: Dict[str, Dict]) -> float:
+        """
+        Expected duration of one step: its expected_ms, else the slowest mean
+        latency observed for the protocols of its target services, else its
+        timeout.
+        """
+        if step.get("expected_ms") is not None:
+            return float(step["expected_ms"])
+        targets = step.get("device") or step.get("devices") or []
+        if targets == "all" or step.get("for_all_devices"):
+            targets = list(devices_by_id)
+        elif isinstance(targets, str):
+            targets = [targets]
+        observed = []
+        for device_id in targets:
+            for service in (devices_by_id.get(device_id) or {}).get("services", []):
+                if not step.get("service") or service.get("name") == step.get("service"):
+                    latency = observed_latency_ms(service.get("protocol"))
+                    if latency is not None:
+                        observed.append(latency)
+        if observed:
+            return max(observed)
+        return float(step.get("timeout_ms", 1000))
 
+    @traced()
     def execute_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """Execute the orchestration plan."""
         plan_id = plan.get("plan_id")
@@ -195,34 +236,36 @@ class LLMOrchestrationAgent:
         results = []
         
         for step in steps:
-            step_id = step.get("step_id")
-            step_type = step.get("type")
-            description = step.get("description")
+            with span(f"step.{step.get('type')}", step_id=step.get("step_id"), mode="sequential"):
+                step_id = step.get("step_id")
+                step_type = step.get("type")
+                description = step.get("description")
             
-            logger.info(f"Step {step_id}: {step_type} - {description}")
+                logger.info(f"Step {step_id}: {step_type} - {description}")
             
-            result = {
-                "step_id": step_id,
-                "type": step_type,
-                "status": "completed",
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
+                result = {
+                    "step_id": step_id,
+                    "type": step_type,
+                    "status": "completed",
+                    "timestamp": datetime.utcnow().isoformat() + "Z"
+                }
             
-            # Execute different step types
-            if step_type == "request_service":
-                result["actions"] = self._execute_service_request(step, plan)
-            elif step_type == "verify":
-                result["verification"] = self._verify_status(step, plan)
-            elif step_type == "configure":
-                result["configuration"] = self._configure_devices(step, plan)
-            elif step_type == "initialize":
-                result["initialization"] = self._initialize_devices(step, plan)
-            elif step_type == "monitor":
-                result["monitoring"] = self._start_monitoring(step, plan)
+                # Execute different step types
+                if step_type == "request_service":
+                    result["actions"] = self._execute_service_request(step, plan)
+                elif step_type == "verify":
+                    result["verification"] = self._verify_status(step, plan)
+                elif step_type == "configure":
+                    result["configuration"] = self._configure_devices(step, plan)
+                elif step_type == "initialize":
+                    result["initialization"] = self._initialize_devices(step, plan)
+                elif step_type == "monitor":
+                    result["monitoring"] = self._start_monitoring(step, plan)
             
-            results.append(result)
-            # Simulate execution time
-            time.sleep(0.5)
+                results.append(result)
+                # Simulate execution time
+                with span("simulated_step_delay"):
+                    time.sleep(0.5)
         
         return results
 
@@ -231,27 +274,28 @@ class LLMOrchestrationAgent:
         results = []
         
         for step in steps:
-            step_id = step.get("step_id")
-            step_type = step.get("type")
-            description = step.get("description")
+            with span(f"step.{step.get('type')}", step_id=step.get("step_id"), mode="parallel"):
+                step_id = step.get("step_id")
+                step_type = step.get("type")
+                description = step.get("description")
             
-            logger.info(f"[PARALLEL] Step {step_id}: {step_type} - {description}")
+                logger.info(f"[PARALLEL] Step {step_id}: {step_type} - {description}")
             
-            result = {
-                "step_id": step_id,
-                "type": step_type,
-                "status": "completed",
-                "execution_mode": "parallel",
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
+                result = {
+                    "step_id": step_id,
+                    "type": step_type,
+                    "status": "completed",
+                    "execution_mode": "parallel",
+                    "timestamp": datetime.utcnow().isoformat() + "Z"
+                }
             
-            # Execute different step types
-            if step_type == "request_service":
-                result["actions"] = self._execute_service_request(step, plan)
-            elif step_type == "verify":
-                result["verification"] = self._verify_status(step, plan)
+                # Execute different step types
+                if step_type == "request_service":
+                    result["actions"] = self._execute_service_request(step, plan)
+                elif step_type == "verify":
+                    result["verification"] = self._verify_status(step, plan)
             
-            results.append(result)
+                results.append(result)
         
         return results
 
@@ -358,6 +402,14 @@ class LLMOrchestrationAgent:
         
         return monitoring
 
+    def iter_plans(self) -> Iterator[Dict[str, Any]]:
+        """list_plans as records (?stream=ndjson): one "plan" record per plan, then a summary."""
+        total = 0
+        for plan in self.plans.get("orchestration_plans", []):
+            total += 1
+            yield {"record": "plan", **plan}
+        yield {"record": "summary", "total_plans": total, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
     def orchestrate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Main orchestration method."""
         user_intent = payload.get("intent", "")
@@ -471,7 +523,7 @@ class LLMOrchestrationAgent:
 
 
 @device_router.post("/device-orchestration")
-def device_orchestration(payload: Dict[str, Any], response: Response):
+def device_orchestration(payload: Dict[str, Any], response: Response, stream: Optional[str] = None):
     """
     Orchestration endpoint for LLM-based device orchestration.
     
@@ -481,7 +533,8 @@ def device_orchestration(payload: Dict[str, Any], response: Response):
     - analyze: Analyze an existing plan
     - execute: Execute a specific plan
     - execute_intent: Generate and execute plan from intent
-    - list_plans: List available orchestration plans
+    - list_plans: List available orchestration plans (?stream=ndjson streams
+      one record per plan followed by a summary record)
     
     Example payload for querying devices:
     {
@@ -500,6 +553,10 @@ def device_orchestration(payload: Dict[str, Any], response: Response):
     """
     try:
         agent = LLMOrchestrationAgent()
+        if wants_ndjson(stream):
+            if payload.get("action") != "list_plans":
+                raise ValueError("stream=ndjson is only supported for the list_plans action")
+            return ndjson_response(agent.iter_plans())
         result = agent.orchestrate(payload)
         
         # Add agent metadata
@@ -0,0 +1,110 @@
+"""Diagnostics - on-demand profiling of a live server (admin only)"""
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Any, Optional
+from datetime import datetime
+import asyncio
+import hmac
+import logging
+import os
+
+from ..utils import profiler, memory_tracker
+from ..profiler import MAX_PROFILE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+diagnostics_router = APIRouter()
+
+
+def require_admin(token: Optional[str]):
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Diagnostics disabled; set ADMIN_TOKEN to enable")
+    if not token or not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required (X-Admin-Token)")
+
+
+@diagnostics_router.post("/diagnostics")
+async def diagnostics(payload: Dict[str, Any], x_admin_token: Optional[str] = Header(None)):
+    """
+    Sampling profiler and memory growth diagnostics. Requires the
+    X-Admin-Token header to match ADMIN_TOKEN.
+
+    Supports actions:
+    - profile: sample all threads for `seconds` (default 10) every
+      `interval_ms` (default 10); `format` is speedscope (default),
+      collapsed (text/plain, flamegraph.pl input) or summary
+    - memory_start: start tracemalloc (`nframes`, default 10) and take a baseline
+    - memory_diff: growth since the baseline (`top`, `group_by`
+      lineno|filename|traceback, `reset` to move the baseline)
+    - memory_stop: stop tracemalloc
+    - status: whether a profile or memory tracking is running
+
+    Example payload:
+    {
+        "action": "profile",
+        "seconds": 15,
+        "format": "collapsed"
+    }
+    """
+    require_admin(x_admin_token)
+    action = payload.get("action", "status")
+    try:
+        if action == "profile":
+            seconds = float(payload.get("seconds", 10))
+            if not 0 < seconds <= MAX_PROFILE_SECONDS:
+                raise ValueError(f"seconds must be in (0, {MAX_PROFILE_SECONDS:g}]")
+            output = payload.get("format", "speedscope")
+            if output not in ("speedscope", "collapsed", "summary"):
+                raise ValueError("format must be speedscope, collapsed or summary")
+
+            profiler.start(float(payload.get("interval_ms", 10)), bool(payload.get("include_idle", False)))
+            try:
+                # Sleep on the event loop so no worker thread is held (and the loop itself is sampled)
+                await asyncio.sleep(seconds)
+            finally:
+                profile = profiler.stop()
+
+            if output == "collapsed":
+                return PlainTextResponse(profile.collapsed())
+            result = {
+                "action": "profile",
+                "summary": profile.summary(),
+                "top": profile.top(int(payload.get("top", 20))),
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+            if output == "speedscope":
+                result["speedscope"] = profile.speedscope()
+            return result
+
+        elif action == "memory_start":
+            status = memory_tracker.start(int(payload.get("nframes", 10)))
+            return {"action": "memory_start", "memory": status, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+        elif action == "memory_diff":
+            diff = memory_tracker.diff(
+                top=int(payload.get("top", 20)),
+                group_by=payload.get("group_by", "lineno"),
+                reset=bool(payload.get("reset", False))
+            )
+            return {"action": "memory_diff", "memory": diff, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+        elif action == "memory_stop":
+            return {"action": "memory_stop", "memory": memory_tracker.stop(), "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+        elif action == "status":
+            return {
+                "action": "status",
+                "profiling": profiler.active,
+                "memory": memory_tracker.status(),
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        # Profile already running / memory tracking not started
+        raise HTTPException(status_code=409, detail=str(e))
@@ -0,0 +1,191 @@
+"""Firmware distribution - upload, verify and serve OTA images from the firmware store"""
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+import logging
+
+from ..utils import firmware_store, delta_builder
+from .diagnostics import require_admin
+
+logger = logging.getLogger(__name__)
+
+firmware_router = APIRouter()
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single byte range from a Range header as (start, end) inclusive.
+    None means serve the whole image (no header, or a multi-range request,
+    which RFC 9110 allows a server to ignore).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+@firmware_router.api_route("/firmware/{ref}", methods=["GET", "HEAD"])
+def download_firmware(ref: str, request: Request, range: Optional[str] = Header(None),
+                      if_range: Optional[str] = Header(None)):
+    """
+    Download an image by sha256 or version. Supports single byte ranges
+    (Range: bytes=start-end) so devices can fetch in chunks and resume an
+    interrupted download; the ETag is the sha256, so If-Range is exact.
+    """
+    try:
+        artifact = firmware_store.get(ref)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    size = artifact["size_bytes"]
+    etag = f'"{artifact["sha256"]}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        # Content-addressed: the bytes behind a sha256 never change
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Content-Disposition": f'attachment; filename="{(artifact["versions"] or [artifact["sha256"]])[-1]}.bin"',
+    }
+    byte_range = _parse_range(range, size) if not if_range or if_range == etag else None
+    status = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type="application/octet-stream")
+    return StreamingResponse(
+        firmware_store.read_range(artifact["sha256"], start, end),
+        status_code=status,
+        headers=headers,
+        media_type="application/octet-stream"
+    )
+
+
+@firmware_router.put("/firmware/{version}")
+async def upload_firmware(
+    version: str,
+    request: Request,
+    x_admin_token: Optional[str] = Header(None),
+    x_firmware_signature: Optional[str] = Header(None),
+    x_firmware_sha256: Optional[str] = Header(None)
+):
+    """
+    Upload an image as `version` (raw request body, admin only). The body is
+    streamed to disk while hashed; X-Firmware-Sha256 rejects a corrupted
+    upload. With X-Firmware-Signature (base64 RSA signature) the image only
+    gets its version and signature once the signature verifies; otherwise
+    the upload is rejected with 400.
+    """
+    require_admin(x_admin_token)
+    writer = await run_in_threadpool(firmware_store.writer)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(writer.write, chunk)
+        # A signed image is stored unversioned until its signature checks out
+        artifact = await run_in_threadpool(
+            writer.commit, version=None if x_firmware_signature else version, expected_sha256=x_firmware_sha256
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        writer.abort()
+        raise
+
+    verification = None
+    if x_firmware_signature:
+        verification = await run_in_threadpool(firmware_store.verify, artifact["sha256"], x_firmware_signature)
+        if not verification["valid"]:
+            raise HTTPException(status_code=400, detail=f"Signature verification failed: {verification['reason']}")
+        artifact = await run_in_threadpool(firmware_store.attach, artifact["sha256"], version, x_firmware_signature)
+    return {
+        "action": "upload",
+        "artifact": artifact,
+        "signature_verification": verification,
+        "download_url": f"/tasks/firmware/{artifact['sha256']}",
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+
+
+@firmware_router.post("/firmware")
+def firmware(payload: Dict[str, Any]):
+    """
+    Firmware store queries.
+
+    Supports actions:
+    - list: all stored images
+    - info: one image by `ref` (sha256, version or binary URL)
+    - verify: check the signature of `ref` (the stored one, or `signature`);
+      results are cached per image and signature
+    - delta: status of the delta from `base` to `ref`, scheduling a build
+      in the worker pool if there is none (`wait` blocks until it is built)
+
+    Example payload:
+    {
+        "action": "verify",
+        "ref": "1.2.3"
+    }
+    """
+    action = payload.get("action", "list")
+    try:
+        if action == "list":
+            return {"action": "list", "artifacts": firmware_store.list(), "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+        ref = payload.get("ref")
+        if not ref:
+            raise ValueError(f"ref required for {action} action")
+
+        if action == "info":
+            artifact = firmware_store.get(ref)
+            return {
+                "action": "info",
+                "artifact": artifact,
+                "download_url": f"/tasks/firmware/{artifact['sha256']}",
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+
+        elif action == "verify":
+            return {
+                "action": "verify",
+                "verification": firmware_store.verify(ref, payload.get("signature")),
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+
+        elif action == "delta":
+            base = payload.get("base")
+            if not base:
+                raise ValueError("base required for delta action")
+            if payload.get("wait"):
+                delta = delta_builder.wait(base, ref, float(payload.get("timeout", 300)))
+            else:
+                delta = delta_builder.request(base, ref)
+            return {"action": "delta", "delta": delta, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
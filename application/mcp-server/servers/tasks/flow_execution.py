@@ -2,17 +2,20 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
-from ..utils import onos_client, read_json, write_json
+from ..utils import onos_client, read_json, write_json, DATA_DIR
 from datetime import datetime
 
-execution_router = APIRouter()
+flow_execution_router = APIRouter()
+
+HISTORY_FILE = DATA_DIR / "flow_execution_history.json"
 
 class ExecutionRequest(BaseModel):
     action: str
     flow_plan: Optional[Dict[str, Any]] = None
     flow_id: Optional[str] = None
+    prune: Optional[bool] = False
 
-@execution_router.post("/flow-execution")
+@flow_execution_router.post("/flow-execution")
 async def flow_execution(request: ExecutionRequest):
     """Execute flow installation via ONOS"""
     
@@ -21,42 +24,31 @@ async def flow_execution(request: ExecutionRequest):
             raise HTTPException(400, "flow_plan required")
         
         flows = request.flow_plan.get("flows", [])
-        results = []
-        
-        for flow in flows:
-            try:
-                result = onos_client.install_flow(flow)
-                results.append({
-                    "node_id": flow.get("nodeId"),
-                    "status": result.get("status", "success"),
-                    "message": result.get("message", "Flow installed")
-                })
-            except Exception as e:
-                results.append({
-                    "node_id": flow.get("nodeId"),
-                    "status": "error",
-                    "message": str(e)
-                })
+        # Diff against installed tables; only changed flows are sent to ONOS
+        install = onos_client.install_flows(flows, prune=bool(request.prune))
+        results = install["results"]
         
         # Record execution
-        history = read_json("execution_history.json")
+        history = read_json(HISTORY_FILE) or {}
         execution_id = f"exec-{int(datetime.utcnow().timestamp())}"
         history[execution_id] = {
             "timestamp": datetime.utcnow().isoformat(),
             "flows": len(flows),
+            "summary": install["summary"],
             "results": results
         }
-        write_json("execution_history.json", history)
+        write_json(HISTORY_FILE, history)
         
         return {
             "status": "success",
             "execution_id": execution_id,
-            "flows_installed": len([r for r in results if r["status"] == "success"]),
+            "flows_installed": len([r for r in results if r["status"] == "success" and r["change"] in ("added", "unchanged")]),
+            "summary": install["summary"],
             "results": results
         }
     
     elif request.action == "get_history":
-        history = read_json("execution_history.json")
+        history = read_json(HISTORY_FILE) or {}
         return {
             "status": "success",
             "history": history
@@ -9,11 +9,15 @@ from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import logging
 
-from ..utils import onos_client, read_json, write_json
+from ..utils import onos_client, read_json, write_json, DATA_DIR
 from ..agents import run_agent
+from ..routing import RouteCompiler
+from ..compaction import FlowCompactor, MAX_FLOW_RULES
 
 flow_router = APIRouter()
 
+FLOW_PLANS_FILE = DATA_DIR / "flow_plans.json"
+
 class FlowRequest(BaseModel):
     action: str
     intent: Optional[str] = None
@@ -62,7 +66,7 @@ async def generate_flow_plan(intent: str, params: Optional[Dict] = None) -> Dict
     if not intent:
         raise HTTPException(status_code=400, detail="Intent is required")
     
-    # Get current topology
+    # Get current topology (cached, see servers/onos.py)
     topology = onos_client.get_topology()
     devices = onos_client.get_wsn_devices()
     
@@ -78,46 +82,92 @@ async def generate_flow_plan(intent: str, params: Optional[Dict] = None) -> Dict
     result = run_agent("flow-orchestration", context)
     
     # If using stub agent, generate mock plan
-    if result.get("status") == "stub_response":
-        return generate_mock_flow_plan(intent, topology, devices)
+    if not result or result.get("status") == "stub_response":
+        return generate_mock_flow_plan(intent, topology, devices, params)
     
     return result
 
 
-def generate_mock_flow_plan(intent: str, topology: Dict, devices: List[Dict]) -> Dict:
+def generate_mock_flow_plan(intent: str, topology: Dict, devices: List[Dict], params: Optional[Dict] = None) -> Dict:
     """Generate mock flow plan for testing without LLM"""
     
+    params = params or {}
+    
     # Simple intent parsing
     intent_lower = intent.lower()
+    metric = params.get("metric") or ("energy" if "energy" in intent_lower or "battery" in intent_lower else "hops")
     
     # Default: route all sensor data to sink
     src_nodes = [d["nodeId"] for d in devices if d.get("type") == "sensor"]
-    dst_node = next((d["nodeId"] for d in devices if d.get("type") == "border-router"), 1)
-    
-    flows = []
-    for src in src_nodes:
-        flows.append({
-            "nodeId": src,
-            "srcAddr": src,
-            "dstAddr": dst_node,
-            "action": 1,  # FORWARD
-            "nextHop": dst_node,
-            "description": f"Route from sensor {src} to sink {dst_node}"
-        })
+    dst_node = params.get("sink") or next((d["nodeId"] for d in devices if d.get("type") == "border-router"), 1)
+    
+    routes = None
+    router = None
+    if topology and topology.get("links"):
+        # Multi-hop: one shortest-path tree from the sink, per-hop rules on every relay
+        try:
+            router = RouteCompiler(topology, metric=metric)
+            routes = router.compile_flows(src_nodes, dst_node)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        flows = routes["flows"]
+    else:
+        # No link information yet: assume every sensor is one hop from the sink
+        flows = []
+        for src in src_nodes:
+            flows.append({
+                "nodeId": src,
+                "srcAddr": src,
+                "dstAddr": dst_node,
+                "action": 1,  # FORWARD
+                "nextHop": dst_node,
+                "description": f"Route from sensor {src} to sink {dst_node}"
+            })
+    
+    compaction = None
+    if params.get("compact", True):
+        # Fit every node's rules into its flow table (MAX_FLOW_RULES on the motes)
+        try:
+            compactor = FlowCompactor(
+                capacity=int(params.get("flow_table_capacity", MAX_FLOW_RULES)),
+                router=router,
+                traffic=params.get("traffic")
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        compaction = compactor.compact(
+            flows,
+            routes={(src, routes["sink"]): path for src, path in routes["paths"].items()} if routes else None
+        )
+        flows = compaction["flows"]
     
     plan = {
         "status": "success",
         "intent": intent,
-       "plan_id": "plan-001",
+        "plan_id": "plan-001",
         "flows": flows,
         "summary": f"Generated {len(flows)} flow rules to route sensor data to sink",
         "mock": True
     }
+    if routes is not None:
+        plan["routing"] = {
+            "metric": routes["metric"],
+            "sink": routes["sink"],
+            "paths": {str(src): path for src, path in routes["paths"].items()},
+            "unreachable": routes["unreachable"]
+        }
+    if compaction is not None:
+        plan["compaction"] = {
+            "summary": compaction["summary"],
+            "utilization": compaction["utilization"],
+            "spilled": compaction["spilled"],
+            "unplaced": compaction["unplaced"]
+        }
     
     # Save plan
-    plans = read_json("flow_plans.json")
+    plans = read_json(FLOW_PLANS_FILE) or {}
     plans[plan["plan_id"]] = plan
-    write_json("flow_plans.json", plans)
+    write_json(FLOW_PLANS_FILE, plans)
     
     return plan
 
@@ -134,24 +184,18 @@ async def execute_intent(intent: str) -> Dict:
     # 2. Validate (placeholder - will implement in flow_validation)
     # For now, assume valid
     
-    # 3. Execute flows
-    installed = 0
-    errors = []
-    
-    for flow in plan_result["flows"]:
-        try:
-            result = onos_client.install_flow(flow)
-            if result.get("status") == "success":
-                installed += 1
-            else:
-                errors.append(f"Flow {flow['nodeId']}: {result.get('message')}")
-        except Exception as e:
-            errors.append(f"Flow {flow['nodeId']}: {str(e)}")
+    # 3. Execute flows (bulk: only flows missing from the installed tables are sent)
+    install = onos_client.install_flows(plan_result["flows"])
+    installed = len([r for r in install["results"] if r["status"] == "success" and r["change"] in ("added", "unchanged")])
+    errors = [f"Flow {r['node_id']}: {r['message']}" for r in install["results"] if r["status"] != "success"]
     
     return {
         "status": "success" if installed > 0 else "error",
         "intent": intent,
         "flows_installed": installed,
+        "flows_added": install["summary"]["added"],
+        "flows_unchanged": install["summary"]["unchanged"],
+        "flows_replaced": install["summary"]["removed"],
         "total_flows": len(plan_result["flows"]),
         "errors": errors if errors else None
     }
@@ -159,7 +203,7 @@ async def execute_intent(intent: str) -> Dict:
 
 async def list_flow_plans() -> Dict:
     """List all saved flow plans"""
-    plans = read_json("flow_plans.json")
+    plans = read_json(FLOW_PLANS_FILE) or {}
     
     return {
         "status": "success",
@@ -180,7 +224,7 @@ async def analyze_plan(params: Optional[Dict]) -> Dict:
     if not params or "plan_id" not in params:
         raise HTTPException(status_code=400, detail="plan_id required")
     
-    plans = read_json("flow_plans.json")
+    plans = read_json(FLOW_PLANS_FILE) or {}
     plan = plans.get(params["plan_id"])
     
     if not plan:
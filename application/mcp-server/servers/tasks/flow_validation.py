@@ -3,14 +3,17 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 
-validation_router = APIRouter()
+from ..compaction import FlowCompactor, MAX_FLOW_RULES
+from ..utils import onos_client
+
+flow_validation_router = APIRouter()
 
 class ValidationRequest(BaseModel):
     action: str
     flow_plan: Optional[Dict[str, Any]] = None
     params: Optional[Dict[str, Any]] = None
 
-@validation_router.post("/flow-validation")
+@flow_validation_router.post("/flow-validation")
 async def flow_validation(request: ValidationRequest):
     """Validate flow plans against WSN constraints"""
     
@@ -26,8 +29,8 @@ async def flow_validation(request: ValidationRequest):
         for f in flows:
             node_id = f.get("nodeId")
             node_flows[node_id] = node_flows.get(node_id, 0) + 1
-            if node_flows[node_id] > 10:  # Max 10 flows per node
-                issues.append(f"Node {node_id} exceeds flow table capacity")
+            if node_flows[node_id] == MAX_FLOW_RULES + 1:
+                issues.append(f"Node {node_id} exceeds flow table capacity (use action 'compact')")
         
         # Bandwidth: simple check
         if len(flows) > 50:
@@ -39,6 +42,29 @@ async def flow_validation(request: ValidationRequest):
             "issues": issues
         }
     
+    elif request.action == "compact":
+        if not request.flow_plan:
+            raise HTTPException(400, "flow_plan required")
+        
+        params = request.params or {}
+        # Spilling onto alternative paths needs the current topology
+        topology = request.flow_plan.get("topology") or onos_client.get_topology()
+        try:
+            compactor = FlowCompactor(
+                capacity=int(params.get("flow_table_capacity", MAX_FLOW_RULES)),
+                topology=topology,
+                metric=params.get("metric", "hops"),
+                traffic=params.get("traffic")
+            )
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        
+        result = compactor.compact(request.flow_plan.get("flows", []))
+        return {
+            "status": "success" if not result["unplaced"] else "partial",
+            **result
+        }
+    
     elif request.action == "recommendations":
         return {
             "status": "success",
@@ -1,16 +1,106 @@
 from fastapi import APIRouter, HTTPException, Response
-from typing import Dict, Any, List, Optional
-from ..utils import read_json, write_json, DATA_DIR
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set
+from ..utils import read_json, write_json, DATA_DIR, ndjson_response, wants_ndjson, ota_rollouts, firmware_store, delta_builder, ota_queue, report_ingestor
+from ..firmware import CHUNK_SIZE
 from ..agents import run_agent
 import logging
 from datetime import datetime
+from functools import lru_cache
 import hashlib
 import json
+import time
 
 network_config_router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=256)
+def _analyze_intent_text(intent: str) -> Dict[str, Any]:
+    """Intent analysis for a normalized (lowercased, single-spaced) intent."""
+    keywords = intent.split()
+    return {
+        "environment": "healthcare_facility" if "nursing" in intent or "hospital" in intent else "general",
+        "priority_fall_detection": "fall" in intent or "detection" in intent,
+        "priority_video": "video" in intent or "camera" in intent or "monitoring" in intent,
+        "priority_environmental": "temperature" in intent or "environmental" in intent,
+        "multi_protocol_needed": any(x in intent for x in ["wifi", "ble", "zigbee", "thread", "multi"]),
+        "security_required": "secure" in intent or "security" in intent,
+        "ota_enabled": "update" in intent or "ota" in intent,
+        "intent_keywords": keywords
+    }
+
+
+@lru_cache(maxsize=256)
+def _device_profile(
+    device_type: str,
+    ota_enabled: bool,
+    security_required: bool,
+    priority_video: bool,
+    multi_protocol_needed: bool
+) -> Dict[str, Any]:
+    """
+    Configuration template shared by every device of a type under the same
+    intent flags. Device configs reference these sections rather than copying
+    them, so they must be treated as read-only; anything device specific goes
+    in the per-device overlay (see _generate_device_config).
+    """
+    http = {
+        "name": "HTTP/REST",
+        "enabled": True,
+        "port": 80,
+        "security": "HTTPS" if security_required else "HTTP"
+    }
+    mqtt = {
+        "name": "MQTT",
+        "enabled": True,
+        "broker": "192.168.1.200",
+        "port": 1883,
+        "security": "TLS" if security_required else "none"
+    }
+    
+    # Determine protocols based on device type and intent
+    protocols = []
+    if device_type == "camera":
+        if priority_video:
+            protocols.append(http)
+        protocols.append(mqtt)
+    elif device_type == "sensor":
+        protocols.append({**mqtt, "qos": 1, "retain": False})
+        if multi_protocol_needed:
+            protocols.append({
+                "name": "BLE",
+                "enabled": True,
+                "advertising_interval_ms": 100,
+                "power_level": -12
+            })
+    elif device_type in ("actuator", "display"):
+        protocols.append(http)
+    
+    return {
+        "wifi": {
+            "enabled": True,
+            "ssid": "LLMThings_IoT",
+            "security": "WPA2-PSK",
+            "auto_reconnect": True,
+            "power_save": "modem_sleep" if device_type in ["sensor"] else "none"
+        },
+        "protocols": protocols,
+        "ota": {
+            "enabled": ota_enabled,
+            "mode": "push",  # OTA Server => Device
+            "check_interval_seconds": 3600,
+            "auto_update": False,
+            "rollback_protection": True
+        },
+        "security": {
+            "secure_boot": True,
+            "flash_encryption": True,
+            "tls_enabled": True,
+            "certificate_verification": True
+        }
+    }
+
+
 class NetworkAutoConfigurationAgent:
     """
     LLM-based Network Auto-Configuration Agent responsible for:
@@ -29,11 +119,13 @@ class NetworkAutoConfigurationAgent:
         self,
         deployment_monitoring_path: str = DATA_DIR / "deployment_monitoring.json",
         ota_server_config_path: str = DATA_DIR / "ota_server_config.json",
-        network_policies_path: str = DATA_DIR / "network_policies.json"
+        network_policies_path: str = DATA_DIR / "network_policies.json",
+        applied_configurations_path: str = DATA_DIR / "applied_configurations.json"
     ):
         self.deployment_monitoring_path = deployment_monitoring_path
         self.ota_server_config_path = ota_server_config_path
         self.network_policies_path = network_policies_path
+        self.applied_configurations_path = applied_configurations_path
         
         # Load configuration
         self.deployment = read_json(deployment_monitoring_path)
@@ -43,17 +135,26 @@ class NetworkAutoConfigurationAgent:
         self.configuration_history = []
         self.ota_update_history = []
 
-    def configure_network_from_intent(self, user_intent: str) -> Dict[str, Any]:
+    def configure_network_from_intent(
+        self,
+        user_intent: str,
+        dry_run: bool = False,
+        full_sync: bool = False
+    ) -> Dict[str, Any]:
         """
         Parse user intent and generate network configuration.
         
         Example: "Given the current network configuration, reconfigure the network to account
         for tall detection, application in a nursing home"
         
+        Every device's configuration is generated, but configuration steps
+        only cover what changed since the last applied configuration
+        (applied_configurations.json): per-section patches, with devices that
+        need the same patch grouped into one step. dry_run leaves the stored
+        baseline untouched; full_sync ignores it and re-sends everything.
+        
         Returns detailed configuration for all devices.
         """
-        logger.info(f"Configuring network from intent: {user_intent}")
-        
         config_result = {
             "user_intent": user_intent,
             "configuration_timestamp": datetime.utcnow().isoformat() + "Z",
@@ -65,30 +166,18 @@ class NetworkAutoConfigurationAgent:
         }
         
         try:
-            # Step 1: Analyze intent
-            intent_analysis = self._analyze_intent(user_intent)
-            config_result["intent_analysis"] = intent_analysis
-            
-            # Step 2: Generate configuration for each device
-            devices = self.deployment.get("devices", [])
-            for device in devices:
-                device_config = self._generate_device_config(device, intent_analysis)
-                config_result["devices_configured"].append(device_config)
-            
-            # Step 3: Determine required protocols
-            protocols = self._determine_protocols_needed(config_result["devices_configured"])
-            config_result["protocols_enabled"] = protocols
-            
-            # Step 4: Generate configuration steps
-            steps = self._generate_configuration_steps(
-                config_result["devices_configured"],
-                protocols
-            )
-            config_result["configuration_steps"] = steps
-            
-            # Step 5: Provide recommendations
-            recommendations = self._generate_recommendations(intent_analysis)
-            config_result["recommendations"] = recommendations
+            for record in self.iter_network_configuration(user_intent, dry_run=dry_run, full_sync=full_sync):
+                kind = record.pop("record")
+                if kind == "intent":
+                    config_result["intent_analysis"] = record["intent_analysis"]
+                elif kind == "device":
+                    config_result["devices_configured"].append(record)
+                elif kind == "step":
+                    config_result["configuration_steps"].append(record)
+                elif kind == "summary":
+                    config_result["protocols_enabled"] = record["protocols_enabled"]
+                    config_result["diff"] = record["diff"]
+                    config_result["recommendations"] = record["recommendations"]
             
             # Store in history
             self.configuration_history.append(config_result)
@@ -101,219 +190,316 @@ class NetworkAutoConfigurationAgent:
             config_result["error"] = str(e)
             return config_result
 
-    def _analyze_intent(self, user_intent: str) -> Dict[str, Any]:
-        """Analyze user intent to extract requirements."""
-        intent_lower = user_intent.lower()
-        
-        analysis = {
-            "environment": "healthcare_facility" if "nursing" in intent_lower or "hospital" in intent_lower else "general",
-            "priority_fall_detection": "fall" in intent_lower or "detection" in intent_lower,
-            "priority_video": "video" in intent_lower or "camera" in intent_lower or "monitoring" in intent_lower,
-            "priority_environmental": "temperature" in intent_lower or "environmental" in intent_lower,
-            "multi_protocol_needed": any(x in intent_lower for x in ["wifi", "ble", "zigbee", "thread", "multi"]),
-            "security_required": "secure" in intent_lower or "security" in intent_lower,
-            "ota_enabled": "update" in intent_lower or "ota" in intent_lower,
-            "intent_keywords": intent_lower.split()
-        }
-        
-        return analysis
-
-    def _generate_device_config(
+    def iter_network_configuration(
         self,
-        device: Dict[str, Any],
-        intent_analysis: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Generate configuration for a specific device."""
-        device_id = device.get("deviceId")
-        device_type = device.get("type")
+        user_intent: str,
+        dry_run: bool = False,
+        full_sync: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generator behind configure_network_from_intent, used directly for
+        ?stream=ndjson. Yields records tagged by "record":
+        - intent: the intent analysis
+        - device: one per device, as soon as it is generated and diffed
+        - step: grouped configuration steps, once every device is diffed
+        - summary: enabled protocols, diff summary and recommendations
+        Devices are not accumulated; only the diff state (ids, hashes, patch
+        groups) and the new baseline to persist are kept.
+        """
+        logger.info(f"Configuring network from intent: {user_intent}")
         
-        device_config = {
-            "deviceId": device_id,
-            "type": device_type,
-            "configuration": {
-                "wifi": {
-                    "enabled": True,
-                    "ssid": "LLMThings_IoT",
-                    "security": "WPA2-PSK",
-                    "auto_reconnect": True,
-                    "power_save": "modem_sleep" if device_type in ["sensor"] else "none"
-                },
-                "protocols": [],
-                "ota": {
-                    "enabled": intent_analysis.get("ota_enabled", True),
-                    "mode": "push",  # OTA Server => Device
-                    "check_interval_seconds": 3600,
-                    "auto_update": False,
-                    "rollback_protection": True
-                },
-                "security": {
-                    "secure_boot": True,
-                    "flash_encryption": True,
-                    "tls_enabled": True,
-                    "certificate_verification": True
-                },
-                "services": []
-            }
+        # Step 1: Analyze intent
+        intent_analysis = self._analyze_intent(user_intent)
+        yield {
+            "record": "intent",
+            "user_intent": user_intent,
+            "configuration_timestamp": datetime.utcnow().isoformat() + "Z",
+            "intent_analysis": intent_analysis
         }
         
-        # Determine protocols based on device type and intent
-        if device_type == "camera":
-            if intent_analysis.get("priority_video"):
-                device_config["configuration"]["protocols"].append({
-                    "name": "HTTP/REST",
-                    "enabled": True,
-                    "port": 80,
-                    "security": "HTTPS" if intent_analysis.get("security_required") else "HTTP"
-                })
-            device_config["configuration"]["protocols"].append({
-                "name": "MQTT",
-                "enabled": True,
-                "broker": "192.168.1.200",
-                "port": 1883,
-                "security": "TLS" if intent_analysis.get("security_required") else "none"
-            })
+        applied = {} if full_sync else (read_json(self.applied_configurations_path) or {})
+        previous = applied.get("devices", {})
+        baseline = None if dry_run else dict(previous)
+        now = datetime.utcnow().isoformat() + "Z"
+        diff = self._new_config_diff()
+        device_ids = []
+        protocols = set()
+        seen_protocol_lists = set()
         
-        elif device_type == "sensor":
-            device_config["configuration"]["protocols"].append({
-                "name": "MQTT",
-                "enabled": True,
-                "broker": "192.168.1.200",
-                "port": 1883,
-                "security": "TLS" if intent_analysis.get("security_required") else "none",
-                "qos": 1,
-                "retain": False
-            })
+        # Step 2: Generate, diff and emit each device's configuration
+        for device in self.deployment.get("devices", []):
+            device_config = self._generate_device_config(device, intent_analysis)
+            device_id = device_config["deviceId"]
+            device_ids.append(device_id)
+            section_hashes = self._diff_device_config(device_config, previous.get(device_id, {}), diff)
             
-            if intent_analysis.get("multi_protocol_needed"):
-                device_config["configuration"]["protocols"].append({
-                    "name": "BLE",
-                    "enabled": True,
-                    "advertising_interval_ms": 100,
-                    "power_level": -12
-                })
+            # Step 3: Collect required protocols; devices sharing a profile share its protocol list
+            device_protocols = device_config["configuration"].get("protocols", [])
+            if id(device_protocols) not in seen_protocol_lists:
+                seen_protocol_lists.add(id(device_protocols))
+                protocols.update(p.get("name") for p in device_protocols if p.get("enabled"))
+            
+            if baseline is not None and device_config["changed"]:
+                baseline[device_id] = {
+                    "hash": device_config["config_hash"],
+                    "sections": section_hashes,
+                    "configuration": device_config["configuration"],
+                    "applied_at": now
+                }
+            yield {"record": "device", **device_config}
         
-        elif device_type == "actuator":
-            device_config["configuration"]["protocols"].append({
-                "name": "HTTP/REST",
-                "enabled": True,
-                "port": 80,
-                "security": "HTTPS" if intent_analysis.get("security_required") else "HTTP"
-            })
+        # Step 4: Steps for what changed, devices needing the same change grouped
+        protocols = sorted(protocols)
+        for step in self._generate_configuration_steps(
+            device_ids,
+            protocols,
+            diff["groups"].values(),
+            previous_protocols=applied.get("protocols_enabled")
+        ):
+            yield {"record": "step", **step}
         
-        elif device_type == "display":
-            device_config["configuration"]["protocols"].append({
-                "name": "HTTP/REST",
-                "enabled": True,
-                "port": 80,
-                "security": "HTTPS" if intent_analysis.get("security_required") else "HTTP"
+        if baseline is not None and diff["changed"]:
+            write_json(self.applied_configurations_path, {
+                "updated_at": now,
+                "protocols_enabled": protocols,
+                "devices": baseline
             })
         
+        # Step 5: Provide recommendations
+        yield {
+            "record": "summary",
+            "status": "configured",
+            "protocols_enabled": protocols,
+            "diff": {
+                "baseline": bool(applied),
+                "devices_total": len(device_ids),
+                "devices_changed": diff["changed"],
+                "devices_unchanged": len(device_ids) - diff["changed"],
+                "sections_changed": diff["sections_changed"],
+                "patch_groups": len(diff["groups"])
+            },
+            "recommendations": self._generate_recommendations(intent_analysis)
+        }
+
+    @staticmethod
+    def _config_hash(value: Any) -> str:
+        return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+    @classmethod
+    def _config_patch(cls, old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+        """
+        JSON-Patch style add/remove/replace operations turning old into new.
+        Lists of named entries (protocols, services) are diffed by name and
+        addressed as <list>/<name>; other lists are replaced whole. Path
+        segments are escaped as in JSON Pointer ("/" -> "~1").
+        """
+        if old == new:
+            return []
+        
+        def named(items):
+            return isinstance(items, list) and all(isinstance(i, dict) and "name" in i for i in items) \
+                and len({i["name"] for i in items}) == len(items)
+        
+        if named(old) and named(new):
+            old, new = {i["name"]: i for i in old}, {i["name"]: i for i in new}
+        if isinstance(old, dict) and isinstance(new, dict):
+            ops = []
+            for key in sorted(old.keys() | new.keys(), key=str):
+                child = f"{path}/" + str(key).replace("~", "~0").replace("/", "~1")
+                if key not in new:
+                    ops.append({"op": "remove", "path": child})
+                elif key not in old:
+                    ops.append({"op": "add", "path": child, "value": new[key]})
+                else:
+                    ops.extend(cls._config_patch(old[key], new[key], child))
+            return ops
+        return [{"op": "replace", "path": path, "value": new}]
+
+    @staticmethod
+    def _new_config_diff() -> Dict[str, Any]:
+        # Devices built from the same profile share section objects, so each
+        # object is hashed once; likewise one patch per (old, new) section pair
+        return {"groups": {}, "sections_changed": {}, "changed": 0, "hashes_by_id": {}, "patches": {}}
+
+    def _diff_device_config(
+        self,
+        device_config: Dict[str, Any],
+        previous: Dict[str, Any],
+        diff: Dict[str, Any]
+    ) -> Dict[str, str]:
+        """
+        Compare a device's configuration sections with the applied ones
+        (`previous`), adding its changes to the patch groups in `diff`.
+        Devices needing the same change for a section share one group.
+        Returns the device's section hashes.
+        """
+        device_id = device_config.get("deviceId")
+        configuration = device_config.get("configuration", {})
+        hashes_by_id = diff["hashes_by_id"]
+        section_hashes = {}
+        for section, value in configuration.items():
+            digest = hashes_by_id.get(id(value))
+            if digest is None:
+                digest = self._config_hash(value)
+                if section != "services":
+                    hashes_by_id[id(value)] = digest
+            section_hashes[section] = digest
+        device_config["config_hash"] = self._config_hash(section_hashes)
+        device_config["changed"] = device_config["config_hash"] != previous.get("hash")
+        if not device_config["changed"]:
+            return section_hashes
+        
+        diff["changed"] += 1
+        groups = diff["groups"]
+        changed_sections = diff["sections_changed"]
+        old_sections = previous.get("configuration", {})
+        old_hashes = previous.get("sections", {})
+        for section, value in configuration.items():
+            if old_hashes.get(section) == section_hashes[section]:
+                continue
+            if section in old_sections:
+                pair = (old_hashes.get(section) or self._config_hash(old_sections[section]), section_hashes[section])
+                if pair not in diff["patches"]:
+                    body = self._config_patch(old_sections[section], value)
+                    diff["patches"][pair] = (body, self._config_hash(body))
+                kind, (body, body_hash) = "patch", diff["patches"][pair]
+            else:
+                kind, body, body_hash = "set", value, section_hashes[section]
+            key = (section, kind, body_hash)
+            group = groups.setdefault(key, {"section": section, "kind": kind, "body": body, "devices": []})
+            group["devices"].append(device_id)
+            changed_sections[section] = changed_sections.get(section, 0) + 1
+        for section in old_sections.keys() - configuration.keys():
+            key = (section, "remove", "")
+            groups.setdefault(key, {"section": section, "kind": "remove", "body": None, "devices": []})
+            groups[key]["devices"].append(device_id)
+            changed_sections[section] = changed_sections.get(section, 0) + 1
+        return section_hashes
+
+    def _analyze_intent(self, user_intent: str) -> Dict[str, Any]:
+        """Analyze user intent to extract requirements (cached by normalized text)."""
+        analysis = _analyze_intent_text(" ".join(user_intent.lower().split()))
+        return {**analysis, "intent_keywords": list(analysis["intent_keywords"])}
+
+    def _generate_device_config(
+        self,
+        device: Dict[str, Any],
+        intent_analysis: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Generate configuration for a specific device: the memoized profile for
+        its type and intent, overlaid with the device's own services.
+        """
+        profile = _device_profile(
+            device.get("type"),
+            bool(intent_analysis.get("ota_enabled", True)),
+            bool(intent_analysis.get("security_required")),
+            bool(intent_analysis.get("priority_video")),
+            bool(intent_analysis.get("multi_protocol_needed"))
+        )
+        
         # Configure services based on device
-        services = device.get("services", [])
-        for service in services:
-            service_config = {
+        services = [
+            {
                 "name": service.get("name"),
                 "protocol": service.get("protocol"),
                 "enabled": True,
                 "parameters": service.get("details", {})
             }
-            device_config["configuration"]["services"].append(service_config)
-        
-        return device_config
-
-    def _determine_protocols_needed(self, devices_configured: List[Dict]) -> List[str]:
-        """Determine which protocols are needed across all devices."""
-        protocols = set()
-        
-        for device_config in devices_configured:
-            for protocol in device_config.get("configuration", {}).get("protocols", []):
-                if protocol.get("enabled"):
-                    protocols.add(protocol.get("name"))
+            for service in device.get("services", [])
+        ]
         
-        return sorted(list(protocols))
+        return {
+            "deviceId": device.get("deviceId"),
+            "type": device.get("type"),
+            "configuration": {**profile, "services": services}
+        }
 
     def _generate_configuration_steps(
         self,
-        devices_configured: List[Dict],
-        protocols: List[str]
+        all_ids: List[str],
+        protocols: List[str],
+        groups: Iterable[Dict[str, Any]],
+        previous_protocols: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
-        """Generate step-by-step configuration instructions."""
-        steps = [
-            {
-                "step": 1,
-                "description": "Initialize WiFi connection",
+        """Generate step-by-step configuration instructions for what changed."""
+        
+        def target(device_ids):
+            if len(device_ids) == len(all_ids):
+                return "all_devices"
+            return device_ids[0] if len(device_ids) == 1 else device_ids
+        
+        steps = []
+        if previous_protocols is None or sorted(previous_protocols) != protocols:
+            steps.append({
+                "description": "Initialize enabled protocols",
                 "target": "all_devices",
-                "action": "wifi_init",
+                "action": "protocol_init",
                 "parameters": {
-                    "ssid": "LLMThings_IoT",
-                    "security": "WPA2-PSK",
-                    "auto_reconnect": True
+                    "protocols": protocols,
+                    "added": sorted(set(protocols) - set(previous_protocols or [])),
+                    "removed": sorted(set(previous_protocols or []) - set(protocols))
                 }
-            },
-            {
-                "step": 2,
-                "description": "Configure security (Secure Boot, Flash Encryption)",
-                "target": "all_devices",
-                "action": "security_setup",
-                "parameters": {
-                    "secure_boot": True,
-                    "flash_encryption": True
+            })
+        
+        # One step per distinct section change; devices needing the same change share it
+        touched = set()
+        ota_changed = False
+        for group in sorted(groups, key=lambda g: (g["section"], -len(g["devices"]))):
+            touched.update(group["devices"])
+            ota_changed = ota_changed or group["section"] == "ota"
+            count = len(group["devices"])
+            who = f"{count} devices" if count > 1 else group["devices"][0]
+            if group["kind"] == "set":
+                step = {
+                    "description": f"Configure {group['section']} on {who}",
+                    "action": "device_config",
+                    "parameters": {"section": group["section"], "value": group["body"]}
                 }
-            },
-            {
-                "step": 3,
-                "description": "Initialize enabled protocols",
+            elif group["kind"] == "patch":
+                step = {
+                    "description": f"Update {group['section']} on {who}",
+                    "action": "device_config_patch",
+                    "parameters": {"section": group["section"], "operations": group["body"]}
+                }
+            else:
+                step = {
+                    "description": f"Remove {group['section']} from {who}",
+                    "action": "device_config_patch",
+                    "parameters": {"section": group["section"], "operations": [{"op": "remove", "path": ""}]}
+                }
+            step["target"] = target(group["devices"])
+            step["device_count"] = count
+            steps.append(step)
+        
+        if ota_changed:
+            steps.append({
+                "description": "Setup OTA update mechanism (OTA Server => Device)",
                 "target": "all_devices",
-                "action": "protocol_init",
+                "action": "ota_setup",
                 "parameters": {
-                    "protocols": protocols
+                    "mode": "push",
+                    "ota_server": "192.168.1.100",
+                    "check_interval_seconds": 3600,
+                    "signature_verification": True
                 }
-            }
-        ]
+            })
         
-        # Add device-specific steps
-        device_step = 4
-        for device_config in devices_configured:
-            device_id = device_config.get("deviceId")
-            device_type = device_config.get("type")
-            
+        if touched:
+            changed_ids = [d for d in all_ids if d in touched]
             steps.append({
-                "step": device_step,
-                "description": f"Configure {device_type} device {device_id}",
-                "target": device_id,
-                "action": "device_config",
-                "parameters": device_config.get("configuration")
+                "description": "Verify reconfigured devices are connected and configured",
+                "target": target(changed_ids),
+                "action": "verify_connectivity",
+                "parameters": {
+                    "timeout_seconds": 30,
+                    "retry_count": 3
+                }
             })
-            device_step += 1
-        
-        # Add OTA setup step
-        steps.append({
-            "step": device_step,
-            "description": "Setup OTA update mechanism (OTA Server => Device)",
-            "target": "all_devices",
-            "action": "ota_setup",
-            "parameters": {
-                "mode": "push",
-                "ota_server": "192.168.1.100",
-                "check_interval_seconds": 3600,
-                "signature_verification": True
-            }
-        })
-        device_step += 1
-        
-        # Add verification step
-        steps.append({
-            "step": device_step,
-            "description": "Verify all devices are connected and configured",
-            "target": "all_devices",
-            "action": "verify_connectivity",
-            "parameters": {
-                "timeout_seconds": 30,
-                "retry_count": 3
-            }
-        })
         
-        return steps
+        for number, step in enumerate(steps, start=1):
+            step["step"] = number
+        return [{"step": step.pop("step"), **step} for step in steps]
 
     def _generate_recommendations(self, intent_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Generate recommendations based on intent analysis."""
@@ -428,11 +614,13 @@ class NetworkAutoConfigurationAgent:
         ota_result["update_mode"] = "push"
         ota_result["firmware_version"] = firmware_version
         
+        # The image is the same for every target: verify it once, index devices once
+        signature_valid = self._verify_firmware_signature(firmware_binary, firmware_signature)
+        devices_by_id = self._device_index()
+        deferred = []
+        
         for device_id in target_devices:
-            device = next(
-                (d for d in self.deployment.get("devices", []) if d.get("deviceId") == device_id),
-                None
-            )
+            device = devices_by_id.get(device_id)
             
             if not device:
                 ota_result["devices_updated"].append({
@@ -442,9 +630,6 @@ class NetworkAutoConfigurationAgent:
                 })
                 continue
             
-            # Verify firmware signature
-            signature_valid = self._verify_firmware_signature(firmware_binary, firmware_signature)
-            
             if not signature_valid:
                 ota_result["devices_updated"].append({
                     "deviceId": device_id,
@@ -457,12 +642,13 @@ class NetworkAutoConfigurationAgent:
             # Check if device is online
             device_status = device.get("status")
             if device_status not in ["active", "idle"]:
-                ota_result["devices_updated"].append({
+                deferred.append({
                     "deviceId": device_id,
                     "status": "pending",
                     "error": f"Device status is {device_status}, pending until device comes online",
                     "note": "Update will be delivered when device comes online"
                 })
+                ota_result["devices_updated"].append(deferred[-1])
                 continue
             
             # Perform update
@@ -474,6 +660,15 @@ class NetworkAutoConfigurationAgent:
             )
             ota_result["devices_updated"].append(update_result)
         
+        # Offline devices get the update from the delivery queue when they reconnect
+        if deferred:
+            queued = ota_queue.enqueue_many(
+                [d["deviceId"] for d in deferred], firmware_data,
+                source=payload.get("update_id"), **self._retry_policy()
+            )
+            for result, entry in zip(deferred, queued):
+                result["queue_id"] = entry["id"]
+        
         # Determine overall status
         failed_count = len([u for u in ota_result["devices_updated"] if u.get("status") == "failed"])
         completed_count = len([u for u in ota_result["devices_updated"] if u.get("status") == "completed"])
@@ -487,6 +682,91 @@ class NetworkAutoConfigurationAgent:
         
         return ota_result
 
+    def _device_index(self) -> Dict[str, Dict[str, Any]]:
+        return {d.get("deviceId"): d for d in self.deployment.get("devices", [])}
+
+    def _retry_policy(self) -> Dict[str, Any]:
+        policy = self.ota_config.get("firmware_management", {}).get("retry_policy", {})
+        return {
+            "max_retries": int(policy.get("max_retries", 3)),
+            "retry_delay_seconds": float(policy.get("retry_delay_seconds", 60)),
+            "exponential_backoff": bool(policy.get("exponential_backoff", True))
+        }
+
+    def deliver_queued_update(self, device_id: str, firmware: Dict[str, Any]) -> Dict[str, Any]:
+        """Push an update from the delivery queue once its device is back online."""
+        firmware_binary = firmware.get("binary_url") or firmware.get("sha256")
+        if not self._verify_firmware_signature(firmware_binary, firmware.get("signature")):
+            return {"deviceId": device_id, "status": "rejected", "error": "Firmware signature verification failed"}
+        return self._push_firmware_to_device(
+            device_id, firmware_binary, firmware.get("version"), firmware.get("signature")
+        )
+
+    def _resolve_firmware(self, firmware: Any) -> Optional[Dict[str, Any]]:
+        """Firmware dict from the payload, or a version looked up in available_firmware."""
+        if not firmware:
+            return None
+        if isinstance(firmware, dict):
+            return firmware
+        info = self.ota_config.get("available_firmware", {}).get(firmware)
+        if not isinstance(info, dict):
+            raise ValueError(f"Firmware version {firmware} not found on OTA server")
+        return {"version": firmware, "binary_url": info.get("binary_url"), "signature": info.get("signature")}
+
+    def start_ota_rollout(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Start a background wave-based rollout (see servers/rollout.py).
+        
+        The image (and the rollback image) is verified once up front; the
+        returned job is polled with ota_rollout_status.
+        """
+        firmware = self._resolve_firmware(payload.get("firmware") or payload.get("firmware_version")
+                                          or self.ota_config.get("available_firmware", {}).get("latest_version"))
+        if not firmware or not firmware.get("version"):
+            raise ValueError("firmware (or firmware_version) required for ota_rollout action")
+        if not self._verify_firmware_signature(firmware.get("binary_url"), firmware.get("signature")):
+            raise ValueError("Firmware signature verification failed")
+
+        rollback_version = payload.get("rollback_version",
+                                       self.ota_config.get("available_firmware", {}).get("stable_version"))
+        rollback_firmware = None
+        if rollback_version and rollback_version != firmware.get("version"):
+            rollback_firmware = self._resolve_firmware(rollback_version)
+            if not self._verify_firmware_signature(rollback_firmware.get("binary_url"), rollback_firmware.get("signature")):
+                raise ValueError("Rollback firmware signature verification failed")
+
+        devices_by_id = self._device_index()
+        target_devices = payload.get("target_devices") or list(devices_by_id)
+        waves = payload.get("waves", {})
+        management = self.ota_config.get("firmware_management", {})
+
+        def push(device_id: str, image: Dict[str, Any]) -> Dict[str, Any]:
+            return self._push_firmware_to_device(
+                device_id, image.get("binary_url") or "", image.get("version"), image.get("signature")
+            )
+
+        job = ota_rollouts.start(
+            target_devices,
+            devices_by_id,
+            push,
+            firmware,
+            rollback_firmware=rollback_firmware,
+            canary=int(waves.get("canary", 1)),
+            batch_percentages=waves.get("batch_percentages"),
+            max_concurrency=int(payload.get("max_concurrency", management.get("max_concurrent_updates", 5))),
+            failure_threshold=float(payload.get("failure_threshold", 0.2)),
+            on_failure=payload.get("on_failure", "pause"),
+            wave_interval_seconds=float(waves.get("interval_seconds", 0)),
+            job_id=payload.get("update_id")
+        )
+        offline = [d for d in job.skipped if d["status"] == "pending"]
+        if offline:
+            queued = ota_queue.enqueue_many([d["deviceId"] for d in offline], firmware,
+                                            source=job.job_id, **self._retry_policy())
+            for result, entry in zip(offline, queued):
+                result["queue_id"] = entry["id"]
+        return job.snapshot()
+
     def _handle_pull_ota_update(
         self,
         payload: Dict[str, Any],
@@ -501,6 +781,8 @@ class NetworkAutoConfigurationAgent:
         
         ota_result["update_mode"] = "pull"
         ota_result["device_id"] = device_id
+        # A device checking in is online: release anything queued for it
+        ota_queue.heartbeat([device_id])
         
         # Get available firmware version
         available_firmware = self.ota_config.get("available_firmware", {})
@@ -511,19 +793,36 @@ class NetworkAutoConfigurationAgent:
             firmware_info = available_firmware.get(latest_version, {})
             firmware_binary = firmware_info.get("binary_url")
             firmware_signature = firmware_info.get("signature")
+            # The signature uploaded with the image in the store wins over the catalog entry
+            artifact = firmware_store.resolve(firmware_binary) or firmware_store.resolve(latest_version)
+            if artifact:
+                firmware_binary = artifact["sha256"]
+                firmware_signature = artifact.get("signature") or firmware_signature
             
             # Verify signature before sending
             signature_valid = self._verify_firmware_signature(firmware_binary, firmware_signature)
             
             if signature_valid:
-                ota_result["devices_updated"].append({
+                update = {
                     "deviceId": device_id,
                     "status": "completed",
                     "update_available": True,
                     "new_version": latest_version,
                     "download_url": firmware_binary,
                     "signature": firmware_signature
-                })
+                }
+                if artifact:
+                    # Served from the store in chunks; devices resume with Range requests
+                    update.update({
+                        "download_url": f"/tasks/firmware/{artifact['sha256']}",
+                        "sha256": artifact["sha256"],
+                        "size_bytes": artifact["size_bytes"],
+                        "range_requests": True,
+                        "chunk_size_bytes": CHUNK_SIZE,
+                        "update_format": "full"
+                    })
+                    update.update(self._delta_for(current_version, artifact))
+                ota_result["devices_updated"].append(update)
                 ota_result["status"] = "completed"
             else:
                 ota_result["devices_updated"].append({
@@ -544,27 +843,64 @@ class NetworkAutoConfigurationAgent:
         
         return ota_result
 
+    def _delta_for(self, current_version: str, artifact: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Delta from the device's current image to `artifact`, if one is cached.
+        Otherwise a build is scheduled in the background and the device gets
+        the full image this time.
+        """
+        base = firmware_store.resolve(current_version)
+        if base is None:
+            return {"delta_status": "unavailable"}
+        try:
+            delta = delta_builder.request(base["sha256"], artifact["sha256"])
+        except ValueError as e:
+            logger.warning(f"Delta lookup failed: {e}")
+            return {"delta_status": "unavailable"}
+        if delta["status"] != "ready":
+            return {"delta_status": delta["status"]}
+        return {
+            "update_format": "delta",
+            "delta_status": "ready",
+            "delta": {
+                "download_url": f"/tasks/firmware/{delta['sha256']}",
+                "sha256": delta["sha256"],
+                "size_bytes": delta["size_bytes"],
+                "format": delta["format"],
+                "base_version": current_version,
+                "base_sha256": base["sha256"],
+                "target_sha256": artifact["sha256"],
+                "range_requests": True
+            }
+        }
+
     def _verify_firmware_signature(self, firmware_binary: str, signature: str) -> bool:
         """
         Verify firmware signature using RSA-2048.
         
+        firmware_binary refers to an image in the firmware store (sha256,
+        version or a binary URL such as .../v1.2.3.bin); the store verifies
+        each image/signature pair once and caches the result.
+        
         Returns True if signature is valid, False otherwise.
         """
         if not signature or not firmware_binary:
             return False
         
-        try:
-            # In production, use actual RSA verification with device's public key
-            # For now, simulate verification
-            expected_hash = hashlib.sha256(firmware_binary.encode()).hexdigest()
-            
-            # Signature should match the hash
-            # This is simplified; real implementation uses RSA cryptography
-            logger.info(f"Firmware signature verification: {signature[:16]}...")
+        verification = self.ota_config.get("security", {}).get("signature_verification", {})
+        if not verification.get("enabled", True):
+            logger.warning("Firmware signature verification is disabled in OTA server config")
             return True
-        except Exception as e:
-            logger.error(f"Signature verification error: {e}")
+        
+        artifact = firmware_store.resolve(firmware_binary)
+        if artifact is None:
+            logger.warning(f"Firmware {firmware_binary} is not in the firmware store; cannot verify signature")
             return False
+        
+        result = firmware_store.verify(artifact["sha256"], signature)
+        if not result["valid"]:
+            logger.warning(f"Firmware {artifact['sha256'][:12]} signature rejected: {result.get('reason')}")
+        return result["valid"]
 
     def _push_firmware_to_device(
         self,
@@ -589,6 +925,8 @@ class NetworkAutoConfigurationAgent:
         3. Updates bootloader flag
         4. Reboots to apply update
         """
+        artifact = firmware_store.resolve(firmware_binary)
+        size_bytes = artifact["size_bytes"] if artifact else len(firmware_binary)
         result = {
             "deviceId": device_id,
             "status": "completed",
@@ -596,6 +934,8 @@ class NetworkAutoConfigurationAgent:
             "update_timestamp": datetime.utcnow().isoformat() + "Z",
             "steps": []
         }
+        if artifact:
+            result["sha256"] = artifact["sha256"]
         
         # Step 1: Send firmware to device
         result["steps"].append({
@@ -603,7 +943,7 @@ class NetworkAutoConfigurationAgent:
             "description": "POST /ota-update request",
             "action": "send_firmware",
             "endpoint": f"http://{device_id}:80/ota-update",
-            "payload_size_bytes": len(firmware_binary),
+            "payload_size_bytes": size_bytes,
             "status": "sent"
         })
         
@@ -621,7 +961,7 @@ class NetworkAutoConfigurationAgent:
             "description": "Write firmware to flash memory",
             "action": "write_flash",
             "partition": "ota_0",
-            "size_bytes": len(firmware_binary),
+            "size_bytes": size_bytes,
             "status": "completed"
         })
         
@@ -687,7 +1027,8 @@ class NetworkAutoConfigurationAgent:
                 "current_version": "1.0.0",  # Would come from device in real implementation
                 "ota_enabled": True,
                 "update_available": False,
-                "last_check": datetime.utcnow().isoformat() + "Z"
+                "last_check": datetime.utcnow().isoformat() + "Z",
+                "queued_update": ota_queue.get(device.get("deviceId"))
             }
             
             status["devices"].append(device_status)
@@ -695,19 +1036,71 @@ class NetworkAutoConfigurationAgent:
         return status
 
 
+def _online_devices(device_ids: List[str]) -> Set[str]:
+    """Devices the deployment reports as active/idle, or that are live in SDN-WISE reports."""
+    deployment = read_json(DATA_DIR / "deployment_monitoring.json")
+    status = {d.get("deviceId"): d.get("status") for d in deployment.get("devices", [])} if deployment else {}
+    now = time.time()
+    online = set()
+    for device_id in device_ids:
+        if status.get(device_id) in ("active", "idle"):
+            online.add(device_id)
+            continue
+        node = report_ingestor.registry.get(int(device_id)) if str(device_id).isdigit() else None
+        if node is not None and now - node.last_seen < report_ingestor.node_timeout:
+            online.add(device_id)
+    return online
+
+
+def _deliver_queued_update(device_id: str, firmware: Dict[str, Any]) -> Dict[str, Any]:
+    return NetworkAutoConfigurationAgent().deliver_queued_update(device_id, firmware)
+
+
+ota_queue.configure(_deliver_queued_update, _online_devices)
+
+
 @network_config_router.post("/network-configuration")
-def network_configuration(payload: Dict[str, Any], response: Response):
+def network_configuration(payload: Dict[str, Any], response: Response, stream: Optional[str] = None):
     """
     Network Auto-Configuration endpoint.
     
     Supports six modes:
-    1. configure_from_intent: Generate network configuration from user intent
+    1. configure_from_intent: Generate network configuration from user intent;
+       steps only patch what changed since the last applied configuration
+       (`dry_run` previews without recording it, `full_sync` re-sends everything)
+       With ?stream=ndjson the result is streamed as NDJSON records (intent,
+       one per device as it is generated, steps, summary)
     2. configure_network: Apply structured network configuration (VLANs, QoS, firewall rules)
     3. configure_network_service: Apply MCP-style network service configuration
     4. apply_configuration: Apply generic network configuration with changes, verification, and rollback
     5. ota_update: Handle firmware updates (push or pull mode)
     6. ota_status: Get OTA update status
     
+    Fleet-wide firmware rollouts run as background jobs:
+    - ota_rollout: start a wave-based rollout, returns 202 with a job_id
+    - ota_rollout_status: progress of `job_id` (all jobs without one;
+      `include_devices` adds per-device results)
+    - ota_rollout_pause / ota_rollout_resume / ota_rollout_cancel /
+      ota_rollout_rollback: control a running or paused job
+    
+    Updates for offline devices (push or rollout) wait in the OTA delivery
+    queue and are pushed when the device is seen again:
+    - device_heartbeat: `device_id` or `device_ids` are online now
+    - ota_queue_status: queue counters and pending entries (or one `device_id`)
+    - ota_queue_cancel: drop the queued update for `device_id`
+    
+    Example payload for ota_rollout:
+    {
+        "action": "ota_rollout",
+        "firmware_version": "1.2.3",
+        "rollback_version": "1.2.0",
+        "target_devices": ["esp32_001", "esp32_002"],
+        "waves": {"canary": 1, "batch_percentages": [10, 50, 100], "interval_seconds": 0},
+        "max_concurrency": 5,
+        "failure_threshold": 0.2,
+        "on_failure": "pause"
+    }
+    
     Example payload for apply_configuration (from CrewAI):
     {
         "action": "apply_configuration",
@@ -764,13 +1157,25 @@ def network_configuration(payload: Dict[str, Any], response: Response):
     try:
         agent = NetworkAutoConfigurationAgent()
         action = payload.get("action", "configure_from_intent")
+        if wants_ndjson(stream) and action != "configure_from_intent":
+            raise ValueError("stream=ndjson is only supported for the configure_from_intent action")
         
         if action == "configure_from_intent":
             user_intent = payload.get("user_intent")
             if not user_intent:
                 raise ValueError("user_intent required for configure_from_intent action")
             
-            config = agent.configure_network_from_intent(user_intent)
+            if stream:
+                return ndjson_response(agent.iter_network_configuration(
+                    user_intent,
+                    dry_run=bool(payload.get("dry_run", False)),
+                    full_sync=bool(payload.get("full_sync", False))
+                ))
+            config = agent.configure_network_from_intent(
+                user_intent,
+                dry_run=bool(payload.get("dry_run", False)),
+                full_sync=bool(payload.get("full_sync", False))
+            )
             return {
                 "action": "configure_from_intent",
                 "configuration": config,
@@ -785,6 +1190,67 @@ def network_configuration(payload: Dict[str, Any], response: Response):
                 "timestamp": datetime.utcnow().isoformat() + "Z"
             }
         
+        elif action == "ota_rollout":
+            job = agent.start_ota_rollout(payload)
+            response.status_code = 202
+            return {
+                "action": "ota_rollout",
+                "job": job,
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+        
+        elif action in ("ota_rollout_status", "ota_rollout_pause", "ota_rollout_resume",
+                        "ota_rollout_cancel", "ota_rollout_rollback"):
+            job_id = payload.get("job_id")
+            if not job_id:
+                if action != "ota_rollout_status":
+                    raise ValueError(f"job_id required for {action} action")
+                return {
+                    "action": action,
+                    "jobs": ota_rollouts.list(),
+                    "timestamp": datetime.utcnow().isoformat() + "Z"
+                }
+            if action == "ota_rollout_status":
+                job = ota_rollouts.get(job_id).snapshot(include_devices=bool(payload.get("include_devices", False)))
+            else:
+                job = getattr(ota_rollouts, action[len("ota_rollout_"):])(job_id)
+            return {
+                "action": action,
+                "job": job,
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+        
+        elif action == "device_heartbeat":
+            device_ids = payload.get("device_ids") or ([payload["device_id"]] if payload.get("device_id") else [])
+            if not device_ids:
+                raise ValueError("device_id or device_ids required for device_heartbeat action")
+            return {
+                "action": "device_heartbeat",
+                "devices": len(device_ids),
+                "queued_updates": ota_queue.heartbeat(device_ids),
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+        
+        elif action == "ota_queue_status":
+            device_id = payload.get("device_id")
+            result = {"action": "ota_queue_status", "queue": ota_queue.stats()}
+            if device_id:
+                result["entry"] = ota_queue.get(device_id)
+            else:
+                result["entries"] = ota_queue.list(int(payload.get("limit", 100)))
+            result["timestamp"] = datetime.utcnow().isoformat() + "Z"
+            return result
+        
+        elif action == "ota_queue_cancel":
+            device_id = payload.get("device_id")
+            if not device_id:
+                raise ValueError("device_id required for ota_queue_cancel action")
+            return {
+                "action": "ota_queue_cancel",
+                "entry": ota_queue.cancel(device_id),
+                "timestamp": datetime.utcnow().isoformat() + "Z"
+            }
+        
         elif action == "ota_status":
             device_id = payload.get("device_id")
             status = agent.get_ota_status(device_id)
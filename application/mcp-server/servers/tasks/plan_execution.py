@@ -1,11 +1,14 @@
 from fastapi import APIRouter, HTTPException, Response
-from typing import Dict, Any, List, Optional
-from ..utils import read_json, write_json, DATA_DIR
+from typing import Dict, Any, List, Optional, Tuple
+from ..utils import read_json, write_json, DATA_DIR, protocol_dispatcher
 from ..agents import run_agent
-import json
+from ..metrics import plan_step_seconds
+from ..tracing import traced, set_attributes
+from ..plan_graph import PlanGraph, has_dependencies, observed_latency_ms
+from collections import deque
+import concurrent.futures
 import time
 import logging
-import requests
 from datetime import datetime
 
 execution_router = APIRouter()
@@ -19,17 +22,23 @@ class PlanExecutionAgent:
     Translates high-level orchestration plan instructions into concrete device commands:
     - HTTP/REST requests for camera streams, sensor reads, actuator controls
     - MQTT messages for sensor queries and device status
+    - CoAP requests (observe, block-wise transfer) for Contiki/Thread motes
+    - BLE commands batched through the BLE gateway
     - Device-specific service invocations with parameter mapping
+
+    Each protocol is a transport plugin of the protocol dispatcher
+    (see servers/protocols.py).
     
     Flow:
     1. Receive execution plan with list of devices, services, and instructions
     2. For each instruction in sequence:
        a. Resolve device IP and service endpoint
-       b. Translate instruction to device protocol (HTTP, MQTT, etc.)
+       b. Translate instruction to device protocol (HTTP, MQTT, CoAP, BLE)
        c. Execute command with parameters
        d. Collect response/status
        e. Update execution history
-    3. Monitor execution and handle failures/timeouts
+    3. Monitor execution and handle failures/timeouts (in dependency-graph
+       plans a failure skips only the steps that depend on it)
     4. Return execution results with device responses
     """
 
@@ -47,6 +56,8 @@ class PlanExecutionAgent:
         self.devices = read_json(devices_path)
         self.deployment = read_json(deployment_monitoring_path)
         self.execution_history = read_json(execution_history_path) if self._file_exists(execution_history_path) else {"executions": []}
+        # Plan-wide "retry" overrides, merged under each step's own
+        self.plan_retry: Dict[str, Any] = {}
 
     def _file_exists(self, path):
         """Check if file exists."""
@@ -56,6 +67,7 @@ class PlanExecutionAgent:
         except:
             return False
 
+    @traced()
     def execute_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """
         Execute an orchestration plan.
@@ -65,18 +77,30 @@ class PlanExecutionAgent:
             "plan_id": "...",
             "devices": [...],
             "algorithm": {
-                "type": "sequential|parallel",
+                "type": "sequential|parallel|dag",
                 "steps": [
                     {
+                        "step_id": "camera-on",
+                        "depends_on": ["motion-confirmed"],
                         "instruction": "activate_service",
                         "device_id": "esp32-001",
                         "service": "camera",
                         "parameters": {...},
-                        "timeout_ms": 5000
+                        "timeout_ms": 5000,
+                        "retry": {"max_attempts": 3, "backoff_ms": 100}
                     }
                 ]
-            }
+            },
+            "retry": {...}
         }
+
+        Steps with depends_on (or type "dag") run as a dependency graph: each
+        step starts once its dependencies succeeded, independent chains run
+        concurrently, and results include the critical path.
+
+        timeout_ms bounds each attempt. Transient failures (timeouts,
+        unreachable devices, 5xx) are retried with jittered backoff, and
+        steps to a device whose circuit breaker is open fail immediately.
         """
         plan_id = plan.get("plan_id")
         logger.info(f"Executing plan: {plan_id}")
@@ -100,11 +124,17 @@ class PlanExecutionAgent:
             algorithm = plan.get("algorithm", {})
             steps = algorithm.get("steps", [])
             execution_type = algorithm.get("type", "sequential")
+            self.plan_retry = plan.get("retry") or algorithm.get("retry") or {}
+            if not isinstance(self.plan_retry, dict):
+                raise ValueError("retry must be an object")
             
             results["steps_total"] = len(steps)
             results["execution_type"] = execution_type
             
-            if execution_type == "parallel":
+            if execution_type == "dag" or has_dependencies(steps):
+                results["execution_type"] = "dag"
+                results["step_results"] = self._execute_dag(steps, results)
+            elif execution_type == "parallel":
                 results["step_results"] = self._execute_parallel(steps, results)
             else:
                 results["step_results"] = self._execute_sequential(steps, results)
@@ -174,23 +204,144 @@ class PlanExecutionAgent:
     def _execute_parallel(self, steps: List[Dict], results: Dict) -> List[Dict]:
         """
         Execute steps in parallel (for independent device operations).
-        Note: Simplified version using sequential execution with threading.
-        For full parallel execution, use asyncio or ThreadPoolExecutor.
+        All steps are handed to the protocol dispatcher at once; each transport
+        plugin sends its share concurrently (pooled HTTP connections, pipelined
+        MQTT publishes, one BLE gateway batch).
         """
-        # For now, execute sequentially but mark as parallel execution
-        step_results = []
-        
+        step_results: List[Optional[Dict]] = [None] * len(steps)
+        dispatched = []
+
         for idx, step in enumerate(steps):
             step_id = f"step-{idx}"
             try:
-                step_start = time.time()
-                step_result = self._execute_step(step, step_id)
-                step_duration = time.time() - step_start
-                
-                step_result["step_index"] = idx
-                step_result["duration_ms"] = int(step_duration * 1000)
-                step_results.append(step_result)
-                
+                protocol, request = self._prepare_step(step, step_id)
+                if protocol is None:
+                    step_results[idx] = request
+                else:
+                    dispatched.append((idx, protocol, request))
+            except Exception as e:
+                logger.exception(f"Error executing step {step_id}: {e}")
+                step_results[idx] = {"step_id": step_id, "status": "failed", "error": str(e)}
+                results["errors"].append(f"Step {idx}: {str(e)}")
+
+        if dispatched:
+            try:
+                responses = protocol_dispatcher.dispatch_many([(protocol, request) for _, protocol, request in dispatched])
+            except Exception as e:
+                logger.exception(f"Error dispatching parallel steps: {e}")
+                responses = [{"step_id": request["step_id"], "status": "failed", "error": str(e)} for _, _, request in dispatched]
+                results["errors"].append(f"Parallel dispatch: {str(e)}")
+            for (idx, protocol, _), step_result in zip(dispatched, responses):
+                plan_step_seconds.observe(step_result.get("duration_ms", 0) / 1000.0, protocol.upper(),
+                                          step_result.get("status", "unknown"))
+                step_results[idx] = step_result
+
+        for idx, (step, step_result) in enumerate(zip(steps, step_results)):
+            step_result["step_index"] = idx
+            step_result.setdefault("duration_ms", 0)
+
+            # Update device responses
+            device_id = step.get("device_id")
+            if device_id and step_result.get("status") == "success":
+                if device_id not in results["device_responses"]:
+                    results["device_responses"][device_id] = []
+                results["device_responses"][device_id].append({
+                    "service": step.get("service"),
+                    "response": step_result.get("response")
+                })
+
+        return step_results
+
+    def _execute_dag(self, steps: List[Dict], results: Dict) -> List[Dict]:
+        """
+        Execute steps as a dependency graph (depends_on). A step is dispatched
+        as soon as every step it depends on has succeeded, so independent
+        chains run concurrently; the plan takes as long as its critical path.
+        A failed or timed-out step only skips its own dependents.
+        """
+        graph = PlanGraph(steps)
+        schedule = graph.schedule(self._expected_step_ms, lambda step: step.get("timeout_ms", 5000))
+        results["critical_path"] = {
+            "steps": schedule["critical_path"],
+            "estimated_ms": schedule["estimated_ms"],
+            "worst_case_ms": schedule["worst_case_ms"]
+        }
+
+        step_results: List[Optional[Dict]] = [None] * len(steps)
+        waiting = [len(dependencies) for dependencies in graph.dependencies]
+        ready = deque(graph.roots())
+        in_flight: Dict[concurrent.futures.Future, Tuple[int, str, float, float]] = {}
+        plan_start = time.perf_counter()
+
+        def finish(idx: int, step_result: Dict[str, Any]):
+            step_result["step_index"] = idx
+            step_result.setdefault("duration_ms", 0)
+            if graph.dependencies[idx]:
+                step_result["depends_on"] = [graph.names[dependency] for dependency in graph.dependencies[idx]]
+            step_results[idx] = step_result
+            succeeded = step_result.get("status") == "success"
+            for dependent in graph.dependents[idx]:
+                if step_results[dependent] is not None:
+                    continue
+                if succeeded:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        ready.append(dependent)
+                else:
+                    dependent_step = steps[dependent]
+                    finish(dependent, {
+                        "step_id": graph.names[dependent],
+                        "instruction": dependent_step.get("instruction"),
+                        "device_id": dependent_step.get("device_id"),
+                        "service": dependent_step.get("service"),
+                        "status": "skipped",
+                        "error": f"Dependency {graph.names[idx]} {step_result.get('status')}",
+                        "blocked_by": graph.names[idx]
+                    })
+
+        while ready or in_flight:
+            while ready:
+                idx = ready.popleft()
+                if step_results[idx] is not None:
+                    continue
+                step_id = graph.names[idx]
+                try:
+                    protocol, request = self._prepare_step(steps[idx], step_id)
+                    if protocol is None:
+                        finish(idx, request)
+                        continue
+                    future = protocol_dispatcher.submit(protocol, request)
+                except Exception as e:
+                    logger.exception(f"Error executing step {step_id}: {e}")
+                    results["errors"].append(f"Step {idx}: {str(e)}")
+                    finish(idx, {"step_id": step_id, "status": "failed", "error": str(e)})
+                    continue
+                dispatched = time.perf_counter()
+                in_flight[future] = (idx, protocol, dispatched, dispatched + protocol_dispatcher.worst_case_seconds(request) + 5)
+
+            if not in_flight:
+                break
+            # Each request is bounded by its retry policy inside the dispatcher; the deadline is a backstop
+            timeout = max(0.0, min(deadline for *_, deadline in in_flight.values()) - time.perf_counter())
+            done, _ = concurrent.futures.wait(in_flight, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            now = time.perf_counter()
+            for future in list(in_flight):
+                idx, protocol, dispatched, deadline = in_flight[future]
+                if future not in done and now < deadline:
+                    continue
+                del in_flight[future]
+                step = steps[idx]
+                if future in done:
+                    try:
+                        step_result = future.result()
+                    except Exception as e:
+                        step_result = {"step_id": graph.names[idx], "status": "failed", "error": str(e)}
+                else:
+                    future.cancel()
+                    step_result = {"step_id": graph.names[idx], "status": "timeout", "error": "No result from dispatcher"}
+                step_result["started_ms"] = int((dispatched - plan_start) * 1000)
+                plan_step_seconds.observe(now - dispatched, protocol.upper(), step_result.get("status", "unknown"))
+
                 # Update device responses
                 device_id = step.get("device_id")
                 if device_id and step_result.get("status") == "success":
@@ -200,202 +351,98 @@ class PlanExecutionAgent:
                         "service": step.get("service"),
                         "response": step_result.get("response")
                     })
-                    
-            except Exception as e:
-                logger.exception(f"Error executing step {step_id}: {e}")
-                step_results.append({
-                    "step_id": step_id,
-                    "status": "failed",
-                    "error": str(e),
-                    "step_index": idx
-                })
-                results["errors"].append(f"Step {idx}: {str(e)}")
-        
+                logger.info(f"Step {graph.names[idx]} completed: {step_result['status']}")
+                finish(idx, step_result)
+
+        # Chain that actually determined the plan duration
+        observed, path = graph.critical_path([result.get("duration_ms", 0) for result in step_results])
+        results["critical_path"]["observed_ms"] = int(observed)
+        results["critical_path"]["observed_steps"] = [
+            graph.names[idx] for idx in path if step_results[idx].get("status") != "skipped"
+        ]
+        results["steps_skipped"] = sum(1 for result in step_results if result.get("status") == "skipped")
         return step_results
 
+    def _expected_step_ms(self, step: Dict) -> float:
+        """
+        Expected step duration for the up-front estimate: the step's own
+        expected_ms, else the mean latency observed for its protocol, else
+        its timeout.
+        """
+        if step.get("expected_ms") is not None:
+            return float(step["expected_ms"])
+        device = self._find_device(step.get("device_id"))
+        service_info = self._find_service(device, step.get("service")) if device else None
+        observed = observed_latency_ms(service_info.get("protocol", "HTTP/REST")) if service_info else None
+        if observed is not None:
+            return observed
+        return float(step.get("timeout_ms", 5000))
+
+    @traced()
     def _execute_step(self, step: Dict, step_id: str) -> Dict[str, Any]:
         """Execute a single step."""
+        protocol, request = self._prepare_step(step, step_id)
+        if protocol is None:
+            return request
+
+        set_attributes(step_id=step_id, device_id=request["device_id"], service=request["service"], protocol=protocol)
+
+        dispatch_start = time.perf_counter()
+        result = protocol_dispatcher.dispatch(protocol, request)
+        plan_step_seconds.observe(time.perf_counter() - dispatch_start, protocol.upper(), result.get("status", "unknown"))
+        return result
+
+    def _prepare_step(self, step: Dict, step_id: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Resolve a step's device and service into a dispatcher request.
+        Returns (protocol, request), or (None, failed step result) when the
+        device, the service or a transport for its protocol is missing.
+        """
         instruction = step.get("instruction")
         device_id = step.get("device_id")
         service = step.get("service")
-        parameters = step.get("parameters", {})
-        timeout_ms = step.get("timeout_ms", 5000)
-        
+
         logger.info(f"Executing step {step_id}: {instruction} on {device_id}/{service}")
-        
+
+        failed = {
+            "step_id": step_id,
+            "instruction": instruction,
+            "device_id": device_id,
+            "service": service,
+            "status": "failed"
+        }
+
         # Resolve device
         device = self._find_device(device_id)
         if not device:
-            return {
-                "step_id": step_id,
-                "instruction": instruction,
-                "device_id": device_id,
-                "service": service,
-                "status": "failed",
-                "error": f"Device {device_id} not found"
-            }
-        
+            return None, {**failed, "error": f"Device {device_id} not found"}
+
         # Find service in device
         service_info = self._find_service(device, service)
         if not service_info:
-            return {
-                "step_id": step_id,
-                "instruction": instruction,
-                "device_id": device_id,
-                "service": service,
-                "status": "failed",
-                "error": f"Service {service} not found on device {device_id}"
-            }
-        
-        # Execute based on service protocol
+            return None, {**failed, "error": f"Service {service} not found on device {device_id}"}
+
+        # Transport is chosen by the service protocol
         protocol = service_info.get("protocol", "HTTP/REST")
-        
-        if protocol.upper() in ["HTTP", "HTTP/REST"]:
-            return self._execute_http(step, step_id, device, service_info, parameters, timeout_ms)
-        elif protocol.upper() == "MQTT":
-            return self._execute_mqtt(step, step_id, device, service_info, parameters, timeout_ms)
-        else:
-            return {
-                "step_id": step_id,
-                "instruction": instruction,
-                "device_id": device_id,
-                "service": service,
-                "status": "failed",
-                "error": f"Unsupported protocol: {protocol}"
-            }
+        if protocol_dispatcher.plugin_for(protocol) is None:
+            return None, {**failed, "error": f"Unsupported protocol: {protocol}"}
 
-    def _execute_http(self, step: Dict, step_id: str, device: Dict, service_info: Dict, 
-                     parameters: Dict, timeout_ms: int) -> Dict[str, Any]:
-        """Execute HTTP/REST request to device service."""
-        instruction = step.get("instruction")
-        device_id = device.get("device_id") or device.get("deviceId")
-        service = step.get("service")
-        ip = device.get("ip")
-        
-        # Build service endpoint URL
-        protocol = step.get("protocol", "http")
-        port = step.get("port", 80)
-        url = f"{protocol}://{ip}:{port}/{service}"
-        
-        # Map instruction to HTTP method and parameters
-        if instruction == "activate_service":
-            method = "POST"
-            payload = {"command": "activate", **parameters}
-        elif instruction == "query_service":
-            method = "GET"
-            payload = parameters
-        elif instruction == "deactivate_service":
-            method = "POST"
-            payload = {"command": "deactivate", **parameters}
-        else:
-            method = "POST"
-            payload = parameters
-        
-        try:
-            logger.info(f"HTTP {method} to {url} with timeout {timeout_ms}ms")
-            
-            if method == "GET":
-                response = requests.get(url, params=payload, timeout=timeout_ms/1000.0)
-            else:
-                response = requests.post(url, json=payload, timeout=timeout_ms/1000.0)
-            
-            if response.status_code in [200, 201, 202]:
-                try:
-                    response_data = response.json()
-                except:
-                    response_data = response.text
-                
-                return {
-                    "step_id": step_id,
-                    "instruction": instruction,
-                    "device_id": device_id,
-                    "service": service,
-                    "status": "success",
-                    "method": method,
-                    "url": url,
-                    "response_code": response.status_code,
-                    "response": response_data
-                }
-            else:
-                return {
-                    "step_id": step_id,
-                    "instruction": instruction,
-                    "device_id": device_id,
-                    "service": service,
-                    "status": "failed",
-                    "method": method,
-                    "url": url,
-                    "error": f"HTTP {response.status_code}: {response.text}"
-                }
-        except requests.Timeout:
-            return {
-                "step_id": step_id,
-                "instruction": instruction,
-                "device_id": device_id,
-                "service": service,
-                "status": "timeout",
-                "error": f"Request timeout after {timeout_ms}ms",
-                "url": url
-            }
-        except Exception as e:
-            return {
-                "step_id": step_id,
-                "instruction": instruction,
-                "device_id": device_id,
-                "service": service,
-                "status": "failed",
-                "error": str(e),
-                "url": url
-            }
+        retry = step.get("retry") or {}
+        if not isinstance(retry, dict):
+            return None, {**failed, "error": "retry must be an object"}
 
-    def _execute_mqtt(self, step: Dict, step_id: str, device: Dict, service_info: Dict,
-                     parameters: Dict, timeout_ms: int) -> Dict[str, Any]:
-        """
-        Execute MQTT command to device.
-        Note: This is a mock implementation. Real MQTT execution would require
-        an MQTT client and connection to broker.
-        """
-        instruction = step.get("instruction")
-        device_id = device.get("device_id") or device.get("deviceId")
-        service = step.get("service")
-        
-        # Build MQTT topic: device_id/service/command
-        topic = f"{device_id}/{service}/command"
-        
-        try:
-            # Mock MQTT execution
-            logger.info(f"MQTT publish to {topic} with timeout {timeout_ms}ms")
-            
-            payload = {
-                "instruction": instruction,
-                "parameters": parameters,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
-            
-            # In real implementation, would use paho-mqtt or similar
-            logger.info(f"Mock MQTT: {topic} = {json.dumps(payload)}")
-            
-            return {
-                "step_id": step_id,
-                "instruction": instruction,
-                "device_id": device_id,
-                "service": service,
-                "status": "success",
-                "protocol": "MQTT",
-                "topic": topic,
-                "payload": payload,
-                "response": f"MQTT published to {topic}"
-            }
-        except Exception as e:
-            return {
-                "step_id": step_id,
-                "instruction": instruction,
-                "device_id": device_id,
-                "service": service,
-                "status": "failed",
-                "error": str(e),
-                "protocol": "MQTT"
-            }
+        return protocol, {
+            "step_id": step_id,
+            "instruction": instruction,
+            "device_id": device.get("device_id") or device.get("deviceId"),
+            "service": service,
+            "address": device.get("ip") or device.get("ipAddress"),
+            "mac": device.get("mac"),
+            "parameters": step.get("parameters", {}),
+            "timeout_ms": step.get("timeout_ms", 5000),
+            "retry": {**self.plan_retry, **retry},
+            "step": step
+        }
 
     def _find_device(self, device_id: str) -> Optional[Dict]:
         """Find device by device_id."""
@@ -425,6 +472,7 @@ class PlanExecutionAgent:
                 return service
         return None
 
+    @traced()
     def _save_execution_history(self, execution_result: Dict):
         """Save execution result to history."""
         try:
@@ -481,6 +529,7 @@ def plan_execution(payload: Dict[str, Any], response: Response):
     Translates high-level instructions into concrete device commands:
     - HTTP/REST requests for camera streams, sensor reads, actuator controls
     - MQTT messages for device communication
+    - CoAP requests to Contiki motes and BLE commands through the gateway
     - Parallel/sequential execution modes
     
     Supports actions:
@@ -489,6 +538,7 @@ def plan_execution(payload: Dict[str, Any], response: Response):
     - get_history: Retrieve execution history
     - monitor: Monitor a specific execution
     - request_stream: Request camera/sensor stream from a device
+    - protocols: Transport plugins (HTTP, MQTT, CoAP, BLE gateway) with pool stats
     
     Example payload for executing a plan:
     {
@@ -635,7 +685,11 @@ def plan_execution(payload: Dict[str, Any], response: Response):
                 "status": "stream_ready"
             }
             logger.info(f"Stream request for device {target_device}: {stream_type}")
-            
+
+        elif action == "protocols":
+            # Transport plugins, their pools and counters
+            result = {"action": "protocols", "dispatcher": protocol_dispatcher.stats()}
+
         else:
             raise ValueError(f"Unknown action: {action}")
         
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, Response
 from typing import Dict, Any, List, Optional
-from ..utils import read_json, DATA_DIR
+from ..utils import read_json, DATA_DIR, battery_forecaster
+from ..forecast import forecaster_available, plan_duty_cycles, timeline_duty_cycles
 from ..agents import run_agent
+from ..tracing import traced
 import logging
 from datetime import datetime
 
@@ -40,6 +42,7 @@ class PlanValidationAgent:
         
         self.validation_history = []
 
+    @traced()
     def validate_plan(self, plan: Dict[str, Any], user_context: Optional[Dict] = None) -> Dict[str, Any]:
         """
         Validate an orchestration plan against all constraints.
@@ -99,6 +102,7 @@ class PlanValidationAgent:
             validation_result["error"] = str(e)
             return validation_result
 
+    @traced()
     def _validate_energy_constraints(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """
         Validate energy consumption against device battery levels and power budgets.
@@ -108,6 +112,8 @@ class PlanValidationAgent:
         - Sampling frequency energy impact
         - Resolution energy impact
         - Total deployment power consumption
+        - Forecast battery depletion before the end of the plan, for the plan's
+          timeline and the alternative corridor timeline
         """
         check_result = {
             "constraint": "energy",
@@ -121,9 +127,10 @@ class PlanValidationAgent:
         
         total_energy_consumption = 0
         device_battery_risks = []
+        forecast_inputs = []
         
         for device in devices:
-            device_id = device.get("deviceId")
+            device_id = device.get("deviceId") or device.get("device_id")
             device_type = device.get("type")
             
             # Get device from deployment
@@ -145,6 +152,12 @@ class PlanValidationAgent:
             # Calculate energy consumption for this device
             device_consumption = self._calculate_device_energy_consumption(device)
             total_energy_consumption += device_consumption
+            forecast_inputs.append({
+                "id": device_id,
+                "battery": battery_level,
+                "load_mw": device_consumption,
+                "capacity_mwh": deployment_device.get("battery_capacity_mwh")
+            })
             
             # Check battery level
             if battery_level < 20:
@@ -182,12 +195,67 @@ class PlanValidationAgent:
                 "benefit": "Distributes power peaks"
             })
         
+        if forecast_inputs and forecaster_available():
+            forecast = self._forecast_depletion(plan, forecast_inputs)
+            check_result["forecast"] = forecast
+            for device_id, entry in forecast["timelines"][forecast["plan_timeline"]].items():
+                if entry["survives_plan"]:
+                    continue
+                device_battery_risks.append({
+                    "device": device_id,
+                    "battery": entry["battery_now"],
+                    "hours_to_depletion": entry["hours_to_depletion_with_plan"]
+                })
+                check_result["issues"].append({
+                    "severity": "critical",
+                    "device": device_id,
+                    "message": (
+                        f"Device battery forecast to deplete after {entry['hours_to_depletion_with_plan']}h, "
+                        f"before the plan ends ({forecast['horizon_hours']}h)"
+                    )
+                })
+            if forecast["mid_schedule_failures"].get("sequential_corridor", 0) < forecast["mid_schedule_failures"].get("naive_baseline", 0) \
+                    and forecast["plan_timeline"] == "naive_baseline":
+                check_result["recommendations"].append({
+                    "type": "energy",
+                    "priority": "high",
+                    "suggestion": "Switch to sequential_corridor activation: fewer devices are forecast to deplete mid-schedule",
+                    "benefit": f"{forecast['mid_schedule_failures']['naive_baseline']} -> {forecast['mid_schedule_failures']['sequential_corridor']} devices at risk"
+                })
+
         # Check for devices with critically low battery
         if device_battery_risks:
             check_result["status"] = "failed"
         
         return check_result
 
+    @traced()
+    def _forecast_depletion(self, plan: Dict[str, Any], inputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Depletion forecasts for the plan's devices under both corridor timelines."""
+        constraints = plan.get("constraints", {})
+        horizon = float(plan.get("expected_duration_hours") or constraints.get("expected_duration_hours") or 8)
+        algorithm = plan.get("algorithm", {})
+        plan_timeline = "sequential_corridor" if algorithm.get("type") == "sequential" else "naive_baseline"
+
+        device_ids = [str(d["id"]) for d in inputs]
+        t_active = plan.get("t_active_seconds") or constraints.get("t_active_seconds") or 20
+        timelines = timeline_duty_cycles(device_ids, t_active)
+        # The plan's own schedule, when it has one, replaces the synthesized duty cycles
+        scheduled = plan_duty_cycles(plan)
+        if scheduled:
+            timelines[plan_timeline] = {d: scheduled.get(d, 0.0) for d in device_ids}
+
+        result = {"horizon_hours": horizon, "plan_timeline": plan_timeline, "timelines": {}, "mid_schedule_failures": {}}
+        for name, duty in timelines.items():
+            forecast = battery_forecaster.forecast(
+                [{**d, "duty": duty[str(d["id"])]} for d in inputs],
+                horizon_hours=horizon
+            )
+            result["timelines"][name] = forecast
+            result["mid_schedule_failures"][name] = sum(1 for f in forecast.values() if not f["survives_plan"])
+        return result
+
+    @traced()
     def _validate_transmission_constraints(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """
         Validate network transmission constraints.
@@ -272,6 +340,7 @@ class PlanValidationAgent:
         
         return check_result
 
+    @traced()
     def _validate_security_constraints(
         self,
         plan: Dict[str, Any],
@@ -357,6 +426,7 @@ class PlanValidationAgent:
         
         return check_result
 
+    @traced()
     def _validate_location_constraints(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """
         Validate location-based constraints.
@@ -407,6 +477,7 @@ class PlanValidationAgent:
         
         return check_result
 
+    @traced()
     def _validate_privacy_constraints(
         self,
         plan: Dict[str, Any],
@@ -515,6 +586,7 @@ class PlanValidationAgent:
         else:
             return 1  # Default 1 Mbps
 
+    @traced()
     def generate_optimized_plan(
         self,
         plan: Dict[str, Any],
@@ -1,11 +1,20 @@
 """Topology Monitoring - Track WSN status"""
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, Dict, Any
-from ..utils import onos_client
+import logging
+from ..utils import onos_client, report_ingestor, DATA_DIR, cooja_path
+from ..routing import DynamicRouter
+from ..scenarios import generate_scenario, scenario_from_csc, write_scenario
+
+logger = logging.getLogger(__name__)
 
 topology_router = APIRouter()
 
+# Shortest-path trees kept between calls, repaired incrementally by route_updates
+_route_tracker: Optional[DynamicRouter] = None
+
 class TopologyRequest(BaseModel):
     action: str
     params: Optional[Dict[str, Any]] = None
@@ -45,5 +54,118 @@ async def topology_monitoring(request: TopologyRequest):
             "nodes": devices
         }
     
+    elif request.action == "cache_stats":
+        # Hit/miss counters for the ONOS topology/device cache (TTL sizing)
+        return {
+            "status": "success",
+            "cache": onos_client.cache_stats()
+        }
+    
+    elif request.action == "invalidate_cache":
+        onos_client.cache.invalidate()
+        return {
+            "status": "success",
+            "cache": onos_client.cache_stats()
+        }
+    
+    elif request.action == "ingest_stats":
+        # Throughput/drop counters of the UDP mote report listener
+        return {
+            "status": "success",
+            "ingest": report_ingestor.stats()
+        }
+    
+    elif request.action == "reported_nodes":
+        params = request.params or {}
+        nodes = report_ingestor.nodes(active_only=bool(params.get("active_only", False)))
+        return {
+            "status": "success",
+            "count": len(nodes),
+            "stale_nodes": report_ingestor.stale_nodes(),
+            "nodes": nodes
+        }
+    
+    elif request.action == "track_routes":
+        global _route_tracker
+        params = request.params or {}
+        topology = onos_client.get_topology()
+        devices = onos_client.get_wsn_devices()
+        sinks = params.get("sinks") or [params.get("sink") or next((d["nodeId"] for d in devices if d.get("type") == "border-router"), 1)]
+        sources = params.get("sources") or [d["nodeId"] for d in devices if d.get("type") == "sensor"]
+        
+        try:
+            tracker = DynamicRouter(topology, metric=params.get("metric", "hops"))
+            plans = [tracker.track(sink, sources) for sink in sinks]
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        _route_tracker = tracker
+        
+        flows = [f for plan in plans for f in plan["flows"]]
+        logger.info(f"Tracking routes to sinks {sinks}: {len(flows)} flow rules")
+        return {
+            "status": "success",
+            "sinks": sinks,
+            "metric": tracker.metric,
+            "flows": flows,
+            "unreachable": {str(plan["sink"]): plan["unreachable"] for plan in plans}
+        }
+    
+    elif request.action == "route_updates":
+        if _route_tracker is None:
+            raise HTTPException(400, "No routes tracked yet (call action 'track_routes' first)")
+        
+        # Fresh read so nodes that just went stale are seen
+        onos_client.cache.invalidate("topology")
+        delta = _route_tracker.sync(onos_client.get_topology())
+        logger.info(f"Route repair: {delta['events']}, {len(delta['added'])} rules added, {len(delta['removed'])} removed")
+        return {
+            "status": "success",
+            "events": delta["events"],
+            "affected_nodes": delta["affected_nodes"],
+            "flows_added": delta["added"],
+            "flows_removed": delta["removed"],
+            "rerouted": delta["rerouted"],
+            "unreachable": delta["unreachable"]
+        }
+    
+    elif request.action in ("import_csc", "generate_topology"):
+        params = request.params or {}
+        try:
+            # Building large scenarios takes seconds; keep it off the event loop
+            if request.action == "import_csc":
+                if params.get("xml"):
+                    source = str(params["xml"])
+                    if not source.lstrip().startswith("<"):
+                        raise ValueError("xml must be the Cooja simulation XML text")
+                elif params.get("path"):
+                    source = cooja_path(str(params["path"]))
+                else:
+                    raise ValueError("path or xml required")
+                scenario = await run_in_threadpool(
+                    scenario_from_csc, source, location=params.get("location", "corridor")
+                )
+            else:
+                scenario = await run_in_threadpool(
+                    generate_scenario,
+                    params.get("kind", "grid"),
+                    int(params.get("nodes", 1000)),
+                    spacing=float(params.get("spacing", 10.0)),
+                    radio_range=params.get("radio_range"),
+                    seed=int(params.get("seed", 1))
+                )
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        
+        response = {"status": "success", "summary": scenario["summary"]}
+        if params.get("save_as"):
+            # Written next to the live data files, never over them
+            name = str(params["save_as"])
+            if not name.replace("-", "").replace("_", "").isalnum():
+                raise HTTPException(400, "save_as must be alphanumeric (with - or _)")
+            response["files"] = await run_in_threadpool(write_scenario, scenario, DATA_DIR / "scenarios" / name)
+        if params.get("include", not params.get("save_as")):
+            response.update({k: scenario[k] for k in ("devices", "deployment", "topology")})
+        return response
+    
     else:
         raise HTTPException(400, f"Unknown action: {request.action}")
@@ -0,0 +1,460 @@
+"""Embedded time-series store for per-node telemetry.
+
+Each (metric, tier) lives in one memory-mapped file made of fixed-size
+per-node blocks. A block is a ring buffer stored column by column, every
+cell being a 4-byte word viewed either as uint32 or float32:
+
+    raw:      [head, count, ts x cap, value x cap]
+    1m / 1h:  [head, count, ts x cap, n x cap, sum x cap, min x cap, max x cap]
+
+ts is epoch seconds (uint32), head is the next write slot. Samples are
+appended to the raw ring and folded into the current 1-minute and 1-hour
+buckets as they arrive, so downsampled tiers never need a rescan. Queries
+bisect a ring on its timestamp column.
+
+Only a small JSON index (node -> block) lives outside the mapped files;
+the mapped data itself is written back by the OS and on flush().
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+import json
+import logging
+import mmap
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# name, bucket seconds (0 = raw samples)
+TIERS: Tuple[Tuple[str, int], ...] = (("raw", 0), ("1m", 60), ("1h", 3600))
+
+AGGREGATES = ("avg", "min", "max", "sum", "count", "last")
+
+_METRIC_NAME = re.compile(r"^[a-z][a-z0-9_]{0,31}$")
+
+WORD = 4
+HEAD, COUNT = 0, 1
+
+# What a cell can hold: values are float32, timestamps uint32 epoch seconds
+FLOAT32_MAX = 3.4028234663852886e38
+TS_LIMIT = 2 ** 32
+
+
+class RingFile:
+    """One (metric, tier) file: growable array of ring-buffer blocks."""
+
+    def __init__(self, path: Path, capacity: int, columns: int, initial_blocks: int = 64):
+        self.path = path
+        self.capacity = capacity
+        self.columns = columns
+        # Block size in 4-byte words: head + count + one column per field
+        self.block_words = 2 + capacity * columns
+        self.blocks = 0
+        self._mm: Optional[mmap.mmap] = None
+        self.u: Optional[memoryview] = None
+        self.f: Optional[memoryview] = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.stat().st_size >= self.block_words * WORD:
+            self._map(path.stat().st_size // (self.block_words * WORD))
+        else:
+            self._map(initial_blocks)
+
+    def _map(self, blocks: int):
+        self._unmap()
+        size = blocks * self.block_words * WORD
+        with open(self.path, "a+b") as fh:
+            if fh.seek(0, 2) < size:
+                fh.truncate(size)
+        self._fh = open(self.path, "r+b")
+        self._mm = mmap.mmap(self._fh.fileno(), size)
+        raw = memoryview(self._mm)
+        # Same bytes, two typed views: integer columns and float columns
+        self.u = raw.cast("I")
+        self.f = raw.cast("f")
+        raw.release()
+        self.blocks = blocks
+
+    def _unmap(self):
+        if self._mm is None:
+            return
+        self.u.release()
+        self.f.release()
+        self._mm.close()
+        self._fh.close()
+        self._mm = self.u = self.f = None
+
+    def ensure_blocks(self, blocks: int):
+        if blocks <= self.blocks:
+            return
+        new_blocks = self.blocks
+        while new_blocks < blocks:
+            new_blocks *= 2
+        self._map(new_blocks)
+
+    def flush(self):
+        if self._mm is not None:
+            self._mm.flush()
+
+    def close(self):
+        self.flush()
+        self._unmap()
+
+    def base(self, block: int) -> int:
+        return block * self.block_words
+
+    def column(self, block: int, col: int) -> int:
+        """Word offset of column col (0 = ts) inside block."""
+        return block * self.block_words + 2 + col * self.capacity
+
+    def span(self, block: int) -> Tuple[int, int]:
+        """(oldest physical slot, number of samples)."""
+        b = self.base(block)
+        head, count = self.u[b + HEAD], self.u[b + COUNT]
+        return (head - count) % self.capacity, count
+
+    def last_ts(self, block: int) -> Optional[int]:
+        b = self.base(block)
+        if self.u[b + COUNT] == 0:
+            return None
+        return self.u[self.column(block, 0) + (self.u[b + HEAD] - 1) % self.capacity]
+
+    def append(self, block: int, ts: int, value: float) -> bool:
+        """Append a raw sample; False if it is older than the newest one."""
+        u = self.u
+        b = block * self.block_words
+        head, count, cap = u[b], u[b + 1], self.capacity
+        ts_col = b + 2
+        if count and ts < u[ts_col + (head - 1) % cap]:
+            return False
+        u[ts_col + head] = ts
+        self.f[ts_col + cap + head] = value
+        u[b] = (head + 1) % cap
+        if count < cap:
+            u[b + 1] = count + 1
+        return True
+
+    def fold(self, block: int, bucket: int, value: float):
+        """Add a sample to the bucket starting at bucket (opening it if needed)."""
+        u, f = self.u, self.f
+        b = block * self.block_words
+        head, count, cap = u[b], u[b + 1], self.capacity
+        ts_col = b + 2
+        last = (head - 1) % cap
+        if count and u[ts_col + last] == bucket:
+            u[ts_col + cap + last] += 1
+            f[ts_col + 2 * cap + last] += value
+            if value < f[ts_col + 3 * cap + last]:
+                f[ts_col + 3 * cap + last] = value
+            elif value > f[ts_col + 4 * cap + last]:
+                f[ts_col + 4 * cap + last] = value
+            return
+        u[ts_col + head] = bucket
+        u[ts_col + cap + head] = 1
+        f[ts_col + 2 * cap + head] = value
+        f[ts_col + 3 * cap + head] = value
+        f[ts_col + 4 * cap + head] = value
+        u[b] = (head + 1) % cap
+        if count < cap:
+            u[b + 1] = count + 1
+
+    def bisect(self, block: int, ts: int) -> int:
+        """Logical index of the first sample with timestamp >= ts."""
+        oldest, count = self.span(block)
+        ts_col = self.column(block, 0)
+        cap = self.capacity
+        u = self.u
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if u[ts_col + (oldest + mid) % cap] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class TelemetryStore:
+    """
+    Per-node, per-metric telemetry with raw -> 1 min -> 1 h downsampling.
+
+    capacities sets the ring length of each tier (raw samples, 1-minute and
+    1-hour buckets). Range queries pick the finest tier still covering the
+    requested start unless a tier is given.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        capacities: Optional[Dict[str, int]] = None
+    ):
+        self.root = Path(root)
+        self.capacities = {"raw": 360, "1m": 720, "1h": 336}
+        self.capacities.update(capacities or {})
+        self._lock = threading.RLock()
+        self._files: Dict[Tuple[str, str], RingFile] = {}
+        self._by_metric: Dict[str, Tuple[RingFile, ...]] = {}
+        self._index: Dict[str, Dict[str, int]] = {}
+        self._index_dirty = False
+        self._loaded = False
+        self.counters = {"samples": 0, "out_of_order": 0, "rejected": 0}
+
+    # -- files and index ------------------------------------------------------
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / "index.json"
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.index_path.exists():
+            saved = json.loads(self.index_path.read_text())
+            if saved.get("capacities", self.capacities) != self.capacities:
+                raise ValueError(f"Telemetry store at {self.root} was created with capacities {saved['capacities']}")
+            self._index = saved.get("metrics", {})
+
+    def _file(self, metric: str, tier: str) -> RingFile:
+        key = (metric, tier)
+        ring = self._files.get(key)
+        if ring is None:
+            columns = 2 if tier == "raw" else 5
+            ring = self._files[key] = RingFile(self.root / f"{metric}.{tier}.bin", self.capacities[tier], columns)
+        return ring
+
+    def _block(self, metric: str, node_id: str, create: bool) -> Optional[int]:
+        nodes = self._index.get(metric)
+        if nodes is None:
+            if not create:
+                return None
+            if not _METRIC_NAME.match(metric):
+                raise ValueError(f"Invalid metric name: {metric!r}")
+            nodes = self._index[metric] = {}
+        block = nodes.get(node_id)
+        if block is None and create:
+            block = nodes[node_id] = len(nodes)
+            for tier, _ in TIERS:
+                ring = self._file(metric, tier)
+                ring.ensure_blocks(block + 1)
+                # The block may hold data from an index that was never persisted
+                ring.u[ring.base(block) + HEAD] = 0
+                ring.u[ring.base(block) + COUNT] = 0
+            self._index_dirty = True
+        return block
+
+    def flush(self, sync: bool = False):
+        """
+        Persist the node index; with sync, also msync the mapped files (the OS
+        writes dirty pages back on its own, so this is only needed for crash safety).
+        """
+        with self._lock:
+            if sync:
+                for ring in self._files.values():
+                    ring.flush()
+            if self._index_dirty:
+                self.root.mkdir(parents=True, exist_ok=True)
+                tmp = self.index_path.with_suffix(".tmp")
+                tmp.write_text(json.dumps({"capacities": self.capacities, "metrics": self._index}))
+                tmp.replace(self.index_path)
+                self._index_dirty = False
+
+    def close(self):
+        with self._lock:
+            self.flush(sync=True)
+            for ring in self._files.values():
+                ring.close()
+            self._files.clear()
+            self._by_metric.clear()
+
+    # -- writes ----------------------------------------------------------------
+
+    def record(self, node_id: Any, metric: str, value: float, timestamp: Optional[float] = None) -> bool:
+        with self._lock:
+            self._load()
+            return self._record(str(node_id), metric, float(value), int(timestamp if timestamp is not None else time.time()))
+
+    def record_many(self, samples: Iterable[Tuple[Any, str, float, Optional[float]]]) -> int:
+        """Record (node_id, metric, value, timestamp) tuples; returns how many were stored."""
+        stored = 0
+        now = int(time.time())
+        with self._lock:
+            self._load()
+            for node_id, metric, value, timestamp in samples:
+                if value is None:
+                    continue
+                if self._record(str(node_id), metric, float(value), int(timestamp) if timestamp is not None else now):
+                    stored += 1
+        return stored
+
+    def _rings(self, metric: str) -> Tuple[RingFile, ...]:
+        rings = self._by_metric.get(metric)
+        if rings is None:
+            rings = self._by_metric[metric] = tuple(self._file(metric, tier) for tier, _ in TIERS)
+        return rings
+
+    def _record(self, node_id: str, metric: str, value: float, ts: int) -> bool:
+        if not 0 <= ts < TS_LIMIT or not abs(value) <= FLOAT32_MAX:
+            # Checked before _block() so a rejected sample leaves no trace in the index
+            self.counters["rejected"] += 1
+            return False
+        block = self._block(metric, node_id, create=True)
+        raw, *buckets = self._rings(metric)
+        if not raw.append(block, ts, value):
+            # Rings are kept in time order so they can be bisected
+            self.counters["out_of_order"] += 1
+            return False
+        for ring, (_, seconds) in zip(buckets, TIERS[1:]):
+            ring.fold(block, ts - ts % seconds, value)
+        self.counters["samples"] += 1
+        return True
+
+    # -- reads -------------------------------------------------------------------
+
+    def _pick_tier(self, metric: str, block: int, start: int) -> str:
+        for tier, _ in TIERS:
+            ring = self._file(metric, tier)
+            oldest, count = ring.span(block)
+            if count == 0:
+                continue
+            # A ring that has not wrapped yet still holds all history
+            if count < ring.capacity or ring.u[ring.column(block, 0) + oldest] <= start:
+                return tier
+        return TIERS[-1][0]
+
+    def query_range(
+        self,
+        node_id: Any,
+        metric: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        tier: Optional[str] = None,
+        limit: int = 10000
+    ) -> Dict[str, Any]:
+        """
+        Samples in [start, end]. Raw tier points are [ts, value]; downsampled
+        points are [bucket_ts, count, avg, min, max].
+        """
+        if tier is not None and tier not in self.capacities:
+            raise ValueError(f"Unknown tier: {tier} (expected one of {', '.join(t for t, _ in TIERS)})")
+        start_ts = int(start) if start is not None else 0
+        end_ts = int(end) if end is not None else 2 ** 32 - 1
+        with self._lock:
+            self._load()
+            block = self._block(metric, str(node_id), create=False)
+            if block is None:
+                return {"node_id": str(node_id), "metric": metric, "tier": tier or "raw", "points": []}
+            tier = tier or self._pick_tier(metric, block, start_ts)
+            ring = self._file(metric, tier)
+            oldest, count = ring.span(block)
+            first = ring.bisect(block, start_ts)
+            cap = ring.capacity
+            u, f = ring.u, ring.f
+            cols = [ring.column(block, c) for c in range(ring.columns)]
+            points = []
+            for i in range(first, count):
+                slot = (oldest + i) % cap
+                ts = u[cols[0] + slot]
+                if ts > end_ts or len(points) >= limit:
+                    break
+                if tier == "raw":
+                    points.append([ts, round(f[cols[1] + slot], 4)])
+                else:
+                    n = u[cols[1] + slot]
+                    points.append([ts, n, round(f[cols[2] + slot] / n, 4), round(f[cols[3] + slot], 4), round(f[cols[4] + slot], 4)])
+        return {"node_id": str(node_id), "metric": metric, "tier": tier, "points": points}
+
+    def samples_since(self, metric: str, since: Dict[str, int]) -> Dict[str, Tuple[List[int], List[float]]]:
+        """
+        Raw samples newer than since[node] (all samples for nodes not in since),
+        for every node of the metric: {node: (timestamps, values)}. Nodes
+        without new samples are left out, so incremental readers only pay for
+        what arrived since their last call.
+        """
+        result: Dict[str, Tuple[List[int], List[float]]] = {}
+        with self._lock:
+            self._load()
+            nodes = self._index.get(metric)
+            if not nodes:
+                return result
+            ring = self._file(metric, "raw")
+            cap = ring.capacity
+            u, f = ring.u, ring.f
+            for node, block in nodes.items():
+                last = ring.last_ts(block)
+                after = since.get(node)
+                if last is None or (after is not None and last <= after):
+                    continue
+                oldest, count = ring.span(block)
+                first = ring.bisect(block, after + 1) if after is not None else 0
+                ts_col, val_col = ring.column(block, 0), ring.column(block, 1)
+                slots = [(oldest + i) % cap for i in range(first, count)]
+                result[node] = ([u[ts_col + slot] for slot in slots], [f[val_col + slot] for slot in slots])
+        return result
+
+    def aggregate(
+        self,
+        metric: str,
+        fn: str = "avg",
+        node_ids: Optional[List[Any]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        tier: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Aggregate per node over [start, end] (all nodes of the metric by default)."""
+        if fn not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {fn} (expected one of {', '.join(AGGREGATES)})")
+        with self._lock:
+            self._load()
+            nodes = [str(n) for n in node_ids] if node_ids else list(self._index.get(metric, {}))
+            per_node: Dict[str, Optional[float]] = {}
+            total_n, total_sum, total_min, total_max = 0, 0.0, None, None
+            total_last, total_last_ts = None, None
+            for node in nodes:
+                points = self.query_range(node, metric, start, end, tier, limit=2 ** 31)
+                rows = points["points"]
+                if not rows:
+                    per_node[node] = None
+                    continue
+                if points["tier"] == "raw":
+                    n = len(rows)
+                    s = sum(r[1] for r in rows)
+                    lo = min(r[1] for r in rows)
+                    hi = max(r[1] for r in rows)
+                    last = rows[-1][1]
+                else:
+                    n = sum(r[1] for r in rows)
+                    s = sum(r[1] * r[2] for r in rows)
+                    lo = min(r[3] for r in rows)
+                    hi = max(r[4] for r in rows)
+                    last = rows[-1][2]
+                per_node[node] = round({"avg": s / n, "min": lo, "max": hi, "sum": s, "count": n, "last": last}[fn], 4)
+                total_n += n
+                total_sum += s
+                total_min = lo if total_min is None else min(total_min, lo)
+                total_max = hi if total_max is None else max(total_max, hi)
+                # Most recent sample (or bucket) across all nodes
+                if total_last_ts is None or rows[-1][0] > total_last_ts:
+                    total_last, total_last_ts = last, rows[-1][0]
+        overall = None
+        if total_n:
+            overall = {"avg": total_sum / total_n, "min": total_min, "max": total_max, "sum": total_sum, "count": total_n, "last": total_last}[fn]
+        return {
+            "metric": metric,
+            "fn": fn,
+            "nodes": per_node,
+            "overall": round(overall, 4) if overall is not None else None
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            disk = sum(ring.blocks * ring.block_words * WORD for ring in self._files.values())
+            return {
+                "root": str(self.root),
+                "metrics": {metric: len(nodes) for metric, nodes in self._index.items()},
+                "capacities": self.capacities,
+                "mapped_bytes": disk,
+                **self.counters
+            }
@@ -0,0 +1,358 @@
+"""Per-request span tracing for the orchestration pipelines.
+
+A trace is started for a request when it is sampled (TRACE_SAMPLE_RATE) or
+asked for with `?trace=1`. The current span lives in a context variable, so
+spans opened by agents, data-store reads, ONOS calls and plan steps nest under
+the request without passing anything around; FastAPI copies the context into
+the worker thread of sync endpoints. Outside a trace `span()` returns a shared
+no-op, so instrumented code costs one context-variable lookup.
+
+Finished traces are written as OTLP/JSON (one ExportTraceServiceRequest per
+line, the OpenTelemetry file exporter layout) to TRACE_EXPORT_PATH by a
+background thread. With `?trace=1` a flat span list with self times and the
+top hotspots is also added to the JSON response under "trace".
+
+Environment:
+- TRACE_SAMPLE_RATE: fraction of requests traced without ?trace=1 (default 0)
+- TRACE_EXPORT_PATH: OTLP/JSON lines file; unset disables the export
+- TRACE_MAX_SPANS: spans kept per trace, the rest are counted as dropped
+"""
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "sdn-wise-mcp-server"
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+
+class Trace:
+    def __init__(self, max_spans: int):
+        self.trace_id = os.urandom(16).hex()
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    def add(self, span: Span) -> bool:
+        # list.append is atomic, so spans from worker threads need no lock
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return False
+        self.spans.append(span)
+        return True
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("mcp_current_span", default=None)
+
+
+class _NoopSpan:
+    """Returned by span() outside a trace; every operation does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanScope:
+    __slots__ = ("span", "token")
+
+    def __init__(self, span: Span):
+        self.span = span
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        return False
+
+
+def span(name: str, **attributes: Any):
+    """Child span of the current one; a no-op when the request is not traced."""
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    child = Span(parent.trace, name, parent.span_id, SPAN_KIND_INTERNAL, attributes)
+    if not parent.trace.add(child):
+        return _NOOP
+    return _SpanScope(child)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator running the function inside span(name or qualified name)."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attributes(**attributes: Any):
+    """Attach attributes to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for one trace."""
+    spans = []
+    for s in trace.spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns if s.end_ns is not None else s.start_ns),
+            "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": s.error} if s.error else {"code": STATUS_OK},
+        }
+        spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                {"key": "mcp.dropped_spans", "value": {"intValue": str(trace.dropped)}},
+            ]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]
+    }
+
+
+def summarize(trace: Trace, hotspots: int = 5) -> Dict[str, Any]:
+    """Flat span list with offsets and self time, plus the spans with the most self time."""
+    if not trace.spans:
+        return {"trace_id": trace.trace_id, "spans": [], "hotspots": []}
+    root = trace.spans[0]
+    child_ms: Dict[str, float] = {}
+    depth: Dict[Optional[str], int] = {None: -1}
+    for s in trace.spans:
+        if s.parent_id:
+            child_ms[s.parent_id] = child_ms.get(s.parent_id, 0.0) + s.duration_ms
+    rows = []
+    for s in trace.spans:
+        depth[s.span_id] = depth.get(s.parent_id, -1) + 1
+        rows.append({
+            "name": s.name,
+            "span_id": s.span_id,
+            "parent_span_id": s.parent_id,
+            "depth": depth[s.span_id],
+            "start_offset_ms": round((s.start_ns - root.start_ns) / 1e6, 3),
+            "duration_ms": round(s.duration_ms, 3),
+            # Children running concurrently can exceed the parent; clamp at zero
+            "self_ms": round(max(s.duration_ms - child_ms.get(s.span_id, 0.0), 0.0), 3),
+            "attributes": s.attributes,
+            **({"error": s.error} if s.error else {}),
+        })
+    ranked = sorted(rows, key=lambda r: r["self_ms"], reverse=True)[:hotspots]
+    return {
+        "trace_id": trace.trace_id,
+        "duration_ms": round(root.duration_ms, 3),
+        "span_count": len(rows),
+        "dropped_spans": trace.dropped,
+        "spans": rows,
+        "hotspots": [{"name": r["name"], "self_ms": r["self_ms"], "span_id": r["span_id"]} for r in ranked],
+    }
+
+
+class TraceExporter:
+    """Appends OTLP/JSON lines to a file from a background thread."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.failed = 0
+
+    def export(self, trace: Trace):
+        if not self.path:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(to_otlp(trace))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(item) + "\n")
+                self.exported += 1
+            except OSError as e:
+                self.failed += 1
+                logger.warning(f"Trace export to {self.path} failed: {e}")
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, export_path: Optional[str] = None, max_spans: int = 2000):
+        self.sample_rate = sample_rate
+        self.max_spans = max_spans
+        self.exporter = TraceExporter(export_path)
+
+    def start(self, name: str, force: bool = False, **attributes: Any) -> Optional[_SpanScope]:
+        """Root span for a request, or None when the request is not sampled."""
+        if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return None
+        trace = Trace(self.max_spans)
+        root = Span(trace, name, None, SPAN_KIND_SERVER, attributes)
+        trace.add(root)
+        return _SpanScope(root)
+
+    def finish(self, scope: _SpanScope):
+        self.exporter.export(scope.span.trace)
+
+
+tracer = Tracer(
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0")),
+    export_path=os.getenv("TRACE_EXPORT_PATH") or None,
+    max_spans=int(os.getenv("TRACE_MAX_SPANS", "2000")),
+)
+
+
+class TracingMiddleware:
+    """Root span per sampled request; `?trace=1` forces a trace and inlines its summary."""
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        inline = query.get("trace", ["0"])[0] in ("1", "true", "yes")
+        root = self.tracer.start(
+            f"{scope.get('method', 'GET')} {scope.get('path', '')}", force=inline,
+            **{"http.method": scope.get("method", "GET"), "http.target": scope.get("path", "")}
+        )
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Dict[str, Any] = {}
+        body_parts: List[bytes] = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.span.set_attribute("http.status_code", message["status"])
+                if inline:
+                    start_message.update(message)
+                    return
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-trace-id", root.span.trace.trace_id.encode())
+                ]}
+            elif message["type"] == "http.response.body" and inline:
+                body_parts.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await self._send_with_trace(send, start_message, b"".join(body_parts), root)
+                return
+            await send(message)
+
+        # Parsed from the payload by MetricsMiddleware, which runs outside this one
+        action = (scope.get("state") or {}).get("action")
+        if action:
+            root.span.set_attribute("mcp.action", action)
+        try:
+            with root:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            self.tracer.finish(root)
+
+    async def _send_with_trace(self, send, start: Dict[str, Any], body: bytes, root: _SpanScope):
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+        content_type = next((v for k, v in headers if k.lower() == b"content-type"), b"")
+        if content_type.startswith(b"application/json"):
+            try:
+                payload = json.loads(body)
+                if isinstance(payload, dict):
+                    # Still inside the root span; close its clock at the last app byte
+                    root.span.end_ns = time.time_ns()
+                    payload["trace"] = summarize(root.span.trace)
+                    body = json.dumps(payload).encode()
+            except ValueError:
+                pass
+        headers.append((b"content-length", str(len(body)).encode()))
+        headers.append((b"x-trace-id", root.span.trace.trace_id.encode()))
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,18 +1,183 @@
 from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
 import json
+import logging
 import threading
+import time
+import os
 
-DATA_DIR = Path(__file__).parent / ".." / "data"
+from starlette.responses import StreamingResponse
+
+from .onos import OnosClient
+from .ingest import ReportIngestor
+from .timeseries import TelemetryStore
+from .forecast import BatteryForecaster
+from .profiler import SamplingProfiler, MemoryTracker
+from .rollout import RolloutManager
+from .firmware import FirmwareStore
+from .delta import DeltaBuilder
+from .ota_queue import OtaDeliveryQueue
+from .protocols import ProtocolDispatcher, HttpTransport, MqttTransport, CoapTransport, BleGatewayTransport
+from .resilience import RetryPolicy, CircuitBreakerRegistry
+from .metrics import REGISTRY, datastore_seconds, datastore_lock_wait_seconds, register_cache
+from .tracing import span
+
+# MCP_DATA_DIR points the server at another data set (benchmark fixtures, scenarios)
+DATA_DIR = Path(os.getenv("MCP_DATA_DIR", str(Path(__file__).parent / ".." / "data")))
 DATA_DIR = DATA_DIR.resolve()
 
+# Cooja simulations callers may name by path, besides DATA_DIR (see cooja_path)
+COOJA_SIMULATIONS_DIR = Path(os.getenv(
+    "COOJA_SIMULATIONS_DIR",
+    str(Path(__file__).parent / ".." / ".." / ".." / "controller" / "onos-simulation" / "cooja-simulations")
+)).resolve()
+
+
+def cooja_path(path: str) -> Path:
+    """
+    Resolve a caller-supplied Cooja simulation path inside DATA_DIR or
+    COOJA_SIMULATIONS_DIR; relative paths are looked up in each. Anything
+    else is a ValueError, so callers cannot make the server read arbitrary files.
+    """
+    roots = (DATA_DIR, COOJA_SIMULATIONS_DIR)
+    candidate = Path(path)
+    candidates = [candidate] if candidate.is_absolute() else [root / candidate for root in roots]
+    for resolved in (c.resolve() for c in candidates):
+        if any(resolved.is_relative_to(root) for root in roots) and resolved.exists():
+            return resolved
+    raise ValueError(f"Cooja simulation not found in the data or cooja-simulations directory: {path}")
+
 
 _write_lock = threading.Lock()
 
+# Shared ONOS client; topology/device reads are cached (see servers/onos.py)
+onos_client = OnosClient()
+register_cache("onos_topology", onos_client.cache_stats)
+
+# Per-node telemetry history (memory-mapped ring buffers, see servers/timeseries.py)
+telemetry_store = TelemetryStore(Path(os.getenv("TELEMETRY_DIR", str(DATA_DIR / "timeseries"))))
+
+# Mote report listener state (started by app startup when WISE_INGEST_ENABLED)
+report_ingestor = ReportIngestor(
+    flush_interval=float(os.getenv("WISE_INGEST_FLUSH_SECONDS", "0.25")),
+    node_timeout=float(os.getenv("WISE_NODE_TIMEOUT_SECONDS", "30")),
+    telemetry=telemetry_store
+)
+
+# Battery depletion forecasts over the telemetry history (see servers/forecast.py)
+battery_forecaster = BatteryForecaster(
+    telemetry_store,
+    refresh_seconds=float(os.getenv("FORECAST_REFRESH_SECONDS", "30"))
+)
+
+# On-demand CPU sampling / tracemalloc diffs behind /tasks/diagnostics (see servers/profiler.py)
+profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
+
+# Background wave-based OTA rollout jobs (see servers/rollout.py)
+ota_rollouts = RolloutManager()
+
+# Content-addressed firmware images and cached signature checks (see servers/firmware.py)
+firmware_store = FirmwareStore(
+    Path(os.getenv("FIRMWARE_STORE_DIR", str(DATA_DIR / "firmware"))),
+    public_key_path=os.getenv("FIRMWARE_PUBLIC_KEY_PATH") or None
+)
+register_cache("firmware_signatures", firmware_store.cache_stats)
+
+# Binary deltas between stored images, built in worker processes (see servers/delta.py)
+delta_builder = DeltaBuilder(
+    firmware_store,
+    max_workers=int(os.getenv("DELTA_WORKERS", "1")),
+    max_image_bytes=int(os.getenv("DELTA_MAX_IMAGE_BYTES", str(64 << 20)))
+)
+
+# Durable OTA updates for offline devices, delivered on reconnect (see servers/ota_queue.py)
+ota_queue = OtaDeliveryQueue(
+    DATA_DIR / "ota_queue.jsonl",
+    rate_per_second=float(os.getenv("OTA_QUEUE_RATE_PER_SECOND", "5")),
+    burst=float(os.getenv("OTA_QUEUE_BURST", "10")),
+    max_concurrency=int(os.getenv("OTA_QUEUE_MAX_CONCURRENCY", "5")),
+    poll_seconds=float(os.getenv("OTA_QUEUE_POLL_SECONDS", "5")),
+    heartbeat_timeout=float(os.getenv("OTA_HEARTBEAT_TIMEOUT_SECONDS", "60"))
+)
+REGISTRY.gauge_callback("mcp_ota_queue_pending", "Queued OTA updates waiting for their device", (),
+                        lambda: [((), ota_queue.depth())])
+
+# Transport plugins for plan steps: HTTP, MQTT, CoAP, BLE gateway (see servers/protocols.py),
+# with retries and per-device circuit breakers (see servers/resilience.py)
+protocol_dispatcher = ProtocolDispatcher(
+    loopback=os.getenv("PROTOCOL_LOOPBACK", ""),
+    retry_policy=RetryPolicy(
+        max_attempts=int(os.getenv("STEP_RETRY_MAX_ATTEMPTS", "3")),
+        backoff_ms=float(os.getenv("STEP_RETRY_BACKOFF_MS", "100")),
+        max_backoff_ms=float(os.getenv("STEP_RETRY_MAX_BACKOFF_MS", "2000"))
+    ),
+    breakers=CircuitBreakerRegistry(
+        failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3")),
+        reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+        half_open_probes=int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+    )
+)
+protocol_dispatcher.register(HttpTransport(pool_size=int(os.getenv("HTTP_POOL_SIZE", "20"))))
+protocol_dispatcher.register(MqttTransport(
+    host=os.getenv("MQTT_BROKER_HOST", "localhost"),
+    port=int(os.getenv("MQTT_BROKER_PORT", "1883")),
+    max_inflight=int(os.getenv("MQTT_MAX_INFLIGHT", "20"))
+))
+protocol_dispatcher.register(CoapTransport(nstart=int(os.getenv("COAP_NSTART", "1"))))
+protocol_dispatcher.register(BleGatewayTransport(
+    os.getenv("BLE_GATEWAY_URL", ""),
+    max_batch=int(os.getenv("BLE_GATEWAY_MAX_BATCH", "32")),
+    linger_ms=float(os.getenv("BLE_GATEWAY_LINGER_MS", "10"))
+))
+REGISTRY.gauge_callback("mcp_device_circuits_open", "Devices whose plan step circuit breaker is open or half-open", (),
+                        lambda: [((), protocol_dispatcher.breakers.open_count())])
+
 def read_json(path: Path):
     if not path.exists():
         return []
-    return json.loads(path.read_text())
+    with span("datastore.read", file=path.name), datastore_seconds.time("read", path.name):
+        return json.loads(path.read_text())
 
 def write_json(path: Path, data):
-    with _write_lock:
-        path.write_text(json.dumps(data, indent=2))
+    waited = time.perf_counter()
+    with span("datastore.write", file=path.name), _write_lock:
+        datastore_lock_wait_seconds.observe(time.perf_counter() - waited)
+        with datastore_seconds.time("write", path.name):
+            path.write_text(json.dumps(data, indent=2))
+
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+def wants_ndjson(stream: Optional[str]) -> bool:
+    """True for ?stream=ndjson; any other stream format is a ValueError."""
+    if stream is None:
+        return False
+    if stream != "ndjson":
+        raise ValueError(f"Unsupported stream format: {stream} (supported: ndjson)")
+    return True
+
+def ndjson_response(records: Iterable[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Stream records as newline-delimited JSON, encoding each one as the
+    generator produces it. Lines are sent in chunks of about NDJSON_CHUNK_BYTES
+    (each chunk costs a threadpool hop). The status line is sent before the
+    first record, so a failure mid-stream is reported as a final
+    {"record": "error"} line.
+    """
+    def lines():
+        chunk = []
+        size = 0
+        try:
+            for record in records:
+                line = json.dumps(record, default=str) + "\n"
+                chunk.append(line)
+                size += len(line)
+                if size >= NDJSON_CHUNK_BYTES:
+                    yield "".join(chunk)
+                    chunk, size = [], 0
+        except Exception as e:
+            logging.getLogger(__name__).exception("NDJSON stream failed")
+            chunk.append(json.dumps({"record": "error", "error": str(e)}) + "\n")
+        if chunk:
+            yield "".join(chunk)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
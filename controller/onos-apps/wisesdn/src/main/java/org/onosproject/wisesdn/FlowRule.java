@@ -19,6 +19,9 @@ public class FlowRule {
     public static final byte ACTION_MODIFY = 2;
     public static final byte ACTION_AGGREGATE = 3;
 
+    // Wildcard source address (aggregated rules): matches any source
+    public static final int ADDR_ANY = 0xFFFF;
+
     public FlowRule() {
         this.timestamp = System.currentTimeMillis();
     }
@@ -56,11 +56,20 @@ public class FlowTableManager {
             return null;
         }
 
-        // Find first matching rule
-        return rules.stream()
-                .filter(rule -> rule.getSrcAddr() == srcNode && rule.getDstAddr() == dstNode)
-                .findFirst()
-                .orElse(null);
+        // Exact (src, dst) match first, then an aggregated wildcard-source rule
+        FlowRule wildcard = null;
+        for (FlowRule rule : rules) {
+            if (rule.getDstAddr() != dstNode) {
+                continue;
+            }
+            if (rule.getSrcAddr() == srcNode) {
+                return rule;
+            }
+            if (rule.getSrcAddr() == FlowRule.ADDR_ANY && wildcard == null) {
+                wildcard = rule;
+            }
+        }
+        return wildcard;
     }
 
     /**
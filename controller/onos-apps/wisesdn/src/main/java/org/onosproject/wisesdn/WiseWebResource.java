@@ -1,5 +1,6 @@
 package org.onosproject.wisesdn;
 
+import com.fasterxml.jackson.databind.JsonNode;
 import com.fasterxml.jackson.databind.ObjectMapper;
 import com.fasterxml.jackson.databind.node.ArrayNode;
 import com.fasterxml.jackson.databind.node.ObjectNode;
@@ -142,6 +143,99 @@ public class WiseWebResource extends AbstractWebResource {
         }
     }
 
+    /**
+     * Install several flow rules in one request
+     * POST /onos/wisesdn/api/flows/batch
+     *
+     * Body is a JSON array of flow objects (same fields as POST api/flows).
+     * Each flow gets its own result entry, so one bad rule does not fail the batch.
+     */
+    @POST
+    @Path("api/flows/batch")
+    @Consumes(MediaType.APPLICATION_JSON)
+    @Produces(MediaType.APPLICATION_JSON)
+    public Response installFlows(String flowsJson) {
+        try {
+            JsonNode flowsNode = mapper.readTree(flowsJson);
+            if (flowsNode == null || !flowsNode.isArray()) {
+                ObjectNode error = mapper.createObjectNode();
+                error.put("status", "error");
+                error.put("message", "Expected a JSON array of flows");
+                return Response.status(Response.Status.BAD_REQUEST)
+                        .entity(error.toString()).build();
+            }
+
+            AppComponent app = get(AppComponent.class);
+            FlowTableManager flowMgr = app.getFlowManager();
+
+            ArrayNode results = mapper.createArrayNode();
+            int installed = 0;
+            for (JsonNode flowNode : flowsNode) {
+                ObjectNode result = mapper.createObjectNode();
+                try {
+                    FlowRule rule = new FlowRule(
+                            flowNode.get("nodeId").asInt(),
+                            flowNode.get("srcAddr").asInt(),
+                            flowNode.get("dstAddr").asInt(),
+                            (byte) flowNode.get("action").asInt(),
+                            flowNode.get("nextHop").asInt());
+                    String flowId = flowMgr.installFlow(rule);
+                    result.put("status", "success");
+                    result.put("flowId", flowId);
+                    installed++;
+                } catch (Exception e) {
+                    result.put("status", "error");
+                    result.put("message", String.valueOf(e.getMessage()));
+                }
+                results.add(result);
+            }
+
+            ObjectNode response = mapper.createObjectNode();
+            response.put("status", "success");
+            response.put("installed", installed);
+            response.set("results", results);
+
+            log.info("Batch flow install: {}/{} flows installed", installed, flowsNode.size());
+
+            return Response.ok(response.toString()).build();
+
+        } catch (Exception e) {
+            log.error("Error installing flow batch", e);
+            ObjectNode error = mapper.createObjectNode();
+            error.put("status", "error");
+            error.put("message", e.getMessage());
+            return Response.status(Response.Status.BAD_REQUEST)
+                    .entity(error.toString()).build();
+        }
+    }
+
+    /**
+     * Delete a flow rule from a node
+     * DELETE /onos/wisesdn/api/flows/{nodeId}/{flowId}
+     */
+    @DELETE
+    @Path("api/flows/{nodeId}/{flowId}")
+    @Produces(MediaType.APPLICATION_JSON)
+    public Response deleteFlow(@PathParam("nodeId") int nodeId, @PathParam("flowId") String flowId) {
+        try {
+            AppComponent app = get(AppComponent.class);
+            boolean removed = app.getFlowManager().deleteFlow(nodeId, flowId);
+
+            ObjectNode response = mapper.createObjectNode();
+            response.put("status", removed ? "success" : "error");
+            response.put("flowId", flowId);
+            response.put("message", removed ? "Flow rule deleted" : "Flow rule not found");
+
+            return Response.status(removed ? Response.Status.OK : Response.Status.NOT_FOUND)
+                    .entity(response.toString()).build();
+
+        } catch (Exception e) {
+            log.error("Error deleting flow {} on node {}", flowId, nodeId, e);
+            return Response.status(Response.Status.INTERNAL_SERVER_ERROR)
+                    .entity("{\"error\":\"" + e.getMessage() + "\"}").build();
+        }
+    }
+
     /**
      * Get WSN topology
      * GET /onos/wisesdn/api/topology
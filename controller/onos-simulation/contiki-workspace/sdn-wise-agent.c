@@ -31,6 +31,9 @@
 // Flow table configuration
 #define MAX_FLOW_RULES 10
 
+// Wildcard source address: matches any source for the rule's destination
+#define WISE_ADDR_ANY 0xFFFF
+
 // Flow rule structure
 typedef struct {
   uint8_t active;
@@ -82,13 +85,20 @@ static int flow_table_add(uint16_t src, uint16_t dst, uint8_t action,
 }
 
 static flow_rule_t *flow_table_lookup(uint16_t src, uint16_t dst) {
+  flow_rule_t *wildcard = NULL;
   for (uint8_t i = 0; i < flow_count; i++) {
-    if (flow_table[i].active && flow_table[i].src_addr == src &&
-        flow_table[i].dst_addr == dst) {
+    if (!flow_table[i].active || flow_table[i].dst_addr != dst) {
+      continue;
+    }
+    // Exact (src, dst) rules take precedence over aggregated wildcard rules
+    if (flow_table[i].src_addr == src) {
       return &flow_table[i];
     }
+    if (flow_table[i].src_addr == WISE_ADDR_ANY && wildcard == NULL) {
+      wildcard = &flow_table[i];
+    }
   }
-  return NULL;
+  return wildcard;
 }
 
 static void flow_table_clear(void) {
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+SDN-WISE MCP Server - Endpoint Benchmark Suite
+In-process latency/throughput benchmarks of the task endpoints on seeded
+fixtures of 100 / 1k / 10k devices.
+
+The app runs inside this process (FastAPI TestClient), against a temporary
+data directory (MCP_DATA_DIR) holding generated devices.json and
+deployment_monitoring.json plus copies of the other data files, so the live
+data is never touched. Plan execution talks to a local fake device HTTP
+server instead of real ESP32s.
+
+Usage:
+    python3 tests/benchmark_suite.py                        # all sizes, compare with baseline
+    python3 tests/benchmark_suite.py --sizes 100,1000 --only plan-validation
+    python3 tests/benchmark_suite.py --save-baseline        # record current numbers
+
+Exit code 1 when a case regresses against the baseline (p95 slower by more
+than --tolerance and at least --min-delta-ms).
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVER_DIR = ROOT / "application" / "mcp-server"
+LIVE_DATA_DIR = SERVER_DIR / "data"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+
+LOCATIONS = ["corridor", "room_101", "room_102", "room_103", "nurse_station", "storage"]
+DEVICE_TYPES = {
+    "camera": [("camera", "HTTP/REST"), ("motion", "HTTP/REST"), ("temperature", "MQTT")],
+    "sensor": [("temperature", "MQTT"), ("humidity", "MQTT"), ("motion", "HTTP/REST")],
+    "actuator": [("control", "HTTP/REST")],
+    "display": [("display", "HTTP/REST")],
+}
+CAPABILITIES = {
+    "camera": "video_streaming",
+    "motion": "motion_detection",
+    "temperature": "temperature_sensing",
+    "humidity": "humidity_sensing",
+    "control": "actuation",
+    "display": "display",
+}
+STATUSES = ["active"] * 6 + ["idle", "sleep", "deep_sleep"]
+
+
+class FakeDeviceHandler(BaseHTTPRequestHandler):
+    """Answers every device service call with 200, like an idle ESP32 firmware."""
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        body = json.dumps({"status": "ok", "path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_fixture(size: int, seed: int) -> Dict[str, Any]:
+    """Seeded devices.json / deployment_monitoring.json contents for size devices."""
+    rng = random.Random(seed + size)
+    now = datetime.utcnow()
+    devices, deployed = [], []
+    for i in range(size):
+        device_id = f"esp32-{i + 1:05d}"
+        device_type = rng.choices(list(DEVICE_TYPES), weights=[3, 5, 1, 1])[0]
+        location = LOCATIONS[0] if i % 4 == 0 else rng.choice(LOCATIONS)
+        services = [
+            {"name": name, "protocol": protocol, "details": {"sampling_frequency": rng.choice([1, 10, 30])}}
+            for name, protocol in DEVICE_TYPES[device_type]
+        ]
+        battery = rng.randint(5, 100)
+        status = rng.choice(STATUSES)
+        devices.append({
+            "device_id": device_id,
+            "deviceId": device_id,
+            "name": f"{device_type.title()} {i + 1}",
+            "type": device_type,
+            "device_type": device_type,
+            "status": status,
+            "ip": "127.0.0.1",
+            "battery": battery,
+            "location": location,
+            "capabilities": [CAPABILITIES[s["name"]] for s in services],
+            "services": services,
+        })
+        deployed.append({
+            "deviceId": device_id,
+            "name": f"{device_type.title()} {i + 1}",
+            "type": device_type,
+            "status": status,
+            "ip": "127.0.0.1",
+            "battery": battery,
+            "location": {"x": (i % 100) * 5, "y": (i // 100) * 5, "z": 2.0},
+            "locationName": location,
+            "services": services,
+            "last_seen": (now - timedelta(seconds=rng.randint(0, 900))).isoformat() + "Z",
+        })
+    deployment = {
+        "deployment": {
+            "name": f"Benchmark fixture ({size} devices)",
+            "environment": "benchmark",
+            "timezone": "UTC",
+            "created_at": now.isoformat() + "Z",
+            "last_updated": now.isoformat() + "Z",
+        },
+        "devices": deployed,
+    }
+    return {"devices": devices, "deployment": deployment}
+
+
+def write_fixture(data_dir: Path, fixture: Dict[str, Any]):
+    (data_dir / "devices.json").write_text(json.dumps(fixture["devices"]))
+    (data_dir / "deployment_monitoring.json").write_text(json.dumps(fixture["deployment"]))
+    # Fresh history per size so earlier runs do not grow the files being read
+    (data_dir / "execution_history.json").write_text(json.dumps({"executions": []}))
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * q / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class BenchmarkCase:
+    def __init__(self, endpoint: str, action: str, payload: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 iterations: int = 20, expect: tuple = (200,)):
+        self.endpoint = endpoint
+        self.action = action
+        self.payload = payload
+        self.iterations = iterations
+        self.expect = expect
+
+    @property
+    def name(self) -> str:
+        return f"{self.endpoint}:{self.action}"
+
+
+def sample_plan(ctx: Dict[str, Any], count: int = 20) -> Dict[str, Any]:
+    """Validation plan over the first count corridor devices."""
+    devices = [
+        {"deviceId": d["device_id"], "type": d["type"], "services": d["services"]}
+        for d in ctx["corridor"][:count]
+    ]
+    return {
+        "plan_id": "benchmark-plan",
+        "description": "Fall detection along the corridor",
+        "devices": devices,
+        "algorithm": {"type": "parallel", "steps": []},
+        "expected_duration_hours": 8,
+    }
+
+
+def execution_plan(ctx: Dict[str, Any], count: int = 5) -> Dict[str, Any]:
+    """Plan whose HTTP steps hit the fake device server."""
+    steps = []
+    for d in [d for d in ctx["corridor"] if d["type"] == "camera"][:count]:
+        steps.append({
+            "instruction": "activate_service",
+            "device_id": d["device_id"],
+            "service": "camera",
+            "parameters": {"stream": "on"},
+            "port": ctx["device_port"],
+            "timeout_ms": 2000,
+        })
+        steps.append({
+            "instruction": "query_service",
+            "device_id": d["device_id"],
+            "service": "temperature",
+            "parameters": {},
+        })
+    return {
+        "plan_id": "benchmark-execution",
+        "devices": [{"device_id": s["device_id"]} for s in steps],
+        "algorithm": {"type": "parallel", "steps": steps},
+    }
+
+
+def benchmark_cases() -> List[BenchmarkCase]:
+    dm = "deployment-monitoring"
+    do = "device-orchestration"
+    pv = "plan-validation"
+    pe = "plan-execution"
+    ae = "algorithm-execution"
+    nc = "network-configuration"
+    ac = "access-control"
+    return [
+        # Deployment monitoring
+        BenchmarkCase(dm, "status", lambda c: {"action": "status"}),
+        BenchmarkCase(dm, "device_info", lambda c: {"action": "device_info", "device_id": c["last_id"]}),
+        BenchmarkCase(dm, "connectivity", lambda c: {"action": "connectivity", "device_id": c["last_id"]}),
+        BenchmarkCase(dm, "query_location", lambda c: {"action": "query_location", "location_id": "corridor"}),
+        BenchmarkCase(dm, "query_service", lambda c: {"action": "query_service", "service_name": "camera"}),
+        BenchmarkCase(dm, "query_status", lambda c: {"action": "query_status", "status": "active"}),
+        BenchmarkCase(dm, "query_capability", lambda c: {"action": "query_capability", "location_id": "corridor", "capability": "camera"}),
+        BenchmarkCase(dm, "active_devices", lambda c: {"action": "active_devices", "minutes": 10}),
+        BenchmarkCase(dm, "telemetry_record", lambda c: {"action": "telemetry_record", "samples": c["samples"]}),
+        BenchmarkCase(dm, "telemetry_range", lambda c: {"action": "telemetry_range", "device_id": c["first_id"], "metric": "battery"}),
+        BenchmarkCase(dm, "telemetry_aggregate", lambda c: {"action": "telemetry_aggregate", "metric": "battery", "fn": "avg"}),
+        BenchmarkCase(dm, "telemetry_stats", lambda c: {"action": "telemetry_stats"}),
+        BenchmarkCase(dm, "query", lambda c: {"action": "query", "query": "cameras in the corridor"}),
+        # Device orchestration (sequential execution sleeps per step, so few iterations)
+        BenchmarkCase(do, "query_devices", lambda c: {"action": "query_devices", "parameters": {"filters": {"location": "corridor", "capabilities": ["video_streaming"]}}}),
+        BenchmarkCase(do, "generate_plan", lambda c: {"action": "generate_plan", "intent": "Monitor the corridor for falls"}),
+        BenchmarkCase(do, "analyze", lambda c: {"action": "analyze", "plan_id": c["plan_id"]}, expect=(200, 400)),
+        BenchmarkCase(do, "list_plans", lambda c: {"action": "list_plans"}),
+        BenchmarkCase(do, "execute", lambda c: {"action": "execute", "plan_id": c["plan_id"], "intent": "Monitor the corridor"}, iterations=3),
+        BenchmarkCase(do, "execute_intent", lambda c: {"action": "execute_intent", "intent": "Monitor the corridor for falls"}, iterations=3),
+        # Plan validation
+        BenchmarkCase(pv, "validate", lambda c: {"action": "validate", "plan": sample_plan(c)}),
+        BenchmarkCase(pv, "validate_and_optimize", lambda c: {"action": "validate_and_optimize", "plan": sample_plan(c)}),
+        BenchmarkCase(pv, "recommendations", lambda c: {"action": "recommendations", "plan": sample_plan(c)}),
+        BenchmarkCase(pv, "validate_plan", lambda c: {"action": "validate_plan", "parameters": {"devices": c["power_devices"], "total_power_consumption_mw": 2400, "constraints_to_check": ["energy", "latency", "security"]}}),
+        BenchmarkCase(pv, "plan_validation_check", lambda c: {"action": "plan_validation_check", "parameters": {"plan_details": {"devices": c["power_devices"], "constraints_to_check": ["energy", "latency"]}}}),
+        BenchmarkCase(pv, "mcp_check_constraints", lambda c: {"action": "mcp_check_constraints", "payload": {"plan_details": {"devices": c["power_devices"], "constraints_to_check": ["energy", "latency"]}}}),
+        BenchmarkCase(pv, "request_constraints", lambda c: {"action": "request_constraints", "details": {"plan_id": "benchmark", "required_constraints": ["energy", "latency"]}}),
+        BenchmarkCase(pv, "plan_validation_result", lambda c: {"action": "plan_validation_result", "validation_result": "VALID"}),
+        # Plan execution (HTTP steps go to the fake device server)
+        BenchmarkCase(pe, "execute", lambda c: {"action": "execute", "plan": execution_plan(c)}),
+        BenchmarkCase(pe, "execute_and_monitor", lambda c: {"action": "execute_and_monitor", "plan": execution_plan(c)}),
+        BenchmarkCase(pe, "get_history", lambda c: {"action": "get_history", "limit": 10}),
+        BenchmarkCase(pe, "monitor", lambda c: {"action": "monitor", "execution_id": "unknown-execution"}, expect=(200, 400)),
+        BenchmarkCase(pe, "request_stream", lambda c: {"action": "request_stream", "target": c["camera_id"], "stream_type": "camera"}),
+        # Algorithm execution
+        BenchmarkCase(ae, "options", lambda c: {"action": "options", "intent": "corridor monitoring"}),
+        BenchmarkCase(ae, "build_plan:naive_baseline", lambda c: {"action": "build_plan", "algorithm_key": "naive_baseline"}),
+        BenchmarkCase(ae, "build_plan:sequential_corridor", lambda c: {"action": "build_plan", "algorithm_key": "sequential_corridor"}),
+        BenchmarkCase(ae, "execute", lambda c: {"action": "execute", "algorithm_key": "sequential_corridor", "dry_run": True}),
+        BenchmarkCase(ae, "simulate", lambda c: {"action": "simulate", "devices": c["corridor"][:20], "params": {"hours": 24}}, iterations=5),
+        # Network configuration
+        BenchmarkCase(nc, "configure_from_intent", lambda c: {"action": "configure_from_intent", "user_intent": "Set up fall detection in the corridor"}),
+        BenchmarkCase(nc, "ota_update:push", lambda c: {"action": "ota_update", "update_type": "push", "target_devices": c["ota_targets"], "firmware": {"version": "1.2.3", "binary_url": "http://ota.local/fw-1.2.3.bin", "signature": "benchmark"}}),
+        BenchmarkCase(nc, "ota_update:pull", lambda c: {"action": "ota_update", "update_type": "pull", "device_id": c["first_id"], "current_version": "1.0.0"}),
+        BenchmarkCase(nc, "ota_status", lambda c: {"action": "ota_status", "device_id": c["first_id"]}),
+        BenchmarkCase(nc, "configure_network", lambda c: {"action": "configure_network", "parameters": {"configuration_type": "vlan", "description": "benchmark", "changes": [{"type": "vlan", "vlan_id": 150}]}}),
+        BenchmarkCase(nc, "configure_network_service", lambda c: {"action": "configure_network_service", "service_name": "FallDetection", "configuration_details": {"network_elements": [{"element_type": "VLAN", "vlan_id": 50}]}}),
+        BenchmarkCase(nc, "apply_configuration", lambda c: {"action": "apply_configuration", "parameters": {"description": "benchmark", "configuration_changes": [{"type": "vlan_provisioning", "vlan_id": 150}], "verification_steps": ["Verify VLAN 150"]}}),
+        BenchmarkCase(nc, "deploy_configuration", lambda c: {"action": "deploy_configuration", "parameters": {"target_scope": "ward", "configuration_details": {"vlan_management": {"vlan_id": 150, "name": "bench"}, "qos_policy": {"rules": [{}]}}}}),
+        # Access control
+        BenchmarkCase(ac, "check", lambda c: {"op": "check", "user": "nurse-1", "permission": "read_patient"}),
+        BenchmarkCase(ac, "grant", lambda c: {"op": "grant", "role": "tech", "permission": "read_device"}),
+    ]
+
+
+class BenchmarkSuite:
+    def __init__(self, sizes: List[int], iterations: Optional[int] = None, only: Optional[List[str]] = None,
+                 seed: int = 42):
+        self.sizes = sizes
+        self.iterations = iterations
+        self.only = only
+        self.seed = seed
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def log(self, message: str):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
+    def _context(self, fixture: Dict[str, Any], device_port: int, client) -> Dict[str, Any]:
+        devices = fixture["devices"]
+        corridor = [d for d in devices if d["location"] == "corridor"]
+        now = int(time.time())
+        plans = client.post("/tasks/device-orchestration", json={"action": "list_plans"}).json()
+        plan_ids = [p.get("plan_id") for p in plans.get("plans", []) if p.get("plan_id")]
+        return {
+            "device_port": device_port,
+            "first_id": devices[0]["device_id"],
+            "last_id": devices[-1]["device_id"],
+            "camera_id": next(d["device_id"] for d in devices if d["type"] == "camera"),
+            "corridor": corridor,
+            "plan_id": plan_ids[0] if plan_ids else "unknown-plan",
+            "ota_targets": [d["device_id"] for d in devices[:10]],
+            "power_devices": [{"device_id": d["device_id"], "power_mW": 80 + i % 7 * 40} for i, d in enumerate(devices[:50])],
+            "samples": [
+                {"device_id": d["device_id"], "metric": "battery", "value": d["battery"], "timestamp": now - 60 * k}
+                for d in devices[:100] for k in range(5, 0, -1)
+            ],
+        }
+
+    def run_case(self, client, case: BenchmarkCase, ctx: Dict[str, Any], size: int) -> Dict[str, Any]:
+        # Fewer repetitions on big fixtures, where every request reloads the data files
+        iterations = self.iterations or max(3, case.iterations * 1000 // max(size, 1000))
+        payload = case.payload(ctx)
+        url = f"/tasks/{case.endpoint}"
+        # Warm-up request (imports, file cache) is not measured
+        client.post(url, json=payload)
+        rss_before = peak_rss_mb()
+        latencies, errors, statuses = [], 0, {}
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            response = client.post(url, json=payload)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code not in case.expect:
+                errors += 1
+        elapsed = time.perf_counter() - started
+        return {
+            "iterations": iterations,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.mean(latencies), 3),
+            "throughput_rps": round(iterations / elapsed, 2) if elapsed > 0 else None,
+            "errors": errors,
+            "status_codes": {str(k): v for k, v in statuses.items()},
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+        }
+
+    def run(self) -> Dict[str, Any]:
+        data_dir = Path(tempfile.mkdtemp(prefix="mcp-bench-"))
+        for path in LIVE_DATA_DIR.glob("*.json"):
+            shutil.copy(path, data_dir / path.name)
+        os.environ["MCP_DATA_DIR"] = str(data_dir)
+        os.environ.setdefault("TELEMETRY_DIR", str(data_dir / "timeseries"))
+        os.environ.setdefault("ONOS_URL", "http://127.0.0.1:9")
+
+        device_server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDeviceHandler)
+        threading.Thread(target=device_server.serve_forever, daemon=True).start()
+        device_port = device_server.server_address[1]
+
+        sys.path.insert(0, str(SERVER_DIR))
+        from fastapi.testclient import TestClient
+        from servers.app import app
+
+        cases = [c for c in benchmark_cases() if not self.only or c.endpoint in self.only or c.name in self.only]
+        try:
+            with TestClient(app) as client:
+                for size in self.sizes:
+                    fixture = build_fixture(size, self.seed)
+                    write_fixture(data_dir, fixture)
+                    ctx = self._context(fixture, device_port, client)
+                    self.log(f"Fixture: {size} devices ({len(ctx['corridor'])} in corridor)")
+                    size_results = self.results.setdefault(str(size), {})
+                    for case in cases:
+                        result = self.run_case(client, case, ctx, size)
+                        size_results[case.name] = result
+                        flag = " ERRORS" if result["errors"] else ""
+                        self.log(
+                            f"  {case.name:<52} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                            f"p99 {result['p99_ms']:>9.2f}ms  {result['throughput_rps']:>8} req/s{flag}"
+                        )
+        finally:
+            device_server.shutdown()
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        return {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": sys.version.split()[0],
+            "platform": sys.platform,
+            "sizes": self.sizes,
+            "seed": self.seed,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "results": self.results,
+        }
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                          min_delta_ms: float) -> List[Dict[str, Any]]:
+    """Cases whose p95 got slower than the baseline by more than tolerance (relative) and min_delta_ms."""
+    regressions = []
+    for size, cases in report["results"].items():
+        for name, result in cases.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if not before:
+                continue
+            delta = result["p95_ms"] - before["p95_ms"]
+            if delta > min_delta_ms and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append({
+                    "size": int(size),
+                    "case": name,
+                    "baseline_p95_ms": before["p95_ms"],
+                    "p95_ms": result["p95_ms"],
+                    "slowdown": round(result["p95_ms"] / before["p95_ms"], 2) if before["p95_ms"] else None,
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process endpoint benchmarks for the MCP server")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated fixture sizes")
+    parser.add_argument("--iterations", type=int, help="Override iterations per case")
+    parser.add_argument("--only", help="Comma-separated endpoints or endpoint:action cases")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative p95 slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore p95 slowdowns below this")
+    parser.add_argument("--output", default="benchmark_report.json")
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(
+        sizes=[int(s) for s in args.sizes.split(",") if s],
+        iterations=args.iterations,
+        only=[s for s in args.only.split(",") if s] if args.only else None,
+        seed=args.seed,
+    )
+    report = suite.run()
+
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        report["regressions"] = compare_with_baseline(report, baseline, args.tolerance, args.min_delta_ms)
+        report["baseline"] = {"path": str(baseline_path), "timestamp": baseline.get("timestamp")}
+    else:
+        report["regressions"] = []
+        report["baseline"] = None
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    suite.log(f"Report written to {args.output} (peak RSS {report['peak_rss_mb']} MB)")
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2))
+        suite.log(f"Baseline saved to {baseline_path}")
+
+    if report["regressions"]:
+        suite.log(f"[FAIL] {len(report['regressions'])} regression(s) against baseline:")
+        for r in report["regressions"]:
+            suite.log(f"  {r['size']:>6} devices  {r['case']:<52} p95 {r['baseline_p95_ms']}ms -> {r['p95_ms']}ms")
+        sys.exit(1)
+    elif report["baseline"]:
+        suite.log("[PASS] No regressions against baseline")
+    else:
+        suite.log("[SKIP] No baseline to compare with (use --save-baseline)")
+
+
+if __name__ == "__main__":
+    main()
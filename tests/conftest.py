@@ -0,0 +1,16 @@
+"""
+Shared setup for the pytest modules: the MCP server package on sys.path and
+a scratch data directory, set before any test module imports servers.* (the
+shared singletons in servers/utils.py read MCP_DATA_DIR at import time).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent / "application" / "mcp-server"
+
+_data_dir = tempfile.mkdtemp(prefix="mcp-test-")
+os.environ.setdefault("MCP_DATA_DIR", _data_dir)
+os.environ.setdefault("TELEMETRY_DIR", str(Path(_data_dir) / "timeseries"))
+sys.path.insert(0, str(SERVER_DIR))
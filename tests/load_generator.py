@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+SDN-WISE MCP Server - Load Generator
+Sustained, concurrent, open-loop traffic against a running MCP server.
+
+Requests arrive as a Poisson process at a fixed offered rate, independent of
+how fast the server answers, so a slow server builds a queue instead of
+quietly slowing the client down. Latency is measured from the intended send
+time (no coordinated omission) into HDR-style log-linear histograms, overall,
+per scenario and per time window.
+
+The payload mix replays what the dashboards and nurses' tablets send:
+
+    dashboard   deployment-monitoring status / active_devices / topology status
+    access      access-control permission checks
+    ota         network-configuration ota_status
+    intent      device-orchestration execute_intent (writes plans, runs steps)
+
+Each --rates value is a stage of --stage-seconds. A stage is saturated when
+completed throughput falls below 90% of the offered rate, p99 exceeds
+--slo-p99-ms, the error rate exceeds --max-error-rate, or arrivals were shed
+because --max-inflight requests were already outstanding. The report names
+the highest sustainable rate and the first saturated one.
+
+Usage:
+    python3 tests/load_generator.py --url http://localhost:8000 --rates 5,10,20,40,80
+    python3 tests/load_generator.py --serve --workers 1 --rates 10,50,100,200
+    python3 tests/load_generator.py --mix dashboard=70,access=20,ota=10 --stage-seconds 60
+
+With --serve and no ONOS_URL in the environment, the local server talks to
+an in-process stub of the wisesdn REST API (a ten-node WSN), so the
+controller-backed dashboard and intent calls measure the MCP server rather
+than connection errors to a missing ONOS.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVER_DIR = ROOT / "application" / "mcp-server"
+LIVE_DATA_DIR = SERVER_DIR / "data"
+
+DEFAULT_MIX = "dashboard=60,access=20,ota=15,intent=5"
+INTENTS = [
+    "Monitor the corridor for falls",
+    "Check temperature in room 101",
+    "Stream the corridor camera to the nurse station",
+]
+
+
+class LatencyHistogram:
+    """Log-linear histogram of microsecond values in the spirit of HdrHistogram.
+
+    Values below 2**sub_bits are counted exactly; above that every power of two
+    is split into 2**(sub_bits - 1) equal buckets, which bounds the relative
+    error by the requested significant figures at constant memory.
+    """
+
+    def __init__(self, highest_us: int = 120_000_000, significant_figures: int = 2):
+        self.sub_bits = max(1, math.ceil(math.log2(2 * 10 ** significant_figures)))
+        self.sub_count = 1 << self.sub_bits
+        self.half = self.sub_count >> 1
+        self.highest_us = highest_us
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+        self.sum_us = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half + ((value >> shift) - self.half)
+
+    def _upper_bound(self, index: int) -> int:
+        if index < self.sub_count:
+            return index
+        shift = (index - self.sub_count) // self.half + 1
+        mantissa = (index - self.sub_count) % self.half + self.half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value_us: int):
+        value_us = min(max(int(value_us), 0), self.highest_us)
+        index = self._index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum_us += value_us
+        self.max_us = max(self.max_us, value_us)
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+
+    def value_at_percentile(self, percentile: float) -> int:
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(percentile / 100 * self.total))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._upper_bound(index), self.max_us)
+        return self.max_us
+
+    def summary(self) -> Dict[str, Any]:
+        ms = lambda us: round(us / 1000, 3)
+        return {
+            "count": self.total,
+            "min_ms": ms(self.min_us or 0),
+            "mean_ms": ms(self.sum_us / self.total) if self.total else 0.0,
+            "p50_ms": ms(self.value_at_percentile(50)),
+            "p90_ms": ms(self.value_at_percentile(90)),
+            "p99_ms": ms(self.value_at_percentile(99)),
+            "p999_ms": ms(self.value_at_percentile(99.9)),
+            "max_ms": ms(self.max_us),
+        }
+
+
+class Scenario:
+    def __init__(self, name: str, weight: float, requests: List[Callable[[Dict[str, Any]], tuple]]):
+        self.name = name
+        self.weight = weight
+        # Each entry yields (endpoint, payload); one is picked per arrival
+        self.requests = requests
+
+
+def scenarios(mix: Dict[str, float]) -> List[Scenario]:
+    catalog = {
+        "dashboard": [
+            lambda c: ("deployment-monitoring", {"action": "status"}),
+            lambda c: ("deployment-monitoring", {"action": "active_devices", "minutes": 10}),
+            lambda c: ("topology-monitoring", {"action": "status"}),
+        ],
+        "access": [
+            lambda c: ("access-control", {"op": "check", "user": c["rng"].choice(c["users"]),
+                                          "permission": c["rng"].choice(["read_patient", "read_device", "ack_alert"])}),
+        ],
+        "ota": [
+            lambda c: ("network-configuration", {"action": "ota_status", "device_id": c["rng"].choice(c["device_ids"])}),
+        ],
+        "intent": [
+            lambda c: ("device-orchestration", {"action": "execute_intent", "intent": c["rng"].choice(INTENTS)}),
+        ],
+    }
+    unknown = set(mix) - set(catalog)
+    if unknown:
+        raise ValueError(f"Unknown scenario(s) in mix: {', '.join(sorted(unknown))}")
+    return [Scenario(name, weight, catalog[name]) for name, weight in mix.items() if weight > 0]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class StageStats:
+    """Counters and histograms for one offered-rate stage."""
+
+    def __init__(self, rate: float, stage_seconds: float, window_seconds: float):
+        self.rate = rate
+        self.stage_seconds = stage_seconds
+        self.window_seconds = window_seconds
+        self.offered = 0
+        self.shed = 0
+        self.ok = 0
+        self.ok_in_stage = 0
+        self.errors: Dict[str, int] = {}
+        self.latency = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.by_scenario: Dict[str, Dict[str, Any]] = {}
+        self.windows: Dict[int, Dict[str, Any]] = {}
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def record(self, scenario: str, intended: float, sent: float, finished: float, error: Optional[str]):
+        latency_us = (finished - intended) * 1e6
+        self.latency.record(latency_us)
+        self.service.record((finished - sent) * 1e6)
+
+        entry = self.by_scenario.setdefault(scenario, {"latency": LatencyHistogram(), "ok": 0, "errors": 0})
+        entry["latency"].record(latency_us)
+
+        window = self.windows.setdefault(int((finished - self.started) // self.window_seconds),
+                                         {"latency": LatencyHistogram(), "ok": 0, "errors": 0})
+        window["latency"].record(latency_us)
+
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+            entry["errors"] += 1
+            window["errors"] += 1
+        else:
+            self.ok += 1
+            if finished - self.started <= self.stage_seconds:
+                self.ok_in_stage += 1
+            entry["ok"] += 1
+            window["ok"] += 1
+
+    @property
+    def completed(self) -> int:
+        return self.ok + sum(self.errors.values())
+
+    def summary(self, slo_p99_ms: float, max_error_rate: float) -> Dict[str, Any]:
+        completed = self.completed
+        error_rate = (completed - self.ok) / completed if completed else 0.0
+        # Only completions inside the stage count, so a backlog drained afterwards shows as lost throughput
+        achieved = self.ok_in_stage / self.stage_seconds
+        latency = self.latency.summary()
+        reasons = []
+        if achieved < 0.9 * self.offered / self.stage_seconds:
+            reasons.append("throughput")
+        if latency["p99_ms"] > slo_p99_ms:
+            reasons.append("p99")
+        if error_rate > max_error_rate:
+            reasons.append("errors")
+        if self.shed:
+            reasons.append("shed")
+        return {
+            "offered_rate": self.rate,
+            "duration_s": round(self.elapsed, 2),
+            "offered": self.offered,
+            "completed": completed,
+            "ok": self.ok,
+            "shed": self.shed,
+            "achieved_rps": round(achieved, 2),
+            "error_rate": round(error_rate, 4),
+            "errors": self.errors,
+            "latency": latency,
+            "service_time": self.service.summary(),
+            "scenarios": {
+                name: {"ok": e["ok"], "errors": e["errors"], **e["latency"].summary()}
+                for name, e in sorted(self.by_scenario.items())
+            },
+            "timeline": [
+                {
+                    "t_s": round(index * self.window_seconds, 2),
+                    "rps": round((w["ok"] + w["errors"]) / self.window_seconds, 2),
+                    "error_rate": round(w["errors"] / max(w["ok"] + w["errors"], 1), 4),
+                    "p50_ms": round(w["latency"].value_at_percentile(50) / 1000, 3),
+                    "p99_ms": round(w["latency"].value_at_percentile(99) / 1000, 3),
+                }
+                for index, w in sorted(self.windows.items())
+            ],
+            "saturated": bool(reasons),
+            "saturation_reasons": reasons,
+        }
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, mix: Dict[str, float], rates: List[float], stage_seconds: float,
+                 max_inflight: int = 256, timeout: float = 30.0, window_seconds: float = 1.0,
+                 slo_p99_ms: float = 1000.0, max_error_rate: float = 0.01, seed: int = 42,
+                 constant: bool = False):
+        self.base_url = base_url.rstrip("/")
+        self.scenarios = scenarios(mix)
+        if not self.scenarios:
+            raise ValueError("Payload mix is empty")
+        self.rates = rates
+        self.stage_seconds = stage_seconds
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self.window_seconds = window_seconds
+        self.slo_p99_ms = slo_p99_ms
+        self.max_error_rate = max_error_rate
+        self.constant = constant
+        self.rng = random.Random(seed)
+        self.stages: List[Dict[str, Any]] = []
+
+    def log(self, message: str):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
+    async def _context(self, client: httpx.AsyncClient) -> Dict[str, Any]:
+        """Device ids and user names the payloads draw from, taken from the server."""
+        device_ids, users = [], []
+        response = await client.post("/tasks/deployment-monitoring", json={"action": "query_status", "status": "active"})
+        response.raise_for_status()
+        device_ids = [d.get("deviceId") or d.get("device_id") for d in response.json().get("devices", [])]
+        access_file = Path(os.getenv("MCP_DATA_DIR", str(LIVE_DATA_DIR))) / "access.json"
+        if access_file.exists():
+            users = [u.get("name") for u in json.loads(access_file.read_text()).get("users", []) if u.get("name")]
+        return {
+            "rng": self.rng,
+            "device_ids": [d for d in device_ids if d] or ["esp32-001"],
+            "users": users or ["nurse-1"],
+        }
+
+    async def _fire(self, client: httpx.AsyncClient, stats: StageStats, scenario: Scenario,
+                    endpoint: str, payload: Dict[str, Any], intended: float):
+        loop = asyncio.get_running_loop()
+        sent = loop.time()
+        error = None
+        try:
+            response = await client.post(f"/tasks/{endpoint}", json=payload)
+            if response.status_code >= 400:
+                error = f"http_{response.status_code}"
+        except httpx.TimeoutException:
+            error = "timeout"
+        except httpx.TransportError as e:
+            error = type(e).__name__
+        stats.record(scenario.name, intended, sent, loop.time(), error)
+
+    async def run_stage(self, client: httpx.AsyncClient, ctx: Dict[str, Any], rate: float) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        stats = StageStats(rate, self.stage_seconds, self.window_seconds)
+        weights = [s.weight for s in self.scenarios]
+        inflight = set()
+
+        stats.started = loop.time()
+        next_at = stats.started
+        while True:
+            next_at += 1.0 / rate if self.constant else self.rng.expovariate(rate)
+            if next_at - stats.started >= self.stage_seconds:
+                break
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            stats.offered += 1
+            if len(inflight) >= self.max_inflight:
+                stats.shed += 1
+                continue
+            scenario = self.rng.choices(self.scenarios, weights=weights)[0]
+            endpoint, payload = self.rng.choice(scenario.requests)(ctx)
+            task = asyncio.create_task(self._fire(client, stats, scenario, endpoint, payload, next_at))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+
+        if inflight:
+            _, pending = await asyncio.wait(set(inflight), timeout=self.timeout + 1)
+            for task in pending:
+                task.cancel()
+            if pending:
+                stats.errors["unfinished"] = len(pending)
+        stats.elapsed = max(loop.time() - stats.started, 1e-9)
+        return stats.summary(self.slo_p99_ms, self.max_error_rate)
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.max_inflight, max_keepalive_connections=self.max_inflight)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            ctx = await self._context(client)
+            self.log(f"Target {self.base_url}: {len(ctx['device_ids'])} active devices, "
+                     f"mix {', '.join(f'{s.name}={s.weight:g}' for s in self.scenarios)}")
+            for rate in self.rates:
+                stage = await self.run_stage(client, ctx, rate)
+                self.stages.append(stage)
+                latency = stage["latency"]
+                flag = f"  SATURATED ({', '.join(stage['saturation_reasons'])})" if stage["saturated"] else ""
+                self.log(
+                    f"  {rate:>8g} req/s offered  {stage['achieved_rps']:>8.2f} ok/s  "
+                    f"p50 {latency['p50_ms']:>9.2f}ms  p99 {latency['p99_ms']:>9.2f}ms  "
+                    f"err {stage['error_rate'] * 100:5.1f}%  shed {stage['shed']}{flag}"
+                )
+
+        sustainable = [s["offered_rate"] for s in self.stages if not s["saturated"]]
+        saturated = next((s for s in self.stages if s["saturated"]), None)
+        return {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "target": self.base_url,
+            "mix": {s.name: s.weight for s in self.scenarios},
+            "stage_seconds": self.stage_seconds,
+            "max_inflight": self.max_inflight,
+            "slo_p99_ms": self.slo_p99_ms,
+            "max_error_rate": self.max_error_rate,
+            "max_sustainable_rate": max(sustainable) if sustainable else None,
+            "saturation_point": {
+                "offered_rate": saturated["offered_rate"],
+                "achieved_rps": saturated["achieved_rps"],
+                "reasons": saturated["saturation_reasons"],
+            } if saturated else None,
+            "stages": self.stages,
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubOnosHandler(BaseHTTPRequestHandler):
+    """
+    The parts of /onos/wisesdn/api the MCP server calls, answered from a fixed
+    ten-node WSN: border router 1 with sensors 2-10 in a two-hop tree. Flow
+    writes are acknowledged but not stored.
+    """
+
+    API = "/onos/wisesdn/api/"
+    NODES = list(range(1, 11))
+    LINKS = [(1, n) for n in range(2, 5)] + [(2 + (n % 3), n) for n in range(5, 11)]
+
+    def _reply(self, code: int, body: Any):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _node(self, node_id: int) -> Dict[str, Any]:
+        return {"type": "border-router" if node_id == 1 else "sensor", "active": True,
+                "battery": 100 - 3 * node_id, "lastSeen": int(time.time() * 1000)}
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        resource = path[len(self.API):].split("/") if path.startswith(self.API) else []
+        if resource == ["topology"]:
+            self._reply(200, {
+                "nodes": [dict(self._node(n), id=n) for n in self.NODES],
+                "links": [{"source": a, "target": b} for a, b in self.LINKS],
+            })
+        elif resource == ["devices"]:
+            self._reply(200, [dict(self._node(n), nodeId=n, flowCount=0) for n in self.NODES])
+        elif len(resource) == 2 and resource[0] == "flows" and resource[1].isdigit():
+            self._reply(200, {"nodeId": int(resource[1]), "flows": []})
+        elif len(resource) == 2 and resource[0] == "stats" and resource[1].isdigit() and int(resource[1]) in self.NODES:
+            self._reply(200, {"nodeId": int(resource[1]), "battery": 80, "packetsSent": 0, "packetsReceived": 0,
+                              "lastSeen": int(time.time() * 1000)})
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"null")
+        if self.path.startswith(self.API + "flows/batch") and isinstance(payload, list):
+            self._reply(200, [{"status": "success", "message": "Flow installed"} for _ in payload])
+        elif self.path.startswith(self.API + "flows"):
+            self._reply(200, {"status": "success", "message": "Flow installed"})
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_DELETE(self):
+        self._reply(200, {"status": "success", "message": "Flow removed"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_onos() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOnosHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_local_server(workers: int, log_path: Path) -> tuple:
+    """
+    uvicorn on a free port against a scratch copy of the data directory;
+    server output goes to log_path. Returns (url, process, data_dir, stub):
+    stub is the stub ONOS controller, or None when ONOS_URL was given.
+    """
+    data_dir = Path(tempfile.mkdtemp(prefix="mcp-load-"))
+    for path in LIVE_DATA_DIR.glob("*.json"):
+        shutil.copy(path, data_dir / path.name)
+    port = _free_port()
+    env = dict(os.environ, MCP_DATA_DIR=str(data_dir), TELEMETRY_DIR=str(data_dir / "timeseries"))
+    stub = None
+    if "ONOS_URL" not in env:
+        stub = start_stub_onos()
+        env["ONOS_URL"] = f"http://127.0.0.1:{stub.server_address[1]}"
+    log_file = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "servers.app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=str(SERVER_DIR), env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    os.environ["MCP_DATA_DIR"] = str(data_dir)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return url, process, data_dir, stub
+        except httpx.TransportError:
+            time.sleep(0.2)
+    shutil.rmtree(data_dir, ignore_errors=True)
+    if stub:
+        stub.shutdown()
+    if process.poll() is not None:
+        raise RuntimeError(f"uvicorn exited with code {process.returncode} (see {log_path})")
+    process.terminate()
+    raise RuntimeError(f"uvicorn did not become healthy within 30s (see {log_path})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the MCP server")
+    parser.add_argument("--url", default=os.getenv("MCP_URL", "http://localhost:8000"))
+    parser.add_argument("--serve", action="store_true", help="Start a local uvicorn on a scratch data copy")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --serve")
+    parser.add_argument("--server-log", default="load_server.log", help="uvicorn output with --serve")
+    parser.add_argument("--rates", default="5,10,20,40,80", help="Comma-separated offered rates (req/s), one stage each")
+    parser.add_argument("--stage-seconds", type=float, default=30.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. dashboard=60,access=20")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Shed arrivals beyond this many outstanding")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--window-seconds", type=float, default=1.0, help="Timeline resolution")
+    parser.add_argument("--slo-p99-ms", type=float, default=1000.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--constant", action="store_true", help="Evenly spaced arrivals instead of Poisson")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="load_report.json")
+    args = parser.parse_args()
+
+    process, data_dir, stub = None, None, None
+    url = args.url
+    if args.serve:
+        try:
+            url, process, data_dir, stub = start_local_server(args.workers, Path(args.server_log))
+        except RuntimeError as e:
+            print(f"✗ Local server failed: {e}")
+            sys.exit(1)
+
+    try:
+        generator = LoadGenerator(
+            base_url=url,
+            mix=parse_mix(args.mix),
+            rates=[float(r) for r in args.rates.split(",") if r],
+            stage_seconds=args.stage_seconds,
+            max_inflight=args.max_inflight,
+            timeout=args.timeout,
+            window_seconds=args.window_seconds,
+            slo_p99_ms=args.slo_p99_ms,
+            max_error_rate=args.max_error_rate,
+            seed=args.seed,
+            constant=args.constant,
+        )
+        report = asyncio.run(generator.run())
+    except (ValueError, httpx.HTTPError) as e:
+        print(f"✗ Load run failed: {e}")
+        sys.exit(1)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+            shutil.rmtree(data_dir, ignore_errors=True)
+        if stub:
+            stub.shutdown()
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    generator.log(f"Report written to {args.output}")
+    if report["saturation_point"]:
+        point = report["saturation_point"]
+        generator.log(
+            f"Saturation at {point['offered_rate']:g} req/s offered ({point['achieved_rps']} ok/s, "
+            f"{', '.join(point['reasons'])}); max sustainable {report['max_sustainable_rate'] or 'none'} req/s"
+        )
+    else:
+        generator.log(f"No saturation up to {max(generator.rates):g} req/s; raise --rates to find the knee")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Firmware deltas: requests that can never produce a delta don't reach the build pool."""
+import tempfile
+from pathlib import Path
+
+from servers.delta import DeltaBuilder
+from servers.firmware import FirmwareStore
+
+
+def _store_with_two_images():
+    store = FirmwareStore(Path(tempfile.mkdtemp(prefix="mcp-firmware-")))
+    base = store.put([b"\x7fELF" + bytes(range(256)) * 64], version="1.0.0")
+    target = store.put([b"\x7fELF" + bytes(range(255, -1, -1)) * 64], version="1.1.0")
+    return store, base["sha256"], target["sha256"]
+
+
+def test_empty_image_is_unavailable_without_a_build():
+    store, base, target = _store_with_two_images()
+    store.object_path(target).write_bytes(b"")  # truncated on disk
+    builder = DeltaBuilder(store)
+
+    for _ in range(3):
+        assert builder.request(base, target) == {"status": "unavailable", "reason": "Empty image"}
+        assert builder.request(target, base) == {"status": "unavailable", "reason": "Empty image"}
+    assert builder._pool is None
+    assert not builder._inflight
+
+
+def test_missing_image_object_is_unavailable():
+    store, base, target = _store_with_two_images()
+    store.object_path(base).unlink()
+    status = DeltaBuilder(store).request(base, target)
+    assert status["status"] == "unavailable"
+    assert "missing" in status["reason"]
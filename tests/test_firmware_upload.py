@@ -0,0 +1,61 @@
+"""Firmware upload: a signature is only stored once it verifies."""
+import base64
+import hashlib
+import tempfile
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("cryptography")  # optional dependency of servers/firmware.py
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+from fastapi.testclient import TestClient
+
+from servers.app import app
+from servers.utils import firmware_store
+
+IMAGE = b"\x7fELF" + bytes(range(256)) * 32
+OTHER_IMAGE = IMAGE[::-1]
+
+
+@pytest.fixture
+def signing_key(monkeypatch):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = Path(tempfile.mkdtemp(prefix="mcp-key-")) / "firmware.pub.pem"
+    pem.write_bytes(key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+    monkeypatch.setenv("ADMIN_TOKEN", "test-admin")
+    monkeypatch.setattr(firmware_store, "public_key_path", str(pem))
+    monkeypatch.setattr(firmware_store, "_public_key", None)
+    return key
+
+
+def _sign(key, image):
+    digest = hashlib.sha256(image).digest()
+    return base64.b64encode(key.sign(digest, padding.PKCS1v15(), Prehashed(hashes.SHA256()))).decode()
+
+
+def _upload(version, image, signature):
+    return TestClient(app).put(f"/tasks/firmware/{version}", content=image,
+                               headers={"X-Admin-Token": "test-admin", "X-Firmware-Signature": signature})
+
+
+def test_invalid_signature_is_rejected_and_not_stored(signing_key):
+    response = _upload("9.9.1", IMAGE, _sign(signing_key, OTHER_IMAGE))
+    assert response.status_code == 400
+    assert "Invalid signature" in response.json()["detail"]
+
+    artifact = firmware_store.get(hashlib.sha256(IMAGE).hexdigest())
+    assert "signature" not in artifact
+    assert "9.9.1" not in artifact["versions"]
+
+
+def test_valid_signature_is_stored_with_the_version(signing_key):
+    signature = _sign(signing_key, IMAGE)
+    response = _upload("9.9.2", IMAGE, signature)
+    assert response.status_code == 200, response.text
+    assert response.json()["signature_verification"]["valid"]
+    assert response.json()["artifact"]["signature"] == signature
+    assert "9.9.2" in response.json()["artifact"]["versions"]
@@ -0,0 +1,78 @@
+"""Bulk flow installation against an in-memory controller flow table."""
+
+from servers.onos import OnosClient, flow_id, flow_payload
+
+
+class FakeFlowTableClient(OnosClient):
+    """
+    OnosClient over a dict of flow tables that behaves like FlowTableManager:
+    installFlow appends, deleteFlow drops every rule with the flow id, and
+    getMatchingFlow returns the first exact (src, dst) match.
+    """
+
+    def __init__(self):
+        super().__init__(base_url="http://127.0.0.1:9")
+        self.tables = {}
+        self.deleted = []
+
+    def get_flows(self, node_id):
+        return list(self.tables.get(node_id, []))
+
+    def _post_flow_batch(self, payloads):
+        for payload in payloads:
+            self.tables.setdefault(payload["nodeId"], []).append(payload)
+        return [{"status": "success", "message": "Flow installed"} for _ in payloads]
+
+    def _delete_flow(self, payload):
+        fid = flow_id(payload)
+        self.deleted.append(fid)
+        self.tables[payload["nodeId"]] = [f for f in self.tables.get(payload["nodeId"], []) if flow_id(f) != fid]
+        return {"status": "success", "message": "Flow removed"}
+
+    def matching_next_hop(self, node_id, src, dst):
+        for flow in self.tables.get(node_id, []):
+            if flow["srcAddr"] == src and flow["dstAddr"] == dst:
+                return flow["nextHop"]
+        return None
+
+
+def _route(next_hop):
+    return [
+        {"nodeId": 1, "srcAddr": 1, "dstAddr": 9, "action": 1, "nextHop": next_hop},
+        {"nodeId": 1, "srcAddr": 2, "dstAddr": 9, "action": 1, "nextHop": 3},
+    ]
+
+
+def test_reapplied_intent_with_new_next_hop_replaces_rule():
+    client = FakeFlowTableClient()
+    first = client.install_flows(_route(next_hop=4))
+    assert first["summary"]["added"] == 2
+
+    # Same intent, re-routed through node 5; prune stays off as on the intent path
+    second = client.install_flows(_route(next_hop=5))
+    assert second["status"] == "success"
+    assert second["summary"]["added"] == 1
+    assert second["summary"]["removed"] == 1
+    assert second["summary"]["unchanged"] == 1
+    assert second["summary"]["stale"] == 0
+    assert client.matching_next_hop(1, 1, 9) == 5
+    assert [flow_payload(f) for f in client.tables[1] if f["srcAddr"] == 1] == [flow_payload(_route(5)[0])]
+
+
+def test_unrelated_installed_flow_stays_stale_without_prune():
+    client = FakeFlowTableClient()
+    client.install_flows(_route(next_hop=4) + [{"nodeId": 1, "srcAddr": 7, "dstAddr": 9, "action": 1, "nextHop": 4}])
+
+    result = client.install_flows(_route(next_hop=4))
+    assert result["summary"]["stale"] == 1
+    assert result["summary"]["removed"] == 0
+    assert client.deleted == []
+
+
+def test_reapplying_identical_intent_sends_nothing():
+    client = FakeFlowTableClient()
+    client.install_flows(_route(next_hop=4))
+    result = client.install_flows(_route(next_hop=4))
+    assert result["summary"]["unchanged"] == 2
+    assert result["summary"]["added"] == 0
+    assert client.deleted == []
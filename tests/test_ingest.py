@@ -0,0 +1,51 @@
+"""Report ingestion: the Contiki mote report and WisePacket framing."""
+import struct
+
+from servers.ingest import ReportIngestor
+
+
+def mote_report(node_id: int, packets_sent: int) -> bytes:
+    """Datagram built exactly as send_report_to_controller() in sdn-wise-agent.c does."""
+    buffer = bytearray(b"\xAA" * 32)  # the mote never clears its stack buffer
+    buffer[0] = 20  # length
+    buffer[1] = 0x03  # WISE_TYPE_REPORT
+    buffer[2] = (node_id >> 8) & 0xFF
+    buffer[3] = node_id & 0xFF
+    buffer[7] = (packets_sent >> 24) & 0xFF
+    buffer[8] = (packets_sent >> 16) & 0xFF
+    buffer[9] = (packets_sent >> 8) & 0xFF
+    buffer[10] = packets_sent & 0xFF
+    return bytes(buffer[:20])  # simple_udp_sendto(&udp_conn, buffer, 20, ...)
+
+
+def test_mote_report_reaches_registry():
+    ingestor = ReportIngestor()
+    assert ingestor.ingest(mote_report(0x0102, 70000), now=100.0)
+    ingestor.flush()
+
+    state = ingestor.registry[0x0102]
+    assert state.packets_sent == 70000
+    assert state.battery is None
+    assert state.last_seen == 100.0
+    assert ingestor.counters["mote_reports"] == 1
+    assert ingestor.counters["dropped_bad_length"] == 0
+
+
+def test_wisepacket_stats_report_still_decoded():
+    ingestor = ReportIngestor()
+    # netId len dst src typ ttl nxh | battery packets_sent packets_received | pad;
+    # len = 11 + payload, as WisePacket counts one byte more than the header
+    packet = struct.pack(">BBHHBBH", 1, 15, 1, 7, 4, 100, 1) + struct.pack(">BHB", 80, 12, 5) + b"\x00"
+    assert ingestor.ingest(packet, now=5.0)
+    ingestor.flush()
+
+    state = ingestor.registry[7]
+    assert (state.battery, state.packets_sent, state.packets_received) == (80, 12, 5)
+    assert ingestor.counters["mote_reports"] == 0
+
+
+def test_mote_report_with_truncated_length_is_dropped():
+    ingestor = ReportIngestor()
+    assert not ingestor.ingest(mote_report(3, 1)[:10])
+    assert ingestor.counters["dropped_short"] == 1
+    assert not ingestor.registry
@@ -0,0 +1,29 @@
+"""HTTP request metrics: router labels stay bounded by the mounted routes."""
+
+from fastapi.testclient import TestClient
+
+from servers.app import app
+from servers.metrics import _known_actions, http_requests
+
+
+def _routers():
+    return {labels[0] for labels in http_requests._rows.snapshot()}
+
+
+def test_unknown_routers_are_labelled_other():
+    client = TestClient(app)
+    for i in range(20):
+        response = client.post(f"/tasks/made-up-{i}", json={"action": f"probe-{i}"})
+        assert response.status_code == 404
+    client.get("/tasks/topology-monitoring/extra")
+
+    assert not any(router.startswith("made-up") for router in _routers())
+    assert not any(router.startswith("made-up") for router in _known_actions)
+    assert "other" in _routers()
+
+
+def test_mounted_router_keeps_its_label():
+    client = TestClient(app)
+    client.post("/tasks/topology-monitoring", json={"action": "cache_stats"})
+    assert "topology-monitoring" in _routers()
+    assert "cache_stats" in _known_actions["topology-monitoring"]
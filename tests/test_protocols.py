@@ -0,0 +1,39 @@
+"""Transport plugins: pending MQTT acknowledgements don't outlive their step."""
+import asyncio
+
+from servers.protocols import MqttTransport
+
+
+def _request(**fields):
+    return {"step_id": "s1", "instruction": "activate_service", "device_id": "esp32-1", "service": "motion",
+            "timeout_ms": 50, **fields}
+
+
+def test_mqtt_step_timing_out_before_puback_leaves_nothing_pending():
+    async def run():
+        transport = MqttTransport()
+        transport.loopback = True
+        await transport.start()
+        transport.started = True
+        # A broker that takes the publish but never sends the PUBACK
+        transport._broker.publish = lambda topic, payload, qos: 7
+        result = await transport.submit(_request())
+        return result, transport.pool_stats()
+
+    result, stats = asyncio.run(run())
+    assert result["status"] == "timeout"
+    assert stats["awaiting_ack"] == 0
+    assert stats["awaiting_reply"] == 0
+
+
+def test_mqtt_loopback_step_succeeds():
+    async def run():
+        transport = MqttTransport()
+        transport.loopback = True
+        result = await transport.submit(_request(instruction="query_service", timeout_ms=1000))
+        return result, transport.pool_stats()
+
+    result, stats = asyncio.run(run())
+    assert result["status"] == "success"
+    assert result["response"]["status"] == "ok"
+    assert stats["awaiting_ack"] == 0
@@ -0,0 +1,49 @@
+"""Circuit breakers: half-open probe slots come back when a probe never finishes."""
+import asyncio
+import time
+
+from servers.protocols import ProtocolDispatcher, TransportPlugin
+from servers.resilience import CircuitBreakerRegistry
+
+
+class HangingTransport(TransportPlugin):
+    """A device that accepts the request and never answers."""
+
+    name = "hang"
+    protocols = ("HANG",)
+
+    async def send(self, request):
+        await asyncio.sleep(3600)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_cancelled_probe_releases_its_half_open_slot():
+    breakers = CircuitBreakerRegistry(failure_threshold=1, reset_seconds=0.05)
+    breakers.record("esp32-1", failed=True, error="timeout")
+    time.sleep(0.06)
+    dispatcher = ProtocolDispatcher(breakers=breakers)
+    dispatcher.register(HangingTransport())
+    try:
+        probe = dispatcher.submit("HANG", {"step_id": "s1", "device_id": "esp32-1", "timeout_ms": 60000})
+        _wait_until(lambda: breakers._breakers["esp32-1"].probes_in_flight == 1)
+        probe.cancel()
+        _wait_until(lambda: breakers._breakers["esp32-1"].probes_in_flight == 0)
+        # The next request is allowed to probe the device again
+        assert breakers.allow("esp32-1")
+    finally:
+        dispatcher.close()
+
+
+def test_release_outside_half_open_is_a_no_op():
+    breakers = CircuitBreakerRegistry(failure_threshold=1, reset_seconds=60)
+    breakers.release("esp32-2")
+    breakers.record("esp32-2", failed=True)
+    breakers.release("esp32-2")
+    assert breakers.state("esp32-2") == "open"
+    assert not breakers.allow("esp32-2")
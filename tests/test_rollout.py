@@ -0,0 +1,59 @@
+"""Rollout jobs: operator commands sent while a wave is in flight are not lost."""
+import threading
+import time
+
+from servers.rollout import RolloutManager
+
+DEVICES = {f"esp32-{i}": {"status": "active"} for i in range(1, 11)}
+
+
+def _wait_for_status(job, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.status not in statuses:
+        assert time.monotonic() < deadline, f"job stuck in {job.status}"
+        time.sleep(0.01)
+
+
+def _start_failing_rollout(manager, release):
+    def push(device_id, firmware):
+        release.wait(5)
+        return {"deviceId": device_id, "status": "failed", "error": "flash write failed"}
+
+    return manager.start(list(DEVICES), DEVICES, push, {"version": "2.0.0"},
+                         rollback_firmware={"version": "1.0.0"}, canary=1)
+
+
+def test_cancel_during_failing_wave_finishes_the_job():
+    manager, release = RolloutManager(), threading.Event()
+    job = _start_failing_rollout(manager, release)
+    _wait_for_status(job, ("running",))
+    manager.cancel(job.job_id)
+    release.set()
+
+    _wait_for_status(job, ("failed",))
+    assert job.waves[0]["status"] == "failed"
+    assert job.next_wave == 1
+
+
+def test_rollback_during_failing_wave_rolls_back():
+    manager, release = RolloutManager(), threading.Event()
+    job = _start_failing_rollout(manager, release)
+    _wait_for_status(job, ("running",))
+    manager.rollback(job.job_id)
+    release.set()
+
+    _wait_for_status(job, ("rolled_back",))
+
+
+def test_resume_from_an_earlier_pause_does_not_skip_the_failure_pause():
+    manager, release = RolloutManager(), threading.Event()
+    job = _start_failing_rollout(manager, release)
+    _wait_for_status(job, ("running",))
+    manager.pause(job.job_id)
+    manager.resume(job.job_id)
+    release.set()
+
+    _wait_for_status(job, ("paused",))
+    assert "failure rate" in job.reason
+    manager.cancel(job.job_id)
+    _wait_for_status(job, ("failed",))
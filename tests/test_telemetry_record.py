@@ -0,0 +1,58 @@
+"""telemetry_record: malformed samples are client errors, not server errors."""
+import json
+
+from fastapi.testclient import TestClient
+
+from servers.app import app
+from servers.utils import DATA_DIR
+
+# The agent loads the deployment file on every request
+if not (DATA_DIR / "deployment_monitoring.json").exists():
+    (DATA_DIR / "deployment_monitoring.json").write_text(json.dumps({"devices": [], "locations": []}))
+
+
+def _call(action, **payload):
+    return TestClient(app).post("/tasks/deployment-monitoring", json={"action": action, **payload})
+
+
+def _record(samples):
+    return _call("telemetry_record", samples=samples)
+
+
+def test_malformed_samples_are_rejected_with_400():
+    for samples in ([5], [{"device_id": "esp32-1", "value": 3}], [{"metric": "battery", "value": 3}],
+                    [{"device_id": "esp32-1", "metric": "battery", "value": {"x": 1}}],
+                    [{"device_id": "esp32-1", "metric": "battery", "value": 3, "timestamp": [1]}],
+                    {"device_id": "esp32-1"}):
+        response = _record(samples)
+        assert response.status_code == 400, (samples, response.text)
+
+
+def test_valid_samples_are_stored():
+    response = _record([{"device_id": "esp32-1", "metric": "battery", "value": 87, "timestamp": 1700000000},
+                        {"device_id": "esp32-1", "metric": "battery", "value": None}])
+    assert response.status_code == 200, response.text
+    assert response.json()["received"] == 2
+    assert response.json()["stored"] == 1
+
+
+def test_out_of_range_samples_are_rejected_before_anything_is_written():
+    good = {"device_id": "esp32-range", "metric": "range_probe", "value": 1, "timestamp": 1700000000}
+    for bad in ({"value": 1e40}, {"value": -1e40}, {"timestamp": 1700000000000}, {"timestamp": -1}):
+        response = _record([good, {**good, "timestamp": 1700000001, **bad}])
+        assert response.status_code == 400, (bad, response.text)
+
+    # Nothing from the rejected batches reached the store
+    series = _call("telemetry_range", device_id="esp32-range", metric="range_probe")
+    assert series.status_code == 200, series.text
+    assert series.json()["points"] == []
+
+
+def test_aggregate_overall_last_is_the_most_recent_sample():
+    _record([{"device_id": "esp32-a", "metric": "last_probe", "value": 10, "timestamp": 1700000000},
+             {"device_id": "esp32-b", "metric": "last_probe", "value": 30, "timestamp": 1700000060},
+             {"device_id": "esp32-a", "metric": "last_probe", "value": 20, "timestamp": 1700000030}])
+    result = _call("telemetry_aggregate", metric="last_probe", fn="last", start=1699999000, end=1700001000)
+    assert result.status_code == 200, result.text
+    assert result.json()["nodes"] == {"esp32-a": 20.0, "esp32-b": 30.0}
+    assert result.json()["overall"] == 30.0
@@ -0,0 +1,35 @@
+"""Scenario import: import_csc only reads Cooja files from the allowed directories."""
+import tempfile
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from servers.app import app
+from servers.utils import COOJA_SIMULATIONS_DIR
+
+
+def _import(params):
+    return TestClient(app).post("/tasks/topology-monitoring", json={"action": "import_csc", "params": params})
+
+
+def test_paths_outside_allowed_directories_are_rejected():
+    for params in ({"path": "/etc/passwd"}, {"path": "../../../../../etc/passwd"}, {"xml": "/etc/passwd"}):
+        response = _import(params)
+        assert response.status_code == 400, params
+
+
+def test_bundled_cooja_simulation_imports_by_name():
+    response = _import({"path": "wsn-topology.csc"})
+    assert response.status_code == 200
+    assert response.json()["summary"]["nodes"] > 0
+
+
+def test_simulate_confines_csc_paths_too():
+    outside = Path(tempfile.mkdtemp(prefix="mcp-outside-")) / "x.csc"
+    outside.write_text((COOJA_SIMULATIONS_DIR / "wsn-topology.csc").read_text())
+    client = TestClient(app)
+    response = client.post("/tasks/algorithm-execution", json={"action": "simulate", "csc": str(outside)})
+    assert response.status_code == 400
+
+    response = client.post("/tasks/algorithm-execution", json={"action": "simulate", "csc": "wsn-topology.csc"})
+    assert response.status_code == 200, response.text